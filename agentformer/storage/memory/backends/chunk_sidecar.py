@@ -0,0 +1,188 @@
+"""
+ChunkSidecar
+
+Offset-indeksoitu binäärinen sivutiedosto FAISS-snapshotin chunkeille.
+Chunkien teksti ja metadata tallennetaan peräkkäisinä JSON-tietueina
+yhteen tiedostoon, ja erillinen offset-taulukko kertoo mistä kukin
+tietue alkaa. Näin yksittäinen tietue voidaan lukea muistikartoitetusta
+tiedostosta ilman, että koko korpusta tarvitsee jäsentää.
+
+Tiedostot:
+    faiss_chunks.<seq>.bin   JSON-tietueet peräkkäin (utf-8)
+    faiss_chunks.<seq>.idx   uint64-offsetit (n + 1 kpl, .npy-muodossa)
+
+LazyChunkList käyttäytyy kuin FaissMemoryBackendin metadata-lista:
+snapshotin rivit luetaan levyltä vasta kun niitä tarvitaan, ja
+käynnistyksen jälkeen lisätyt rivit pidetään muistissa.
+
+ChunkSidecarin muistikartoitus ja tiedostokahvat vapautetaan close()-
+kutsulla tai viimeistään, kun mikään sukupolvi ei enää viittaa siihen
+(weakref.finalize). Tiivistyksen jälkeen vanhaa sivutiedostoa voivat
+vielä käyttää käynnissä olevat haut, joten sitä ei suljeta heti.
+"""
+
+import io
+import json
+import mmap
+import os
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+def write_sidecar(data_path: str, offsets_path: str, raw_records: Iterable[bytes]):
+    """Write records and their offsets atomically
+
+    Args:
+        data_path: Record data file
+        offsets_path: Offset table file
+        raw_records: Serialized JSON records
+
+    Returns:
+        int: Number of written records
+    """
+    offsets = [0]
+    tmp_path = f"{data_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for raw in raw_records:
+            f.write(raw)
+            offsets.append(offsets[-1] + len(raw))
+        f.flush()
+        os.fsync(f.fileno())
+
+    buffer = io.BytesIO()
+    np.save(buffer, np.array(offsets, dtype=np.uint64))
+    tmp_offsets = f"{offsets_path}.tmp"
+    with open(tmp_offsets, "wb") as f:
+        f.write(buffer.getvalue())
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, data_path)
+    os.replace(tmp_offsets, offsets_path)
+    return len(offsets) - 1
+
+
+def _release(data, file):
+    """Close a sidecar's data mapping and file handle"""
+    if isinstance(data, mmap.mmap):
+        data.close()
+    file.close()
+
+
+def encode_record(record: Dict) -> bytes:
+    """Serialize one chunk record"""
+    return json.dumps(record, ensure_ascii=False).encode("utf-8")
+
+
+class ChunkSidecar:
+    """Read-only, memory-mapped view of a sidecar file pair"""
+
+    def __init__(self, data_path: str, offsets_path: str):
+        self.data_path = data_path
+        self.offsets_path = offsets_path
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self._file = open(data_path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+        self._finalizer = weakref.finalize(self, _release, self._data, self._file)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def read_raw(self, row: int) -> bytes:
+        """Read serialized record by row number"""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self._data[start:end])
+
+    def read(self, row: int) -> Dict:
+        """Read and decode record by row number"""
+        return json.loads(self.read_raw(row).decode("utf-8"))
+
+    def read_all(self) -> List[Dict]:
+        """Decode every record"""
+        return [self.read(row) for row in range(len(self))]
+
+    def close(self):
+        """Release the mappings and the file handle (idempotent)"""
+        self._finalizer()
+        # Offset-taulukon kartoitus vapautuu, kun viittaus siihen poistuu;
+        # suljettu sivutiedosto näyttää tyhjältä
+        self.offsets = np.zeros(1, dtype=np.uint64)
+        self._data = b""
+
+
+class LazyChunkList:
+    """List-like metadata view backed by a sidecar plus an in-memory tail"""
+
+    def __init__(self, sidecar: ChunkSidecar):
+        self.sidecar = sidecar
+        # None = kaikki snapshotin rivit järjestyksessä, muuten säilytetyt rivit
+        self._rows: Optional[np.ndarray] = None
+        self._tail: List[Dict] = []
+
+    def __len__(self) -> int:
+        return self._base_count() + len(self._tail)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("chunk index out of range")
+
+        base = self._base_count()
+        if i < base:
+            return self.sidecar.read(self._row(i))
+        return self._tail[i - base]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self._base_count()):
+            yield self.sidecar.read(self._row(i))
+        yield from self._tail
+
+    def append(self, record: Dict):
+        self._tail.append(record)
+
+    def extend(self, records: Iterable[Dict]):
+        self._tail.extend(records)
+
+    def drop(self, positions: Iterable[int]):
+        """Remove records at the given positions"""
+        drop = set(positions)
+        base = self._base_count()
+        rows = self._rows if self._rows is not None else np.arange(base)
+        keep = np.ones(base, dtype=bool)
+        keep[[i for i in drop if i < base]] = False
+        self._rows = rows[keep]
+        self._tail = [r for i, r in enumerate(self._tail, base) if i not in drop]
+
+    def frozen(self) -> "LazyChunkList":
+        """Return an independent copy that later mutations do not affect"""
+        copy = LazyChunkList(self.sidecar)
+        copy._rows = None if self._rows is None else self._rows.copy()
+        copy._tail = list(self._tail)
+        return copy
+
+    def iter_raw(self) -> Iterator[bytes]:
+        """Yield serialized records, copying snapshot rows without decoding"""
+        for i in range(self._base_count()):
+            yield self.sidecar.read_raw(self._row(i))
+        for record in self._tail:
+            yield encode_record(record)
+
+    def _base_count(self) -> int:
+        return len(self.sidecar) if self._rows is None else len(self._rows)
+
+    def _row(self, i: int) -> int:
+        return i if self._rows is None else int(self._rows[i])
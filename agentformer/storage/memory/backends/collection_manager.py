@@ -0,0 +1,284 @@
+"""
+CollectionManager
+
+Nimettyjen vektorikokoelmien (namespace per käyttäjä tai projekti)
+hallinta. Jokainen kokoelma on oma FaissMemoryBackendinsa omassa
+hakemistossaan collections/<namespace>/, joten pienen kokoelman haku
+ei käy läpi muiden vektoreita.
+
+Prosessin laajuinen LRU pitää auki vain viimeksi käytetyt kokoelmat:
+kun avoimien kokoelmien arvioitu muistinkäyttö (resident_bytes) tai
+määrä ylittää rajan, kylmimmät kokoelmat tiivistetään snapshotiksi
+levylle ja suljetaan. Seuraava kysely avaa kokoelman uudelleen.
+
+Kokoelmien koot pidetään välimuistissa. Koko mitataan uudelleen vain
+kokoelmalle, jota juuri käytettiin, ja vain jos sen julkaistu sukupolvi
+on muuttunut. Mittaus tehdään managerin lukon ulkopuolella, joten kysely
+ei odota muiden kokoelmien kirjoittajia eikä käy läpi kaikkia avoimia
+kokoelmia.
+
+Käyttö:
+    manager = get_collection_manager()
+    with manager.collection("tenant-a") as backend:
+        backend.store_many(ids, texts, embeddings)
+        results = backend.semantic_search(query_embedding, k=5)
+
+Kokoelma on kiinnitetty (pinned) with-lohkon ajan, joten sitä ei
+suljeta kesken kyselyn; backend-viitettä ei pidä säilyttää lohkon ulkopuolella.
+"""
+
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .faiss_backend import FaissMemoryBackend
+from .index_factory import IndexConfig
+from ..path_manager import PathManager
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionManager:
+    """Opens named collections on demand and keeps the hottest ones resident"""
+
+    def __init__(
+        self,
+        storage_dir: Optional[str] = None,
+        max_resident_bytes: int = 512 * 1024 * 1024,
+        max_open: int = 64,
+        index_config: Optional[IndexConfig] = None,
+        read_mostly: bool = False,
+        compact_on_evict: bool = True,
+    ):
+        """Initialize collection manager
+
+        Args:
+            storage_dir: Memory storage directory (default storage/memory)
+            max_resident_bytes: Estimated memory budget of open collections
+            max_open: Maximum number of open collections
+            index_config: Index configuration used for every collection
+            read_mostly: Open collections in read-mostly (mmap) mode
+            compact_on_evict: Fold the journal into a snapshot before closing,
+                so the next open loads a snapshot instead of replaying
+        """
+        self.storage_dir = storage_dir
+        self.max_resident_bytes = max_resident_bytes
+        self.max_open = max_open
+        self.index_config = index_config
+        self.read_mostly = read_mostly
+        self.compact_on_evict = compact_on_evict
+
+        self._open: "OrderedDict[str, FaissMemoryBackend]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        # Kokoelma -> (mitattu sukupolvi, arvioitu koko) ja kokojen summa
+        self._sizes: Dict[str, Tuple[int, int]] = {}
+        self._resident_total = 0
+        # Kokoelmakohtainen lukko: avaus ja sulkeminen eivät mene päällekkäin
+        self._namespace_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @contextmanager
+    def collection(self, namespace: str) -> Iterator[FaissMemoryBackend]:
+        """Open a collection (if needed) and pin it for the block
+
+        Args:
+            namespace: Collection name
+
+        Yields:
+            FaissMemoryBackend: The collection's backend
+
+        Raises:
+            ValueError: If the collection name is invalid
+        """
+        backend = self._acquire(namespace)
+        try:
+            yield backend
+        finally:
+            self._release(namespace)
+
+    def semantic_search(
+        self, namespace: str, query_embedding: np.ndarray, k: int = 5, **kwargs
+    ) -> List[Dict]:
+        """Search one collection (see FaissMemoryBackend.semantic_search)"""
+        with self.collection(namespace) as backend:
+            return backend.semantic_search(query_embedding, k, **kwargs)
+
+    def store_many(self, namespace: str, *args, **kwargs) -> int:
+        """Store chunks into one collection (see FaissMemoryBackend.store_many)"""
+        with self.collection(namespace) as backend:
+            return backend.store_many(*args, **kwargs)
+
+    def list_collections(self) -> List[str]:
+        """Collections on disk and currently open"""
+        with self._lock:
+            open_names = set(self._open)
+        return sorted(open_names | set(PathManager.list_collections(self.storage_dir)))
+
+    def resident(self) -> Dict[str, int]:
+        """Estimated resident bytes of each open collection, coldest first"""
+        with self._lock:
+            backends = list(self._open.items())
+        return {name: backend.resident_bytes() for name, backend in backends}
+
+    def evict(self, namespace: str) -> bool:
+        """Write a collection to disk and close it unless it is in use
+
+        Returns:
+            bool: True if the collection was open and got closed
+        """
+        with self._lock:
+            if namespace not in self._open or self._pins.get(namespace):
+                return False
+            if not self._namespace_lock(namespace).acquire(blocking=False):
+                return False
+            backend = self._open.pop(namespace)
+            self._forget_size(namespace)
+        self._close(namespace, backend)
+        return True
+
+    def close_all(self):
+        """Close every open collection that is not in use"""
+        with self._lock:
+            names = list(self._open)
+        for name in names:
+            self.evict(name)
+
+    def _acquire(self, namespace: str) -> FaissMemoryBackend:
+        """Pin a collection, opening it outside the manager lock on a miss"""
+        PathManager.validate_namespace(namespace)
+        with self._lock:
+            # Kiinnitys ennen avausta estää tuoreen kokoelman häädön
+            self._pins[namespace] = self._pins.get(namespace, 0) + 1
+            backend = self._open.get(namespace)
+            if backend is not None:
+                self._open.move_to_end(namespace)
+                self.stats["hits"] += 1
+                return backend
+            namespace_lock = self._namespace_lock(namespace)
+
+        try:
+            with namespace_lock:
+                with self._lock:
+                    backend = self._open.get(namespace)
+                if backend is None:
+                    backend = FaissMemoryBackend(
+                        storage_dir=self.storage_dir,
+                        read_mostly=self.read_mostly,
+                        index_config=self.index_config,
+                        namespace=namespace,
+                    )
+                    with self._lock:
+                        self._open[namespace] = backend
+                        self.stats["misses"] += 1
+                    self._measure(namespace, backend)
+        except Exception:
+            self._release(namespace)
+            raise
+
+        self._evict_over_budget()
+        return backend
+
+    def _release(self, namespace: str):
+        """Unpin a collection and evict if over budget"""
+        with self._lock:
+            pins = self._pins.get(namespace, 0) - 1
+            if pins > 0:
+                self._pins[namespace] = pins
+            else:
+                self._pins.pop(namespace, None)
+            backend = self._open.get(namespace)
+        if backend is not None:
+            # Kokoelmaa on voitu muuttaa lohkon aikana
+            self._measure(namespace, backend)
+        self._evict_over_budget()
+
+    def _measure(self, namespace: str, backend: FaissMemoryBackend):
+        """Refresh the cached size of a collection if it has changed"""
+        generation = backend.generation
+        cached = self._sizes.get(namespace)
+        if cached is not None and cached[0] == generation:
+            return
+        # Mittaus ottaa kokoelman lukon, ei managerin lukkoa
+        size = backend.resident_bytes()
+        with self._lock:
+            if self._open.get(namespace) is not backend:
+                return
+            self._forget_size(namespace)
+            self._sizes[namespace] = (generation, size)
+            self._resident_total += size
+
+    def _forget_size(self, namespace: str):
+        """Drop the cached size of a closed collection (lock held)"""
+        cached = self._sizes.pop(namespace, None)
+        if cached is not None:
+            self._resident_total -= cached[1]
+
+    def _evict_over_budget(self):
+        """Close least recently used, unpinned collections until within budget"""
+        with self._lock:
+            total = self._resident_total
+            count = len(self._open)
+            if total <= self.max_resident_bytes and count <= self.max_open:
+                return
+            victims = []
+            for name in list(self._open):
+                if total <= self.max_resident_bytes and count <= self.max_open:
+                    break
+                if self._pins.get(name):
+                    continue
+                # Lukko otetaan ennen poistoa listalta, jotta uudelleenavaus
+                # odottaa, kunnes vanha instanssi on kirjoitettu levylle
+                if not self._namespace_lock(name).acquire(blocking=False):
+                    continue
+                victims.append((name, self._open.pop(name)))
+                self._forget_size(name)
+                total = self._resident_total
+                count -= 1
+
+        for name, backend in victims:
+            self._close(name, backend)
+
+    def _close(self, namespace: str, backend: FaissMemoryBackend):
+        """Compact and close an evicted collection (namespace lock held)"""
+        try:
+            if self.compact_on_evict:
+                backend.compact()
+            backend.close()
+        except Exception as e:
+            logger.error(f"Error closing collection {namespace}: {e}")
+        finally:
+            self._namespace_lock(namespace).release()
+        with self._lock:
+            self.stats["evictions"] += 1
+        logger.debug(f"Evicted collection {namespace}")
+
+    def _namespace_lock(self, namespace: str) -> threading.Lock:
+        with self._lock:
+            return self._namespace_locks.setdefault(namespace, threading.Lock())
+
+
+_manager: Optional[CollectionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_collection_manager(**kwargs) -> CollectionManager:
+    """Get the process-wide collection manager
+
+    Args:
+        **kwargs: CollectionManager arguments, used only on the first call
+
+    Returns:
+        CollectionManager: Shared manager instance
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = CollectionManager(**kwargs)
+            atexit.register(_manager.close_all)
+        return _manager
@@ -4,9 +4,12 @@ import os
 import logging
 from typing import List, Dict, Optional, Any
 import numpy as np
-from azure.cosmos import CosmosClient
 from dotenv import load_dotenv
 
+from .cosmos_bulk import BulkReport, bulk_delete, bulk_upsert, get_cosmos_client
+from .cosmos_mirror import CosmosVectorMirror
+from .index_factory import IndexConfig
+
 # Load environment variables
 load_dotenv(
     os.path.join(
@@ -21,8 +24,20 @@ logger = logging.getLogger(__name__)
 class CosmosMemoryBackend:
     """CosmosDB backend for storing and retrieving vector embeddings"""
 
-    def __init__(self):
-        """Initialize CosmosDB connection"""
+    def __init__(
+        self,
+        local_mirror: bool = False,
+        index_config: Optional[IndexConfig] = None,
+        mirror_poll_interval: float = 5.0,
+    ):
+        """Initialize CosmosDB connection
+
+        Args:
+            local_mirror: Answer semantic searches from a local FAISS mirror
+                of the embeddings instead of scoring every document in Cosmos
+            index_config: Index settings of the local mirror
+            mirror_poll_interval: Seconds between incremental mirror syncs
+        """
         try:
             # Get connection details from environment variables
             self.cosmos_uri = os.getenv("COSMOS_DB_URI")
@@ -41,12 +56,22 @@ class CosmosMemoryBackend:
                 raise ValueError("Missing required CosmosDB environment variables")
 
             # Initialize CosmosDB client
-            self.client = CosmosClient(self.cosmos_uri, credential=self.cosmos_key)
+            # Sama asiakas (ja yhteyspooli) jaetaan kaikkien backendien kesken
+            self.client = get_cosmos_client(self.cosmos_uri, self.cosmos_key)
             self.database = self.client.get_database_client(self.database_name)
             self.container = self.database.get_container_client(self.collection_name)
 
             logger.info(f"Connected to CosmosDB database: {self.database_name}")
 
+            # Peili rakennetaan vasta ensimmäisessä haussa
+            self.mirror = (
+                CosmosVectorMirror(
+                    self.container, index_config, poll_interval=mirror_poll_interval
+                )
+                if local_mirror
+                else None
+            )
+
         except Exception as e:
             logger.error(f"Error initializing CosmosDB backend: {str(e)}")
             raise
@@ -75,15 +100,63 @@ class CosmosMemoryBackend:
 
             # Store in CosmosDB
             self.container.upsert_item(document)
+            if self.mirror is not None:
+                self.mirror.expire()
             return True
 
         except Exception as e:
             logger.error(f"Error storing content in CosmosDB: {str(e)}")
             return False
 
+    def store_many(
+        self,
+        content_ids: List[str],
+        text_contents: List[str],
+        embeddings: np.ndarray,
+        extra_metas: Optional[List[Dict]] = None,
+        max_workers: int = 16,
+    ) -> BulkReport:
+        """Upsert many documents concurrently with throttling retries
+
+        Args:
+            content_ids: Document identifiers
+            text_contents: Texts, one per id
+            embeddings: Embedding matrix of shape (n, dimension)
+            extra_metas: Optional per-document metadata dicts
+            max_workers: Maximum concurrent upsert requests
+
+        Returns:
+            BulkReport: Upsert counts, failed ids and throughput
+        """
+        count = len(content_ids)
+        if extra_metas is None:
+            extra_metas = [None] * count
+        if len(text_contents) != count or len(extra_metas) != count:
+            raise ValueError("content_ids, text_contents and extra_metas must align")
+
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
+        documents = (
+            {
+                "id": content_id,
+                "content": text_content,
+                "embedding": embedding.tolist(),
+                "metadata": extra_meta or {},
+            }
+            for content_id, text_content, embedding, extra_meta in zip(
+                content_ids, text_contents, embeddings, extra_metas
+            )
+        )
+        report = bulk_upsert(self.container, documents, max_workers=max_workers)
+        if self.mirror is not None:
+            self.mirror.expire()
+        return report
+
     def semantic_search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict]:
         """Perform semantic search using cosine similarity"""
         try:
+            if self.mirror is not None:
+                return self.mirror.search(query_embedding, k)
+
             # Convert query embedding to list
             query_vector = (
                 query_embedding.tolist()
@@ -175,21 +248,29 @@ class CosmosMemoryBackend:
             logger.error(f"Error loading file {filename}: {str(e)}")
             return None
 
-    def reset_index(self):
-        """Clear all documents from the container"""
+    def reset_index(self, max_workers: int = 16) -> BulkReport:
+        """Clear all documents from the container
+
+        Args:
+            max_workers: Maximum concurrent delete requests
+
+        Returns:
+            BulkReport: Delete counts and throughput
+
+        Raises:
+            RuntimeError: If some documents could not be deleted
+        """
         try:
             # Delete all documents except file metadata
             query = "SELECT c.id FROM c WHERE c.type != 'file_metadata'"
-            items = list(
-                self.container.query_items(
-                    query=query, enable_cross_partition_query=True
-                )
-            )
-
-            for item in items:
-                self.container.delete_item(item["id"], partition_key=item["id"])
+            report = bulk_delete(self.container, query, max_workers=max_workers)
+            if self.mirror is not None:
+                self.mirror.clear()
+            if report.failed:
+                raise RuntimeError(report.summary())
 
             logger.info("Index reset successfully")
+            return report
 
         except Exception as e:
             logger.error(f"Error resetting index: {str(e)}")
@@ -0,0 +1,214 @@
+"""
+Cosmos bulk operations
+
+Rinnakkaiset massa-upsertit ja -poistot Cosmos DB -pohjaisille
+backendeille (CosmosMemoryBackend, HybridMemoryBackend). Yksi kerrallaan
+tehty upsert odottaa jokaisen verkkokutsun loppuun; suuren PDF:n
+chunkit tallennetaan tässä rajatulla määrällä samanaikaisia pyyntöjä,
+jolloin kaistanleveys eikä viive rajoittaa nopeutta.
+
+1. get_cosmos_client() jakaa yhden CosmosClientin (ja sen yhteyspoolin)
+   kaikille saman tilin backendeille prosessin sisällä
+2. bulk_execute() ajaa operaatiot säiepoolissa; korkeintaan
+   max_workers pyyntöä on kesken kerrallaan
+3. Kuristetut pyynnöt (HTTP 429) yritetään uudelleen palvelimen
+   x-ms-retry-after-ms-vihjeen tai eksponentiaalisen viiveen mukaan
+4. BulkReport kertoo onnistuneet, epäonnistuneet, uudelleenyritykset ja
+   läpäisyn (kohdetta sekunnissa)
+
+Poistot luetaan kyselystä sivu kerrallaan ja poistetaan samalla
+säiepoolilla, joten koko säiliön tyhjennys ei pidä kaikkia tunnisteita
+muistissa eikä odota jokaista poistoa erikseen.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[Tuple[str, str], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_cosmos_client(endpoint: str, key: str):
+    """Shared CosmosClient for an account
+
+    Args:
+        endpoint: Account URI
+        key: Account key
+
+    Returns:
+        CosmosClient: One client (and connection pool) per account and key
+    """
+    from azure.cosmos import CosmosClient
+
+    with _clients_lock:
+        client = _clients.get((endpoint, key))
+        if client is None:
+            client = CosmosClient(endpoint, credential=key)
+            _clients[(endpoint, key)] = client
+        return client
+
+
+@dataclass
+class BulkReport:
+    """Outcome and throughput of a bulk operation"""
+
+    operation: str
+    total: int = 0
+    succeeded: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    # (avain, virheilmoitus) epäonnistuneille kohteille
+    errors: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def failed(self) -> int:
+        return len(self.errors)
+
+    @property
+    def failed_keys(self) -> set:
+        return {key for key, _ in self.errors}
+
+    @property
+    def items_per_second(self) -> float:
+        return self.total / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        """One-line human readable report"""
+        return (
+            f"{self.operation}: {self.succeeded}/{self.total} ok, "
+            f"{self.failed} failed, {self.retries} throttled retries, "
+            f"{self.seconds:.2f}s ({self.items_per_second:.1f} items/s)"
+        )
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a Cosmos error, None for other errors"""
+    return getattr(error, "status_code", None)
+
+
+def retry_delay(error: Exception, attempt: int, base_delay: float, max_delay: float):
+    """Seconds to wait before retrying a throttled request"""
+    headers = getattr(error, "headers", None) or {}
+    retry_after = headers.get("x-ms-retry-after-ms")
+    if retry_after is not None:
+        try:
+            return min(float(retry_after) / 1000.0, max_delay)
+        except ValueError:
+            pass
+    # Eksponentiaalinen viive satunnaisella hajonnalla (full jitter)
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+def bulk_execute(
+    operation: Callable[[Any], Any],
+    items: Iterable[Any],
+    key: Callable[[Any], str] = str,
+    name: str = "bulk",
+    max_workers: int = 16,
+    max_retries: int = 8,
+    base_delay: float = 0.1,
+    max_delay: float = 10.0,
+    ignore_status: Iterable[int] = (),
+) -> BulkReport:
+    """Run an operation for every item with bounded concurrency
+
+    Args:
+        operation: Called once per item (e.g. container.upsert_item)
+        items: Items to process, consumed lazily
+        key: Item identifier used in the report
+        name: Operation name for the report
+        max_workers: Maximum number of requests in flight
+        max_retries: Retries per item for throttled (429) requests
+        base_delay: First backoff delay in seconds
+        max_delay: Longest backoff delay in seconds
+        ignore_status: Statuses counted as success (e.g. 404 for deletes)
+
+    Returns:
+        BulkReport: Counts, failed keys and throughput
+    """
+    report = BulkReport(operation=name)
+    ignored = set(ignore_status)
+    lock = threading.Lock()
+
+    def run(item):
+        for attempt in range(max_retries + 1):
+            try:
+                operation(item)
+                return None
+            except Exception as e:
+                code = status_code(e)
+                if code in ignored:
+                    return None
+                if code != 429 or attempt == max_retries:
+                    return f"{type(e).__name__}: {e}"
+                with lock:
+                    report.retries += 1
+                time.sleep(retry_delay(e, attempt, base_delay, max_delay))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        def collect(done):
+            for future in done:
+                item_key = in_flight.pop(future)
+                error = future.result()
+                if error is None:
+                    report.succeeded += 1
+                else:
+                    report.errors.append((item_key, error))
+
+        for item in items:
+            # Syötettä ei lueta etukäteen muistiin: uusi pyyntö vasta kun
+            # jokin keskeneräisistä valmistuu
+            if len(in_flight) >= max_workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[executor.submit(run, item)] = key(item)
+            report.total += 1
+        collect(wait(in_flight).done)
+
+    report.seconds = time.perf_counter() - started
+    level = logging.WARNING if report.errors else logging.INFO
+    logger.log(level, report.summary())
+    return report
+
+
+def bulk_upsert(container, documents: Iterable[Dict], **kwargs) -> BulkReport:
+    """Upsert documents concurrently (see bulk_execute for options)"""
+    return bulk_execute(
+        container.upsert_item, documents, key=lambda d: d["id"], name="upsert", **kwargs
+    )
+
+
+def bulk_delete(container, query: str, page_size: int = 1000, **kwargs) -> BulkReport:
+    """Delete every document matched by an id query, page by page
+
+    Args:
+        container: Cosmos container client
+        query: Query returning documents with an "id" field, e.g.
+            "SELECT c.id FROM c"; the id is also the partition key
+        page_size: Ids fetched per query page
+        **kwargs: bulk_execute options
+
+    Returns:
+        BulkReport: Counts, failed ids and throughput
+    """
+    items = container.query_items(
+        query=query, enable_cross_partition_query=True, max_item_count=page_size
+    )
+    ids = (item["id"] for item in items)
+    kwargs.setdefault("ignore_status", (404,))
+    return bulk_execute(
+        lambda item_id: container.delete_item(item_id, partition_key=item_id),
+        ids,
+        name="delete",
+        **kwargs,
+    )
@@ -0,0 +1,272 @@
+"""
+CosmosVectorMirror
+
+Paikallinen FAISS-peili Cosmos DB -säiliön embeddingeistä.
+CosmosMemoryBackendin palvelinpuolen haku laskee dotProduct-kosinin
+jokaiselle dokumentille ja järjestää ne (koko säiliön läpikäynti per
+kysely). Peilin kanssa haku tehdään paikallisesti, ja Cosmosista
+haetaan yhdellä kyselyllä vain top-k-dokumenttien teksti ja metadata.
+
+Synkronointi:
+1. Ensimmäinen käyttö lukee kaikki embeddingit (kursori 0)
+2. Tämän jälkeen sync() hakee vain dokumentit, joiden aikaleima
+   (oletuksena Cosmosin _ts, sekunteina) on vähintään kursorin arvo.
+   Kursorin sekunnin dokumentti ohitetaan vain, jos sen _etag on sama
+   kuin jo sovelletun version; saman sekunnin päivitys siis korvaa
+   vektorin, eikä mitään lisätä kahdesti
+3. Päivitetty dokumentti saa uuden aikaleiman, ja sen vanha vektori
+   korvataan
+4. Poistot eivät näy aikaleimakyselyssä: jos top-k-dokumenttia ei enää
+   löydy Cosmosista, se poistetaan peilistä ja haku täydennetään
+   seuraavilla ehdokkailla
+
+Vektorit normalisoidaan, joten sisätulo on kosinisamankaltaisuus ja
+etäisyys (1 - samankaltaisuus) on sama kuin palvelinpuolen haussa.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .index_factory import (
+    IdMapPromoter,
+    IndexConfig,
+    build_id_index,
+    choose_index_type,
+    reconstruct_ids,
+    remove_ids,
+    search_index,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CosmosVectorMirror:
+    """Local id-addressed FAISS index kept in sync with a Cosmos container"""
+
+    SYNC_QUERY = (
+        "SELECT c.id, c.embedding, c._etag AS etag, c.{field} AS cursor FROM c "
+        "WHERE c.{field} >= @since AND IS_DEFINED(c.embedding) "
+        "ORDER BY c.{field}"
+    )
+    FETCH_QUERY = (
+        "SELECT c.id, c.content, c.metadata FROM c WHERE ARRAY_CONTAINS(@ids, c.id)"
+    )
+
+    def __init__(
+        self,
+        container,
+        index_config: Optional[IndexConfig] = None,
+        cursor_field: str = "_ts",
+        poll_interval: float = 5.0,
+        page_size: int = 1000,
+    ):
+        """Initialize an empty mirror (it is filled on the first sync)
+
+        Args:
+            container: Cosmos container client
+            index_config: Local index type and tuning (metric is inner product)
+            cursor_field: Monotonic timestamp field used as the sync cursor
+            poll_interval: Seconds between syncs triggered by searches
+            page_size: Documents per sync query page
+        """
+        self.container = container
+        self.index_config = index_config or IndexConfig(metric="ip")
+        self.cursor_field = cursor_field
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+
+        self.index = None
+        self.cursor = 0
+        # Kursorin sekunnilla jo käsitellyt dokumentit: id -> _etag
+        self._at_cursor: Dict[str, Optional[str]] = {}
+        # Cosmos-tunniste <-> kasvava int64-tunniste FAISS-indeksissä
+        self._ids: Dict[str, int] = {}
+        self._keys: Dict[int, str] = {}
+        self._next_id = 0
+        self._last_sync: Optional[float] = None
+        self._lock = threading.RLock()
+        self.promoter = IdMapPromoter(
+            self.index_config, self._lock, lambda: self.index, self._install_index
+        )
+        self.stats = {"synced": 0, "replaced": 0, "pruned": 0}
+
+    def _install_index(self, index):
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def sync(self) -> int:
+        """Pull documents changed since the cursor
+
+        Returns:
+            int: Number of added or replaced vectors
+        """
+        query = self.SYNC_QUERY.format(field=self.cursor_field)
+        with self._lock:
+            items = self.container.query_items(
+                query=query,
+                parameters=[{"name": "@since", "value": self.cursor}],
+                enable_cross_partition_query=True,
+                max_item_count=self.page_size,
+            )
+            changed = 0
+            batch: List[Tuple[str, list]] = []
+            for item in items:
+                cursor, etag = item["cursor"], item.get("etag")
+                if (
+                    cursor == self.cursor
+                    and etag is not None
+                    and self._at_cursor.get(item["id"]) == etag
+                ):
+                    continue
+                if cursor > self.cursor:
+                    self.cursor = cursor
+                    self._at_cursor = {}
+                self._at_cursor[item["id"]] = etag
+                batch.append((item["id"], item["embedding"]))
+                if len(batch) >= self.page_size:
+                    changed += self._apply(batch)
+                    batch = []
+            changed += self._apply(batch)
+            self._last_sync = time.monotonic()
+            self.stats["synced"] += changed
+
+        if changed:
+            logger.debug(f"Synced {changed} vectors into the local mirror")
+            self.promoter.maybe_promote()
+        return changed
+
+    def expire(self):
+        """Make the next search sync regardless of poll_interval"""
+        self._last_sync = None
+
+    def maybe_sync(self):
+        """Sync if the mirror is empty or older than poll_interval"""
+        last = self._last_sync
+        if last is None or time.monotonic() - last >= self.poll_interval:
+            self.sync()
+
+    def _apply(self, batch: List[Tuple[str, list]]) -> int:
+        """Add a batch of (id, embedding) pairs, replacing older vectors"""
+        if not batch:
+            return 0
+        vectors = np.asarray([embedding for _, embedding in batch], dtype=np.float32)
+        vectors = _normalize(vectors)
+        if self.index is None:
+            self.index = build_id_index(
+                vectors.shape[1],
+                self.index_config,
+                choose_index_type(0, self.index_config),
+            )
+
+        # Sama dokumentti voi esiintyä erässä vain kerran (uusin voittaa)
+        latest = {key: row for row, (key, _) in enumerate(batch)}
+        replaced = [self._ids[key] for key in latest if key in self._ids]
+        if replaced:
+            self._remove(replaced)
+            self.stats["replaced"] += len(replaced)
+
+        rows = np.fromiter(latest.values(), dtype=np.int64, count=len(latest))
+        ids = np.arange(self._next_id, self._next_id + len(rows), dtype=np.int64)
+        self._next_id += len(rows)
+        self.index.add_with_ids(vectors[rows], ids)
+        for key, vector_id in zip(latest, ids.tolist()):
+            self._ids[key] = vector_id
+            self._keys[vector_id] = key
+        return len(rows)
+
+    def _remove(self, vector_ids: List[int]):
+        """Drop vectors from the index and the id maps (lock held)"""
+        self.index = remove_ids(
+            self.index, vector_ids, lambda ids: reconstruct_ids(self.index, ids)
+        )
+        for vector_id in vector_ids:
+            self._ids.pop(self._keys.pop(vector_id), None)
+        self.promoter.invalidate()
+
+    def discard(self, keys: List[str]):
+        """Remove documents known to be deleted from Cosmos"""
+        with self._lock:
+            vector_ids = [self._ids[key] for key in keys if key in self._ids]
+            if vector_ids:
+                self._remove(vector_ids)
+                self.stats["pruned"] += len(vector_ids)
+
+    def clear(self):
+        """Forget everything; the next sync reads the whole container"""
+        with self._lock:
+            self.index = None
+            self.cursor = 0
+            self._at_cursor = {}
+            self._ids = {}
+            self._keys = {}
+            self._last_sync = None
+            self.promoter.invalidate()
+
+    def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict]:
+        """Search locally and fetch only the top-k documents from Cosmos
+
+        Args:
+            query_embedding: Query vector
+            k: Number of results
+
+        Returns:
+            List[Dict]: Results with content, meta and distance (1 - cosine)
+        """
+        self.maybe_sync()
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))
+
+        results: List[Dict] = []
+        fetch = k
+        while len(results) < k:
+            with self._lock:
+                if self.index is None or self.index.ntotal == 0:
+                    return results
+                scores, ids = search_index(self.index, query, fetch, self.index_config)
+                hits = [
+                    (self._keys[int(i)], float(s))
+                    for s, i in zip(scores[0], ids[0])
+                    if i >= 0 and int(i) in self._keys
+                ]
+                exhausted = fetch >= self.index.ntotal
+
+            documents = self._fetch([key for key, _ in hits])
+            missing = [key for key, _ in hits if key not in documents]
+            if missing:
+                self.discard(missing)
+
+            results = [
+                {
+                    "content": documents[key]["content"],
+                    "meta": documents[key].get("metadata", {}),
+                    "distance": 1 - score,
+                }
+                for key, score in hits
+                if key in documents
+            ][:k]
+            if not missing or exhausted:
+                break
+            # Poistettujen tilalle haetaan seuraavat ehdokkaat
+            fetch = fetch * 2
+        return results
+
+    def _fetch(self, keys: List[str]) -> Dict[str, Dict]:
+        """Fetch documents by id with one query"""
+        if not keys:
+            return {}
+        items = self.container.query_items(
+            query=self.FETCH_QUERY,
+            parameters=[{"name": "@ids", "value": keys}],
+            enable_cross_partition_query=True,
+        )
+        return {item["id"]: item for item in items}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.maximum(norms, 1e-12), dtype=np.float32)
@@ -21,6 +21,39 @@ Käyttö:
    a) Teksti + vektori tallentuu sisäiseen listaan (metadataan).
    b) Myös indeksin päivitys (faiss) tallentuu tiedostoon.
 
+Pysyvyys: jokainen muutos kirjoitetaan append-only journaliin
+(faiss_journal.wal, ks. faiss_journal.py). Kun journal kasvaa yli
+compact_threshold-rajan, taustasäie tiivistää sen uudeksi snapshotiksi
+(faiss_index.<seq>.bin + faiss_chunks.<seq>.bin/.idx), joka otetaan
+käyttöön faiss_snapshot.json-manifestin atomisella vaihdolla.
+
+Read-mostly-tilassa (read_mostly=True) indeksi avataan FAISS:n mmap-
+lipuilla ja chunkien tekstit luetaan offset-indeksoidusta sivutiedostosta
+(ks. chunk_sidecar.py) vasta hakutuloksille, joten käynnistysaika ja
+muistinkäyttö eivät kasva koko tekstikorpuksen mukana.
+
+Kvantisointi (IndexConfig.quantization="sq8"/"pq") pakkaa indeksin
+vektorit 4-16-kertaisesti. Tarkat float32-vektorit tallennetaan
+snapshotin mukana faiss_vectors.<seq>.npy-tiedostoon (ks.
+vector_sidecar.py), josta haku lukee muistikartoitettuna vain lyhyen
+ehdokaslistan tarkkaa uudelleenjärjestystä varten.
+
+Suodatettu haku (semantic_search(filter={"filename": ...})) käyttää
+metadatakenttien käänteistä indeksiä (ks. metadata_filter.py), joka
+rakennetaan ensimmäisellä suodatetulla haulla ja pidetään ajan tasalla
+lisäyksissä. Poisto siirtää rivipaikkoja, joten se mitätöi indeksin.
+
+Samanaikaisuus: haut eivät ota lukkoa. Jokainen muutos julkaistaan
+uutena muuttumattomana sukupolvena (_Generation: IndexSnapshot, metadata,
+rivimäärä, vektorit), jonka haku ottaa talteen alussa; kirjoittaja ei
+muokkaa julkaistua indeksiä (copy-on-write, ks. index_snapshot.py).
+Suuren indeksin lisäykset kerätään delta-riveiksi, jotta jokainen
+lisäys ei kopioi koko indeksiä.
+
+Nimetty kokoelma (namespace="tenant") tallennetaan omaan hakemistoonsa
+collections/<namespace>/; useita kokoelmia avataan ja suljetaan
+tarpeen mukaan CollectionManagerin kautta (ks. collection_manager.py).
+
 Laajennus: halutessasi siirry Cosmos DB:hen - toteutat vain samat
 funktiot (store, search, clear, load/save) Cosmos-lausekkeilla. Voit
 säilyttää query-embedding -logiikan identtisenä.
@@ -32,18 +65,96 @@ Huom: tämä filu vaatii, että pythonin puolelta on asennettu faiss
 import logging
 import os
 import json
+import threading
+from contextlib import contextmanager
 import numpy as np
 from typing import List, Dict, Optional, Any
 import faiss
 
+from .faiss_journal import FaissJournal, atomic_write
+from .chunk_sidecar import ChunkSidecar, LazyChunkList, encode_record, write_sidecar
+from .vector_sidecar import VectorSidecar, write_vectors
+from .metadata_filter import MetadataIndex
+from .index_snapshot import (
+    IndexSnapshot,
+    add_to_snapshot,
+    folded,
+    writable_index,
+)
+from ..path_manager import PathManager
+from .index_factory import (
+    IndexConfig,
+    IndexPromoter,
+    build_index,
+    choose_index_type,
+    index_kind,
+    index_quantization,
+    reconstruct_all,
+    remove_positions,
+)
+
 logger = logging.getLogger(__name__)
 
 
+def query_matrix(query_embeddings) -> np.ndarray:
+    """Query vectors as a contiguous float32 matrix of shape (n, dimension)
+
+    A single 1-D query vector becomes one row.
+
+    Raises:
+        ValueError: If the input is not one vector or a 2-D batch of them
+    """
+    queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+    if queries.ndim != 2:
+        raise ValueError(
+            f"Expected query vectors of shape (n, dimension), got {queries.shape}"
+        )
+    return np.ascontiguousarray(queries)
+
+
+class _Generation:
+    """Generation published to lock-free readers"""
+
+    __slots__ = ("index", "metadata", "count", "vectors", "filters")
+
+    def __init__(self, index, metadata, count, vectors, filters):
+        self.index: IndexSnapshot = index
+        # Metadatalistaan voidaan lisätä rivejä julkaisun jälkeen, joten
+        # lukija käyttää vain count ensimmäistä riviä
+        self.metadata = metadata
+        self.count: int = count
+        self.vectors: Optional[VectorSidecar] = vectors
+        # Lukija voi rakentaa suodatinindeksin tälle sukupolvelle
+        self.filters: Optional[MetadataIndex] = filters
+
+
 class FaissMemoryBackend:
     """FAISS-based memory backend for vector storage and retrieval"""
 
-    def __init__(self):
-        """Initialize FAISS backend"""
+    def __init__(
+        self,
+        storage_dir: Optional[str] = None,
+        compact_threshold: int = 64 * 1024 * 1024,
+        sync_writes: bool = True,
+        read_mostly: bool = False,
+        index_config: Optional[IndexConfig] = None,
+        namespace: Optional[str] = None,
+    ):
+        """Initialize FAISS backend
+
+        Args:
+            storage_dir: Optional memory storage directory. Defaults to
+                agentformer/storage/memory.
+            compact_threshold: Journal size in bytes that triggers a
+                background compaction into a new snapshot
+            sync_writes: Whether every journal append is fsynced
+            read_mostly: Open the index through FAISS mmap IO flags and read
+                chunk text and metadata from the sidecar only for search hits
+            index_config: Index type and tuning (Flat/IVF/HNSW/auto, SQ8/PQ
+                quantization with exact re-ranking)
+            namespace: Named collection with its own index and metadata under
+                collections/<namespace>; None uses the shared vector_database
+        """
         # Määritä projektin juurihakemisto
         project_root = os.path.abspath(
             os.path.join(
@@ -55,8 +166,16 @@ class FaissMemoryBackend:
         )
 
         # Määritä polut suhteessa projektin juureen
-        self.storage_dir = os.path.join(project_root, "storage", "memory")
-        self.vector_db_dir = os.path.join(self.storage_dir, "vector_database")
+        self.storage_dir = storage_dir or os.path.join(
+            project_root, "storage", "memory"
+        )
+        self.namespace = namespace
+        if namespace is None:
+            self.vector_db_dir = os.path.join(self.storage_dir, "vector_database")
+        else:
+            self.vector_db_dir = PathManager.get_collection_path(
+                namespace, self.storage_dir
+            )
         self.saved_files_dir = os.path.join(self.storage_dir, "saved_files")
 
         logger.info("\n=== Initializing FAISS Backend ===")
@@ -69,56 +188,240 @@ class FaissMemoryBackend:
         os.makedirs(self.vector_db_dir, exist_ok=True)
         os.makedirs(self.saved_files_dir, exist_ok=True)
 
-        # Indeksin ja metadatan polut
+        # Indeksin ja metadatan polut. Snapshot-manifesti kertoo mitkä
+        # tiedostot ovat voimassa, journal sisältää sen jälkeiset muutokset.
         self.index_path = os.path.join(self.vector_db_dir, "faiss_index.bin")
         self.metadata_path = os.path.join(self.vector_db_dir, "faiss_metadata.json")
+        self.manifest_path = os.path.join(self.vector_db_dir, "faiss_snapshot.json")
+        self.chunks_path = None
+        self.offsets_path = None
+        self.vectors_path = None
+        self.read_mostly = read_mostly
+        self.journal = FaissJournal(
+            os.path.join(self.vector_db_dir, "faiss_journal.wal"), sync=sync_writes
+        )
+        self.compact_threshold = compact_threshold
 
         self.dimension = 384  # SBERT embedding dimension
-        self.index = None
+        # Kirjoittajan tila (muutetaan vain lukon alla); self.index on
+        # pohjaindeksi, self._index_snapshot lisäksi julkaisemattomat delta-rivit
+        self._index_snapshot: Optional[IndexSnapshot] = None
         self.metadata = []
+        # Tarkat vektorit uudelleenjärjestystä varten (vain kvantisoinnilla)
+        self.vectors: Optional[VectorSidecar] = None
+        # Metadatakentät -> rivipaikat, rakennetaan tarvittaessa
+        self._filters: Optional[MetadataIndex] = None
+        # Hauille julkaistu sukupolvi; ennen ensimmäistä julkaisua
+        # (lataus, journalin toisto) muutokset tehdään paikallaan
+        self._current: Optional[_Generation] = None
+        self._published = False
+        # Julkaisujen laskuri: muuttuu aina, kun hauille näkyvä tila muuttuu
+        self.generation = 0
+
+        # Batch-tilassa store()-kutsut puskuroidaan ja tallennetaan kerralla;
+        # puskuri on säiekohtainen, joten muiden säikeiden kirjoitukset
+        # eivät päädy toisen säikeen batchiin
+        self._batch_state = threading.local()
+
+        # Journalin järjestysnumerot: viimeisin muutos ja viimeisin snapshot
+        self._seq = 0
+        self._snapshot_seq = 0
+        # Poistettujen metadatarivien laskuri (tiivistyksen vaihtoa varten)
+        self._drops = 0
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+
+        # Indeksityyppi ja automaattinen ylennys ANN-indeksiksi
+        self.index_config = index_config or IndexConfig()
+        self.promoter = IndexPromoter(
+            self.index_config,
+            self._lock,
+            lambda: self.index,
+            self._install_index,
+            self._exact_vectors,
+            lambda: self._index_snapshot.ntotal,
+            self._fold_delta,
+        )
 
         self._load_or_create_index()
         logger.info("=== FAISS Backend Initialized ===\n")
 
+    @property
+    def index(self) -> Optional[faiss.Index]:
+        """Writer's base index (delta rows not folded in yet are excluded)"""
+        return self._index_snapshot.index if self._index_snapshot is not None else None
+
+    @index.setter
+    def index(self, index: Optional[faiss.Index]):
+        self._index_snapshot = IndexSnapshot.of(index) if index is not None else None
+
+    def _publish(self):
+        """Make the writer state visible to searches (lock held)"""
+        self._current = _Generation(
+            self._index_snapshot,
+            self.metadata,
+            len(self.metadata),
+            self.vectors,
+            self._filters,
+        )
+        self._published = True
+        self.generation += 1
+
+    def _load_or_create_index(self):
+        """Load the latest snapshot, replay the journal tail on top of it"""
+        manifest = self._load_manifest()
+        if manifest:
+            self.index_path = os.path.join(self.vector_db_dir, manifest["index"])
+            if "chunks" in manifest:
+                self.chunks_path = os.path.join(self.vector_db_dir, manifest["chunks"])
+                self.offsets_path = os.path.join(
+                    self.vector_db_dir, manifest["offsets"]
+                )
+            else:
+                self.metadata_path = os.path.join(
+                    self.vector_db_dir, manifest["metadata"]
+                )
+            if "vectors" in manifest:
+                self.vectors_path = os.path.join(
+                    self.vector_db_dir, manifest["vectors"]
+                )
+            self._seq = self._snapshot_seq = manifest["seq"]
+
+        self._load_index()
+        self._load_metadata()
+        self._check_alignment()
+        self._load_vectors()
+        self._replay_journal()
+        self._check_alignment()
+        with self._lock:
+            self._publish()
+        self.promoter.maybe_promote()
+
+    def _check_alignment(self):
+        """Refuse to open an index whose rows do not match the metadata"""
+        if self.index.ntotal != len(self.metadata):
+            raise ValueError(
+                f"Index has {self.index.ntotal} vectors but metadata has "
+                f"{len(self.metadata)} records in {self.vector_db_dir}"
+            )
+
     def _init_index(self):
         """Initialize FAISS index with correct dimension"""
         if self.index is None:
-            self.index = faiss.IndexFlatIP(self.dimension)
+            self.index = self._new_index()
             logger.debug(f"Initialized new FAISS index with dimension {self.dimension}")
 
+    def _new_index(self):
+        """Create an empty index of the configured type"""
+        return build_index(
+            self.dimension, self.index_config, choose_index_type(0, self.index_config)
+        )
+
+    def _fold_delta(self) -> None:
+        """Move pending delta rows into the base index (called under the lock)"""
+        self._index_snapshot = folded(self._index_snapshot)
+        if self._published:
+            self._publish()
+
+    def _install_index(self, index):
+        """Swap in a rebuilt index (called by the promoter under the lock)"""
+        # Ylennys rakennetaan pohjaindeksistä, delta-rivit säilyvät ennallaan
+        self._index_snapshot = self._index_snapshot.with_index(index)
+        if self._published:
+            self._publish()
+
+    def _keeps_vectors(self) -> bool:
+        """Whether exact vectors are kept next to a quantized index"""
+        return self.index_config.quantization != "none"
+
+    def _exact_vectors(self, start: int, end: int) -> np.ndarray:
+        """Exact vectors for positions start..end-1"""
+        if self.vectors is not None:
+            return self.vectors.range(start, end)
+        return reconstruct_all(self.index, start, end)
+
+    def _load_vectors(self):
+        """Map the exact vector file of the snapshot"""
+        if not self._keeps_vectors():
+            return
+        if self.vectors_path and os.path.isfile(self.vectors_path):
+            self.vectors = VectorSidecar(self.dimension, self.vectors_path)
+            return
+
+        # Snapshot kirjoitettiin ilman kvantisointia: indeksin vektorit ovat tarkkoja
+        self.vectors = VectorSidecar(self.dimension)
+        if self.index.ntotal:
+            if index_quantization(self.index) != "none":
+                logger.warning("No exact vectors stored, re-ranking uses decoded ones")
+            self.vectors.extend(reconstruct_all(self.index))
+
     def reset_index(self):
         """Reset the FAISS index and metadata"""
-        self.index = faiss.IndexFlatIP(self.dimension)
-        self.metadata = []
-        self._save_metadata()
+        self._commit({"op": "reset"})
+        self.compact()
         logger.info(f"Reset FAISS index with dimension {self.dimension}")
 
+    def _load_manifest(self) -> Optional[Dict]:
+        """Load snapshot manifest if one has been written"""
+        if not os.path.isfile(self.manifest_path):
+            return None
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _replay_journal(self):
+        """Apply journal records written after the loaded snapshot"""
+        replayed = 0
+        for position, (header, vectors) in enumerate(self.journal.read_records()):
+            if header["seq"] <= self._seq:
+                continue
+            try:
+                self._apply(header, vectors)
+            except Exception as e:
+                # Tietue ja sen jälkeiset jätetään pois, jotta uudet
+                # kirjoitukset eivät jää toistamattoman tietueen taakse
+                logger.error(
+                    f"Cannot apply journal record {header['seq']}, "
+                    f"dropping it and the rest of the journal: {e}"
+                )
+                self.journal.truncate_records(position)
+                break
+            self._seq = header["seq"]
+            replayed += 1
+
+        if replayed:
+            logger.info(f"Replayed {replayed} journal records on top of snapshot")
+
     def _load_metadata(self):
         """Load metadata from file"""
         try:
-            if os.path.isfile(self.metadata_path):
-                logger.debug("Loading metadata from faiss_metadata.json")
+            if self.chunks_path:
+                sidecar = ChunkSidecar(self.chunks_path, self.offsets_path)
+                if self.read_mostly:
+                    # Tietueet luetaan levyltä vasta hakutuloksia varten
+                    self.metadata = LazyChunkList(sidecar)
+                else:
+                    self.metadata = sidecar.read_all()
+                    sidecar.close()
+                logger.debug(f"Loaded {len(self.metadata)} chunk records")
+            elif os.path.isfile(self.metadata_path):
+                logger.debug(f"Loading metadata from {self.metadata_path}")
                 with open(self.metadata_path, "r", encoding="utf-8") as f:
                     self.metadata = json.load(f)
         except Exception as e:
+            # Tyhjä metadata ei olisi linjassa indeksin kanssa: hauissa
+            # palautuisi vektoreita väärillä tai puuttuvilla teksteillä
             logger.error(f"Failed to load metadata: {e}")
-            self.metadata = []
-
-    def _save_metadata(self):
-        """Save metadata to file"""
-        try:
-            with open(self.metadata_path, "w", encoding="utf-8") as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-            logger.debug(f"Saved metadata with {len(self.metadata)} records")
-        except Exception as e:
-            logger.error(f"Failed to save metadata: {e}")
+            raise ValueError(
+                f"Unreadable chunk metadata in {self.vector_db_dir}"
+            ) from e
 
     def _load_index(self):
         """Load FAISS index from file"""
         try:
             if os.path.isfile(self.index_path):
-                logger.debug("Loading existing FAISS index from faiss_index.bin")
-                self.index = faiss.read_index(self.index_path)
+                logger.debug(f"Loading existing FAISS index from {self.index_path}")
+                self.index = self._read_index_file(self.index_path)
                 logger.debug(f"Loaded FAISS index with {self.index.ntotal} vectors")
                 # Update dimension if needed
                 if self.index.d != self.dimension:
@@ -132,14 +435,133 @@ class FaissMemoryBackend:
             logger.error(f"Failed to load FAISS index: {e}")
             self._init_index()
 
-    def _save_index(self):
-        """Save FAISS index to file"""
+    def _read_index_file(self, path: str):
+        """Read index file, memory-mapped in read-mostly mode"""
+        if self.read_mostly:
+            try:
+                return faiss.read_index(
+                    path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError as e:
+                logger.warning(f"Index type does not support mmap, reading it: {e}")
+        return faiss.read_index(path)
+
+    def compact(self) -> bool:
+        """Fold the journal into a new snapshot
+
+        Snapshot kirjoitetaan uusiin tiedostoihin ja otetaan käyttöön
+        manifestin atomisella uudelleennimeämisellä. Vasta sen jälkeen
+        journalista leikataan snapshotiin sisältyvät tietueet pois, joten
+        kaatuminen missä tahansa vaiheessa jättää eheän tilan.
+
+        Returns:
+            bool: True if a new snapshot was written
+        """
+        with self._compaction_lock:
+            with self._lock:
+                seq = self._seq
+                if seq == self._snapshot_seq and self.journal.size() == 0:
+                    return False
+                index = folded(self._index_snapshot).index
+                index_bytes = faiss.serialize_index(index).tobytes()
+                if isinstance(self.metadata, LazyChunkList):
+                    frozen = self.metadata.frozen()
+                    raw_records = frozen.iter_raw()
+                    written_count = len(frozen)
+                else:
+                    raw_records = map(encode_record, list(self.metadata))
+                drops = self._drops
+                vectors = self.vectors.frozen() if self.vectors is not None else None
+                journal_offset = self.journal.size()
+
+            index_name = f"faiss_index.{seq}.bin"
+            chunks_name = f"faiss_chunks.{seq}.bin"
+            offsets_name = f"faiss_chunks.{seq}.idx"
+            index_path = os.path.join(self.vector_db_dir, index_name)
+            chunks_path = os.path.join(self.vector_db_dir, chunks_name)
+            offsets_path = os.path.join(self.vector_db_dir, offsets_name)
+
+            atomic_write(index_path, index_bytes)
+            count = write_sidecar(chunks_path, offsets_path, raw_records)
+            manifest = {
+                "seq": seq,
+                "index": index_name,
+                "chunks": chunks_name,
+                "offsets": offsets_name,
+                "count": count,
+            }
+            vectors_path = None
+            if vectors is not None:
+                manifest["vectors"] = f"faiss_vectors.{seq}.npy"
+                vectors_path = os.path.join(self.vector_db_dir, manifest["vectors"])
+                write_vectors(vectors_path, vectors)
+            atomic_write(self.manifest_path, json.dumps(manifest).encode("utf-8"))
+
+            with self._lock:
+                self.journal.trim(journal_offset)
+                old_paths = {
+                    self.index_path,
+                    self.metadata_path,
+                    self.chunks_path,
+                    self.offsets_path,
+                    self.vectors_path,
+                }
+                self.index_path = index_path
+                self.chunks_path = chunks_path
+                self.offsets_path = offsets_path
+                self.vectors_path = vectors_path
+                self._snapshot_seq = seq
+
+                # Lazy-näkymä vaihdetaan uuteen sivutiedostoon, jos kirjoituksen
+                # aikana tuli vain lisäyksiä: ne siirretään uuden näkymän
+                # muistissa pidettävään häntään. Vanha sivutiedosto suljetaan,
+                # kun mikään sukupolvi ei enää viittaa siihen
+                if isinstance(self.metadata, LazyChunkList) and self._drops == drops:
+                    metadata = LazyChunkList(ChunkSidecar(chunks_path, offsets_path))
+                    metadata.extend(self.metadata[written_count:])
+                    self.metadata = metadata
+                # Tarkat vektorit luetaan jatkossa levyltä muistin sijaan
+                if vectors_path and self.vectors is not None and self._seq == seq:
+                    self.vectors = VectorSidecar(self.dimension, vectors_path)
+                self._publish()
+
+            new_paths = {index_path, chunks_path, offsets_path, vectors_path, None}
+            for path in old_paths - new_paths:
+                if os.path.isfile(path):
+                    os.remove(path)
+
+            logger.info(f"Compacted journal into snapshot {seq} ({count} chunks)")
+            return True
+
+    def close(self):
+        """Wait for background compaction, close the journal and the sidecar"""
+        self.promoter.wait()
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join()
+        self.journal.close()
+        if isinstance(self.metadata, LazyChunkList):
+            self.metadata.sidecar.close()
+
+    def _maybe_compact(self):
+        """Start a background compaction when the journal has grown large"""
+        if self.journal.size() < self.compact_threshold:
+            return
+        thread = self._compaction_thread
+        if thread is not None and thread.is_alive():
+            return
+
+        self._compaction_thread = threading.Thread(
+            target=self._compact_in_background, name="faiss-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+
+    def _compact_in_background(self):
+        """Run compaction in a worker thread"""
         try:
-            if self.index is not None:
-                faiss.write_index(self.index, self.index_path)
-                logger.debug(f"Saved FAISS index with {self.index.ntotal} vectors")
+            self.compact()
         except Exception as e:
-            logger.error(f"Failed to save FAISS index: {e}")
+            logger.error(f"Background compaction failed: {e}")
 
     def store(
         self,
@@ -152,60 +574,411 @@ class FaissMemoryBackend:
         try:
             # Ensure embedding is the right shape and type
             embedding = np.ascontiguousarray(embedding.reshape(1, -1), dtype=np.float32)
+            self._check_dimension(embedding)
+            record = self._make_record(content_id, text_content, extra_meta)
 
-            # Add to FAISS index
-            self.index.add(embedding)
+            # Batch-tilassa vain puskuroidaan, tallennus tapahtuu commitissa
+            pending = self._pending
+            if pending is not None:
+                pending.append((embedding, [record]))
+                return
 
-            # Store metadata
-            metadata = {
-                "content_id": content_id,
-                "content": text_content,
-                "meta": extra_meta or {},
-            }
-            self.metadata.append(metadata)
-
-            # Save changes
-            self._save_metadata()
-            self._save_index()
+            self._add_records(embedding, [record])
 
         except Exception as e:
             logger.error(f"Error storing content: {e}")
             raise
 
-    def semantic_search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict]:
-        """Search for similar content"""
+    def store_many(
+        self,
+        content_ids: List[str],
+        text_contents: List[str],
+        embeddings: np.ndarray,
+        extra_metas: Optional[List[Dict]] = None,
+    ) -> int:
+        """Store many chunks with a single index update and a single flush
+
+        Args:
+            content_ids: Chunk identifiers
+            text_contents: Chunk texts, one per id
+            embeddings: Stacked embedding matrix of shape (n, dimension)
+            extra_metas: Optional per-chunk metadata dicts
+
+        Returns:
+            int: Number of stored chunks
+        """
+        count = len(content_ids)
+        if extra_metas is None:
+            extra_metas = [None] * count
+        if len(text_contents) != count or len(extra_metas) != count:
+            raise ValueError("content_ids, text_contents and extra_metas must align")
+        if count == 0:
+            return 0
+
         try:
-            # Ensure query embedding is numpy array and right shape
-            if isinstance(query_embedding, str):
-                logger.error("Expected numpy array for embedding, got string")
-                return []
-
-            # Ensure query embedding is the right shape
-            query_embedding = np.ascontiguousarray(
-                query_embedding.reshape(1, -1), dtype=np.float32
+            embeddings = np.ascontiguousarray(
+                np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
             )
+            self._check_dimension(embeddings)
 
-            # Search
-            D, I = self.index.search(query_embedding, k)
+            records = [
+                self._make_record(content_id, text_content, extra_meta)
+                for content_id, text_content, extra_meta in zip(
+                    content_ids, text_contents, extra_metas
+                )
+            ]
 
-            # Get results
-            results = []
-            for score, idx in zip(D[0], I[0]):
-                if idx >= len(self.metadata):
-                    continue
-                result = {
-                    "content": self.metadata[idx]["content"],
-                    "meta": self.metadata[idx]["meta"],
-                    "distance": float(score),
-                }
-                results.append(result)
+            pending = self._pending
+            if pending is not None:
+                pending.append((embeddings, records))
+            else:
+                self._add_records(embeddings, records)
 
-            return results
+            return count
 
         except Exception as e:
-            logger.error(f"Error in semantic search: {e}")
+            logger.error(f"Error storing batch of {count} chunks: {e}")
+            raise
+
+    def _check_dimension(self, embeddings: np.ndarray):
+        """Reject vectors before they reach the journal"""
+        if embeddings.shape[1] != self.index.d:
+            raise ValueError(
+                f"Embedding dimension {embeddings.shape[1]} does not match "
+                f"index dimension {self.index.d}"
+            )
+
+    @property
+    def _pending(self) -> Optional[List]:
+        """Batch buffer of the calling thread, None outside batch()"""
+        return getattr(self._batch_state, "pending", None)
+
+    @contextmanager
+    def batch(self):
+        """Buffer store() calls and persist them once when the block exits
+
+        Käyttö:
+            with backend.batch():
+                for chunk_id, text, vector in chunks:
+                    backend.store(chunk_id, text, vector)
+
+        Puskuroidut rivit eivät näy hauissa ennen commitia. Jos lohko
+        päättyy poikkeukseen, puskuri hylätään eikä levylle kirjoiteta mitään.
+        Sisäkkäinen batch liittyy ulompaan. Puskuri on säiekohtainen: muiden
+        säikeiden store()-kutsut tallentuvat heti tavalliseen tapaan.
+        """
+        if self._pending is not None:
+            yield self
+            return
+
+        pending = self._batch_state.pending = []
+        try:
+            yield self
+        finally:
+            self._batch_state.pending = None
+
+        if pending:
+            vectors = np.vstack([vectors for vectors, _ in pending])
+            records = [
+                record for _, batch_records in pending for record in batch_records
+            ]
+            self._add_records(vectors, records)
+
+    def _make_record(
+        self, content_id: str, text_content: str, extra_meta: Optional[Dict]
+    ) -> Dict:
+        """Build a metadata record for one chunk"""
+        return {
+            "content_id": content_id,
+            "content": text_content,
+            "meta": extra_meta or {},
+        }
+
+    def _add_records(self, vectors: np.ndarray, records: List[Dict]):
+        """Add vectors with one index.add call and one journal append"""
+        header = {
+            "op": "store",
+            "rows": vectors.shape[0],
+            "dim": vectors.shape[1],
+            "records": records,
+        }
+        self._commit(header, vectors)
+        logger.debug(f"Stored {len(records)} chunks")
+
+    def count(self) -> int:
+        """Number of chunks visible to searches"""
+        return self._current.count
+
+    def delete(self, content_ids: List[str]) -> int:
+        """Delete chunks by content id
+
+        Args:
+            content_ids: Ids of chunks to remove
+
+        Returns:
+            int: Number of removed chunks
+        """
+        wanted = set(content_ids)
+        with self._lock:
+            count = sum(1 for r in self.metadata if r["content_id"] in wanted)
+            if count:
+                self._commit({"op": "delete", "content_ids": sorted(wanted)})
+        return count
+
+    def _commit(self, header: Dict, vectors: Optional[np.ndarray] = None):
+        """Write a mutation to the journal, then apply it in memory"""
+        with self._lock:
+            header["seq"] = self._seq + 1
+            self.journal.append(header, vectors)
+            self._seq = header["seq"]
+            self._apply(header, vectors)
+            self._publish()
+        if header["op"] == "store":
+            self.promoter.maybe_promote()
+        self._maybe_compact()
+
+    def _apply(self, header: Dict, vectors: Optional[np.ndarray]):
+        """Apply a journal record to the in-memory index and metadata
+
+        Julkaistua sukupolvea ei muokata: indeksi ja vektorit kopioidaan
+        tai kasvatetaan delta-riveillä. Metadatalistaan lisätään paikallaan,
+        koska lukijat käyttävät vain julkaisuhetken rivimäärän verran rivejä.
+        """
+        in_place = not self._published
+        op = header["op"]
+        if op == "store":
+            start = len(self.metadata)
+            current = self._current
+            if (
+                self._filters is None
+                and current is not None
+                and current.filters is not None
+                and current.count == start
+            ):
+                # Haun rakentama suodatinindeksi otetaan käyttöön
+                self._filters = current.filters
+            self._index_snapshot = add_to_snapshot(
+                self._index_snapshot,
+                vectors,
+                np.arange(start, start + len(vectors)),
+                self.index_config,
+                in_place,
+            )
+            self.metadata.extend(header["records"])
+            if self._filters is not None:
+                self._filters.add_many(
+                    range(start, len(self.metadata)),
+                    (r["meta"] for r in header["records"]),
+                )
+            if self.vectors is not None:
+                if not in_place:
+                    self.vectors = self.vectors.frozen()
+                self.vectors.extend(vectors)
+        elif op == "delete":
+            wanted = set(header["content_ids"])
+            positions = [
+                i for i, r in enumerate(self.metadata) if r["content_id"] in wanted
+            ]
+            if positions:
+                # Jäljelle jäävät vektorit pysyvät järjestyksessä, joten
+                # paikkaindeksit pysyvät linjassa metadatan kanssa
+                kept_vectors = None
+                if self.vectors is not None:
+                    if not in_place:
+                        self.vectors = self.vectors.frozen()
+                    self.vectors.drop(positions)
+                    kept_vectors = lambda: self._exact_vectors(0, len(self.vectors))
+                # IVF/HNSW rakennetaan poistossa uudelleen, flat muokataan
+                # paikallaan, joten vain se vaatii kopion
+                generation = self._index_snapshot
+                copy = not in_place and (
+                    index_kind(generation.index) == "flat" or generation.delta_count > 0
+                )
+                index = writable_index(generation, in_place=not copy)
+                self.index = remove_positions(index, positions, kept_vectors)
+                self._drop_records(positions, in_place)
+                self._filters = None
+                self.promoter.invalidate()
+        elif op == "reset":
+            self.index = self._new_index()
+            self.metadata = []
+            self._filters = None
+            if self._keeps_vectors():
+                self.vectors = VectorSidecar(self.dimension)
+            self.promoter.invalidate()
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+    def resident_bytes(self) -> int:
+        """Estimate memory held by the index, exact vectors and chunk records
+
+        Muistikartoitetut osat (read-mostly-current, vektoritiedosto)
+        eivät ole laskennassa mukana, koska käyttöjärjestelmä voi
+        vapauttaa niiden sivut itse.
+        """
+        with self._lock:
+            index = self.index
+            ntotal = index.ntotal
+            total = 0
+            if ntotal and not (self.read_mostly and self._snapshot_seq):
+                per_vector = index.sa_code_size()
+                if index_kind(index) == "hnsw":
+                    # Linkit: noin 2 * M int32-naapuria alimmalla tasolla
+                    per_vector += 2 * self.index_config.hnsw_m * 4
+                total += ntotal * per_vector
+            total += sum(chunk.nbytes for chunk in self._index_snapshot.delta_chunks)
+
+            if self.vectors is not None:
+                total += self.vectors.nbytes_in_memory()
+
+            metadata = self.metadata
+            if isinstance(metadata, LazyChunkList):
+                records = metadata._tail
+            else:
+                records = metadata
+            if records:
+                # Otos riittää arvioon; koko listan sarjallistaminen olisi O(n)
+                step = max(1, len(records) // 64)
+                sample = records[::step]
+                sample_bytes = sum(len(encode_record(r)) for r in sample)
+                total += int(sample_bytes / len(sample) * len(records))
+            return total
+
+    def _drop_records(self, positions: List[int], in_place: bool = True):
+        """Remove metadata records at the given positions"""
+        self._drops += 1
+        if isinstance(self.metadata, LazyChunkList):
+            if not in_place:
+                self.metadata = self.metadata.frozen()
+            self.metadata.drop(positions)
+        else:
+            drop = set(positions)
+            self.metadata = [r for i, r in enumerate(self.metadata) if i not in drop]
+
+    def semantic_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict]:
+        """Search for similar content
+
+        Args:
+            query_embedding: Query vector
+            k: Number of results
+            nprobe: IVF lists to visit (IVF indexes only)
+            ef_search: HNSW search queue length (HNSW indexes only)
+            filter: Only search chunks whose meta matches, e.g.
+                {"filename": "manual.pdf"} or {"file_type": ["pdf", "txt"]}
+
+        Quantized indexes return k * rerank_factor candidates that are
+        re-scored against the exact vectors on disk.
+
+        Raises:
+            ValueError: If the filter uses a field that is not indexed
+        """
+        # Ensure query embedding is numpy array and right shape
+        if isinstance(query_embedding, str):
+            logger.error("Expected numpy array for embedding, got string")
             return []
 
+        results = self.semantic_search_batch(
+            np.asarray(query_embedding).reshape(1, -1), k, nprobe, ef_search, filter
+        )
+        return results[0] if results else []
+
+    def semantic_search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict]]:
+        """Search for similar content for many queries at once
+
+        All queries go to FAISS as one stacked matrix, so the per-call
+        overhead is paid once. Embed the query texts with a single
+        TextEmbedder.embed_texts call before calling this.
+
+        Args:
+            query_embeddings: Query vectors, shape (n, dimension) or a list
+                of vectors; a single 1-D vector is one query
+            k: Number of results per query
+            nprobe: IVF lists to visit (IVF indexes only)
+            ef_search: HNSW search queue length (HNSW indexes only)
+            filter: Only search chunks whose meta matches (see semantic_search)
+
+        Returns:
+            List[List[Dict]]: Result list for each query, in query order
+
+        Raises:
+            ValueError: If query_embeddings has more than two dimensions or
+                the filter uses a field that is not indexed
+        """
+        if not len(query_embeddings):
+            return []
+        queries = query_matrix(query_embeddings)
+
+        try:
+            # Koko haku käyttää samaa sukupolvea, lukkoa ei tarvita
+            current = self._current
+            subset = self._filter_positions(current, filter) if filter else None
+
+            # Search
+            vectors = current.vectors
+            D, I = current.index.search(
+                queries,
+                k,
+                self.index_config,
+                nprobe,
+                ef_search,
+                vectors.take if vectors is not None else None,
+                subset,
+            )
+
+            # Get results
+            metadata, count = current.metadata, current.count
+            batch = []
+            for scores, indices in zip(D, I):
+                results = []
+                for score, idx in zip(scores, indices):
+                    if idx < 0 or idx >= count:
+                        continue
+                    record = metadata[idx]
+                    result = {
+                        "content": record["content"],
+                        "meta": record["meta"],
+                        "distance": float(score),
+                    }
+                    results.append(result)
+                batch.append(results)
+
+            return batch
+
+        except ValueError:
+            # Kutsujan virhe (esim. indeksoimaton suodatinkenttä), ei "ei osumia"
+            raise
+        except Exception as e:
+            logger.error(f"Error in semantic search: {e}")
+            return [[] for _ in range(len(queries))]
+
+    def _filter_positions(
+        self, current: _Generation, filter: Dict[str, Any]
+    ) -> np.ndarray:
+        """Positions of chunks of a generation whose meta matches a filter"""
+        filters = current.filters
+        if filters is None:
+            metadata, count = current.metadata, current.count
+            filters = MetadataIndex()
+            filters.add_many(range(count), (metadata[i]["meta"] for i in range(count)))
+            current.filters = filters
+        positions = filters.match(filter)
+        # Julkaisun jälkeen lisätyt rivit eivät kuulu tähän sukupolveen
+        return positions[: np.searchsorted(positions, current.count)]
+
     def get_saved_files(self) -> List[str]:
         """Get list of saved files in saved_files directory"""
         try:
@@ -0,0 +1,161 @@
+"""
+FaissJournal
+
+Append-only write-ahead journal FaissMemoryBackendin muutoksille.
+Jokainen muutos (store, delete, reset) kirjoitetaan yhtenä tietueena
+journal-tiedoston loppuun, joten kirjoituksen hinta riippuu muutoksen
+koosta eikä koko korpuksen koosta.
+
+Tietueen rakenne:
+    <uint32 payloadin pituus><uint32 crc32><payload>
+    payload = otsikko JSON-rivinä (päättyy b"\\n") + float32-vektorit raakatavuina
+
+Käynnistyksessä backend lataa viimeisimmän snapshotin ja toistaa sen
+jälkeen kirjoitetut tietueet. Kesken jäänyt (katkennut) viimeinen tietue
+tunnistetaan pituudesta tai tarkistussummasta ja leikataan pois.
+"""
+
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_RECORD_HEADER = struct.Struct("<II")
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write file contents through a temporary file and an atomic rename"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FaissJournal:
+    """Append-only journal of vector store mutations"""
+
+    def __init__(self, path: str, sync: bool = True):
+        """Initialize journal
+
+        Args:
+            path: Journal file path
+            sync: Whether every append is fsynced to disk
+        """
+        self.path = path
+        self.sync = sync
+        self._file = None
+
+    def append(self, header: Dict, vectors: Optional[np.ndarray] = None) -> int:
+        """Append one record and return the journal size after the write"""
+        payload = json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n"
+        if vectors is not None:
+            payload += np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+
+        record = _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        f = self._open()
+        f.write(record)
+        f.flush()
+        if self.sync:
+            os.fsync(f.fileno())
+        return f.tell()
+
+    def read_records(self) -> List[Tuple[Dict, Optional[np.ndarray]]]:
+        """Read all complete records and cut off a torn tail
+
+        Returns:
+            List of (header, vectors) tuples in write order
+        """
+        if not os.path.isfile(self.path):
+            return []
+
+        records = []
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            while True:
+                head = f.read(_RECORD_HEADER.size)
+                if len(head) < _RECORD_HEADER.size:
+                    break
+                length, crc = _RECORD_HEADER.unpack(head)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+
+                newline = payload.index(b"\n")
+                header = json.loads(payload[:newline].decode("utf-8"))
+                raw = payload[newline + 1 :]
+                vectors = None
+                if raw:
+                    vectors = np.frombuffer(raw, dtype=np.float32).reshape(
+                        header["rows"], header["dim"]
+                    )
+                records.append((header, vectors))
+                valid_size = f.tell()
+
+        if valid_size < os.path.getsize(self.path):
+            logger.warning(
+                f"Truncating torn journal tail at offset {valid_size} in {self.path}"
+            )
+            self.close()
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+        return records
+
+    def truncate_records(self, count: int) -> None:
+        """Keep only the first count records (drop a tail that cannot be applied)"""
+        self.close()
+        if not os.path.isfile(self.path):
+            return
+
+        offset = 0
+        with open(self.path, "r+b") as f:
+            for _ in range(count):
+                f.seek(offset)
+                head = f.read(_RECORD_HEADER.size)
+                if len(head) < _RECORD_HEADER.size:
+                    return
+                length, _ = _RECORD_HEADER.unpack(head)
+                offset += _RECORD_HEADER.size + length
+            f.truncate(offset)
+        logger.warning(f"Truncated journal to {count} records in {self.path}")
+
+    def size(self) -> int:
+        """Get journal size in bytes"""
+        if self._file is not None:
+            return self._file.tell()
+        if os.path.isfile(self.path):
+            return os.path.getsize(self.path)
+        return 0
+
+    def trim(self, offset: int) -> None:
+        """Drop everything before offset (already folded into a snapshot)"""
+        self.close()
+        if not os.path.isfile(self.path):
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            tail = f.read()
+        atomic_write(self.path, tail)
+        logger.debug(f"Trimmed journal to {len(tail)} bytes")
+
+    def close(self) -> None:
+        """Close the append handle"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        """Open the append handle lazily"""
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        return self._file
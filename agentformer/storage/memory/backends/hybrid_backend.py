@@ -13,21 +13,41 @@ Edut:
 
 Käyttö:
 1. Alusta backend omilla Azure Cosmos DB tunnuksilla
-2. Käytä store()-metodia dokumenttien tallentamiseen
+2. Käytä store()-metodia dokumenttien tallentamiseen, suurille
+   määrille store_many()-metodia (rinnakkaiset upsertit, ks. cosmos_bulk.py)
 3. Käytä semantic_search()-metodia hakuihin
 
+Hakutulosten metadata haetaan CosmosDB:stä yhdellä parametrisoidulla
+ARRAY_CONTAINS-kyselyllä kaikille osumille (ei erillistä kyselyä per
+osuma). Kyselyn edessä on paikallinen LRU-välimuisti (MetadataCache)
+vector_id:n mukaan, joten usein toistuvat osumat eivät vaadi verkkokutsua
+lainkaan. store() kirjoittaa välimuistiin ja delete()/reset_index()
+mitätöivät sen.
+
 Huom: Tämä backend vaatii sekä faiss-cpu että azure-cosmos paketit.
+Testeissä Cosmos-säiliön voi korvata muistinvaraisella toteutuksella
+(container-parametri), jolloin azure-cosmosia ei tuoda.
 """
 
 import logging
 import os
 import json
+import threading
+from collections import OrderedDict
 import numpy as np
-from typing import List, Dict, Optional, Any
+from typing import Iterable, List, Dict, Optional, Any, Tuple
 import faiss
-from azure.cosmos import CosmosClient
 from datetime import datetime
 
+from .cosmos_bulk import BulkReport, bulk_delete, bulk_upsert, get_cosmos_client
+from .index_factory import (
+    IndexConfig,
+    IndexPromoter,
+    build_index,
+    choose_index_type,
+    search_parameters,
+)
+
 logger = logging.getLogger(__name__)
 
 # FAISS configuration
@@ -40,34 +60,158 @@ INDEX_FILE = os.path.join(VECTOR_DB_DIR, "faiss_index.bin")
 os.makedirs(VECTOR_DB_DIR, exist_ok=True)
 
 
+class MetadataCache:
+    """Thread-safe LRU cache of Cosmos metadata documents keyed by vector_id
+
+    Puuttuva dokumentti (esim. poistetun chunkin vektori) tallennetaan
+    None-arvona, jotta sama osuma ei aiheuta kyselyä joka haulla.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._items: "OrderedDict[int, Optional[Dict]]" = OrderedDict()
+        # content_id -> vector_id, jotta upsert ja delete löytävät vanhan rivin
+        self._by_content: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Kasvaa jokaisessa kirjoituksessa; vanhentunut kyselytulos hylätään
+        self.version = 0
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_many(self, vector_ids: Iterable[int]) -> Tuple[Dict[int, Dict], List[int]]:
+        """Look up documents
+
+        Returns:
+            Tuple: (vector_id -> document for cached documents,
+                vector_ids that are not cached)
+        """
+        found, missing = {}, []
+        with self._lock:
+            for vector_id in vector_ids:
+                if vector_id in self._items:
+                    self._items.move_to_end(vector_id)
+                    document = self._items[vector_id]
+                    if document is not None:
+                        found[vector_id] = document
+                    self.stats["hits"] += 1
+                elif vector_id not in missing:
+                    missing.append(vector_id)
+                    self.stats["misses"] += 1
+        return found, missing
+
+    def fill(self, documents: Dict[int, Optional[Dict]], version: int):
+        """Cache query results unless the cache was written since version"""
+        with self._lock:
+            if version != self.version:
+                return
+            for vector_id, document in documents.items():
+                self._set(vector_id, document)
+
+    def put(self, document: Dict):
+        """Write through a stored document, replacing its previous version"""
+        with self._lock:
+            self.version += 1
+            self._forget(document["id"])
+            self._set(document["vector_id"], document)
+
+    def invalidate(self, content_ids: Iterable[str]):
+        """Drop documents of deleted chunks"""
+        with self._lock:
+            self.version += 1
+            for content_id in content_ids:
+                self._forget(content_id)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._items.clear()
+            self._by_content.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _set(self, vector_id: int, document: Optional[Dict]):
+        self._items[vector_id] = document
+        self._items.move_to_end(vector_id)
+        if document is not None:
+            self._by_content[document["id"]] = vector_id
+        while len(self._items) > self.max_size:
+            _, evicted = self._items.popitem(last=False)
+            if evicted is not None:
+                self._by_content.pop(evicted["id"], None)
+
+    def _forget(self, content_id: str):
+        vector_id = self._by_content.pop(content_id, None)
+        if vector_id is not None:
+            # Vanha vektori jää FAISSiin ilman dokumenttia
+            self._items[vector_id] = None
+
+
 class HybridMemoryBackend:
     """Hybrid backend using FAISS for vector search and CosmosDB for metadata"""
 
-    def __init__(self):
-        """Initialize hybrid backend with FAISS and CosmosDB"""
+    METADATA_QUERY = "SELECT * FROM c WHERE ARRAY_CONTAINS(@vector_ids, c.vector_id)"
+
+    def __init__(
+        self,
+        index_config: Optional[IndexConfig] = None,
+        container=None,
+        index_file: Optional[str] = None,
+        metadata_cache_size: int = 10_000,
+    ):
+        """Initialize hybrid backend with FAISS and CosmosDB
+
+        Args:
+            index_config: FAISS index type and tuning (default: exact flat index)
+            container: Cosmos container client to use instead of connecting
+                with the COSMOS_DB_* environment variables
+            index_file: FAISS index file (default vector_database/faiss_index.bin)
+            metadata_cache_size: Documents kept in the local metadata cache
+        """
         # Initialize FAISS
         self.index = None
         self.dimension = 768  # Default dimension for SBERT
+        self.index_config = index_config or IndexConfig()
+        self.index_file = index_file or INDEX_FILE
+        self._lock = threading.RLock()
         self._init_faiss()
+        self.promoter = IndexPromoter(
+            self.index_config, self._lock, lambda: self.index, self._install_index
+        )
+        self.promoter.maybe_promote()
+        self.metadata_cache = MetadataCache(metadata_cache_size)
 
         # Initialize CosmosDB
-        self._init_cosmos()
+        if container is not None:
+            self.container = container
+        else:
+            self._init_cosmos()
 
     def _init_faiss(self):
         """Initialize FAISS index"""
         try:
-            if os.path.isfile(INDEX_FILE):
+            if os.path.isfile(self.index_file):
                 logger.debug("Loading existing FAISS index")
-                self.index = faiss.read_index(INDEX_FILE)
+                self.index = faiss.read_index(self.index_file)
                 if self.index.d != self.dimension:
                     logger.warning(f"Index dimension mismatch, reinitializing")
-                    self.index = faiss.IndexFlatIP(self.dimension)
+                    self.index = self._new_index()
             else:
                 logger.debug("Creating new FAISS index")
-                self.index = faiss.IndexFlatIP(self.dimension)
+                self.index = self._new_index()
         except Exception as e:
             logger.error(f"Error initializing FAISS: {e}")
-            self.index = faiss.IndexFlatIP(self.dimension)
+            self.index = self._new_index()
+
+    def _new_index(self):
+        """Create an empty index of the configured starting type"""
+        return build_index(
+            self.dimension, self.index_config, choose_index_type(0, self.index_config)
+        )
+
+    def _install_index(self, index):
+        """Swap in a promoted index and persist it (called under the lock)"""
+        self.index = index
+        self._save_faiss_index()
 
     def _init_cosmos(self):
         """Initialize CosmosDB connection"""
@@ -82,7 +226,7 @@ class HybridMemoryBackend:
                 raise ValueError("Missing CosmosDB configuration")
 
             # Initialize CosmosDB client
-            self.cosmos_client = CosmosClient(endpoint, key)
+            self.cosmos_client = get_cosmos_client(endpoint, key)
             self.database = self.cosmos_client.get_database_client(database_name)
             self.container = self.database.get_container_client(container_name)
 
@@ -96,7 +240,7 @@ class HybridMemoryBackend:
         """Save FAISS index to file"""
         try:
             if self.index is not None:
-                faiss.write_index(self.index, INDEX_FILE)
+                faiss.write_index(self.index, self.index_file)
                 logger.debug(f"Saved FAISS index with {self.index.ntotal} vectors")
         except Exception as e:
             logger.error(f"Error saving FAISS index: {e}")
@@ -114,8 +258,9 @@ class HybridMemoryBackend:
             embedding = np.ascontiguousarray(embedding.reshape(1, -1), dtype=np.float32)
 
             # Add to FAISS index and get the index
-            self.index.add(embedding)
-            vector_id = self.index.ntotal - 1
+            with self._lock:
+                self.index.add(embedding)
+                vector_id = self.index.ntotal - 1
 
             # Prepare metadata for CosmosDB
             metadata = {
@@ -128,9 +273,12 @@ class HybridMemoryBackend:
 
             # Store metadata in CosmosDB
             self.container.upsert_item(metadata)
+            self.metadata_cache.put(metadata)
 
             # Save FAISS index
-            self._save_faiss_index()
+            with self._lock:
+                self._save_faiss_index()
+            self.promoter.maybe_promote()
 
             logger.debug(f"Stored content {content_id} with vector_id {vector_id}")
 
@@ -138,8 +286,82 @@ class HybridMemoryBackend:
             logger.error(f"Error storing content: {e}")
             raise
 
-    def semantic_search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict]:
-        """Search using FAISS and fetch metadata from CosmosDB"""
+    def store_many(
+        self,
+        content_ids: List[str],
+        text_contents: List[str],
+        embeddings: np.ndarray,
+        extra_metas: Optional[List[Dict]] = None,
+        max_workers: int = 16,
+    ) -> BulkReport:
+        """Bulk-store chunks: one FAISS add and save, concurrent Cosmos upserts
+
+        Args:
+            content_ids: Chunk identifiers
+            text_contents: Chunk texts, one per id
+            embeddings: Stacked embedding matrix of shape (n, dimension)
+            extra_metas: Optional per-chunk metadata dicts
+            max_workers: Maximum concurrent upsert requests
+
+        Returns:
+            BulkReport: Upsert counts, failed ids and throughput. Chunks whose
+                upsert failed have a vector but no document, so they are not
+                returned by searches.
+        """
+        count = len(content_ids)
+        if extra_metas is None:
+            extra_metas = [None] * count
+        if len(text_contents) != count or len(extra_metas) != count:
+            raise ValueError("content_ids, text_contents and extra_metas must align")
+        if count == 0:
+            return BulkReport(operation="upsert")
+
+        embeddings = np.ascontiguousarray(
+            np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
+        )
+        with self._lock:
+            first_id = self.index.ntotal
+            self.index.add(embeddings)
+
+        timestamp = datetime.utcnow().isoformat()
+        documents = [
+            {
+                "id": content_id,
+                "content": text_content,
+                "vector_id": first_id + i,
+                "timestamp": timestamp,
+                "meta": extra_meta or {},
+            }
+            for i, (content_id, text_content, extra_meta) in enumerate(
+                zip(content_ids, text_contents, extra_metas)
+            )
+        ]
+        report = bulk_upsert(self.container, documents, max_workers=max_workers)
+        failed = report.failed_keys
+        for document in documents:
+            if document["id"] not in failed:
+                self.metadata_cache.put(document)
+
+        with self._lock:
+            self._save_faiss_index()
+        self.promoter.maybe_promote()
+        return report
+
+    def semantic_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> List[Dict]:
+        """Search using FAISS and fetch metadata from CosmosDB
+
+        Args:
+            query_embedding: Query vector
+            k: Number of results
+            nprobe: IVF lists to visit (default from index_config)
+            ef_search: HNSW search breadth (default from index_config)
+        """
         try:
             # Ensure query embedding is numpy array and right shape
             if isinstance(query_embedding, str):
@@ -151,36 +373,30 @@ class HybridMemoryBackend:
             )
 
             # Search with FAISS
-            D, I = self.index.search(query_embedding, k)
+            index = self.index
+            params = search_parameters(
+                index,
+                nprobe if nprobe is not None else self.index_config.nprobe,
+                ef_search if ef_search is not None else self.index_config.ef_search,
+            )
+            D, I = index.search(query_embedding, k, params=params)
 
-            # Get results with metadata from CosmosDB
-            results = []
-            for score, vector_id in zip(D[0], I[0]):
-                try:
-                    # Query CosmosDB for metadata using vector_id
-                    query = f"SELECT * FROM c WHERE c.vector_id = {vector_id}"
-                    items = list(
-                        self.container.query_items(
-                            query=query, enable_cross_partition_query=True
-                        )
-                    )
-
-                    if items:
-                        metadata = items[0]
-                        result = {
-                            "content": metadata["content"],
-                            "meta": metadata["meta"],
-                            "distance": float(score),
-                            "vector_id": vector_id,
-                            "timestamp": metadata["timestamp"],
-                        }
-                        results.append(result)
+            # Get results with metadata from CosmosDB (one query for all hits)
+            hits = [(float(s), int(v)) for s, v in zip(D[0], I[0]) if v >= 0]
+            documents = self._fetch_metadata([vector_id for _, vector_id in hits])
 
-                except Exception as e:
-                    logger.error(
-                        f"Error fetching metadata for vector_id {vector_id}: {e}"
-                    )
-                    continue
+            results = []
+            for score, vector_id in hits:
+                metadata = documents.get(vector_id)
+                if metadata:
+                    result = {
+                        "content": metadata["content"],
+                        "meta": metadata["meta"],
+                        "distance": score,
+                        "vector_id": vector_id,
+                        "timestamp": metadata["timestamp"],
+                    }
+                    results.append(result)
 
             return results
 
@@ -188,6 +404,62 @@ class HybridMemoryBackend:
             logger.error(f"Error in semantic search: {e}")
             return []
 
+    def _fetch_metadata(self, vector_ids: List[int]) -> Dict[int, Dict]:
+        """Metadata documents of vector ids: cache first, then one Cosmos query
+
+        Args:
+            vector_ids: FAISS ids of the search hits
+
+        Returns:
+            Dict[int, Dict]: vector_id -> document for ids that have one
+        """
+        version = self.metadata_cache.version
+        documents, missing = self.metadata_cache.get_many(vector_ids)
+        if not missing:
+            return documents
+
+        try:
+            items = self.container.query_items(
+                query=self.METADATA_QUERY,
+                parameters=[{"name": "@vector_ids", "value": missing}],
+                enable_cross_partition_query=True,
+            )
+            fetched = {item["vector_id"]: item for item in items}
+        except Exception as e:
+            logger.error(f"Error fetching metadata for vector_ids {missing}: {e}")
+            return documents
+
+        self.metadata_cache.fill(
+            {vector_id: fetched.get(vector_id) for vector_id in missing}, version
+        )
+        documents.update(fetched)
+        return documents
+
+    def delete(self, content_ids: List[str]) -> int:
+        """Delete metadata documents by content id
+
+        FAISS-vektorit jäävät indeksiin, mutta niillä ei enää ole
+        dokumenttia, joten ne eivät päädy hakutuloksiin.
+
+        Args:
+            content_ids: Ids of stored content
+
+        Returns:
+            int: Number of deleted documents
+        """
+        deleted = 0
+        try:
+            for content_id in content_ids:
+                try:
+                    self.container.delete_item(content_id, partition_key=content_id)
+                    deleted += 1
+                except Exception as e:
+                    if getattr(e, "status_code", None) != 404:
+                        raise
+        finally:
+            self.metadata_cache.invalidate(content_ids)
+        return deleted
+
     def get_saved_files(self) -> List[str]:
         """Get list of unique filenames from CosmosDB"""
         try:
@@ -231,25 +503,36 @@ class HybridMemoryBackend:
             logger.error(f"Error saving file {filename}: {e}")
             return False
 
-    def reset_index(self):
-        """Reset both FAISS index and CosmosDB container"""
+    def reset_index(self, max_workers: int = 16) -> BulkReport:
+        """Reset both FAISS index and CosmosDB container
+
+        Args:
+            max_workers: Maximum concurrent delete requests
+
+        Returns:
+            BulkReport: Delete counts and throughput
+
+        Raises:
+            RuntimeError: If some documents could not be deleted
+        """
         try:
             # Reset FAISS
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self._save_faiss_index()
+            with self._lock:
+                self.index = self._new_index()
+                self._save_faiss_index()
+                self.promoter.invalidate()
+                # Tunnisteet alkavat alusta, joten vanhat rivit ovat vääriä
+                self.metadata_cache.clear()
 
             # Reset CosmosDB (delete all items)
-            query = "SELECT c.id FROM c"
-            items = list(
-                self.container.query_items(
-                    query=query, enable_cross_partition_query=True
-                )
+            report = bulk_delete(
+                self.container, "SELECT c.id FROM c", max_workers=max_workers
             )
-
-            for item in items:
-                self.container.delete_item(item["id"], partition_key=item["id"])
+            if report.failed:
+                raise RuntimeError(report.summary())
 
             logger.info("Reset both FAISS index and CosmosDB container")
+            return report
 
         except Exception as e:
             logger.error(f"Error resetting indexes: {e}")
@@ -0,0 +1,918 @@
+"""
+FAISS Index Factory
+
+Yhteinen tehdas vektorivarastojen FAISS-indekseille. Kaikki varastot
+(FaissMemoryBackend, HybridMemoryBackend, VectorStore) käyttivät aiemmin
+brute-force Flat-indeksiä, jonka hakuaika kasvaa lineaarisesti korpuksen
+mukana. Tämä moduuli tarjoaa:
+
+1. IndexConfig - indeksityypin ja hakuparametrien asetukset
+2. build_index - Flat-, IVF-Flat- ja HNSW-indeksien luonti ja koulutus otoksella
+3. search_parameters - nprobe/efSearch-säätö hakuhetkellä
+4. IndexPromoter - Flat-indeksin taustalla tehtävä uudelleenrakennus
+   ANN-indeksiksi, kun vektorien määrä ylittää kynnysarvon
+5. recall_latency_report - recall@k vs. viive -raportti asetusten valintaan
+6. Kvantisointi (SQ8 / PQ) - vektorit tallennetaan indeksiin pakattuina
+   (SQ8 ~4x, PQ ~16x pienempi kuin float32), ja lyhyt ehdokaslista
+   voidaan järjestää uudelleen tarkoilla float-vektoreilla (exact_rerank),
+   jotka varasto pitää levyllä muistikartoitettuna (VectorSidecar)
+7. build_id_index / remove_ids - pysyvillä int64-tunnisteilla osoitetut
+   indeksit, joista yksittäisen dokumentin vektorit voi poistaa ilman
+   koko indeksin uudelleenrakennusta (IdMapPromoter ylentää ne)
+8. Suodatettu haku (search_index(subset=...)) - pieni osajoukko
+   pisteytetään suoraan omista vektoreistaan, suurempi haetaan FAISS:n
+   IDSelectorilla niin, että suodatus tapahtuu indeksin läpikäynnin aikana
+
+Komentoriviltä raportin voi ajaa tallennetulle FaissMemoryBackendille;
+se näyttää myös kvantisoinnin recall-menetyksen ja vektorikohtaisen koon:
+    python -m agentformer.storage.memory.backends.index_factory --storage-dir DIR
+"""
+
+import argparse
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "sq8", "pq")
+
+# IVF tarvitsee riittävän otoksen klusterien kouluttamiseen
+MIN_IVF_TRAINING = 1_000
+
+# Kvantisoijien koulutusotos: PQ kouluttaa 256 keskusta per alivektori
+MIN_QUANT_TRAINING = {"sq8": 1_000, "pq": 10_000}
+
+
+@dataclass
+class IndexConfig:
+    """FAISS-indeksin asetukset"""
+
+    index_type: str = "flat"  # flat/ivf/hnsw/auto
+    metric: str = "ip"  # ip (kosini normalisoiduilla vektoreilla) / l2
+
+    # IVF-asetukset
+    nlist: int = 0  # 0 = valitaan automaattisesti otoksen koon mukaan
+    nprobe: int = 8  # Montako klusteria haetaan oletuksena
+
+    # HNSW-asetukset
+    hnsw_m: int = 32  # Naapureiden määrä per solmu
+    ef_construction: int = 64
+    ef_search: int = 64  # Hakujonon pituus oletuksena
+
+    # Kvantisointi
+    quantization: str = "none"  # none/sq8/pq
+    pq_m: int = 0  # PQ-alivektorien määrä, 0 = dimension // 4 (~16x pakkaus)
+    rerank_factor: int = (
+        4  # Ehdokkaita k * rerank_factor tarkkaan uudelleenjärjestykseen, 0 = pois
+    )
+
+    # Suodatettu haku: enintään näin monen vektorin osajoukko pisteytetään
+    # suoraan, suuremmat haetaan indeksistä IDSelectorilla
+    exact_filter_limit: int = 4_096
+
+    # Copy-on-write-julkaisu (ks. index_snapshot.py): lisäykset kerätään
+    # deltaan, joka yhdistetään pohjan kopioon, kun se ylittää
+    # max(cow_delta_min, cow_delta_fraction * pohjan koko) riviä
+    cow_delta_min: int = 1_024
+    cow_delta_fraction: float = 0.05
+
+    # Koulutus
+    train_sample_size: int = 50_000  # Koulutusotoksen maksimikoko
+
+    # Automaattinen ylennys (index_type="auto"): tyyppi -> vektorimäärä
+    promote_at: Dict[str, int] = field(
+        default_factory=lambda: {"hnsw": 20_000, "ivf": 500_000}
+    )
+
+
+def faiss_metric(config: IndexConfig) -> int:
+    """Map metric name to FAISS metric constant"""
+    if config.metric == "ip":
+        return faiss.METRIC_INNER_PRODUCT
+    if config.metric == "l2":
+        return faiss.METRIC_L2
+    raise ValueError(f"Unknown metric: {config.metric}")
+
+
+def choose_index_type(ntotal: int, config: IndexConfig) -> str:
+    """Pick index type for a corpus size
+
+    Args:
+        ntotal: Number of vectors
+        config: Index configuration
+
+    Returns:
+        str: One of INDEX_TYPES
+    """
+    if config.index_type == "auto":
+        chosen, chosen_at = "flat", -1
+        for index_type, threshold in config.promote_at.items():
+            if ntotal >= threshold > chosen_at:
+                chosen, chosen_at = index_type, threshold
+    else:
+        chosen = config.index_type
+
+    if chosen == "ivf" and ntotal < MIN_IVF_TRAINING:
+        return "flat"
+    return chosen
+
+
+def choose_quantization(ntotal: int, config: IndexConfig) -> str:
+    """Pick vector encoding for a corpus size
+
+    Kvantisoija koulutetaan vasta kun otos on riittävän suuri; sitä
+    ennen vektorit pidetään float32-muodossa.
+
+    Returns:
+        str: One of QUANTIZATIONS
+    """
+    quantization = config.quantization
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    if quantization != "none" and ntotal < MIN_QUANT_TRAINING[quantization]:
+        return "none"
+    return quantization
+
+
+def pq_subquantizers(dimension: int, config: IndexConfig) -> int:
+    """Number of PQ sub-vectors (must divide the dimension)"""
+    m = config.pq_m or max(1, dimension // 4)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def build_index(
+    dimension: int,
+    config: IndexConfig,
+    index_type: Optional[str] = None,
+    training_vectors: Optional[np.ndarray] = None,
+    quantization: str = "none",
+) -> faiss.Index:
+    """Create an empty (trained) index
+
+    Args:
+        dimension: Vector dimension
+        config: Index configuration
+        index_type: Override for config.index_type ("auto" builds flat)
+        training_vectors: Vectors to train IVF and quantizers on; a sample is used
+        quantization: Vector encoding, one of QUANTIZATIONS
+
+    Returns:
+        faiss.Index: Empty index ready for add()
+    """
+    index_type = index_type or config.index_type
+    if index_type == "auto":
+        index_type = "flat"
+    metric = faiss_metric(config)
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    pq_m = pq_subquantizers(dimension, config)
+
+    if index_type == "flat":
+        if quantization == "sq8":
+            index = faiss.IndexScalarQuantizer(dimension, sq8, metric)
+        elif quantization == "pq":
+            index = faiss.IndexPQ(dimension, pq_m, 8, metric)
+        elif metric == faiss.METRIC_INNER_PRODUCT:
+            return faiss.IndexFlatIP(dimension)
+        else:
+            return faiss.IndexFlatL2(dimension)
+
+    elif index_type == "hnsw":
+        if quantization == "sq8":
+            index = faiss.IndexHNSWSQ(dimension, sq8, config.hnsw_m, metric)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dimension, pq_m, config.hnsw_m, 8, metric)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, metric)
+        index.hnsw.efConstruction = config.ef_construction
+        index.hnsw.efSearch = config.ef_search
+        if quantization == "none":
+            return index
+
+    elif index_type == "ivf":
+        if training_vectors is None or len(training_vectors) == 0:
+            raise ValueError("IVF index needs training vectors")
+        nlist = config.nlist or default_nlist(
+            min(len(training_vectors), config.train_sample_size)
+        )
+        coarse = build_index(dimension, config, "flat")
+        if quantization == "sq8":
+            index = faiss.IndexIVFScalarQuantizer(coarse, dimension, nlist, sq8, metric)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(coarse, dimension, nlist, pq_m, 8, metric)
+        else:
+            index = faiss.IndexIVFFlat(coarse, dimension, nlist, metric)
+        index.nprobe = config.nprobe
+        # Suora kartta mahdollistaa reconstruct()-kutsut uudelleenrakennuksessa
+        index.make_direct_map()
+
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    if training_vectors is None or len(training_vectors) == 0:
+        raise ValueError(f"{quantization} index needs training vectors")
+    index.train(sample_vectors(training_vectors, config.train_sample_size))
+    return index
+
+
+def default_nlist(num_training: int) -> int:
+    """Choose IVF list count so that every list gets enough training points"""
+    return max(1, min(int(4 * math.sqrt(num_training)), num_training // 39))
+
+
+def sample_vectors(vectors: np.ndarray, sample_size: int) -> np.ndarray:
+    """Take a random training sample"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) <= sample_size:
+        return vectors
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(vectors), size=sample_size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def index_kind(index: faiss.Index) -> str:
+    """Return "flat", "ivf" or "hnsw" for an index"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def index_quantization(index: faiss.Index) -> str:
+    """Return "none", "sq8" or "pq" for an index"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def search_parameters(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    selector: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    """Build per-query search parameters for an index
+
+    Args:
+        index: Index that will be searched
+        nprobe: IVF lists to visit
+        ef_search: HNSW search queue length
+        selector: Restrict the search to the selected ids; the caller must
+            keep it alive for the duration of the search
+
+    Returns:
+        SearchParameters or None when defaults are fine
+    """
+    kind = index_kind(index)
+    extra = {"sel": selector} if selector is not None else {}
+    if kind == "ivf" and (nprobe is not None or extra):
+        if nprobe is not None:
+            extra["nprobe"] = nprobe
+        return faiss.SearchParametersIVF(**extra)
+    if kind == "hnsw" and (ef_search is not None or extra):
+        if ef_search is not None:
+            extra["efSearch"] = ef_search
+        return faiss.SearchParametersHNSW(**extra)
+    if extra:
+        return faiss.SearchParameters(**extra)
+    return None
+
+
+def supports_selector(index: faiss.Index) -> bool:
+    """Whether an index accepts an IDSelector in its search parameters"""
+    # IndexPQ hylkää hakuparametrit kokonaan
+    return not (index_kind(index) == "flat" and index_quantization(index) == "pq")
+
+
+def reconstruct_all(index: faiss.Index, start: int = 0, end: Optional[int] = None):
+    """Copy stored vectors out of an index"""
+    end = index.ntotal if end is None else end
+    if end <= start:
+        return np.empty((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    return index.reconstruct_n(start, end - start)
+
+
+def empty_like(index: faiss.Index) -> faiss.Index:
+    """Return an empty index of the same type, keeping IVF training"""
+    clone = faiss.clone_index(index)
+    clone.reset()
+    return clone
+
+
+def remove_positions(
+    index: faiss.Index,
+    positions: Sequence[int],
+    kept_vectors: Optional[Callable[[], np.ndarray]] = None,
+) -> faiss.Index:
+    """Remove vectors by position and keep remaining positions contiguous
+
+    Flat-indeksi tiivistää rivit itse. IVF ei siirrä tunnisteita ja HNSW
+    ei tue poistoa lainkaan, joten niille rakennetaan indeksi uudelleen
+    säilytetyistä vektoreista.
+
+    Args:
+        index: Index to remove from
+        positions: Row positions to remove
+        kept_vectors: Returns exact vectors of the kept rows; by default they
+            are reconstructed from the (possibly quantized) index
+
+    Returns:
+        faiss.Index: Index without the removed positions (may be a new object)
+    """
+    if index_kind(index) == "flat":
+        index.remove_ids(np.array(positions, dtype=np.int64))
+        return index
+
+    if kept_vectors is not None:
+        vectors = kept_vectors()
+    else:
+        keep = np.ones(index.ntotal, dtype=bool)
+        keep[list(positions)] = False
+        vectors = reconstruct_all(index)[keep]
+    rebuilt = empty_like(index)
+    if len(vectors):
+        rebuilt.add(vectors)
+    return rebuilt
+
+
+def build_id_index(
+    dimension: int,
+    config: IndexConfig,
+    index_type: Optional[str] = None,
+    training_vectors: Optional[np.ndarray] = None,
+    quantization: str = "none",
+) -> faiss.Index:
+    """Create an empty index addressed by stable int64 ids (add_with_ids)
+
+    IVF tallentaa tunnisteet itse; hajautustaulu-tyyppinen suora kartta
+    mahdollistaa poiston ja reconstruct()-kutsut tunnisteella. Muut
+    tyypit kääritään IndexIDMap2:een.
+    """
+    index = build_index(dimension, config, index_type, training_vectors, quantization)
+    if index_kind(index) == "ivf":
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def stored_ids(index: faiss.Index) -> np.ndarray:
+    """Ids stored in an index built with build_id_index"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    invlists = index.invlists
+    ids = [
+        faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+        for i in range(index.nlist)
+        if invlists.list_size(i)
+    ]
+    if not ids:
+        return np.empty(0, dtype=np.int64)
+    return np.sort(np.concatenate(ids).astype(np.int64))
+
+
+def reconstruct_ids(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """Copy vectors out of an id-addressed index"""
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(ids)
+
+
+def remove_ids(
+    index: faiss.Index,
+    ids: Sequence[int],
+    kept_vectors: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+) -> faiss.Index:
+    """Remove vectors by id from an index built with build_id_index
+
+    Flat- ja IVF-indekseistä poistetaan vain annetut tunnisteet. HNSW ei
+    tue poistoa, joten se rakennetaan uudelleen säilytetyistä vektoreista.
+
+    Args:
+        index: Index to remove from
+        ids: Ids to remove
+        kept_vectors: Returns exact vectors for an array of kept ids (HNSW only)
+
+    Returns:
+        faiss.Index: Index without the removed ids (may be a new object)
+    """
+    ids = np.asarray(list(ids), dtype=np.int64)
+    if index_kind(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    kept = stored_ids(index)
+    kept = kept[~np.isin(kept, ids)]
+    if kept_vectors is not None:
+        vectors = kept_vectors(kept)
+    else:
+        vectors = reconstruct_ids(index, kept)
+    rebuilt = empty_like(index)
+    if len(kept):
+        rebuilt.add_with_ids(vectors, kept)
+    return rebuilt
+
+
+class IndexPromoter:
+    """Rebuilds a store's index into an ANN index in a background thread
+
+    Tyhjä varasto aloittaa Flat-indeksillä (IVF tarvitsee koulutusdataa,
+    ja "auto"-tilassa ylennys tapahtuu vasta kynnysarvojen ylittyessä).
+    Omistaja (vektorivarasto) kutsuu maybe_promote() jokaisen lisäyksen
+    jälkeen ja invalidate() jokaisen poiston tai nollauksen jälkeen.
+    Uusi indeksi koulutetaan ja täytetään ilman lukkoa; lopuksi lukon
+    alla siihen lisätään rakennuksen aikana tulleet vektorit ja se
+    asennetaan install-callbackilla. Jos välissä on poistettu rivejä,
+    rakennus hylätään ja yritetään myöhemmin uudelleen.
+
+    Samalla mekanismilla float-indeksi vaihdetaan kvantisoituun, kun
+    kvantisoijan koulutusotos on kertynyt. Jos varasto pitää tarkat
+    vektorit tallessa, get_vectors antaa ne, jotta uutta indeksiä ei
+    rakenneta jo kertaalleen kvantisoiduista vektoreista.
+
+    Varasto, jonka rivit ovat osin copy-on-write-deltassa (ks.
+    index_snapshot.py), antaa get_count-callbackin kaikkien rivien
+    määrälle ja fold-callbackin, joka yhdistää deltan pohjaindeksiin
+    ennen rakennusta.
+    """
+
+    def __init__(
+        self,
+        config: IndexConfig,
+        lock,
+        get_index: Callable[[], faiss.Index],
+        install: Callable[[faiss.Index], None],
+        get_vectors: Optional[Callable[[int, int], np.ndarray]] = None,
+        get_count: Optional[Callable[[], int]] = None,
+        fold: Optional[Callable[[], None]] = None,
+    ):
+        self.config = config
+        self._lock = lock
+        self._get_index = get_index
+        self._install = install
+        self._get_vectors = get_vectors
+        self._get_count = get_count
+        self._fold = fold
+        self._version = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def invalidate(self):
+        """Mark in-flight rebuilds stale (rows were removed)"""
+        self._version += 1
+
+    def maybe_promote(self, background: bool = True) -> Optional[Tuple[str, str]]:
+        """Start a rebuild if the corpus crossed a promotion threshold
+
+        Returns:
+            tuple: Target (index type, quantization) if a rebuild was started
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return None
+
+        index = self._get_index()
+        ntotal = self._get_count() if self._get_count is not None else index.ntotal
+        target = (
+            choose_index_type(ntotal, self.config),
+            choose_quantization(ntotal, self.config),
+        )
+        if target == (index_kind(index), index_quantization(index)):
+            return None
+        if self._fold is not None and index.ntotal < ntotal:
+            # Rakennus lukee pohjaindeksin, joten delta-rivit yhdistetään siihen
+            with self._lock:
+                self._fold()
+
+        if background:
+            self._thread = threading.Thread(
+                target=self._run, args=(target,), name="faiss-promote", daemon=True
+            )
+            self._thread.start()
+        else:
+            self._run(target)
+        return target
+
+    def wait(self):
+        """Wait for a running rebuild"""
+        if self._thread is not None:
+            self._thread.join()
+
+    def _vectors(self, index: faiss.Index, start: int, end: Optional[int] = None):
+        """Exact vectors from the store if available, else from the index"""
+        end = index.ntotal if end is None else end
+        if self._get_vectors is not None:
+            return self._get_vectors(start, end)
+        return reconstruct_all(index, start, end)
+
+    def _contents(self, index: faiss.Index):
+        """Vectors to rebuild from, plus a marker for catching up later"""
+        return self._vectors(index, 0), index.ntotal
+
+    def _build(self, index, index_type, quantization, vectors, marker):
+        promoted = build_index(index.d, self.config, index_type, vectors, quantization)
+        promoted.add(vectors)
+        return promoted
+
+    def _catch_up(self, promoted, current, marker):
+        """Add vectors written to the current index during the rebuild"""
+        if current.ntotal > marker:
+            promoted.add(self._vectors(current, marker))
+
+    def _run(self, target: Tuple[str, str]):
+        index_type, quantization = target
+        name = index_type if quantization == "none" else f"{index_type}+{quantization}"
+        try:
+            with self._lock:
+                index = self._get_index()
+                version = self._version
+                vectors, marker = self._contents(index)
+
+            started = time.time()
+            promoted = self._build(index, index_type, quantization, vectors, marker)
+
+            with self._lock:
+                if self._version != version:
+                    logger.info(f"Discarded {name} rebuild, rows were removed")
+                    return
+                self._catch_up(promoted, self._get_index(), marker)
+                self._install(promoted)
+
+            logger.info(
+                f"Promoted index to {name} with {promoted.ntotal} vectors "
+                f"in {time.time() - started:.1f}s"
+            )
+        except Exception as e:
+            logger.error(f"Index promotion to {name} failed: {e}")
+
+
+class IdMapPromoter(IndexPromoter):
+    """IndexPromoter for indexes built with build_id_index
+
+    Tunnisteet säilyvät uudelleenrakennuksessa. get_vectors saa
+    tunnistetaulukon ja palauttaa niiden tarkat vektorit. Tunnisteet
+    oletetaan kasvaviksi, joten rakennuksen aikana lisätyt vektorit
+    tunnistetaan suuremmasta tunnisteesta.
+    """
+
+    def _vectors_for(self, index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+        if self._get_vectors is not None:
+            return self._get_vectors(ids)
+        return reconstruct_ids(index, ids)
+
+    def _contents(self, index: faiss.Index):
+        ids = stored_ids(index)
+        return self._vectors_for(index, ids), ids
+
+    def _build(self, index, index_type, quantization, vectors, marker):
+        promoted = build_id_index(
+            index.d, self.config, index_type, vectors, quantization
+        )
+        if len(marker):
+            promoted.add_with_ids(vectors, marker)
+        return promoted
+
+    def _catch_up(self, promoted, current, marker):
+        ids = stored_ids(current)
+        if len(marker):
+            ids = ids[ids > marker.max()]
+        if len(ids):
+            promoted.add_with_ids(self._vectors_for(current, ids), ids)
+
+
+def exact_rerank(
+    queries: np.ndarray,
+    candidate_ids: np.ndarray,
+    fetch: Callable[[np.ndarray], np.ndarray],
+    k: int,
+    config: IndexConfig,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Rescore candidate lists against exact float vectors
+
+    Args:
+        queries: Query vectors (nq, d)
+        candidate_ids: Candidate positions from the compressed index (nq, kk),
+            -1 for missing
+        fetch: Returns float vectors for an array of positions
+        k: Result list length
+        config: Index configuration (metric)
+
+    Returns:
+        tuple: (scores, ids) arrays of shape (nq, k) ordered like FAISS results
+    """
+    nq, kk = candidate_ids.shape
+    valid = candidate_ids >= 0
+    rows = np.where(valid, candidate_ids, 0)
+    vectors = fetch(rows.ravel()).reshape(nq, kk, -1)
+
+    if faiss_metric(config) == faiss.METRIC_INNER_PRODUCT:
+        scores = np.einsum("qkd,qd->qk", vectors, queries)
+        scores = np.where(valid, scores, -np.inf)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    else:
+        scores = ((vectors - queries[:, None, :]) ** 2).sum(axis=2)
+        scores = np.where(valid, scores, np.inf)
+        order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+
+    ids = np.take_along_axis(np.where(valid, candidate_ids, -1), order, axis=1)
+    return np.take_along_axis(scores, order, axis=1).astype(np.float32), ids
+
+
+def search_subset(
+    index: faiss.Index,
+    queries: np.ndarray,
+    subset: np.ndarray,
+    k: int,
+    config: IndexConfig,
+    fetch: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Score queries against a small set of ids only
+
+    Args:
+        index: Index holding the ids (used when fetch is not given)
+        queries: Query vectors (nq, d)
+        subset: Ids (positions or stored ids) to score
+        k: Result list length
+        config: Index configuration (metric)
+        fetch: Returns exact float vectors for ids
+
+    Returns:
+        tuple: (scores, ids) like faiss.Index.search, padded with -1
+    """
+    nq = len(queries)
+    subset = np.asarray(subset, dtype=np.int64)
+    out_scores = np.full((nq, k), np.nan, dtype=np.float32)
+    out_ids = np.full((nq, k), -1, dtype=np.int64)
+    if len(subset) == 0:
+        return out_scores, out_ids
+
+    if fetch is not None:
+        vectors = np.asarray(fetch(subset), dtype=np.float32)
+    else:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+        vectors = index.reconstruct_batch(subset)
+
+    if faiss_metric(config) == faiss.METRIC_INNER_PRODUCT:
+        scores = queries @ vectors.T
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    else:
+        scores = (
+            (queries**2).sum(axis=1)[:, None]
+            - 2 * queries @ vectors.T
+            + (vectors**2).sum(axis=1)[None, :]
+        )
+        order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+
+    found = order.shape[1]
+    out_scores[:, :found] = np.take_along_axis(scores, order, axis=1)
+    out_ids[:, :found] = subset[order]
+    return out_scores, out_ids
+
+
+def search_index(
+    index: faiss.Index,
+    queries: np.ndarray,
+    k: int,
+    config: IndexConfig,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    fetch: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    subset: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Search an index with query-time tuning and optional exact re-ranking
+
+    Kvantisoidusta indeksistä haetaan k * rerank_factor ehdokasta, jotka
+    järjestetään uudelleen tarkoilla vektoreilla, jos fetch on annettu.
+
+    Args:
+        index: Index to search
+        queries: Query vectors (nq, d)
+        k: Result list length
+        config: Index configuration (defaults for nprobe/ef_search, rerank_factor)
+        nprobe: IVF lists to visit
+        ef_search: HNSW search breadth
+        fetch: Returns exact float vectors for positions
+        subset: Only return these ids (e.g. from MetadataIndex.match)
+
+    Returns:
+        tuple: (scores, ids) like faiss.Index.search
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    selector = None
+    if subset is not None:
+        if len(subset) <= config.exact_filter_limit or not supports_selector(index):
+            return search_subset(index, queries, subset, k, config, fetch)
+        selector = faiss.IDSelectorBatch(np.asarray(subset, dtype=np.int64))
+
+    rerank = (
+        fetch is not None
+        and config.rerank_factor > 0
+        and index_quantization(index) != "none"
+    )
+    fetch_k = k * config.rerank_factor if rerank else k
+    fetch_k = max(1, min(fetch_k, index.ntotal))
+    ef_search = ef_search if ef_search is not None else config.ef_search
+    params = search_parameters(
+        index,
+        nprobe if nprobe is not None else config.nprobe,
+        max(ef_search, fetch_k),
+        selector,
+    )
+    scores, ids = index.search(queries, fetch_k, params=params)
+    if not rerank:
+        return scores, ids
+    return exact_rerank(queries, ids, fetch, k, config)
+
+
+def recall_latency_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    config: Optional[IndexConfig] = None,
+    nprobe_values: Sequence[int] = (1, 4, 8, 16, 32),
+    ef_search_values: Sequence[int] = (16, 32, 64, 128, 256),
+    quantizations: Sequence[str] = ("sq8", "pq"),
+) -> List[Dict]:
+    """Measure recall@k, latency and size of index settings against exact search
+
+    Args:
+        vectors: Corpus vectors
+        queries: Query vectors
+        k: Result list length
+        config: Base index configuration (metric, nlist, hnsw_m, pq_m,
+            rerank_factor)
+        nprobe_values: IVF settings to try
+        ef_search_values: HNSW settings to try
+        quantizations: Compressed encodings to try, with and without re-ranking
+
+    Returns:
+        List of dicts with index, setting, recall, latency_ms and
+        bytes_per_vector
+    """
+    config = config or IndexConfig()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+    dimension = vectors.shape[1]
+
+    exact = build_index(dimension, config, "flat")
+    exact.add(vectors)
+    report = [_measure(exact, queries, k, config, "flat", "exact", None)]
+    truth = report[0].pop("ids")
+
+    if len(vectors) >= 39:
+        ivf = build_index(dimension, config, "ivf", vectors)
+        ivf.add(vectors)
+        for nprobe in nprobe_values:
+            report.append(
+                _measure(
+                    ivf, queries, k, config, "ivf", f"nprobe={nprobe}", truth, nprobe
+                )
+            )
+
+    hnsw = build_index(dimension, config, "hnsw")
+    hnsw.add(vectors)
+    for ef_search in ef_search_values:
+        report.append(
+            _measure(
+                hnsw,
+                queries,
+                k,
+                config,
+                "hnsw",
+                f"efSearch={ef_search}",
+                truth,
+                ef_search=max(ef_search, k),
+            )
+        )
+
+    # Kvantisoitu Flat-indeksi ilman ja tarkalla uudelleenjärjestyksellä
+    fetch = vectors.__getitem__
+    rerank_factor = config.rerank_factor or 4
+    for quantization in quantizations:
+        if len(vectors) < MIN_QUANT_TRAINING[quantization]:
+            continue
+        compressed = build_index(dimension, config, "flat", vectors, quantization)
+        compressed.add(vectors)
+        report.append(
+            _measure(compressed, queries, k, config, quantization, "no rerank", truth)
+        )
+        reranked = replace(config, rerank_factor=rerank_factor)
+        report.append(
+            _measure(
+                compressed,
+                queries,
+                k,
+                reranked,
+                quantization,
+                f"rerank x{rerank_factor}",
+                truth,
+                fetch=fetch,
+            )
+        )
+
+    return report
+
+
+def _measure(
+    index,
+    queries,
+    k,
+    config,
+    name,
+    setting,
+    truth,
+    nprobe=None,
+    ef_search=None,
+    fetch=None,
+) -> Dict:
+    """Time one search setting and compare it to the exact result"""
+    started = time.perf_counter()
+    _, ids = search_index(index, queries, k, config, nprobe, ef_search, fetch)
+    elapsed = time.perf_counter() - started
+
+    row = {
+        "index": name,
+        "setting": setting,
+        "latency_ms": 1000 * elapsed / max(len(queries), 1),
+        "bytes_per_vector": len(faiss.serialize_index(index)) / max(index.ntotal, 1),
+    }
+    if truth is None:
+        row["recall"] = 1.0
+        row["ids"] = ids
+    else:
+        hits = sum(
+            len(set(found) & set(expected)) for found, expected in zip(ids, truth)
+        )
+        row["recall"] = hits / truth.size
+    return row
+
+
+def format_report(report: List[Dict]) -> str:
+    """Format a report as a plain text table"""
+    lines = [f"{'index':<8}{'setting':<16}{'recall':>8}{'ms/query':>10}{'B/vec':>9}"]
+    for row in report:
+        lines.append(
+            f"{row['index']:<8}{row['setting']:<16}"
+            f"{row['recall']:>8.3f}{row['latency_ms']:>10.3f}"
+            f"{row['bytes_per_vector']:>9.0f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Print a recall, latency and size report for a stored FaissMemoryBackend"""
+    from .faiss_backend import FaissMemoryBackend
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--storage-dir", help="Memory storage directory")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pq-m", type=int, default=0, help="PQ sub-vectors")
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    backend = FaissMemoryBackend(storage_dir=args.storage_dir, read_mostly=True)
+    if backend.vectors is not None:
+        vectors = backend.vectors.take(np.arange(len(backend.vectors)))
+    else:
+        vectors = reconstruct_all(backend.index)
+    if len(vectors) == 0:
+        print("Index is empty")
+        return
+
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    config = replace(
+        backend.index_config, pq_m=args.pq_m, rerank_factor=args.rerank_factor
+    )
+    report = recall_latency_report(vectors, vectors[rows], k=args.k, config=config)
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+IndexSnapshot
+
+Copy-on-write -julkaisu FAISS-indekseille (RCU-tyyli). Vektorivarasto
+julkaisee lukijoille muuttumattoman IndexSnapshotin; kirjoittaja ei
+koskaan muokkaa julkaistua indeksiä, vaan rakentaa muutoksista uuden
+sukupolven ja vaihtaa sen yhdellä viittauksen sijoituksella. Lukija
+ottaa viittauksen talteen haun alussa eikä tarvitse lukkoa: se näkee
+joko vanhan tai uuden sukupolven, ei koskaan puolivalmista indeksiä.
+
+Jokaisen kirjoituksen kopiointi olisi O(n), joten:
+1. Lisäykset kerätään muuttumattomiin delta-lohkoihin, jotka haetaan
+   brute-forcena pohjaindeksin rinnalla. Uusi sukupolvi jakaa vanhan
+   lohkot ja lisää niihin yhden, joten lisäys ei kopioi aiempia rivejä
+2. Kun delta kasvaa yli max(cow_delta_min, cow_delta_fraction * pohjan
+   koko) rivin, se yhdistetään pohjan kopioon. Kopiointikustannus
+   jakautuu näin lisäyksille, ja yksittäinen store() on tasattuna O(1)
+
+Poistot ja uudelleenrakennukset tehdään aina kopioon (writable_index).
+Lataus- ja journalin toistovaiheessa, kun lukijoita ei vielä ole,
+in_place=True muokkaa indeksiä suoraan.
+"""
+
+from dataclasses import dataclass, replace
+from functools import cached_property
+from typing import Callable, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from .index_factory import (
+    IndexConfig,
+    faiss_metric,
+    search_index,
+    search_subset,
+)
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Immutable published index generation: base index plus exact delta rows"""
+
+    index: faiss.Index
+    # Pohjaindeksiin vielä yhdistämättömät vektorit ja niiden tunnisteet
+    # lohkoina (rivipaikat tai pysyvät tunnisteet, kasvavassa järjestyksessä)
+    delta_chunks: Tuple[np.ndarray, ...] = ()
+    delta_id_chunks: Tuple[np.ndarray, ...] = ()
+    # True: pohjaan lisätään add_with_ids, False: add (paikkaosoitus)
+    with_ids: bool = False
+    delta_count: int = 0
+
+    @classmethod
+    def of(cls, index: faiss.Index, with_ids: bool = False) -> "IndexSnapshot":
+        """Snapshot of an index without delta rows"""
+        return cls(index, with_ids=with_ids)
+
+    @cached_property
+    def delta(self) -> np.ndarray:
+        """Delta rows as one matrix, built on first use"""
+        if not self.delta_chunks:
+            return np.empty((0, self.index.d), dtype=np.float32)
+        if len(self.delta_chunks) == 1:
+            return self.delta_chunks[0]
+        return np.concatenate(self.delta_chunks)
+
+    @cached_property
+    def delta_ids(self) -> np.ndarray:
+        """Ids of the delta rows, built on first use"""
+        if not self.delta_id_chunks:
+            return np.empty(0, dtype=np.int64)
+        if len(self.delta_id_chunks) == 1:
+            return self.delta_id_chunks[0]
+        return np.concatenate(self.delta_id_chunks)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + self.delta_count
+
+    def with_index(self, index: faiss.Index) -> "IndexSnapshot":
+        """Same delta rows on top of another base index (e.g. a promoted one)"""
+        return replace(self, index=index)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        config: IndexConfig,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        fetch: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        subset: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Search base index and delta rows and merge the results
+
+        Arguments are the same as in index_factory.search_index.
+        """
+        if not self.delta_count:
+            return search_index(
+                self.index, queries, k, config, nprobe, ef_search, fetch, subset
+            )
+
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        delta_subset = self.delta_ids
+        base_subset = None
+        if subset is not None:
+            subset = np.asarray(subset, dtype=np.int64)
+            in_delta = np.isin(subset, self.delta_ids)
+            delta_subset = subset[in_delta]
+            base_subset = subset[~in_delta]
+
+        results = [
+            search_subset(None, queries, delta_subset, k, config, self._delta_rows)
+        ]
+        if self.index.ntotal and (base_subset is None or len(base_subset)):
+            results.append(
+                search_index(
+                    self.index,
+                    queries,
+                    k,
+                    config,
+                    nprobe,
+                    ef_search,
+                    fetch,
+                    base_subset,
+                )
+            )
+        return merge_results(results, k, config)
+
+    def _delta_rows(self, ids: np.ndarray) -> np.ndarray:
+        return self.delta[np.searchsorted(self.delta_ids, ids)]
+
+
+def merge_results(
+    results, k: int, config: IndexConfig
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge (scores, ids) result arrays into the best k per query"""
+    scores = np.concatenate([s for s, _ in results], axis=1)
+    ids = np.concatenate([i for _, i in results], axis=1)
+    if faiss_metric(config) == faiss.METRIC_INNER_PRODUCT:
+        keys = np.where(ids >= 0, -np.nan_to_num(scores, nan=-np.inf), np.inf)
+    else:
+        keys = np.where(ids >= 0, np.nan_to_num(scores, nan=np.inf), np.inf)
+    order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(
+        ids, order, axis=1
+    )
+
+
+def _fold(snapshot: IndexSnapshot, in_place: bool) -> faiss.Index:
+    """Base index with the delta rows added (a copy unless in_place)"""
+    index = snapshot.index if in_place else faiss.clone_index(snapshot.index)
+    if snapshot.delta_count:
+        if snapshot.with_ids:
+            index.add_with_ids(snapshot.delta, snapshot.delta_ids)
+        else:
+            index.add(snapshot.delta)
+    return index
+
+
+def add_to_snapshot(
+    snapshot: IndexSnapshot,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    config: IndexConfig,
+    in_place: bool = False,
+) -> IndexSnapshot:
+    """Return a new generation with vectors added
+
+    Args:
+        snapshot: Current generation
+        vectors: Vectors to add (n, d)
+        ids: Their positions or ids (must be larger than any existing one)
+        config: Index configuration (cow_delta_min, cow_delta_fraction)
+        in_place: Modify the current index (no readers yet)
+
+    Returns:
+        IndexSnapshot: New generation
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    grown = IndexSnapshot(
+        snapshot.index,
+        snapshot.delta_chunks + (vectors,),
+        snapshot.delta_id_chunks + (ids,),
+        snapshot.with_ids,
+        snapshot.delta_count + len(ids),
+    )
+    limit = max(config.cow_delta_min, snapshot.index.ntotal * config.cow_delta_fraction)
+    if in_place or grown.delta_count > limit:
+        return IndexSnapshot.of(_fold(grown, in_place), snapshot.with_ids)
+    return grown
+
+
+def writable_index(snapshot: IndexSnapshot, in_place: bool = False) -> faiss.Index:
+    """Private index holding every row of a generation, safe to modify"""
+    return _fold(snapshot, in_place)
+
+
+def folded(snapshot: IndexSnapshot, in_place: bool = False) -> IndexSnapshot:
+    """Same generation with the delta rows moved into the base index"""
+    if not snapshot.delta_count:
+        return snapshot
+    return IndexSnapshot.of(_fold(snapshot, in_place), snapshot.with_ids)
@@ -1,17 +1,141 @@
+"""
+LocalJsonMemoryBackend
+
+Paikallinen tiedostopohjainen muisti kahdessa muodossa:
+
+- "json": koko historia yhtenä JSON-taulukkona. Jokainen store() lukee
+  ja kirjoittaa koko tiedoston, joten kirjoitus on O(n) ja rinnakkaiset
+  kirjoittajat voivat hukata toistensa tietueita
+- "jsonl": yksi tietue per rivi. store() lisää rivin tiedoston loppuun
+  tiedostolukon alla (O(1)), ja muistissa pidetään rivien alkukohtien
+  indeksi satunnaishakua varten. retrieve_all() lukee tietueet
+  generaattorina, joten koko historiaa ei ladata kerralla muistiin
+
+Muoto päätellään tiedostopäätteestä (.jsonl), ellei sitä anneta. Jos
+jsonl-tilassa avattava tiedosto sisältää vanhan JSON-taulukon, se
+muunnetaan kerran rivimuotoon (ks. migrate_to_jsonl).
+
+Muiden prosessien lisäämät rivit luetaan indeksiin, kun tiedosto on
+kasvanut indeksoidun kohdan yli. Kesken jäänyt viimeinen rivi (kaatunut
+kirjoittaja) jätetään lukematta ja leikataan pois seuraavassa
+kirjoituksessa.
+
+Tiedostolukko otetaan erilliseen <path>.lock-tiedostoon eikä
+datatiedostoon: migraatio korvaa datatiedoston os.replace():lla, jolloin
+vanhaan inodeen otettu lukko ei suojaisi uutta tiedostoa ja lukkoa
+odottanut kirjoittaja lisäisi rivinsä poistettuun tiedostoon.
+"""
+
 import json
 import os
-from typing import List, Dict, Any
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock on the sidecar <path>.lock, released when the block exits"""
+    with open(f"{path}.lock", "ab") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            return
+
+        # msvcrt lukitsee tavualueen; kaikki kirjoittajat lukitsevat tavun 0
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _is_json_array(path: str) -> bool:
+    """Whether a file holds the legacy JSON array format"""
+    with open(path, "rb") as f:
+        return f.read(64).lstrip()[:1] == b"["
+
+
+def migrate_to_jsonl(source: str, target: Optional[str] = None) -> int:
+    """Convert a JSON array file to JSON Lines
+
+    Args:
+        source: Path of the JSON array file
+        target: Output path, defaults to replacing source in place
+
+    Returns:
+        int: Number of migrated records
+    """
+    with open(source, "r", encoding="utf-8") as f:
+        records = json.load(f)
+
+    target = target or source
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, "wb") as f:
+        for record in records:
+            f.write(_encode(record))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target)
+    return len(records)
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
 
 
 class LocalJsonMemoryBackend:
-    def __init__(self, filepath: str = "local_memory.json"):
+    def __init__(
+        self, filepath: str = "local_memory.json", storage_format: Optional[str] = None
+    ):
+        """Open or create a local memory file
+
+        Args:
+            filepath: Memory file path
+            storage_format: "json" (array) or "jsonl" (append-only lines);
+                inferred from the file extension when omitted
+        """
         self.filepath = filepath
+        if storage_format is None:
+            storage_format = "jsonl" if filepath.endswith(".jsonl") else "json"
+        if storage_format not in ("json", "jsonl"):
+            raise ValueError(f"Unknown storage format: {storage_format}")
+        self.storage_format = storage_format
+
+        # jsonl: rivien alkukohdat ja ensimmäisen indeksoimattoman tavun kohta
+        self._offsets = array("Q")
+        self._indexed_end = 0
+        self._lock = threading.Lock()
+
         # Luodaan tiedosto, jos sitä ei ole
         if not os.path.exists(self.filepath):
-            with open(self.filepath, "w", encoding="utf-8") as f:
-                json.dump([], f)
+            if self.storage_format == "json":
+                with open(self.filepath, "w", encoding="utf-8") as f:
+                    json.dump([], f)
+            else:
+                open(self.filepath, "ab").close()
+        elif self.storage_format == "jsonl" and _is_json_array(self.filepath):
+            with _file_lock(self.filepath):
+                # Toinen prosessi on voinut ehtiä muuntaa tiedoston
+                if _is_json_array(self.filepath):
+                    migrate_to_jsonl(self.filepath)
 
     def store(self, data: Dict[str, Any]) -> None:
+        if self.storage_format == "jsonl":
+            self._append(data)
+            return
         # Lue
         records = self._read_all()
         # Lisää
@@ -19,11 +143,88 @@ class LocalJsonMemoryBackend:
         # Kirjoita
         self._write_all(records)
 
-    def retrieve_all(self) -> List[Dict[str, Any]]:
+    def retrieve_all(self) -> Union[List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+        """All records in write order
+
+        Returns:
+            A list in json format, a lazily read generator in jsonl format
+        """
+        if self.storage_format == "jsonl":
+            return self._iter_records()
         return self._read_all()
 
+    def get(self, position: int) -> Dict[str, Any]:
+        """Record at a write-order position (negative counts from the end)"""
+        if self.storage_format == "json":
+            return self._read_all()[position]
+        with self._lock:
+            self._catch_up()
+            offset = self._offsets[position]
+        with open(self.filepath, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def __len__(self) -> int:
+        if self.storage_format == "json":
+            return len(self._read_all())
+        with self._lock:
+            self._catch_up()
+            return len(self._offsets)
+
     def clear(self):
-        self._write_all([])
+        if self.storage_format == "json":
+            self._write_all([])
+            return
+        with self._lock, _file_lock(self.filepath), open(self.filepath, "ab") as f:
+            f.truncate(0)
+            self._offsets = array("Q")
+            self._indexed_end = 0
+
+    def _append(self, data: Dict[str, Any]) -> None:
+        line = _encode(data)
+        with self._lock, _file_lock(self.filepath), open(self.filepath, "ab") as f:
+            self._catch_up()
+            end = f.seek(0, os.SEEK_END)
+            if end > self._indexed_end:
+                # Kaatuneen kirjoittajan keskeneräinen rivi
+                f.truncate(self._indexed_end)
+            f.write(line)
+            f.flush()
+            self._offsets.append(self._indexed_end)
+            self._indexed_end += len(line)
+
+    def _catch_up(self) -> None:
+        """Index complete lines appended since the last scan (lock held)"""
+        size = os.path.getsize(self.filepath)
+        if size < self._indexed_end:
+            # Toinen prosessi on tyhjentänyt tiedoston
+            self._offsets = array("Q")
+            self._indexed_end = 0
+        if size == self._indexed_end:
+            return
+        with open(self.filepath, "rb") as f:
+            f.seek(self._indexed_end)
+            position = self._indexed_end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._offsets.append(position)
+                position += len(line)
+        self._indexed_end = position
+
+    def _iter_records(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            self._catch_up()
+            end = self._indexed_end
+        with open(self.filepath, "rb") as f:
+            position = 0
+            # Vain lukemisen alkaessa valmiit rivit
+            while position < end:
+                line = f.readline()
+                if not line:
+                    break
+                position += len(line)
+                yield json.loads(line)
 
     def _read_all(self) -> List[Dict[str, Any]]:
         with open(self.filepath, "r", encoding="utf-8") as f:
@@ -0,0 +1,145 @@
+"""
+MetadataIndex
+
+Käänteinen indeksi metadatakentistä vektoritunnisteisiin suodatettua
+hakua varten. Jokaiselle kentän arvolle pidetään joukko tunnisteita
+(FaissMemoryBackendissa rivipaikkoja, VectorStoressa pysyviä int64-
+tunnisteita), joten suodattimen täyttävät tunnisteet saadaan ilman
+koko metadatan läpikäyntiä.
+
+Suodatin on sanakirja kenttä -> arvo tai kenttä -> arvojen lista:
+    {"filename": "manual.pdf"}
+    {"file_type": ["pdf", "docx"], "doc_id": "42"}
+Kenttien ehdot yhdistetään AND-ehdolla, listan arvot OR-ehdolla.
+
+file_type päätellään tiedostonimen päätteestä, jos metadatassa ei
+ole sitä erikseen. Hakuun tunnisteet viedään FAISS:n IDSelectorilla
+(ks. index_factory.search_index).
+
+Tunnistelistoja kasvatetaan lisäyksessä paikallaan (list.extend), joten
+store() maksaa vain lisättyjen tunnisteiden verran eikä kopioi koko
+listaa. Poisto korvaa listan suodatetulla kopiolla. Listan kasvattaminen
+ja korvaaminen ovat lukijalle turvallisia, joten yksi kirjoittaja ja
+lukkoa käyttämättömät lukijat (match) voivat käyttää samaa indeksiä yhtä
+aikaa. Lukija voi nähdä julkaisun jälkeen lisättyjä tunnisteita, ja
+kutsujat rajaavat ne pois (FaissMemoryBackend: count, VectorStore:
+next_id).
+"""
+
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+FILTER_FIELDS = ("filename", "doc_id", "file_type")
+
+
+def filter_values(meta: Optional[Dict], fields=FILTER_FIELDS) -> Iterator[Tuple]:
+    """Yield (field, value) pairs of a metadata dict that can be filtered on"""
+    meta = meta or {}
+    for name in fields:
+        value = meta.get(name)
+        if value is None and name == "file_type" and meta.get("filename"):
+            value = os.path.splitext(meta["filename"])[1].lstrip(".").lower() or None
+        if value is not None:
+            yield name, value
+
+
+class MetadataIndex:
+    """Inverted index from metadata field values to vector ids"""
+
+    def __init__(self, fields=FILTER_FIELDS):
+        self.fields = tuple(fields)
+        self.postings: Dict[str, Dict[Any, List[int]]] = {f: {} for f in self.fields}
+
+    def add(self, vector_id: int, meta: Optional[Dict]):
+        """Index the filterable fields of one vector"""
+        self.add_many([vector_id], [meta])
+
+    def add_many(self, vector_ids: Iterable[int], metas: Iterable[Optional[Dict]]):
+        """Index many vectors"""
+        for (name, value), ids in self._group(vector_ids, metas).items():
+            postings = self.postings[name]
+            old = postings.get(value)
+            if old is None:
+                postings[value] = ids
+            else:
+                old.extend(ids)
+
+    def remove(self, vector_id: int, meta: Optional[Dict]):
+        """Drop one vector from the postings it was indexed under"""
+        self.remove_many([vector_id], [meta])
+
+    def remove_many(self, vector_ids: Iterable[int], metas: Iterable[Optional[Dict]]):
+        """Drop many vectors from the postings they were indexed under"""
+        for (name, value), ids in self._group(vector_ids, metas).items():
+            postings = self.postings[name]
+            old = postings.get(value)
+            if old is None:
+                continue
+            drop = set(ids)
+            kept = [i for i in old if i not in drop]
+            if kept:
+                postings[value] = kept
+            else:
+                postings.pop(value, None)
+
+    def _group(self, vector_ids, metas) -> Dict[Tuple, List[int]]:
+        """Group ids by the (field, value) postings they belong to"""
+        grouped: Dict[Tuple, List[int]] = {}
+        for vector_id, meta in zip(vector_ids, metas):
+            for key in filter_values(meta, self.fields):
+                grouped.setdefault(key, []).append(vector_id)
+        return grouped
+
+    def clear(self):
+        """Remove all postings"""
+        self.postings = {f: {} for f in self.fields}
+
+    def ids(self, name: str, value: Any) -> Set[int]:
+        """Ids indexed under a single field value"""
+        return set(self.postings[name].get(value, ()))
+
+    def values(self, name: str) -> Iterable[Any]:
+        """Distinct indexed values of a field"""
+        return self.postings[name].keys()
+
+    def match(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Ids matching every field condition of a filter
+
+        Args:
+            filter: Field -> value, or field -> list of accepted values
+
+        Returns:
+            np.ndarray: Sorted int64 ids
+
+        Raises:
+            ValueError: If the filter uses a field that is not indexed
+        """
+        unknown = set(filter) - set(self.fields)
+        if unknown:
+            raise ValueError(
+                f"Cannot filter on {sorted(unknown)}, indexed fields are "
+                f"{list(self.fields)}"
+            )
+
+        groups = []
+        for name, accepted in filter.items():
+            if not isinstance(accepted, (list, tuple, set, frozenset)):
+                accepted = [accepted]
+            postings = self.postings[name]
+            sets = (postings.get(v) for v in accepted)
+            groups.append([ids for ids in sets if ids is not None])
+
+        # Pienin ehto ensin, jolloin leikkaus pysyy pienenä
+        groups.sort(key=lambda sets: sum(len(s) for s in sets))
+        result: Optional[Set[int]] = None
+        for sets in groups:
+            union = set().union(*sets)
+            result = union if result is None else result & union
+            if not result:
+                break
+
+        if not result:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.fromiter(result, dtype=np.int64, count=len(result)))
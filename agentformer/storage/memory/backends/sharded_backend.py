@@ -0,0 +1,450 @@
+"""
+ShardedMemoryBackend
+
+Vektorikokoelman jakaminen (sharding) usealle paikalliselle
+työprosessille. Yhden prosessin brute-force-haku käyttää vain yhtä
+ydintä; kun kokoelma kasvaa kymmeniin miljooniin chunkeihin, jokainen
+prosessi pitää oman osansa (shard) ja haku tehdään kaikissa osissa
+rinnakkain (scatter-gather).
+
+Rakenne:
+1. Jokainen shard on tavallinen FaissMemoryBackend omassa kokoelmassaan
+   collections/<name>.<i>/ ja elää omassa työprosessissaan
+2. Chunk ohjataan shardiin content_id:n CRC32-tiivisteellä, joten sama
+   tunniste päätyy aina samaan shardiin (poisto löytää sen)
+3. Kysely lähetetään kaikille shardeille yhtä aikaa, ja kunkin shardin
+   top-k-listat yhdistetään kekoon perustuvalla lomituksella (heapq.merge)
+
+Read-mostly-tilassa (oletus) shardien snapshotit avataan muistikartoitettuna,
+joten indeksin sivut jaetaan käyttöjärjestelmän sivuvälimuistin kautta
+eikä niitä kopioida prosessien muistiin.
+
+Shardien määrä tallennetaan collections/<name>.shards.json-tiedostoon;
+kokoelmaa ei voi avata eri shardimäärällä, koska reititys muuttuisi.
+
+Käyttö:
+    backend = ShardedMemoryBackend(name="corpus", num_shards=8)
+    backend.store_many(ids, texts, embeddings, metas)
+    results = backend.semantic_search(query_embedding, k=5)
+    backend.close()
+
+Tulokset ovat samaa muotoa kuin FaissMemoryBackend.semantic_searchissa.
+"""
+
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import zlib
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from .faiss_backend import FaissMemoryBackend, query_matrix
+from .faiss_journal import atomic_write
+from .index_factory import IndexConfig, faiss_metric
+from ..path_manager import PathManager
+
+logger = logging.getLogger(__name__)
+
+# Työprosessin sallimat FaissMemoryBackend-kutsut
+_SHARD_OPS = {
+    "store_many",
+    "semantic_search_batch",
+    "delete",
+    "count",
+    "compact",
+    "reset_index",
+    "resident_bytes",
+}
+
+
+def shard_of(content_id: str, num_shards: int) -> int:
+    """Shard that owns a content id (stable across processes and restarts)"""
+    return zlib.crc32(str(content_id).encode("utf-8")) % num_shards
+
+
+def merge_top_k(
+    result_lists: Sequence[List[Dict]], k: int, higher_is_better: bool
+) -> List[Dict]:
+    """Merge per-shard result lists, each already sorted best first
+
+    Args:
+        result_lists: semantic_search results of every shard for one query
+        k: Number of results to keep
+        higher_is_better: True for inner product scores, False for L2 distances
+
+    Returns:
+        List[Dict]: The best k results over all shards
+    """
+    if higher_is_better:
+        key = lambda result: -result["distance"]
+    else:
+        key = lambda result: result["distance"]
+    return list(islice(heapq.merge(*result_lists, key=key), k))
+
+
+def _shard_worker(
+    conn,
+    storage_dir: Optional[str],
+    namespace: str,
+    index_config: IndexConfig,
+    read_mostly: bool,
+    threads: int,
+):
+    """Serve FaissMemoryBackend calls for one shard until closed"""
+    # Rinnakkaisuus tulee prosesseista, joten OpenMP-säikeitä ei ylitilata
+    faiss.omp_set_num_threads(threads)
+    try:
+        backend = FaissMemoryBackend(
+            storage_dir=storage_dir,
+            read_mostly=read_mostly,
+            index_config=index_config,
+            namespace=namespace,
+        )
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ok", None))
+
+    while True:
+        try:
+            op, args = conn.recv()
+        except EOFError:
+            break
+        if op == "close":
+            backend.close()
+            conn.send(("ok", None))
+            break
+        try:
+            if op not in _SHARD_OPS:
+                raise ValueError(f"Unknown shard operation: {op}")
+            conn.send(("ok", getattr(backend, op)(*args)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class ShardedMemoryBackend:
+    """Vector collection partitioned across local worker processes"""
+
+    def __init__(
+        self,
+        name: str = "sharded",
+        num_shards: Optional[int] = None,
+        storage_dir: Optional[str] = None,
+        index_config: Optional[IndexConfig] = None,
+        read_mostly: bool = True,
+        threads_per_shard: int = 1,
+    ):
+        """Start one worker process per shard
+
+        Args:
+            name: Collection name; shards are stored as collections <name>.<i>
+            num_shards: Number of shards (default: CPU count, or the count
+                the collection was created with)
+            storage_dir: Memory storage directory (default storage/memory)
+            index_config: Index configuration of every shard
+            read_mostly: Open shard snapshots memory-mapped
+            threads_per_shard: FAISS OpenMP threads in each worker
+
+        Raises:
+            ValueError: If the name is invalid or num_shards differs from the
+                count the collection was created with
+            RuntimeError: If a worker fails to start
+        """
+        PathManager.validate_namespace(name)
+        self.name = name
+        self.storage_dir = storage_dir
+        self.index_config = index_config or IndexConfig()
+        self.num_shards = self._load_shard_count(num_shards)
+        self._higher_is_better = (
+            faiss_metric(self.index_config) == faiss.METRIC_INNER_PRODUCT
+        )
+
+        # Spawn: työprosessi ei peri emon säikeitä eikä OpenMP-tilaa
+        context = multiprocessing.get_context("spawn")
+        self._conns = []
+        self._workers = []
+        self._locks = [threading.Lock() for _ in range(self.num_shards)]
+        for i in range(self.num_shards):
+            parent_conn, child_conn = context.Pipe()
+            worker = context.Process(
+                target=_shard_worker,
+                args=(
+                    child_conn,
+                    storage_dir,
+                    self.shard_namespace(i),
+                    self.index_config,
+                    read_mostly,
+                    threads_per_shard,
+                ),
+                name=f"faiss-shard-{name}-{i}",
+                daemon=True,
+            )
+            worker.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._workers.append(worker)
+
+        # Odotetaan, että jokainen shard on ladattu
+        startup = self._gather({i: None for i in range(self.num_shards)})
+        if any(status != "ok" for status, _ in startup.values()):
+            self.close()
+            self._raise_errors(startup)
+        logger.info(f"Started {self.num_shards} shards for collection {name}")
+
+    def shard_namespace(self, shard: int) -> str:
+        """Collection name of one shard"""
+        return f"{self.name}.{shard:03d}"
+
+    def _manifest_path(self) -> str:
+        collection_path = PathManager.get_collection_path(self.name, self.storage_dir)
+        return os.path.join(
+            os.path.dirname(collection_path), f"{self.name}.shards.json"
+        )
+
+    def _load_shard_count(self, num_shards: Optional[int]) -> int:
+        """Read or record the shard count of the collection"""
+        path = self._manifest_path()
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                stored = json.load(f)["num_shards"]
+            if num_shards is not None and num_shards != stored:
+                raise ValueError(
+                    f"Collection {self.name} has {stored} shards, "
+                    f"cannot open it with {num_shards}"
+                )
+            return stored
+
+        num_shards = num_shards or os.cpu_count() or 1
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps({"num_shards": num_shards}).encode("utf-8"))
+        return num_shards
+
+    def store(
+        self,
+        content_id: str,
+        text_content: str,
+        embedding: np.ndarray,
+        extra_meta: Dict = None,
+    ):
+        """Store one chunk in the shard that owns its id"""
+        self.store_many([content_id], [text_content], [embedding], [extra_meta])
+
+    def store_many(
+        self,
+        content_ids: List[str],
+        text_contents: List[str],
+        embeddings: np.ndarray,
+        extra_metas: Optional[List[Dict]] = None,
+    ) -> int:
+        """Store many chunks, each shard receiving its part in parallel
+
+        Args:
+            content_ids: Chunk identifiers (they decide the shard)
+            text_contents: Chunk texts, one per id
+            embeddings: Stacked embedding matrix of shape (n, dimension)
+            extra_metas: Optional per-chunk metadata dicts
+
+        Returns:
+            int: Number of stored chunks
+        """
+        count = len(content_ids)
+        if extra_metas is None:
+            extra_metas = [None] * count
+        if len(text_contents) != count or len(extra_metas) != count:
+            raise ValueError("content_ids, text_contents and extra_metas must align")
+        if count == 0:
+            return 0
+
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
+        shards = np.array([shard_of(c, self.num_shards) for c in content_ids])
+        calls = {}
+        for shard in np.unique(shards).tolist():
+            rows = np.flatnonzero(shards == shard)
+            calls[shard] = (
+                "store_many",
+                (
+                    [content_ids[i] for i in rows],
+                    [text_contents[i] for i in rows],
+                    np.ascontiguousarray(embeddings[rows]),
+                    [extra_metas[i] for i in rows],
+                ),
+            )
+        return sum(self._call(calls).values())
+
+    def delete(self, content_ids: List[str]) -> int:
+        """Delete chunks by content id
+
+        Returns:
+            int: Number of removed chunks
+        """
+        grouped: Dict[int, List[str]] = {}
+        for content_id in content_ids:
+            grouped.setdefault(shard_of(content_id, self.num_shards), []).append(
+                content_id
+            )
+        calls = {shard: ("delete", (ids,)) for shard, ids in grouped.items()}
+        return sum(self._call(calls).values()) if calls else 0
+
+    def semantic_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict]:
+        """Search all shards (see FaissMemoryBackend.semantic_search)"""
+        if isinstance(query_embedding, str):
+            logger.error("Expected numpy array for embedding, got string")
+            return []
+
+        results = self.semantic_search_batch(
+            np.asarray(query_embedding).reshape(1, -1), k, nprobe, ef_search, filter
+        )
+        return results[0] if results else []
+
+    def semantic_search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict]]:
+        """Scatter queries to every shard and merge the per-shard top-k
+
+        Args:
+            query_embeddings: Query vectors, shape (n, dimension); a single
+                1-D vector is one query
+            k: Number of results per query
+            nprobe: IVF lists to visit (IVF indexes only)
+            ef_search: HNSW search queue length (HNSW indexes only)
+            filter: Only search chunks whose meta matches
+
+        Returns:
+            List[List[Dict]]: Result list for each query, in query order
+
+        Raises:
+            ValueError: If query_embeddings has more than two dimensions
+        """
+        if not len(query_embeddings):
+            return []
+        queries = query_matrix(query_embeddings)
+
+        args = (queries, k, nprobe, ef_search, filter)
+        try:
+            replies = self._call(
+                {i: ("semantic_search_batch", args) for i in range(self.num_shards)}
+            )
+        except RuntimeError as e:
+            logger.error(f"Error in sharded search: {e}")
+            return [[] for _ in range(len(queries))]
+
+        return [
+            merge_top_k(
+                [replies[i][q] for i in range(self.num_shards)],
+                k,
+                self._higher_is_better,
+            )
+            for q in range(len(queries))
+        ]
+
+    def count(self) -> int:
+        """Number of chunks over all shards"""
+        return sum(self._call_all("count").values())
+
+    def shard_counts(self) -> List[int]:
+        """Number of chunks in each shard"""
+        counts = self._call_all("count")
+        return [counts[i] for i in range(self.num_shards)]
+
+    def compact(self) -> bool:
+        """Fold every shard's journal into a snapshot
+
+        Returns:
+            bool: True if any shard wrote a new snapshot
+        """
+        return any(self._call_all("compact").values())
+
+    def reset_index(self):
+        """Remove every chunk from every shard"""
+        self._call_all("reset_index")
+
+    def resident_bytes(self) -> int:
+        """Estimated memory held by all shard workers"""
+        return sum(self._call_all("resident_bytes").values())
+
+    def close(self):
+        """Stop the workers (each one closes its journal first)"""
+        alive = {i for i, worker in enumerate(self._workers) if worker.is_alive()}
+        if alive:
+            self._gather({i: ("close", ()) for i in alive})
+        for worker in self._workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._workers = []
+        self._conns = []
+
+    def _call_all(self, op: str, *args) -> Dict[int, Any]:
+        return self._call({i: (op, args) for i in range(self.num_shards)})
+
+    def _call(self, calls: Dict[int, Tuple[str, tuple]]) -> Dict[int, Any]:
+        """Run calls on shards in parallel and return their results
+
+        Raises:
+            RuntimeError: If any shard failed
+        """
+        replies = self._gather(calls)
+        self._raise_errors(replies)
+        return {shard: value for shard, (_, value) in replies.items()}
+
+    def _gather(self, calls: Dict[int, Optional[Tuple[str, tuple]]]) -> Dict:
+        """Send every call first, then collect the replies
+
+        Shardien lukot otetaan aina samassa järjestyksessä, joten
+        samanaikaiset kutsut eivät lukkiudu toisiinsa. None lukee vain
+        vastauksen (käynnistyksen valmiusviesti).
+        """
+        shards = sorted(calls)
+        for shard in shards:
+            self._locks[shard].acquire()
+        try:
+            replies = {}
+            for shard in shards:
+                if calls[shard] is not None:
+                    try:
+                        self._conns[shard].send(calls[shard])
+                    except (OSError, ValueError) as e:
+                        replies[shard] = ("error", f"worker unavailable: {e}")
+            for shard in shards:
+                if shard in replies:
+                    continue
+                try:
+                    replies[shard] = self._conns[shard].recv()
+                except (EOFError, OSError) as e:
+                    replies[shard] = ("error", f"worker exited: {e!r}")
+            return replies
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+
+    def _raise_errors(self, replies: Dict):
+        errors = [
+            f"shard {shard}: {value}"
+            for shard, (status, value) in sorted(replies.items())
+            if status != "ok"
+        ]
+        if errors:
+            raise RuntimeError("; ".join(errors))
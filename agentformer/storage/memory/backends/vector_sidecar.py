@@ -0,0 +1,162 @@
+"""
+VectorSidecar
+
+Tarkat float32-vektorit kvantisoidun FAISS-indeksin rinnalla.
+Kvantisoitu indeksi (SQ8 / PQ) pitää muistissa vain pakatut koodit;
+alkuperäiset vektorit tallennetaan snapshotin yhteydessä .npy-tiedostoon,
+joka luetaan muistikartoitettuna. Haussa vain lyhyen ehdokaslistan
+vektorit luetaan levyltä tarkkaa uudelleenjärjestystä varten.
+
+Tiedosto:
+    faiss_vectors.<seq>.npy   float32-matriisi (n, dimension)
+
+Snapshotin jälkeen lisätyt vektorit pidetään muistissa (tail) seuraavaan
+kompaktointiin asti, samaan tapaan kuin LazyChunkList pitää chunk-tietueet.
+"""
+
+import os
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+
+def write_vectors(path: str, sidecar: "VectorSidecar", block_rows: int = 65_536):
+    """Write all rows of a sidecar to a .npy file atomically
+
+    Args:
+        path: Target file
+        sidecar: Vectors to write (use a frozen() copy when writing concurrently)
+        block_rows: Rows copied per block
+
+    Returns:
+        int: Number of written vectors
+    """
+    count = len(sidecar)
+    tmp_path = f"{path}.tmp"
+    out = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float32, shape=(count, sidecar.dimension)
+    )
+    start = 0
+    for block in sidecar.iter_blocks(block_rows):
+        out[start : start + len(block)] = block
+        start += len(block)
+    out.flush()
+    del out
+
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+class VectorSidecar:
+    """Positional float vector store backed by a mapped file plus an in-memory tail"""
+
+    def __init__(self, dimension: int, path: Optional[str] = None):
+        self.dimension = dimension
+        self.path = path
+        if path:
+            self._base = np.load(path, mmap_mode="r")
+        else:
+            self._base = np.empty((0, dimension), dtype=np.float32)
+        # None = kaikki tiedoston rivit järjestyksessä, muuten säilytetyt rivit
+        self._rows: Optional[np.ndarray] = None
+        self._tail: List[np.ndarray] = []
+        self._tail_array: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self._base_count() + len(self._tail_vectors())
+
+    def extend(self, vectors: np.ndarray):
+        """Append vectors after the last position"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if len(vectors):
+            self._tail.append(vectors)
+            self._tail_array = None
+
+    def drop(self, positions):
+        """Remove vectors at the given positions"""
+        positions = np.asarray(list(positions), dtype=np.int64)
+        base = self._base_count()
+        rows = self._rows if self._rows is not None else np.arange(base)
+        keep = np.ones(base, dtype=bool)
+        keep[positions[positions < base]] = False
+        self._rows = rows[keep]
+
+        tail = self._tail_vectors()
+        keep = np.ones(len(tail), dtype=bool)
+        keep[positions[positions >= base] - base] = False
+        self._tail = [tail[keep]] if keep.any() else []
+        self._tail_array = None
+
+    def take(self, positions) -> np.ndarray:
+        """Read vectors by position
+
+        Args:
+            positions: Array of positions
+
+        Returns:
+            np.ndarray: float32 matrix (len(positions), dimension)
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        base = self._base_count()
+        out = np.empty((len(positions), self.dimension), dtype=np.float32)
+
+        in_base = positions < base
+        if in_base.any():
+            rows = positions[in_base]
+            if self._rows is not None:
+                rows = self._rows[rows]
+            # Järjestetty luku pitää levyhaut peräkkäisinä
+            order = np.argsort(rows, kind="stable")
+            block = np.empty((len(rows), self.dimension), dtype=np.float32)
+            block[order] = self._base[rows[order]]
+            out[in_base] = block
+        if not in_base.all():
+            out[~in_base] = self._tail_vectors()[positions[~in_base] - base]
+        return out
+
+    def range(self, start: int, end: int) -> np.ndarray:
+        """Read vectors for positions start..end-1"""
+        return self.take(np.arange(start, end))
+
+    def frozen(self) -> "VectorSidecar":
+        """Return an independent copy that later mutations do not affect"""
+        copy = VectorSidecar(self.dimension)
+        copy.path = self.path
+        copy._base = self._base
+        # drop() ja extend() eivät muokkaa taulukoita paikallaan, joten
+        # lohkot voidaan jakaa: kopio maksaa vain lohkolistan verran
+        copy._rows = self._rows
+        copy._tail = list(self._tail)
+        copy._tail_array = self._tail_array
+        return copy
+
+    def nbytes_in_memory(self) -> int:
+        """Bytes held in memory (the mapped base file is not counted)"""
+        total = sum(block.nbytes for block in self._tail)
+        if self.path is None:
+            total += self._base.nbytes
+        if self._rows is not None:
+            total += self._rows.nbytes
+        return total
+
+    def iter_blocks(self, block_rows: int = 65_536) -> Iterator[np.ndarray]:
+        """Yield all vectors in position order, block by block"""
+        base = self._base_count()
+        for start in range(0, base, block_rows):
+            yield self.take(np.arange(start, min(start + block_rows, base)))
+        if self._tail:
+            yield self._tail_vectors()
+
+    def _tail_vectors(self) -> np.ndarray:
+        if self._tail_array is None:
+            if self._tail:
+                self._tail_array = np.concatenate(self._tail)
+                self._tail = [self._tail_array]
+            else:
+                self._tail_array = np.empty((0, self.dimension), dtype=np.float32)
+        return self._tail_array
+
+    def _base_count(self) -> int:
+        return len(self._base) if self._rows is None else len(self._rows)
@@ -9,7 +9,18 @@ Key Features:
 - Automatic formation of connections between related nodes
 - Support for associative search and retrieval
 - Active node tracking for recent/relevant information
-- Automatic cleanup of old and weakly connected nodes
+- Automatic cleanup of old and weakly connected nodes; nodes are stored in
+  creation order and the graph flags changed nodes, so cleanup stays
+  proportional to the work due
+- Compact live storage: node attributes live in parallel typed arrays and
+  a text arena (CompactNodeStore, see memory_node_store.py), and the graph
+  keeps embeddings in one float32 matrix and level-0 links in CSR form
+- Bounded-degree similarity graph (see memory_graph.py): a new node links
+  only to its nearest neighbors by embedding, found with an HNSW-style
+  greedy search, so insertion is logarithmic and memory is O(n * M)
+- Top-k spreading-activation retrieval: activation starts from the nodes
+  most similar to the query and spreads best-first along strong, recent
+  links, so the cost depends on k and the hop budget, not on node count
 
 Memory Structure:
 - Nodes: Store actual content with metadata
@@ -26,46 +37,86 @@ The distributed structure allows for organic growth of memory connections
 and efficient retrieval of related information through node traversal.
 """
 
+import heapq
 import time
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 import logging
+import numpy as np
 from .memory_base import BaseMemory
+from .memory_graph import SimilarityGraph, hashed_embedding
+from .memory_node_store import CompactNodeStore
 
 logger = logging.getLogger(__name__)
 
 
 class DistributedMemory(BaseMemory):
-    def __init__(self):
-        self.nodes = {}  # Muistisolmut
+    def __init__(
+        self,
+        embedder: Optional[Callable[[str], np.ndarray]] = None,
+        max_connections: int = 8,
+        ef_construction: int = 48,
+        max_age: float = 30 * 24 * 60 * 60,
+    ):
+        """Initialize distributed memory
+
+        Args:
+            embedder: Text -> embedding vector, defaults to hashed bag of words
+            max_connections: Links per node (M); level 0 allows 2 * M
+            ef_construction: Candidate list length when linking a new node
+            max_age: Seconds after which cleanup removes a node
+        """
         self.connections = {}  # Solmujen väliset yhteydet
-        self.active_nodes = set()  # Aktiiviset solmut
+        self.max_age = max_age
+        self.embedder = embedder or hashed_embedding
+        self.graph = SimilarityGraph(m=max_connections, ef_construction=ef_construction)
+        # Muistisolmut luontijärjestyksessä; yhteydet luetaan graafista
+        self.nodes = CompactNodeStore(graph=self.graph)
         logger.debug("Initialized DistributedMemory")
 
     def store(self, content: Any, memory_type: str = "episodic", **kwargs) -> None:
-        """Store content in distributed nodes"""
+        """Store content in distributed nodes
+
+        An "embedding" keyword argument is used instead of the embedder.
+        """
         node_id = time.time_ns()
-        node = {
-            "content": content,
-            "type": memory_type,
-            "timestamp": time.time(),
-            "metadata": kwargs,
-            "connections": set(),
-        }
+        # time_ns voi toistua karkean kellon alustoilla
+        while node_id in self.nodes:
+            node_id += 1
+        embedding = kwargs.pop("embedding", None)
+        if embedding is None:
+            embedding = self.embedder(str(content))
 
         # Lisää solmu ja yhdistä se relevantteihin solmuihin
-        self.nodes[node_id] = node
-        self._connect_related_nodes(node_id)
-        self.active_nodes.add(node_id)
+        self.nodes.add(node_id, content, memory_type, time.time(), kwargs)
+        self._connect_related_nodes(node_id, embedding)
 
         logger.debug(f"Stored node {node_id}: {content}")
 
-    def retrieve(self, query: str, memory_type: Optional[str] = None) -> List[Dict]:
-        """Retrieve memories through node traversal"""
+    def retrieve(
+        self, query: str, memory_type: Optional[str] = None, k: Optional[int] = None
+    ) -> List[Dict]:
+        """Retrieve memories through node traversal
+
+        Args:
+            query: Substring to match, or free text when k is given
+            memory_type: Only return nodes of this type
+            k: Return the k most activated nodes (see activate) instead of
+                every substring match
+
+        Returns:
+            List[Dict]: Matching nodes
+        """
+        if k is not None:
+            return [
+                self.nodes[node_id]
+                for _, node_id in self.activate(query, k, memory_type=memory_type)
+            ]
+
         results = []
         visited = set()
 
         # Aloita aktiivisista solmuista
-        nodes_to_visit = self.active_nodes.copy()
+        nodes_to_visit = set(self.active_nodes)
 
         while nodes_to_visit:
             node_id = nodes_to_visit.pop()
@@ -87,25 +138,104 @@ class DistributedMemory(BaseMemory):
 
         return results
 
-    def cleanup(self) -> None:
-        """Remove old and weakly connected nodes"""
-        current_time = time.time()
-        max_age = 30 * 24 * 60 * 60  # 30 päivää
-
-        nodes_to_remove = set()
-        for node_id, node in self.nodes.items():
-            # Poista vanhat solmut
-            if current_time - node["timestamp"] > max_age:
-                nodes_to_remove.add(node_id)
+    def activate(
+        self,
+        query: str,
+        k: int = 5,
+        memory_type: Optional[str] = None,
+        max_hops: int = 2,
+        decay: float = 0.8,
+        recency_half_life: float = 7 * 24 * 60 * 60,
+        embedding: Optional[np.ndarray] = None,
+    ) -> List[Tuple[float, int]]:
+        """Best-first spreading activation from the nodes nearest to the query
+
+        Siemensolmut haetaan graafista upotuksen samankaltaisuudella.
+        Naapuri saa aktivaation vanhempi * linkin paino * decay * tuoreus,
+        ja solmut käsitellään prioriteettijonosta suurin aktivaatio
+        ensin. Koska kertoimet ovat enintään 1, haku lopetetaan, kun
+        jonon paras aktivaatio ei enää ylitä k:nneksi parasta tulosta
+        (tulokset ovat vakaat) tai hop-budjetti on käytetty.
+
+        Args:
+            query: Query text
+            k: Number of results
+            memory_type: Only return nodes of this type (others still
+                pass activation on)
+            max_hops: Links followed from a seed at most
+            decay: Activation multiplier per hop
+            recency_half_life: Seconds in which a node's weight halves
+            embedding: Query embedding, computed with the embedder if omitted
+
+        Returns:
+            List of (activation, node_id), most activated first
+        """
+        if embedding is None:
+            embedding = self.embedder(str(query))
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+        now = time.time()
+
+        def recency(node_id: int) -> float:
+            age = max(now - self.nodes.timestamp(node_id), 0.0)
+            return 0.5 ** (age / recency_half_life)
+
+        # Maksimikeko: (-aktivaatio, hypyt, solmu)
+        frontier = [
+            (-max(similarity, 0.0) * recency(node_id), 0, node_id)
+            for similarity, node_id in self.graph.search(embedding, k)
+        ]
+        heapq.heapify(frontier)
+        settled = set()
+        best: List[Tuple[float, int]] = []  # min-keko k parhaasta
+
+        while frontier:
+            negative, hops, node_id = heapq.heappop(frontier)
+            activation = -negative
+            if len(best) >= k and activation <= best[0][0]:
+                break
+            if node_id in settled:
+                continue
+            settled.add(node_id)
+
+            if memory_type is None or self.nodes.node_type(node_id) == memory_type:
+                heapq.heappush(best, (activation, node_id))
+                if len(best) > k:
+                    heapq.heappop(best)
+
+            if hops >= max_hops:
                 continue
+            for neighbor, weight in self.graph.neighbors(node_id).items():
+                if neighbor not in settled and weight > 0:
+                    spread = activation * weight * decay * recency(neighbor)
+                    heapq.heappush(frontier, (-spread, hops + 1, neighbor))
 
-            # Poista heikosti yhdistetyt solmut
-            if len(node["connections"]) < 2:
-                nodes_to_remove.add(node_id)
+        return sorted(best, reverse=True)
 
-        # Päivitä rakenteet
-        for node_id in nodes_to_remove:
+    def cleanup(self) -> None:
+        """Remove old and weakly connected nodes
+
+        Only nodes past max_age (the oldest rows of the node store) and nodes
+        whose links changed since the last cleanup are examined, so the cost
+        does not grow with the total node count.
+        """
+        expired = self.nodes.pop_older(time.time() - self.max_age)
+
+        # Poista heikosti yhdistetyt solmut (vain muuttuneet voivat olla)
+        weak = {
+            node_id
+            for node_id in self.graph.pop_touched()
+            if node_id in self.nodes and self.graph.degree(node_id) < 2
+        }
+
+        # Päivitä rakenteet; vanhentuneet on jo poistettu solmusäilöstä
+        for node_id in expired:
+            self.graph.remove(node_id)
+        for node_id in weak:
             self._remove_node(node_id)
+        nodes_to_remove = weak.union(expired)
 
         logger.info(f"Removed {len(nodes_to_remove)} nodes in cleanup")
 
@@ -115,46 +245,35 @@ class DistributedMemory(BaseMemory):
             "total_nodes": len(self.nodes),
             "active_nodes": len(self.active_nodes),
             "avg_connections": self._get_avg_connections(),
+            "max_connections": self.graph.m0,
             "memory_types": self._get_type_distribution(),
         }
 
-    def _connect_related_nodes(self, node_id: int) -> None:
-        """Connect node to related nodes based on content similarity"""
-        new_node = self.nodes[node_id]
+    @property
+    def active_nodes(self):
+        """Ids of active nodes (every stored node until it is removed)"""
+        return self.nodes.keys()
 
-        for other_id, other_node in self.nodes.items():
-            if other_id == node_id:
-                continue
-
-            # Tässä voisi olla kehittyneempi samankaltaisuuden laskenta
-            if new_node["type"] == other_node["type"]:
-                new_node["connections"].add(other_id)
-                other_node["connections"].add(node_id)
+    def _connect_related_nodes(self, node_id: int, embedding: np.ndarray) -> None:
+        """Link node to its nearest neighbors in the similarity graph"""
+        # Tason 0 linkit ovat solmun yhteydet (nodes[node_id]["connections"])
+        self.graph.add(node_id, embedding)
 
     def _remove_node(self, node_id: int) -> None:
         """Remove node and its connections"""
-        node = self.nodes[node_id]
-
-        # Poista viittaukset muista solmuista
-        for connected_id in node["connections"]:
-            if connected_id in self.nodes:
-                self.nodes[connected_id]["connections"].remove(node_id)
+        # Graafi poistaa linkit molempiin suuntiin ja yhdistää naapurit
+        self.graph.remove(node_id)
 
         # Poista solmu
-        self.nodes.pop(node_id)
-        self.active_nodes.discard(node_id)
+        self.nodes.remove(node_id)
 
     def _get_avg_connections(self) -> float:
         """Calculate average number of connections per node"""
         if not self.nodes:
             return 0.0
-        total = sum(len(node["connections"]) for node in self.nodes.values())
+        total = sum(self.graph.degree(node_id) for node_id in self.nodes)
         return total / len(self.nodes)
 
     def _get_type_distribution(self) -> Dict[str, int]:
         """Get distribution of memory types"""
-        distribution = {}
-        for node in self.nodes.values():
-            mtype = node["type"]
-            distribution[mtype] = distribution.get(mtype, 0) + 1
-        return distribution
+        return self.nodes.type_counts()
@@ -0,0 +1,147 @@
+"""
+Memory Eviction Policies
+
+Kerroskohtaiset poistopolitiikat HierarchicalMemorylle. Kerroksella on
+enimmäiskoko (capacity); kun se ylittyy, politiikka valitsee poistettavan
+muistin. Kaikki kirjanpito on O(1) tai O(log n) per operaatio:
+
+- lru: OrderedDict käyttöjärjestyksessä, vähiten äskettäin käytetty ensin
+- ttl: min-keko vanhenemisajoista; vanhentuneet poistetaan siivouksessa
+  ja kapasiteetin ylittyessä poistetaan ensimmäisenä vanheneva
+- importance: tärkeys puoliintuu ajan kuluessa viimeisestä käytöstä,
+  pisteet = importance * 0.5 ** ((nyt - käytetty) / half_life).
+  Kahden muistin järjestys ei riipu hetkestä "nyt", joten keon avaimeksi
+  kelpaa log2(importance) + käytetty / half_life, eikä kekoa tarvitse
+  päivittää ajan kuluessa
+
+Keot ovat ExpiryScheduler-olioita (ks. memory_expiry.py), joissa
+päivitetty tai poistettu alkio ohitetaan vasta keon kärjessä.
+"""
+
+import math
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .memory_expiry import ExpiryScheduler
+
+
+@dataclass
+class LayerLimits:
+    """Capacity and eviction policy of one memory layer"""
+
+    capacity: Optional[int] = None  # None = rajaton
+    policy: str = "lru"  # lru/ttl/importance
+    ttl: float = 24 * 60 * 60  # ttl: sekunteja tallennuksesta
+    half_life: float = 7 * 24 * 60 * 60  # importance: tärkeyden puoliintumisaika
+
+
+class EvictionPolicy(ABC):
+    """Chooses which entries of a layer to evict"""
+
+    @abstractmethod
+    def add(self, entry_id: int, data: Dict, now: float) -> None:
+        """Start tracking a stored entry"""
+        pass
+
+    def touch(self, entry_id: int, now: float) -> None:
+        """Record an access (retrieval) of an entry"""
+
+    @abstractmethod
+    def remove(self, entry_id: int) -> None:
+        """Stop tracking an evicted or deleted entry"""
+        pass
+
+    @abstractmethod
+    def victim(self) -> Optional[int]:
+        """Entry to evict when the layer is over capacity"""
+        pass
+
+    def expired(self, now: float) -> List[int]:
+        """Entries that must go regardless of capacity"""
+        return []
+
+
+class LRUPolicy(EvictionPolicy):
+    """Evict the least recently stored or retrieved entry"""
+
+    def __init__(self):
+        self._order: "OrderedDict[int, None]" = OrderedDict()
+
+    def add(self, entry_id, data, now):
+        self._order[entry_id] = None
+
+    def touch(self, entry_id, now):
+        if entry_id in self._order:
+            self._order.move_to_end(entry_id)
+
+    def remove(self, entry_id):
+        self._order.pop(entry_id, None)
+
+    def victim(self):
+        return next(iter(self._order), None)
+
+
+class TTLPolicy(EvictionPolicy):
+    """Expire entries a fixed time after they were stored"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._expiry: ExpiryScheduler[int] = ExpiryScheduler()
+
+    def add(self, entry_id, data, now):
+        self._expiry.schedule(entry_id, now + self.ttl)
+
+    def remove(self, entry_id):
+        self._expiry.discard(entry_id)
+
+    def victim(self):
+        head = self._expiry.peek()
+        return head[1] if head else None
+
+    def expired(self, now):
+        # Vain vanhentuneet keon kärjestä: O(k log n)
+        return self._expiry.pop_due(now)
+
+
+class ImportanceDecayPolicy(EvictionPolicy):
+    """Evict the entry with the lowest decayed importance"""
+
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self._scores: ExpiryScheduler[int] = ExpiryScheduler()
+        self._log_importance: Dict[int, float] = {}
+
+    def add(self, entry_id, data, now):
+        importance = data.get("importance", 1.0) if isinstance(data, dict) else 1.0
+        try:
+            importance = float(importance)
+        except (TypeError, ValueError):
+            importance = 1.0
+        self._log_importance[entry_id] = math.log2(max(importance, 1e-9))
+        self.touch(entry_id, now)
+
+    def touch(self, entry_id, now):
+        log_importance = self._log_importance.get(entry_id)
+        if log_importance is not None:
+            self._scores.schedule(entry_id, log_importance + now / self.half_life)
+
+    def remove(self, entry_id):
+        self._log_importance.pop(entry_id, None)
+        self._scores.discard(entry_id)
+
+    def victim(self):
+        head = self._scores.peek()
+        return head[1] if head else None
+
+
+def make_policy(limits: LayerLimits) -> EvictionPolicy:
+    """Create the eviction policy named in layer limits"""
+    if limits.policy == "lru":
+        return LRUPolicy()
+    if limits.policy == "ttl":
+        return TTLPolicy(limits.ttl)
+    if limits.policy == "importance":
+        return ImportanceDecayPolicy(limits.half_life)
+    raise ValueError(f"Unknown eviction policy: {limits.policy}")
@@ -0,0 +1,98 @@
+"""
+Expiry Scheduler
+
+Yhteinen vanhenemisajastin muistirakenteiden siivoukseen
+(LongTermMemory.cleanup, HierarchicalMemoryn TTL-kerrokset ja
+CompactNodeStoren aikajärjestyksestä poikkeavat solmut). Siivous kävi aiemmin läpi kaikki alkiot löytääkseen
+vanhentuneet, joten sitä ajettiin vain harvoin.
+
+Ajastin on min-keko (aika, avain). Jokaisella avaimella on yksi voimassa
+oleva aika; uudelleenajastettu tai poistettu avain jätetään kekoon ja
+ohitetaan, kun se tulee päällimmäiseksi (lazy deletion). Siksi
+- schedule() ja discard() ovat O(log n) / O(1)
+- pop_due(raja) koskee vain erääntyneisiin avaimiin: O(k log n)
+- pop_oldest(k) poistaa k vanhinta avainta: O(k log n), ilman koko
+  joukon järjestämistä
+
+Keko tiivistetään, kun ohitettavia alkioita on enemmän kuin voimassa
+olevia, joten muistia kuluu O(n).
+"""
+
+import heapq
+from typing import Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class ExpiryScheduler(Generic[K]):
+    """Min-heap of keys ordered by time with lazy deletion"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, K]] = []
+        self._times: Dict[K, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def __contains__(self, key) -> bool:
+        return key in self._times
+
+    def time_of(self, key: K) -> Optional[float]:
+        """Scheduled time of a key, None if not scheduled"""
+        return self._times.get(key)
+
+    def schedule(self, key: K, at: float) -> None:
+        """Schedule a key at a time, replacing its earlier time"""
+        if self._times.get(key) == at:
+            return
+        self._times[key] = at
+        heapq.heappush(self._heap, (at, key))
+        if len(self._heap) > 2 * len(self._times) + 64:
+            self._heap = [(t, k) for k, t in self._times.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, key: K) -> None:
+        """Unschedule a key (no-op if missing)"""
+        self._times.pop(key, None)
+
+    def clear(self) -> None:
+        self._heap = []
+        self._times = {}
+
+    def peek(self) -> Optional[Tuple[float, K]]:
+        """Earliest (time, key) without removing it"""
+        heap = self._heap
+        while heap:
+            at, key = heap[0]
+            if self._times.get(key) == at:
+                return at, key
+            heapq.heappop(heap)
+        return None
+
+    def pop(self) -> Optional[Tuple[float, K]]:
+        """Remove and return the earliest (time, key)"""
+        head = self.peek()
+        if head is not None:
+            heapq.heappop(self._heap)
+            del self._times[head[1]]
+        return head
+
+    def pop_due(self, deadline: float) -> List[K]:
+        """Remove and return keys scheduled at or before a deadline"""
+        due = []
+        while True:
+            head = self.peek()
+            if head is None or head[0] > deadline:
+                return due
+            self.pop()
+            due.append(head[1])
+
+    def pop_oldest(self, count: int) -> List[K]:
+        """Remove and return the count earliest keys"""
+        oldest = []
+        while len(oldest) < count:
+            head = self.pop()
+            if head is None:
+                break
+            oldest.append(head[1])
+        return oldest
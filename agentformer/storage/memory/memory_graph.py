@@ -0,0 +1,513 @@
+"""
+Similarity Graph
+
+HNSW-tyyppinen naapurusgraafi DistributedMemoryn solmujen linkitykseen.
+Aiemmin jokainen uusi solmu linkitettiin kaikkiin saman tyypin
+solmuihin: lisäys oli O(n) ja linkkejä kertyi O(n²).
+
+Rakenne:
+1. Jokainen solmu saa satunnaisen tason (eksponentiaalinen jakauma);
+   ylemmillä tasoilla on harvoja solmuja ja pitkiä linkkejä
+2. Lisäys laskeutuu ylimmältä tasolta ahneella haulla ja hakee
+   tasoilla 0..taso ef_construction ehdokasta, joista M lähintä
+   linkitetään. Lisäyksen hinta on noin O(M · log n) vertailua
+3. Linkit ovat symmetrisiä ja painotettuja kosinisamankaltaisuudella.
+   Solmun aste rajataan (M ylätasoilla, 2M tasolla 0) poistamalla
+   heikoin linkki, joten muistia kuluu O(n · M)
+
+Poistossa entiset naapurit yhdistetään toisiinsa, jotta graafi pysyy
+kytkettynä.
+
+Tallennus on rivipohjainen (RowIndex, ks. memory_rows.py), koska
+sanakirjoissa solmu vei vektorin numpy-olion ja linkkien float-olioiden
+kanssa yli kilotavun ennen varsinaista dataa:
+- upotukset ovat yhdessä float32-matriisissa riveittäin, joten haku
+  laskee naapurien samankaltaisuudet yhdellä matriisikertolaskulla
+- taso 0 (kaikki solmut) on CSR-muodossa: indptr, naapuririvit int32 ja
+  painot float32. Uudet solmut ja muuttuneet naapurilistat menevät
+  delta-puskuriin, joka yhdistetään CSR:ään puskurin kasvaessa
+- ylemmät tasot, joilla on vain noin 1/M solmuista, ovat sanakirjoja
+- poistetun solmun rivi jää paikalleen, kunnes kuolleita rivejä on
+  enemmän kuin eläviä; silloin compact() numeroi rivit uudelleen
+"""
+
+import heapq
+import math
+import random
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .memory_index import tokenize
+from .memory_rows import RowIndex
+
+
+def hashed_embedding(text: str, dimension: int = 256) -> np.ndarray:
+    """Normalized bag-of-words vector from hashed tokens
+
+    Kevyt oletus, kun kielimallin embeddingiä ei ole saatavilla:
+    samoja sanoja sisältävät tekstit ovat samankaltaisia.
+    """
+    vector = np.zeros(dimension, dtype=np.float32)
+    for token in tokenize(text):
+        h = zlib.crc32(token.encode("utf-8"))
+        vector[h % dimension] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SimilarityGraph:
+    """Navigable small-world graph with bounded node degree"""
+
+    def __init__(
+        self,
+        m: int = 8,
+        ef_construction: int = 48,
+        seed: Optional[int] = None,
+        compact_threshold: int = 4096,
+    ):
+        """Initialize an empty graph
+
+        Args:
+            m: Links per node on upper levels (2 * m on level 0)
+            ef_construction: Candidate list length during insertion
+            seed: Random seed for level assignment
+            compact_threshold: Delta-buffer size (changed nodes) that triggers
+                a CSR rebuild, at least one eighth of the graph
+        """
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = max(ef_construction, m)
+        self.compact_threshold = compact_threshold
+        self.index = RowIndex()
+        self.levels = array("b")
+        # Upotukset riveittäin; kapasiteetti kasvaa neljänneksen kerrallaan
+        self._vectors: Optional[np.ndarray] = None
+        # Taso 0: CSR (naapuririvit, painot) + delta-puskuri rivi -> listat
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.empty(0, dtype=np.int32)
+        self._weights = np.empty(0, dtype=np.float32)
+        self._delta: Dict[int, Tuple[array, array]] = {}
+        # Tasot 1..: rivi -> {naapuririvi: samankaltaisuus}
+        self._upper: List[Dict[int, Dict[int, float]]] = []
+        self._entry: Optional[int] = None
+        self.distance_computations = 0
+        # Rivit, joiden linkit ovat muuttuneet (siivouksen tarkistettavat)
+        self._touched = bytearray()
+        self._touched_rows = array("i")
+        # Hakujen käyntileimat riveittäin (ei nollata jokaista hakua varten)
+        self._visited = np.zeros(0, dtype=np.uint32)
+        self._epoch = 0
+        self._rng = random.Random(seed)
+        self._level_mult = 1 / math.log(max(m, 2))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, node_id: int) -> bool:
+        return node_id in self.index
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.index)
+
+    @property
+    def entry(self) -> Optional[int]:
+        """Id of the search entry point (a node on the top level)"""
+        return None if self._entry is None else self.index.id_at(self._entry)
+
+    def _require(self, node_id: int) -> int:
+        row = self.index.row(node_id)
+        if row is None:
+            raise KeyError(node_id)
+        return row
+
+    def level(self, node_id: int) -> int:
+        """Highest level of a node"""
+        return self.levels[self._require(node_id)]
+
+    def vector(self, node_id: int) -> np.ndarray:
+        """Normalized embedding of a node (a view, do not modify)"""
+        return self._vectors[self._require(node_id)]
+
+    def vector_matrix(self, node_ids: Sequence[int]) -> np.ndarray:
+        """Embeddings of nodes stacked as a new (len(node_ids), dim) matrix"""
+        rows = [self._require(node_id) for node_id in node_ids]
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._vectors[rows]
+
+    def neighbors(self, node_id: int, level: int = 0) -> Dict[int, float]:
+        """Links of a node as {neighbor: similarity}"""
+        row = self._require(node_id)
+        if level > self.levels[row]:
+            raise KeyError(node_id)
+        id_at = self.index.id_at
+        return {id_at(other): weight for other, weight in self._items(row, level)}
+
+    def degree(self, node_id: int, level: int = 0) -> int:
+        """Number of links of a node"""
+        return self._degree(self._require(node_id), level)
+
+    def pop_touched(self) -> List[int]:
+        """Ids of live nodes whose links changed since the last call"""
+        rows, self._touched_rows = self._touched_rows, array("i")
+        touched, alive, id_at = self._touched, self.index.alive, self.index.id_at
+        changed = []
+        for row in rows:
+            touched[row] = 0
+            if alive[row]:
+                changed.append(id_at(row))
+        return changed
+
+    # Rivitason linkit: taso 0 CSR:stä tai deltasta, ylätasot sanakirjoista
+
+    def _rows(self, row: int, level: int) -> Sequence[int]:
+        if level:
+            return self._upper[level - 1][row].keys()
+        delta = self._delta.get(row)
+        if delta is not None:
+            return delta[0]
+        if row + 1 < len(self._indptr):
+            return self._indices[self._indptr[row] : self._indptr[row + 1]].tolist()
+        return ()
+
+    def _items(self, row: int, level: int) -> Sequence[Tuple[int, float]]:
+        if level:
+            return list(self._upper[level - 1][row].items())
+        delta = self._delta.get(row)
+        if delta is not None:
+            return list(zip(*delta))
+        if row + 1 < len(self._indptr):
+            start, end = self._indptr[row], self._indptr[row + 1]
+            return list(
+                zip(
+                    self._indices[start:end].tolist(),
+                    self._weights[start:end].tolist(),
+                )
+            )
+        return []
+
+    def _degree(self, row: int, level: int) -> int:
+        if level:
+            return len(self._upper[level - 1][row])
+        delta = self._delta.get(row)
+        if delta is not None:
+            return len(delta[0])
+        if row + 1 < len(self._indptr):
+            return int(self._indptr[row + 1] - self._indptr[row])
+        return 0
+
+    def _edit(self, row: int) -> Tuple[array, array]:
+        """Delta-buffer row of level 0 (copied from CSR on first change)"""
+        delta = self._delta.get(row)
+        if delta is None:
+            neighbors, weights = array("i"), array("f")
+            if row + 1 < len(self._indptr):
+                start, end = self._indptr[row], self._indptr[row + 1]
+                neighbors.frombytes(self._indices[start:end].tobytes())
+                weights.frombytes(self._weights[start:end].tobytes())
+            delta = self._delta[row] = (neighbors, weights)
+        return delta
+
+    def _set_link(self, a: int, b: int, similarity: float, level: int) -> None:
+        if level:
+            self._upper[level - 1][a][b] = similarity
+            return
+        neighbors, weights = self._edit(a)
+        if b in neighbors:
+            weights[neighbors.index(b)] = similarity
+        else:
+            neighbors.append(b)
+            weights.append(similarity)
+
+    def _drop_link(self, a: int, b: int, level: int) -> None:
+        if level:
+            del self._upper[level - 1][a][b]
+            return
+        neighbors, weights = self._edit(a)
+        position = neighbors.index(b)
+        del neighbors[position]
+        del weights[position]
+
+    def _touch(self, row: int) -> None:
+        if not self._touched[row]:
+            self._touched[row] = 1
+            self._touched_rows.append(row)
+
+    def _similarities(self, vector: np.ndarray, rows: List[int]) -> List[float]:
+        self.distance_computations += len(rows)
+        return (self._vectors[rows] @ vector).tolist()
+
+    def _neighbor_array(self, row: int, level: int) -> np.ndarray:
+        if level:
+            return np.fromiter(self._upper[level - 1][row], dtype=np.int32)
+        delta = self._delta.get(row)
+        if delta is not None:
+            return np.array(delta[0], dtype=np.int32)
+        if row + 1 < len(self._indptr):
+            return self._indices[self._indptr[row] : self._indptr[row + 1]]
+        return np.empty(0, dtype=np.int32)
+
+    def _visit_marks(self) -> Tuple[np.ndarray, int]:
+        """Per-row visit stamps; rows stamped with the returned epoch are visited"""
+        if len(self._visited) < len(self._vectors):
+            self._visited = np.zeros(len(self._vectors), dtype=np.uint32)
+            self._epoch = 0
+        self._epoch += 1
+        if self._epoch == np.iinfo(np.uint32).max:
+            self._visited[:] = 0
+            self._epoch = 1
+        return self._visited, self._epoch
+
+    def _search_level(
+        self, vector: np.ndarray, entry_points: List[int], ef: int, level: int
+    ) -> List[Tuple[float, int]]:
+        """Best-first search on one level, returns (similarity, row) best first
+
+        Naapurit suodatetaan ja pisteytetään numpylla; Python-silmukkaan
+        päätyvät vain ne, jotka ylittävät tuloslistan heikoimman.
+        """
+        vectors = self._vectors
+        visited, epoch = self._visit_marks()
+        visited[entry_points] = epoch
+        results = list(zip(self._similarities(vector, entry_points), entry_points))
+        candidates = [(-similarity, row) for similarity, row in results]
+        heapq.heapify(results)
+        heapq.heapify(candidates)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        push, pop = heapq.heappush, heapq.heappop
+        while candidates:
+            negative, row = pop(candidates)
+            if len(results) >= ef and -negative < results[0][0]:
+                break
+            neighbors = self._neighbor_array(row, level)
+            fresh = neighbors[visited[neighbors] != epoch]
+            if not len(fresh):
+                continue
+            visited[fresh] = epoch
+            self.distance_computations += len(fresh)
+            similarities = vectors[fresh] @ vector
+            if len(results) >= ef:
+                better = similarities > results[0][0]
+                fresh, similarities = fresh[better], similarities[better]
+            for similarity, neighbor in zip(similarities.tolist(), fresh.tolist()):
+                if len(results) < ef or similarity > results[0][0]:
+                    push(candidates, (-similarity, neighbor))
+                    push(results, (similarity, neighbor))
+                    if len(results) > ef:
+                        pop(results)
+        return sorted(results, reverse=True)
+
+    def _descend(self, vector: np.ndarray, to_level: int) -> List[int]:
+        """Greedy search from the entry point down to a level"""
+        entry_points = [self._entry]
+        for level in range(self.levels[self._entry], to_level, -1):
+            entry_points = [self._search_level(vector, entry_points, 1, level)[0][1]]
+        return entry_points
+
+    def search(
+        self, vector: np.ndarray, k: int, ef: Optional[int] = None
+    ) -> List[Tuple[float, int]]:
+        """Approximate k most similar nodes
+
+        Args:
+            vector: Query vector (normalized)
+            k: Number of results
+            ef: Candidate list length, defaults to max(k, ef_construction)
+
+        Returns:
+            List of (similarity, node_id), most similar first
+        """
+        if self._entry is None:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        entry_points = self._descend(vector, 0)
+        found = self._search_level(
+            vector, entry_points, max(k, ef or self.ef_construction), 0
+        )
+        id_at = self.index.id_at
+        return [(similarity, id_at(row)) for similarity, row in found[:k]]
+
+    def add(self, node_id: int, vector: np.ndarray) -> None:
+        """Insert a node and link it to its nearest neighbors
+
+        Raises:
+            KeyError: If the node already exists
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+
+        row = self.index.append(node_id)
+        if self._vectors is None:
+            self._vectors = np.empty((16, len(vector)), dtype=np.float32)
+        elif row == len(self._vectors):
+            grown = np.empty(
+                (row + max(row // 4, 16), self._vectors.shape[1]), dtype=np.float32
+            )
+            grown[:row] = self._vectors
+            self._vectors = grown
+        self._vectors[row] = vector
+        self.levels.append(level)
+        self._touched.append(0)
+        self._touch(row)
+        while len(self._upper) < level:
+            self._upper.append({})
+        for lvl in range(1, level + 1):
+            self._upper[lvl - 1][row] = {}
+
+        if self._entry is None:
+            self._entry = row
+            return
+
+        top = self.levels[self._entry]
+        entry_points = self._descend(vector, level) if top > level else [self._entry]
+        for lvl in range(min(level, top), -1, -1):
+            found = self._search_level(vector, entry_points, self.ef_construction, lvl)
+            for similarity, neighbor in found[: self.m]:
+                self._link(row, neighbor, similarity, lvl)
+            entry_points = [neighbor for _, neighbor in found]
+
+        if level > top:
+            self._entry = row
+        self._maybe_compact()
+
+    def _link(self, a: int, b: int, similarity: float, level: int) -> None:
+        self._set_link(a, b, similarity, level)
+        self._set_link(b, a, similarity, level)
+        self._touch(a)
+        self._touch(b)
+        cap = self.m0 if level == 0 else self.m
+        for row in (a, b):
+            if self._degree(row, level) > cap:
+                self._prune(row, level)
+
+    def _prune(self, row: int, level: int) -> None:
+        """Drop the weakest link whose other end keeps another link"""
+        for neighbor, _ in sorted(self._items(row, level), key=lambda kv: kv[1]):
+            if self._degree(neighbor, level) > 1:
+                self._drop_link(row, neighbor, level)
+                self._drop_link(neighbor, row, level)
+                self._touch(neighbor)
+                return
+
+    def remove(self, node_id: int) -> None:
+        """Remove a node and reconnect its former neighbors"""
+        row = self.index.row(node_id)
+        if row is None:
+            return
+        for lvl in range(self.levels[row] + 1):
+            former = list(self._rows(row, lvl))
+            for neighbor in former:
+                self._drop_link(neighbor, row, lvl)
+                self._touch(neighbor)
+            if lvl:
+                del self._upper[lvl - 1][row]
+            else:
+                self._delta[row] = (array("i"), array("f"))
+            self._repair(former, lvl)
+        self.index.kill(row)
+
+        # Tyhjät ylätasot pois ja uusi sisääntulosolmu ylimmältä tasolta
+        while self._upper and not self._upper[-1]:
+            self._upper.pop()
+        if self._entry == row:
+            if self._upper:
+                self._entry = next(iter(self._upper[-1]))
+            else:
+                live = self.index.live_rows()
+                self._entry = int(live[0]) if len(live) else None
+        self._maybe_compact()
+
+    def _repair(self, former: List[int], level: int) -> None:
+        """Link orphaned neighbors to the closest other former neighbors"""
+        cap = self.m0 if level == 0 else self.m
+        for row in former:
+            degree = self._degree(row, level)
+            if degree >= cap // 2:
+                continue
+            linked = set(self._rows(row, level))
+            others = [other for other in former if other != row and other not in linked]
+            if not others:
+                continue
+            candidates = sorted(
+                zip(self._similarities(self._vectors[row], others), others),
+                reverse=True,
+            )
+            for similarity, other in candidates[: cap // 2 - degree]:
+                self._link(row, other, similarity, level)
+
+    def _maybe_compact(self) -> None:
+        rows = self.index.row_count
+        dead = rows - len(self.index)
+        if len(self._delta) > max(self.compact_threshold, rows // 8) or dead > max(
+            self.compact_threshold, len(self.index)
+        ):
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge the level-0 delta buffer into CSR and drop removed rows"""
+        rows = self.index.row_count
+        old_indptr = self._indptr
+        old_counts = np.diff(old_indptr)
+        counts = np.zeros(rows, dtype=np.int64)
+        counts[: len(old_counts)] = old_counts
+        replaced = np.zeros(rows, dtype=bool)
+        for row, (neighbors, _) in self._delta.items():
+            counts[row] = len(neighbors)
+            replaced[row] = True
+
+        indptr = np.zeros(rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        weights = np.empty(indptr[-1], dtype=np.float32)
+        # CSR-rivit, joita delta ei korvaa, siirretään kerralla
+        source = np.repeat(np.arange(len(old_counts)), old_counts)
+        kept = ~replaced[source]
+        offsets = np.arange(len(source)) - old_indptr[source]
+        target = indptr[source[kept]] + offsets[kept]
+        indices[target] = self._indices[kept]
+        weights[target] = self._weights[kept]
+        for row, (neighbors, similarities) in self._delta.items():
+            indices[indptr[row] : indptr[row + 1]] = neighbors
+            weights[indptr[row] : indptr[row + 1]] = similarities
+        self._indptr, self._indices, self._weights = indptr, indices, weights
+        self._delta = {}
+
+        if rows - len(self.index) > max(self.compact_threshold, len(self.index)):
+            self._drop_dead_rows()
+
+    def _drop_dead_rows(self) -> None:
+        """Renumber live rows; removed rows have no links after a merge"""
+        rows = self.index.row_count
+        keep = self.index.compact()
+        remap = np.full(rows, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+
+        self._vectors = self._vectors[keep]
+        levels = np.frombuffer(self.levels, dtype=np.int8)[keep]
+        self.levels = array("b", levels.tobytes())
+        counts = np.diff(self._indptr)[keep]
+        self._indptr = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._indptr[1:])
+        self._indices = remap[self._indices].astype(np.int32)
+        self._upper = [
+            {
+                int(remap[row]): {int(remap[n]): w for n, w in links.items()}
+                for row, links in level.items()
+            }
+            for level in self._upper
+        ]
+        if self._entry is not None:
+            self._entry = int(remap[self._entry])
+        touched = np.frombuffer(self._touched, dtype=np.uint8)[keep]
+        self._touched = bytearray(touched.tobytes())
+        self._touched_rows = array(
+            "i", [int(remap[row]) for row in self._touched_rows if remap[row] >= 0]
+        )
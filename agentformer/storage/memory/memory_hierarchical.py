@@ -15,59 +15,314 @@ Key Features:
 - Type-based memory storage and retrieval
 - Memory state tracking for each layer
 - Efficient cleanup of outdated information
+- Inverted text index per layer (see memory_index.py), so retrieval only
+  checks memories that contain every character n-gram of the query
+- Optionally bounded layers with LRU, TTL or importance-decay eviction
+  (see memory_eviction.py) and an optional on-disk archive for evicted
+  memories, searched through an n-gram index of the archived records
 
 This implementation is ideal for systems requiring organized, layered memory storage
 with clear separation between different types of information.
 """
 
+import heapq
+import itertools
+import json
 import logging
-from typing import Dict, List, Optional
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+from .backends.local_json_store import LocalJsonMemoryBackend
 from .memory_base import BaseMemory
+from .memory_eviction import LayerLimits, make_policy
+from .memory_index import TextIndex
 
 logger = logging.getLogger(__name__)
 
+# Oletuksena kerrokset ovat rajattomia; rajat otetaan käyttöön limits-parametrilla
+DEFAULT_LIMITS = {
+    layer: LayerLimits() for layer in ("core", "semantic", "episodic", "working")
+}
+
+
+def _deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """Approximate bytes held by a memory (containers and their contents)"""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            _deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
 
 class HierarchicalMemory(BaseMemory):
-    def __init__(self):
+    def __init__(
+        self,
+        limits: Optional[Dict[str, LayerLimits]] = None,
+        archive_path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """Initialize memory layers
+
+        Args:
+            limits: Capacity and eviction policy per layer; layers not
+                given are unbounded
+            archive_path: JSONL file that receives evicted memories, None to
+                drop them
+            clock: Time source in seconds
+        """
         self.memory_state = {
-            "core": {"count": 0, "oldest": None, "newest": None},
-            "semantic": {"count": 0, "oldest": None, "newest": None},
-            "episodic": {"count": 0, "oldest": None, "newest": None},
-            "working": {"count": 0, "oldest": None, "newest": None},
+            layer: {
+                "count": 0,
+                "oldest": None,
+                "newest": None,
+                "evicted": 0,
+                "resident_bytes": 0,
+            }
+            for layer in ("core", "semantic", "episodic", "working")
+        }
+        # Kerros -> {tunniste: muisti} tallennusjärjestyksessä
+        self.memories: Dict[str, Dict[int, Dict]] = {
+            layer: {} for layer in self.memory_state
+        }
+        self.indexes = {layer: TextIndex() for layer in self.memory_state}
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.policies = {
+            layer: make_policy(self.limits[layer]) for layer in self.memory_state
+        }
+        # Kerros -> {tunniste: (tallennusaika, koko tavuina)}
+        self._entries: Dict[str, Dict[int, tuple]] = {
+            layer: {} for layer in self.memory_state
         }
-        self.memories = {"core": [], "semantic": [], "episodic": [], "working": []}
+        self.archive = (
+            LocalJsonMemoryBackend(archive_path, storage_format="jsonl")
+            if archive_path
+            else None
+        )
+        # Arkiston n-grammi-indeksi (tunniste = tietueen sijainti) ja
+        # kerros sijainnin mukaan; tekstit luetaan levyltä osumia tarkistettaessa
+        self._archive_index = TextIndex(keep_texts=False)
+        self._archive_layers: List[str] = []
+        self._clock = clock
+        self._next_id = itertools.count()
         logger.debug("Initialized HierarchicalMemory")
 
+    @staticmethod
+    def _searchable_text(data: Dict) -> str:
+        """Text matched by retrieve: content and response"""
+        # Erotin estää osumat kenttien rajan yli
+        return f"{data.get('content', '')}\x00{data.get('response', '')}"
+
     def store(self, data: Dict, memory_type: str) -> None:
         """Store memory"""
         if memory_type not in self.memory_state:
             raise ValueError(f"Invalid memory type: {memory_type}")
 
-        self.memories[memory_type].append(data)
-        self.memory_state[memory_type]["count"] += 1
+        now = self._clock()
+        entry_id = next(self._next_id)
+        text = self._searchable_text(data)
+        size = _deep_sizeof(data) + sys.getsizeof(text)
+        self.memories[memory_type][entry_id] = data
+        self.indexes[memory_type].add(entry_id, text)
+        self.policies[memory_type].add(entry_id, data, now)
+        self._entries[memory_type][entry_id] = (now, size)
+
+        state = self.memory_state[memory_type]
+        state["count"] += 1
+        state["resident_bytes"] += size
+        state["newest"] = now
+        if state["oldest"] is None:
+            state["oldest"] = now
         logger.debug(f"Stored memory in {memory_type}: {data}")
 
-    def retrieve(self, query: str, memory_type: Optional[str] = None) -> List[Dict]:
-        """Retrieve memories"""
-        results = []
-        memory_types = [memory_type] if memory_type else self.memories.keys()
+        self._expire(memory_type, now)
+        capacity = self.limits[memory_type].capacity
+        if capacity is not None:
+            policy = self.policies[memory_type]
+            while len(self.memories[memory_type]) > capacity:
+                self._evict(memory_type, policy.victim(), now)
+
+    def _expire(self, memory_type: str, now: float) -> int:
+        """Evict entries whose policy says they are expired"""
+        expired = self.policies[memory_type].expired(now)
+        for entry_id in expired:
+            self._evict(memory_type, entry_id, now)
+        return len(expired)
+
+    def _evict(self, memory_type: str, entry_id: int, now: float) -> None:
+        """Remove one entry from a layer, archiving it if enabled"""
+        data = self.memories[memory_type].pop(entry_id)
+        self.indexes[memory_type].remove(entry_id)
+        self.policies[memory_type].remove(entry_id)
+        stored_at, size = self._entries[memory_type].pop(entry_id)
+
+        state = self.memory_state[memory_type]
+        state["count"] -= 1
+        state["evicted"] += 1
+        state["resident_bytes"] -= size
+        first = next(iter(self._entries[memory_type].values()), None)
+        state["oldest"] = first[0] if first else None
+
+        if self.archive is not None:
+            self.archive.store(
+                {
+                    "layer": memory_type,
+                    "stored_at": stored_at,
+                    "evicted_at": now,
+                    # Muut kuin JSON-arvot tallennetaan merkkijonoina
+                    "data": json.loads(json.dumps(data, default=str)),
+                }
+            )
 
+    def _touch(self, memory_type: str, entry_id: int) -> None:
+        self.policies[memory_type].touch(entry_id, self._clock())
+
+    def iter_matches(
+        self, query: str, memory_type: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """Yield memories whose content or response contains the query
+
+        Args:
+            query: Case-insensitive substring to look for
+            memory_type: Layer to search, all layers when omitted
+
+        Yields:
+            Dict: Matching memories, layer by layer in storage order
+        """
+        memory_types = [memory_type] if memory_type else list(self.memories)
+        now = self._clock()
         for mtype in memory_types:
-            for memory in self.memories[mtype]:
-                content = memory.get("content", "")
-                response = memory.get("response", "")
-                if (
-                    query.lower() in str(content).lower()
-                    or query.lower() in str(response).lower()
-                ):
-                    results.append(memory)
+            self._expire(mtype, now)
+            memories = self.memories[mtype]
+            for entry_id in self.indexes[mtype].search(query):
+                data = memories.get(entry_id)
+                # Haun aikana poistettu muisti ohitetaan
+                if data is not None:
+                    self._touch(mtype, entry_id)
+                    yield data
+
+    def search_archive(
+        self, query: str, memory_type: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """Yield evicted memories whose content or response contains the query
+
+        Args:
+            query: Case-insensitive substring to look for
+            memory_type: Layer the memory was evicted from, all when omitted
+
+        Yields:
+            Dict: Archived memories in eviction order
+        """
+        if self.archive is None:
+            return
+        self._sync_archive()
+        needle = query.lower()
+        for position in self._archive_index.candidates(needle):
+            if memory_type and self._archive_layers[position] != memory_type:
+                continue
+            record = self.archive.get(position)
+            if needle in self._searchable_text(record["data"]).lower():
+                yield record["data"]
+
+    def _sync_archive(self) -> None:
+        """Index archive records written since the last search"""
+        indexed = len(self._archive_layers)
+        total = len(self.archive)
+        if total < indexed:
+            # Arkisto on tyhjennetty
+            self._archive_index.clear()
+            self._archive_layers = []
+            indexed = 0
+        if total == indexed:
+            return
+        if indexed:
+            records = (self.archive.get(p) for p in range(indexed, total))
+        else:
+            records = itertools.islice(self.archive.retrieve_all(), total)
+        for position, record in enumerate(records, start=indexed):
+            self._archive_index.add(position, self._searchable_text(record["data"]))
+            self._archive_layers.append(record["layer"])
 
+    def retrieve(
+        self,
+        query: str,
+        memory_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        rank: bool = False,
+        include_archive: bool = False,
+    ) -> List[Dict]:
+        """Retrieve memories
+
+        Args:
+            query: Case-insensitive substring to look for
+            memory_type: Layer to search, all layers when omitted
+            limit: Maximum number of results; the search stops early
+            rank: Order resident results by term frequency of the query words
+            include_archive: Continue with evicted memories from the archive
+                after the resident ones
+
+        Returns:
+            List[Dict]: Matching memories
+        """
+        if not rank:
+            matches = self.iter_matches(query, memory_type)
+            if include_archive:
+                matches = itertools.chain(
+                    matches, self.search_archive(query, memory_type)
+                )
+            return list(itertools.islice(matches, limit))
+
+        memory_types = [memory_type] if memory_type else list(self.memories)
+        now = self._clock()
+        for mtype in memory_types:
+            self._expire(mtype, now)
+        hits = [
+            (mtype, entry_id)
+            for mtype in memory_types
+            for entry_id in self.indexes[mtype].search(query)
+        ]
+        scored = (
+            (self.indexes[mtype].score(query, entry_id), -order, mtype, entry_id)
+            for order, (mtype, entry_id) in enumerate(hits)
+        )
+        # Tasapisteissä säilytetään tallennusjärjestys
+        if limit is None:
+            best = sorted(scored, reverse=True)
+        else:
+            best = heapq.nlargest(limit, scored)
+        for _, _, mtype, entry_id in best:
+            self._touch(mtype, entry_id)
+        results = [self.memories[mtype][entry_id] for _, _, mtype, entry_id in best]
+
+        if include_archive and (limit is None or len(results) < limit):
+            archived = self.search_archive(query, memory_type)
+            remaining = None if limit is None else limit - len(results)
+            results.extend(itertools.islice(archived, remaining))
         return results
 
     def cleanup(self) -> None:
-        """Clean old memories"""
-        # Implement cleanup logic here
-        pass
+        """Clean old memories
+
+        Evicts expired entries and trims every layer to its capacity.
+        """
+        now = self._clock()
+        evicted = 0
+        for memory_type, policy in self.policies.items():
+            evicted += self._expire(memory_type, now)
+            capacity = self.limits[memory_type].capacity
+            if capacity is None:
+                continue
+            while len(self.memories[memory_type]) > capacity:
+                self._evict(memory_type, policy.victim(), now)
+                evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} memories in cleanup")
 
     def get_state(self) -> Dict:
         """Get memory state"""
@@ -0,0 +1,118 @@
+"""
+Memory Text Index
+
+Inkrementaalinen käänteinen indeksi muistikerroksen teksteille.
+HierarchicalMemory.retrieve vertasi aiemmin hakua jokaisen muistin
+tekstiin (substring), jolloin haun hinta kasvoi koko muistin ja
+tekstien pituuden mukana.
+
+Indeksi pitää kaksi postauslistaa:
+1. Merkki-n-grammit (oletuksena trigrammit) -> muistitunnisteet.
+   Hakusanan kaikki n-grammit sisältävät muistit ovat ainoat mahdolliset
+   osumat, ja vain ne tarkistetaan substring-vertailulla. Näin haku
+   palauttaa täsmälleen samat osumat kuin aiempi läpikäynti
+2. Sanat -> {tunniste: esiintymiskerrat}, jota käytetään osumien
+   järjestämiseen termifrekvenssin mukaan
+
+Tunnisteet ovat kasvavia kokonaislukuja, joten osumat palautetaan
+tallennusjärjestyksessä generaattorina ja kutsuja voi lopettaa
+haun ensimmäisten osumien jälkeen.
+
+keep_texts=False pitää vain postauslistat. Tekstit ovat silloin muualla
+(esim. levyllä olevassa arkistossa), kutsuja tarkistaa candidates()-
+ehdokkaat itse, eikä muisteja voi poistaa indeksistä.
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, Set
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a text"""
+    return _TOKEN.findall(text.lower())
+
+
+class TextIndex:
+    """Character n-gram and token postings for one memory layer"""
+
+    def __init__(self, ngram: int = 3, keep_texts: bool = True):
+        self.ngram = ngram
+        self.keep_texts = keep_texts
+        # Tunniste -> pienaakkosin kirjoitettu haettava teksti ("" ilman tekstejä)
+        self.texts: Dict[int, str] = {}
+        self.grams: Dict[str, Set[int]] = {}
+        self.tokens: Dict[str, Dict[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def _ngrams(self, text: str) -> Set[str]:
+        n = self.ngram
+        return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+    def add(self, entry_id: int, text: str) -> None:
+        """Index the searchable text of one memory"""
+        text = text.lower()
+        self.texts[entry_id] = text if self.keep_texts else ""
+        for gram in self._ngrams(text):
+            self.grams.setdefault(gram, set()).add(entry_id)
+        for token in tokenize(text):
+            counts = self.tokens.setdefault(token, {})
+            counts[entry_id] = counts.get(entry_id, 0) + 1
+
+    def remove(self, entry_id: int) -> None:
+        """Drop one memory from every posting"""
+        if not self.keep_texts:
+            raise ValueError("Cannot remove from an index without texts")
+        text = self.texts.pop(entry_id, None)
+        if text is None:
+            return
+        for gram in self._ngrams(text):
+            postings = self.grams[gram]
+            postings.discard(entry_id)
+            if not postings:
+                del self.grams[gram]
+        for token in set(tokenize(text)):
+            counts = self.tokens[token]
+            counts.pop(entry_id, None)
+            if not counts:
+                del self.tokens[token]
+
+    def clear(self) -> None:
+        self.texts = {}
+        self.grams = {}
+        self.tokens = {}
+
+    def candidates(self, query: str) -> Iterable[int]:
+        """Ids that may contain the query, in ascending order"""
+        grams = self._ngrams(query.lower())
+        if not grams:
+            # Lyhyt hakusana: ei n-grammeja, tarkistetaan kaikki
+            return list(self.texts)
+
+        postings = []
+        for gram in grams:
+            ids = self.grams.get(gram)
+            if not ids:
+                return ()
+            postings.append(ids)
+        # Pienin postauslista ensin, jolloin leikkaus pysyy pienenä
+        postings.sort(key=len)
+        result = postings[0].intersection(*postings[1:])
+        return sorted(result)
+
+    def search(self, query: str) -> Iterator[int]:
+        """Ids whose text contains the query (case-insensitive), lazily"""
+        needle = query.lower()
+        texts = self.texts
+        for entry_id in self.candidates(needle):
+            if needle in texts.get(entry_id, ""):
+                yield entry_id
+
+    def score(self, query: str, entry_id: int) -> int:
+        """Term frequency of the query tokens in one memory"""
+        return sum(
+            self.tokens.get(token, {}).get(entry_id, 0) for token in tokenize(query)
+        )
@@ -47,6 +47,10 @@ class MemoryManager:
         """Retrieve memories based on query"""
         try:
             # Delegate to memory backend
+            if isinstance(self.memory, HierarchicalMemory):
+                # Haku lopetetaan, kun limit osumaa on löytynyt
+                return self.memory.retrieve(query, limit=limit)
+
             memories = self.memory.retrieve(query)
 
             # Apply limit if specified
@@ -0,0 +1,631 @@
+"""
+Compact Node Store
+
+Taulukoihin perustuva solmusäilö DistributedMemorylle. DistributedMemory
+pitää elävät solmunsa tässä säilössä; silloin yhteydet luetaan
+SimilarityGraphin tasolta 0 (graph-parametri), eikä säilö tallenna omaa
+vierekkäisyyttään. Irrallisena (from_memory) sama luokka on muistin
+tilannekuva omine CSR-yhteyksineen ja vektoreineen, jota voi lukea ilman
+elävää graafia.
+
+Sanakirjasolmu ({"content", "type", "timestamp", "metadata",
+"connections"}) vei satoja tavuja ennen varsinaista sisältöä: sanakirja,
+float-olio ja time_ns-avaimet ovat kukin erillisiä Python-olioita.
+
+Tässä esityksessä:
+1. Solmun kentät ovat rinnakkaisissa tyypitetyissä taulukoissa
+   (array-moduuli): aikaleima float64 ja tyyppikoodi uint8. Tunnisteet
+   ja elossa-liput ovat RowIndexissä (ks. memory_rows.py), joka hakee
+   rivin binäärihaulla ilman sanakirjaa
+2. Tekstisisältö on yhdessä UTF-8-areenassa (bytearray), ja solmulla on
+   vain alkukohta. Muut kuin merkkijonosisällöt ja ei-tyhjä metadata
+   pidetään harvoissa sanakirjoissa
+3. Irrallisen säilön yhteydet ovat CSR-muodossa: indptr (n + 1
+   alkukohtaa) ja indices (naapurien rivipaikat int32-lukuina).
+   Muuttuneiden solmujen naapurilistat kerätään delta-puskuriin, joka
+   yhdistetään CSR:ään compact()-kutsulla tai puskurin kasvaessa
+4. Rivit lisätään aikajärjestyksessä, joten pop_older() löytää
+   vanhentuneet solmut kursorilla rivien alusta ilman erillistä kekoa
+5. Viennissä (from_memory) upotukset ovat yhdessä yhtenäisessä
+   float32-matriisissa rivipaikkojen järjestyksessä. Yhteyksiksi viedään
+   graafin alin taso; ylemmät tasot jätetään pois
+
+Poistettu solmu merkitään kuolleeksi. Kun kuolleita rivejä on enemmän
+kuin eläviä, compact() numeroi rivit uudelleen ja vapauttaa niiden
+areenatavut.
+
+Muistivertailu elävän DistributedMemoryn ja aiemman sanakirja-asettelun
+välillä (sama sisältö ja samat linkit):
+    python -m agentformer.storage.memory.memory_node_store --nodes 1000000
+
+Tulos 1 000 000 solmulla (M=8, 256-ulotteiset upotukset, sanakirja-
+asettelu mitattu 100 000 ensimmäisellä solmulla, ajo 1574 s):
+DistributedMemory 1478 B/solmu, sanakirja-asettelu 3586 B/solmu
+(2,4x pienempi). Elävän muistin luvusta noin 1 KB on float32-upotus.
+"""
+
+import argparse
+import gc
+import itertools
+import math
+import sys
+import time
+import types
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .memory_expiry import ExpiryScheduler
+from .memory_rows import RowIndex
+
+
+def _take(column: array, rows: np.ndarray) -> array:
+    """Rows of a typed array as a new array of the same type"""
+    taken = array(column.typecode)
+    taken.frombytes(np.frombuffer(column, dtype=column.typecode)[rows].tobytes())
+    return taken
+
+
+class CompactNodeStore(Mapping):
+    """Array-backed node attributes with CSR adjacency"""
+
+    def __init__(self, compact_threshold: int = 4096, graph=None):
+        """Initialize an empty store
+
+        Args:
+            compact_threshold: Delta-buffer size (changed nodes) that triggers
+                a CSR rebuild, at least one eighth of the store
+            graph: Live SimilarityGraph whose level-0 links are the
+                connections; the store then keeps no adjacency of its own
+        """
+        self.compact_threshold = compact_threshold
+        self.graph = graph
+        self.index = RowIndex()
+        self.timestamps = array("d")
+        self.type_codes = array("B")
+        self.type_names: List[str] = []
+        self._type_index: Dict[str, int] = {}
+
+        # Tekstiareena: rivin i sisältö on arena[offsets[i]:offsets[i + 1]]
+        self.arena = bytearray()
+        self.offsets = array("Q", [0])
+        self._objects: Dict[int, Any] = {}  # Muut kuin str-sisällöt
+        self._metadata: Dict[int, Dict] = {}  # Vain ei-tyhjät
+
+        # CSR + delta-puskuri (rivi -> koko uusi naapurilista)
+        self.indptr = array("Q", [0])
+        self.indices = array("i")
+        self._delta: Dict[int, array] = {}
+
+        # Rivit ennen kursoria on jo vanhennettu; aikajärjestyksestä
+        # poikkeavat aikaleimat ajastetaan erikseen
+        self._expired = 0
+        self._newest = -math.inf
+        self._early: ExpiryScheduler[int] = ExpiryScheduler()
+
+        # Upotukset (n, dim) rivipaikoittain, vain viedyissä säilöissä
+        self.vectors: Optional[np.ndarray] = None
+
+    # Mapping-rajapinta: store[node_id] palauttaa solmun sanakirjana
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.index)
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self.index
+
+    def __getitem__(self, node_id: int) -> Dict:
+        position = self._require(node_id)
+        return {
+            "content": self._content(position),
+            "type": self.type_names[self.type_codes[position]],
+            "timestamp": self.timestamps[position],
+            "metadata": dict(self._metadata.get(position, {})),
+            "connections": set(self.neighbors(node_id)),
+        }
+
+    def _require(self, node_id: int) -> int:
+        position = self.index.row(node_id)
+        if position is None:
+            raise KeyError(node_id)
+        return position
+
+    def _content(self, position: int) -> Any:
+        if position in self._objects:
+            return self._objects[position]
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.arena[start:end].decode("utf-8")
+
+    def _type_code(self, memory_type: str) -> int:
+        code = self._type_index.get(memory_type)
+        if code is None:
+            if len(self.type_names) == 256:
+                raise ValueError("CompactNodeStore supports at most 256 node types")
+            code = len(self.type_names)
+            self.type_names.append(memory_type)
+            self._type_index[memory_type] = code
+        return code
+
+    def _own_links(self) -> None:
+        if self.graph is not None:
+            raise ValueError("Connections of a graph-backed store live in the graph")
+
+    def add(
+        self,
+        node_id: int,
+        content: Any,
+        memory_type: str = "episodic",
+        timestamp: Optional[float] = None,
+        metadata: Optional[Dict] = None,
+        connections: Iterable[int] = (),
+    ) -> None:
+        """Append a node and link it symmetrically to existing nodes
+
+        Raises:
+            KeyError: If the id exists or a connection is unknown
+            ValueError: If the store holds exported vectors, or connections
+                are given to a graph-backed store
+        """
+        if self.vectors is not None:
+            raise ValueError("Cannot add nodes to a store with exported vectors")
+        neighbors = [self._require(other) for other in connections]
+        if neighbors:
+            self._own_links()
+        code = self._type_code(memory_type)
+
+        position = self.index.append(node_id)
+        timestamp = time.time() if timestamp is None else timestamp
+        self.timestamps.append(timestamp)
+        if timestamp < self._newest:
+            self._early.schedule(node_id, timestamp)
+        else:
+            self._newest = timestamp
+        self.type_codes.append(code)
+
+        if isinstance(content, str):
+            self.arena += content.encode("utf-8")
+        else:
+            self._objects[position] = content
+        self.offsets.append(len(self.arena))
+        if metadata:
+            self._metadata[position] = dict(metadata)
+
+        if self.graph is None:
+            # Uudella rivillä ei ole CSR-naapureita
+            self.indptr.append(self.indptr[-1])
+            if neighbors:
+                self._delta[position] = array("i", neighbors)
+                for other in neighbors:
+                    self._edit(other).append(position)
+            self._maybe_compact()
+
+    def timestamp(self, node_id: int) -> float:
+        """Creation time of a node"""
+        return self.timestamps[self._require(node_id)]
+
+    def node_type(self, node_id: int) -> str:
+        """Memory type of a node"""
+        return self.type_names[self.type_codes[self._require(node_id)]]
+
+    def type_counts(self) -> Dict[str, int]:
+        """Live nodes per memory type"""
+        codes = np.frombuffer(self.type_codes, dtype=np.uint8)[self.index.live_rows()]
+        counts = np.bincount(codes, minlength=len(self.type_names))
+        return {name: int(n) for name, n in zip(self.type_names, counts) if n}
+
+    def vector(self, node_id: int) -> np.ndarray:
+        """Exported embedding of a node
+
+        Raises:
+            KeyError: If the node is unknown or the store has no vectors
+        """
+        if self.vectors is None:
+            raise KeyError(f"No vectors stored for node {node_id}")
+        return self.vectors[self._require(node_id)]
+
+    def neighbors(self, node_id: int) -> List[int]:
+        """Ids of the nodes linked to a node"""
+        if self.graph is not None:
+            return list(self.graph.neighbors(node_id))
+        position = self._require(node_id)
+        return [self.index.id_at(p) for p in self._neighbor_positions(position)]
+
+    def link(self, a: int, b: int) -> None:
+        """Connect two nodes in both directions"""
+        self._own_links()
+        pa, pb = self._require(a), self._require(b)
+        if pb not in self._neighbor_positions(pa):
+            self._edit(pa).append(pb)
+            self._edit(pb).append(pa)
+            self._maybe_compact()
+
+    def unlink(self, a: int, b: int) -> None:
+        """Remove the connection between two nodes"""
+        self._own_links()
+        pa, pb = self._require(a), self._require(b)
+        for source, target in ((pa, pb), (pb, pa)):
+            row = self._edit(source)
+            if target in row:
+                row.remove(target)
+
+    def remove(self, node_id: int) -> None:
+        """Remove a node and its connections"""
+        position = self._require(node_id)
+        if self.graph is None:
+            for other in list(self._neighbor_positions(position)):
+                row = self._edit(other)
+                if position in row:
+                    row.remove(position)
+            self._delta[position] = array("i")
+        self.index.kill(position)
+        self._objects.pop(position, None)
+        self._metadata.pop(position, None)
+        self._early.discard(node_id)
+        self._maybe_compact()
+
+    def pop_older(self, deadline: float) -> List[int]:
+        """Remove and return the nodes stamped at or before a deadline
+
+        Rivit ovat aikajärjestyksessä, joten kursori ohittaa alusta
+        poistetut ja vanhentuneet rivit ja pysähtyy ensimmäiseen
+        tuoreeseen. Kutsun hinta riippuu vain vanhentuneiden määrästä.
+
+        Args:
+            deadline: Nodes with this timestamp or older are removed
+
+        Returns:
+            List[int]: Removed ids, oldest row first
+        """
+        index, timestamps = self.index, self.timestamps
+        row = self._expired
+        while row < index.row_count and (
+            not index.alive[row] or timestamps[row] <= deadline
+        ):
+            row += 1
+        due = [
+            index.id_at(position)
+            for position in range(self._expired, row)
+            if index.alive[position]
+        ]
+        self._expired = row
+        seen = set(due)
+        due.extend(n for n in self._early.pop_due(deadline) if n not in seen)
+        for node_id in due:
+            self.remove(node_id)
+        return due
+
+    def _neighbor_positions(self, position: int) -> array:
+        row = self._delta.get(position)
+        if row is not None:
+            return row
+        return self.indices[self.indptr[position] : self.indptr[position + 1]]
+
+    def _edit(self, position: int) -> array:
+        """Delta-buffer row of a node (copied from CSR on first change)"""
+        row = self._delta.get(position)
+        if row is None:
+            row = self._neighbor_positions(position)
+            self._delta[position] = row
+        return row
+
+    def _maybe_compact(self) -> None:
+        rows = self.index.row_count
+        dead = rows - len(self.index)
+        if len(self._delta) > max(self.compact_threshold, rows // 8) or dead > max(
+            self.compact_threshold, len(self.index)
+        ):
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge the delta buffer into the CSR arrays and drop removed rows"""
+        if self._delta:
+            indptr = array("Q", [0])
+            indices = array("i")
+            for position in range(self.index.row_count):
+                indices.extend(self._neighbor_positions(position))
+                indptr.append(len(indices))
+            self.indptr, self.indices = indptr, indices
+            self._delta = {}
+        if self.index.row_count - len(self.index) > max(
+            self.compact_threshold, len(self.index)
+        ):
+            self._drop_dead_rows()
+
+    def _drop_dead_rows(self) -> None:
+        """Renumber live rows and release the arena bytes of removed ones"""
+        rows = self.index.row_count
+        keep = self.index.compact()
+        remap = np.full(rows, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+
+        self.timestamps = _take(self.timestamps, keep)
+        self.type_codes = _take(self.type_codes, keep)
+        lengths = np.diff(np.frombuffer(self.offsets, dtype=np.uint64).astype(np.int64))
+        kept = np.zeros(rows, dtype=bool)
+        kept[keep] = True
+        arena = np.frombuffer(self.arena, dtype=np.uint8)[np.repeat(kept, lengths)]
+        self.arena = bytearray(arena.tobytes())
+        self.offsets = array("Q", [0])
+        self.offsets.frombytes(np.cumsum(lengths[keep], dtype=np.uint64).tobytes())
+        self._objects = {int(remap[p]): v for p, v in self._objects.items()}
+        self._metadata = {int(remap[p]): v for p, v in self._metadata.items()}
+
+        if self.graph is None:
+            # Poistetuilla riveillä ei ole yhdistämisen jälkeen naapureita
+            indptr = np.frombuffer(self.indptr, dtype=np.uint64).astype(np.int64)
+            counts = np.diff(indptr)[keep]
+            self.indptr = array("Q", [0])
+            self.indptr.frombytes(np.cumsum(counts, dtype=np.uint64).tobytes())
+            indices = remap[np.frombuffer(self.indices, dtype=np.int32)]
+            self.indices = array("i", indices.astype(np.int32).tobytes())
+        if self.vectors is not None:
+            self.vectors = self.vectors[keep]
+        self._expired = int(np.searchsorted(keep, self._expired))
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by arrays, arena and sparse side tables"""
+        arrays = (
+            self.index.keys,
+            self.timestamps,
+            self.type_codes,
+            self.offsets,
+            self.indptr,
+            self.indices,
+        )
+        total = sum(a.itemsize * len(a) for a in arrays)
+        total += len(self.index.alive) + len(self.arena)
+        total += sum(row.itemsize * len(row) + 64 for row in self._delta.values())
+        total += 100 * (len(self._objects) + len(self._metadata) + len(self._early))
+        if self.vectors is not None:
+            total += self.vectors.nbytes
+        return total
+
+    @classmethod
+    def from_memory(cls, memory, **kwargs) -> "CompactNodeStore":
+        """Export a DistributedMemory: nodes, level-0 links and vectors
+
+        Args:
+            memory: DistributedMemory to export
+            **kwargs: CompactNodeStore options
+
+        Returns:
+            CompactNodeStore: Read-only snapshot of the memory
+        """
+        store = cls.from_nodes(memory.nodes, **kwargs)
+        store.vectors = memory.graph.vector_matrix(list(store))
+        return store
+
+    @classmethod
+    def from_nodes(
+        cls, nodes: Mapping, vectors: Optional[Mapping] = None, **kwargs
+    ) -> "CompactNodeStore":
+        """Build a compacted store from DistributedMemory-style node dicts
+
+        Args:
+            nodes: node_id -> {"content", "type", "timestamp", "metadata",
+                "connections"}; connections to unknown ids are dropped
+            vectors: Optional node_id -> embedding for every node
+            **kwargs: CompactNodeStore options
+
+        Returns:
+            CompactNodeStore: Store with all edges in CSR form
+        """
+        store = cls(**kwargs)
+        node_ids = sorted(nodes)
+        for node_id in node_ids:
+            node = nodes[node_id]
+            store.add(
+                node_id,
+                node["content"],
+                node.get("type", "episodic"),
+                node.get("timestamp"),
+                node.get("metadata"),
+            )
+
+        # Yhteydet rakennetaan kerralla suoraan CSR-muotoon
+        positions = {node_id: p for p, node_id in enumerate(node_ids)}
+        indices = array("i")
+        indptr = array("Q", [0])
+        for node_id in node_ids:
+            indices.extend(
+                sorted(
+                    positions[other]
+                    for other in nodes[node_id].get("connections", ())
+                    if other in positions
+                )
+            )
+            indptr.append(len(indices))
+        store.indptr, store.indices = indptr, indices
+
+        if vectors is not None:
+            store.vectors = np.ascontiguousarray(
+                np.stack([vectors[node_id] for node_id in node_ids]),
+                dtype=np.float32,
+            )
+        return store
+
+
+def _dict_layout(memory, node_ids: List[int]) -> Dict[str, Any]:
+    """Nodes of a DistributedMemory and their links in the former dict layout
+
+    Aiemmin solmu oli sanakirja, jonka "connections" oli näkymä graafin
+    tason 0 linkkisanakirjaan; graafi piti jokaisesta solmusta
+    numpy-vektorin, linkit sanakirjoina tasoittain ja tason sanakirjassa,
+    ja muistilla oli lisäksi aktiivijoukko, vanhenemiskeko ja graafin
+    muuttuneiden solmujen joukko.
+    """
+    graph = memory.graph
+    levels = {node_id: graph.level(node_id) for node_id in node_ids}
+    links: List[Dict[int, Dict[int, float]]] = [
+        {} for _ in range(max(levels.values(), default=-1) + 1)
+    ]
+    vectors = {}
+    for node_id in node_ids:
+        for level in range(levels[node_id] + 1):
+            links[level][node_id] = dict(graph.neighbors(node_id, level))
+        vectors[node_id] = np.array(graph.vector(node_id))
+
+    nodes = {}
+    expiry: ExpiryScheduler[int] = ExpiryScheduler()
+    for node_id in node_ids:
+        node = memory.nodes[node_id]
+        node["connections"] = links[0][node_id].keys()
+        nodes[node_id] = node
+        expiry.schedule(node_id, node["timestamp"])
+    return {
+        "nodes": nodes,
+        "links": links,
+        "levels": levels,
+        "vectors": vectors,
+        "active_nodes": set(node_ids),
+        "expiry": expiry,
+        "touched": set(node_ids),
+    }
+
+
+# Jaettuja olioita (luokat, moduulit, funktiot) ei lasketa rakenteen kokoon
+_SHARED_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+)
+
+
+def _retained_bytes(root: Any) -> int:
+    """Bytes of every object reachable from root, each counted once
+
+    sys.getsizeof sisältää taulukoiden, bytearrayn ja datansa omistavien
+    numpy-taulukoiden puskurit, joten summa vastaa tracemallocin lukua
+    ilman, että jokainen store()-kutsu ajetaan jäljityksen alla.
+    """
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def memory_report(
+    num_nodes: int,
+    max_connections: int = 8,
+    dimension: int = 256,
+    seed: int = 0,
+    dict_sample: Optional[int] = None,
+) -> Dict[str, float]:
+    """Measure bytes per node of a live DistributedMemory and the dict layout
+
+    Elävä muisti rakennetaan store()-kutsuilla ilman tracemallocia, ja
+    sen koko mitataan valmiista rakenteesta (_retained_bytes), joten luku
+    sisältää solmusäilön, graafin kaikki tasot, vektorimatriisin
+    varakapasiteetin ja delta-puskurit. Vertailukohta rakennetaan samasta
+    muistista aiempaan sanakirja-asetteluun (_dict_layout), joten solmut
+    ja linkit ovat samat. Sanakirja-asettelu vie moninkertaisesti elävän
+    muistin tilan, joten dict_sample rajaa sen ensimmäisiin solmuihin;
+    sen kustannus solmua kohden ei riipu solmujen määrästä.
+
+    Args:
+        num_nodes: Number of nodes to store
+        max_connections: DistributedMemory max_connections (M)
+        dimension: Embedding dimension (hashed_embedding default is 256)
+        seed: Seed of the random embeddings
+        dict_sample: Measure the dict layout on this many nodes only,
+            defaults to all
+
+    Returns:
+        Dict: bytes per node of both layouts and their ratio
+
+    Raises:
+        RuntimeError: If the layouts do not hold the same nodes and links
+    """
+    from .memory_distributed import DistributedMemory
+
+    rng = np.random.default_rng(seed)
+    memory = DistributedMemory(max_connections=max_connections)
+    for start in range(0, num_nodes, 4096):
+        block = rng.standard_normal((min(4096, num_nodes - start), dimension))
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        for i, embedding in enumerate(block.astype(np.float32), start):
+            memory.store(
+                f"muistiinpano {i}",
+                ("episodic", "semantic")[i % 2],
+                embedding=embedding,
+            )
+    memory_bytes = _retained_bytes(memory)
+
+    sample = list(itertools.islice(memory.nodes, dict_sample))
+    layout = _dict_layout(memory, sample)
+    dict_bytes = _retained_bytes(layout)
+
+    if len(memory.nodes) != num_nodes or len(layout["nodes"]) != len(sample):
+        raise RuntimeError(
+            f"Expected {num_nodes} nodes, live memory has {len(memory.nodes)} "
+            f"and the dict layout {len(layout['nodes'])} of {len(sample)} sampled"
+        )
+    live_links = sum(memory.graph.degree(node_id) for node_id in sample)
+    dict_links = sum(len(links) for links in layout["links"][0].values())
+    if live_links != dict_links:
+        raise RuntimeError(
+            f"Level-0 links differ: live memory {live_links}, "
+            f"dict layout {dict_links}"
+        )
+    return {
+        "nodes": num_nodes,
+        "max_connections": max_connections,
+        "dimension": dimension,
+        "dict_sample": len(sample),
+        "memory_bytes_per_node": memory_bytes / num_nodes,
+        "dict_bytes_per_node": dict_bytes / max(len(sample), 1),
+        "reduction": dict_bytes
+        / max(len(sample), 1)
+        / max(memory_bytes / num_nodes, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Compare live DistributedMemory and the dict layout by bytes per node"
+    )
+    parser.add_argument("--nodes", type=int, default=1_000_000)
+    parser.add_argument("--max-connections", type=int, default=8)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument(
+        "--dict-sample",
+        type=int,
+        default=100_000,
+        help="Measure the dict layout on the first N nodes",
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    report = memory_report(
+        args.nodes,
+        args.max_connections,
+        args.dimension,
+        dict_sample=args.dict_sample,
+    )
+    print(
+        f"{report['nodes']} nodes, M={report['max_connections']}, "
+        f"dim {report['dimension']}: "
+        f"DistributedMemory {report['memory_bytes_per_node']:.0f} B/node, "
+        f"dict layout {report['dict_bytes_per_node']:.0f} B/node "
+        f"(measured on {report['dict_sample']} nodes) "
+        f"({report['reduction']:.1f}x smaller) "
+        f"in {time.perf_counter() - start:.0f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
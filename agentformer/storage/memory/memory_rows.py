@@ -0,0 +1,121 @@
+"""
+Row Index
+
+Tunniste -> rivipaikka -kuvaus taulukkopohjaisille muistirakenteille
+(CompactNodeStore, SimilarityGraph). Sanakirja vie jokaista avainta
+kohden hajautustaulun paikan ja erillisen int-olion; tässä tunnisteet
+ovat int64-taulukossa lisäysjärjestyksessä. Koska time_ns-tunnisteet
+kasvavat, rivi löytyy binäärihaulla. Järjestyksestä poikkeavat ja
+uudelleen lisätyt tunnisteet menevät pieneen ylivuotosanakirjaan.
+
+Poistettu rivi merkitään kuolleeksi, ja rivipaikat pysyvät ennallaan,
+kunnes omistaja kutsuu compact()-metodia ja tiivistää omat sarakkeensa
+sen palauttamilla riveillä.
+"""
+
+import bisect
+from array import array
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+
+class RowIndex:
+    """Append-only int64 id -> row mapping with binary search"""
+
+    def __init__(self):
+        # Kasvavat hakuavaimet; ylivuotorivin avain toistaa edellisen
+        self.keys = array("q")
+        self.alive = bytearray()
+        self._overflow: Dict[int, int] = {}  # tunniste -> rivi
+        self._row_ids: Dict[int, int] = {}  # rivi -> tunniste
+        self._alive_count = 0
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    def __contains__(self, node_id) -> bool:
+        return self.row(node_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        for row in range(len(self.keys)):
+            if self.alive[row]:
+                yield self.id_at(row)
+
+    @property
+    def row_count(self) -> int:
+        """Rows including dead ones"""
+        return len(self.keys)
+
+    def id_at(self, row: int) -> int:
+        if self._row_ids:
+            node_id = self._row_ids.get(row)
+            if node_id is not None:
+                return node_id
+        return self.keys[row]
+
+    def row(self, node_id: int) -> Optional[int]:
+        """Row of a live id, None if unknown or removed"""
+        row = bisect.bisect_left(self.keys, node_id)
+        if row < len(self.keys) and self.id_at(row) == node_id and self.alive[row]:
+            return row
+        row = self._overflow.get(node_id)
+        if row is None or not self.alive[row]:
+            return None
+        return row
+
+    def append(self, node_id: int) -> int:
+        """Add an id as a new live row
+
+        Raises:
+            KeyError: If the id is already live
+        """
+        if node_id in self:
+            raise KeyError(f"Node {node_id} already exists")
+        row = len(self.keys)
+        if self.keys and node_id <= self.keys[-1]:
+            # Binäärihaku vaatii kasvavat avaimet; rivin oikea tunniste
+            # ylivuotoon ja avaimeksi edellisen rivin arvo
+            self._overflow[node_id] = row
+            self._row_ids[row] = node_id
+            self.keys.append(self.keys[-1])
+        else:
+            self.keys.append(node_id)
+        self.alive.append(1)
+        self._alive_count += 1
+        return row
+
+    def kill(self, row: int) -> None:
+        """Mark a row removed (its position stays until compact)"""
+        if self.alive[row]:
+            self.alive[row] = 0
+            self._alive_count -= 1
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(np.frombuffer(self.alive, dtype=np.uint8))
+
+    def compact(self) -> np.ndarray:
+        """Drop dead rows
+
+        Returns:
+            np.ndarray: Old rows that were kept; new row i was keep[i]
+        """
+        keep = self.live_rows()
+        ids = np.frombuffer(self.keys, dtype=np.int64).copy()
+        for row, node_id in self._row_ids.items():
+            ids[row] = node_id
+        ids = ids[keep]
+
+        self.keys = array("q")
+        self.alive = bytearray()
+        self._overflow = {}
+        self._row_ids = {}
+        self._alive_count = 0
+        if len(ids) < 2 or (np.diff(ids) > 0).all():
+            self.keys.frombytes(ids.tobytes())
+            self.alive = bytearray(b"\x01" * len(ids))
+            self._alive_count = len(ids)
+        else:
+            for node_id in ids.tolist():
+                self.append(node_id)
+        return keep
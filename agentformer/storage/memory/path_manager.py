@@ -1,10 +1,23 @@
-"""Path manager for memory storage"""
+"""Path manager for memory storage
+
+Nimetyt kokoelmat (namespace per käyttäjä/projekti) tallennetaan
+hakemistoon storage/memory/collections/<namespace>/, jossa kullakin on
+oma FAISS-indeksinsä, journalinsa ja metadatansa. Oletuskokoelma
+(namespace=None) käyttää edelleen vector_database-hakemistoa.
+"""
 
 import os
+import re
 import logging
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
+COLLECTIONS_DIR = "collections"
+
+# Nimi päätyy hakemistonimeksi, joten polkuerottimet ja ".." eivät käy
+_NAMESPACE_PATTERN = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}$")
+
 
 class PathManager:
     """Manage paths for memory storage"""
@@ -47,3 +60,47 @@ class PathManager:
         logger.info("===================\n")
 
         return paths
+
+    @staticmethod
+    def validate_namespace(namespace: str) -> str:
+        """Check that a collection name is safe to use as a directory name
+
+        Raises:
+            ValueError: If the name is empty, too long or contains path characters
+        """
+        if not isinstance(namespace, str) or not _NAMESPACE_PATTERN.match(namespace):
+            raise ValueError(
+                f"Invalid collection name {namespace!r}: use 1-64 letters, digits, "
+                "'_', '-' or '.', not starting with '.' or '-'"
+            )
+        return namespace
+
+    @staticmethod
+    def get_collection_path(namespace: str, memory_dir: Optional[str] = None) -> str:
+        """Get vector database directory of a named collection
+
+        Args:
+            namespace: Collection name
+            memory_dir: Memory storage directory (default storage/memory)
+        """
+        PathManager.validate_namespace(namespace)
+        memory_dir = memory_dir or os.path.join(
+            PathManager.get_project_root(), "storage", "memory"
+        )
+        return os.path.join(memory_dir, COLLECTIONS_DIR, namespace)
+
+    @staticmethod
+    def list_collections(memory_dir: Optional[str] = None) -> List[str]:
+        """List named collections stored on disk"""
+        memory_dir = memory_dir or os.path.join(
+            PathManager.get_project_root(), "storage", "memory"
+        )
+        root = os.path.join(memory_dir, COLLECTIONS_DIR)
+        if not os.path.isdir(root):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(root)
+            if _NAMESPACE_PATTERN.match(name)
+            and os.path.isdir(os.path.join(root, name))
+        )
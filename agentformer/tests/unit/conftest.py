@@ -0,0 +1,18 @@
+"""Shared fixtures for unit tests"""
+
+import numpy as np
+import pytest
+
+
+def _random_vectors(n: int, dim: int, seed: int = 0, normalize: bool = True):
+    """Seeded float32 vectors from a standard normal, unit length by default"""
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    if normalize:
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+@pytest.fixture(scope="session")
+def random_vectors():
+    """Factory of reproducible test vectors: random_vectors(n, dim, seed=0)"""
+    return _random_vectors
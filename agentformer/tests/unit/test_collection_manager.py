@@ -0,0 +1,104 @@
+"""Tests for named vector collections.
+
+This module tests:
+1. Collection isolation and on-disk layout
+2. LRU eviction by count and by resident bytes
+3. Reopening evicted collections
+4. Pinning collections while in use
+5. Cached collection sizes
+"""
+
+import os
+
+import pytest
+from agentformer.storage.memory.backends.collection_manager import CollectionManager
+from agentformer.storage.memory.backends.faiss_backend import FaissMemoryBackend
+from agentformer.storage.memory.path_manager import PathManager
+
+DIM = 384
+
+
+def test_collections_are_isolated(tmp_path, random_vectors):
+    """Each namespace has its own index directory and search space."""
+    manager = CollectionManager(storage_dir=str(tmp_path))
+    vectors = random_vectors(2, DIM)
+    manager.store_many("tenant-a", ["a"], ["A"], vectors[:1])
+    manager.store_many("tenant-b", ["b"], ["B"], vectors[1:])
+
+    results = manager.semantic_search("tenant-a", vectors[1], k=5)
+    assert [r["content"] for r in results] == ["A"]
+    assert manager.list_collections() == ["tenant-a", "tenant-b"]
+    assert os.path.isdir(PathManager.get_collection_path("tenant-a", str(tmp_path)))
+    assert not (tmp_path / "vector_database" / "faiss_journal.wal").exists()
+
+
+def test_invalid_namespace_rejected(tmp_path):
+    """Names that could escape the collections directory are refused."""
+    manager = CollectionManager(storage_dir=str(tmp_path))
+    for name in ["../other", "", ".hidden", "a/b"]:
+        with pytest.raises(ValueError):
+            with manager.collection(name):
+                pass
+
+
+def test_lru_evicts_cold_collection_and_reopens(tmp_path, random_vectors):
+    """Over max_open the least recently used collection is written and closed."""
+    manager = CollectionManager(storage_dir=str(tmp_path), max_open=2)
+    vectors = random_vectors(3, DIM)
+    for i, name in enumerate(["a", "b", "c"]):
+        manager.store_many(name, [name], [name.upper()], vectors[i : i + 1])
+
+    assert list(manager.resident()) == ["b", "c"]
+    assert manager.stats["evictions"] == 1
+    assert (tmp_path / "collections" / "a" / "faiss_snapshot.json").exists()
+
+    results = manager.semantic_search("a", vectors[0], k=1)
+    assert results[0]["content"] == "A"
+    assert list(manager.resident()) == ["c", "a"]
+    assert manager.stats["misses"] == 4
+
+
+def test_byte_budget_keeps_pinned_collection(tmp_path, random_vectors):
+    """A collection in use stays open even when over the byte budget."""
+    manager = CollectionManager(storage_dir=str(tmp_path), max_resident_bytes=1)
+    vectors = random_vectors(10, DIM)
+
+    with manager.collection("big") as backend:
+        backend.store_many([str(i) for i in range(10)], ["x"] * 10, vectors)
+        manager.store_many("other", ["o"], ["O"], vectors[:1])
+        assert list(manager.resident()) == ["big"]
+        assert backend.semantic_search(vectors[3], k=1)[0]["content"] == "x"
+
+    assert manager.resident() == {}
+    with manager.collection("big") as backend:
+        assert backend.index.ntotal == 10
+
+
+def test_sizes_are_measured_only_for_changed_collection(
+    tmp_path, monkeypatch, random_vectors
+):
+    """A query measures only its own collection, and only after changes."""
+    manager = CollectionManager(storage_dir=str(tmp_path))
+    vectors = random_vectors(3, DIM)
+    for i, name in enumerate(["a", "b", "c"]):
+        manager.store_many(name, [name], [name.upper()], vectors[i : i + 1])
+
+    measured = []
+    original = FaissMemoryBackend.resident_bytes
+
+    def counting(backend):
+        measured.append(backend.namespace)
+        return original(backend)
+
+    monkeypatch.setattr(FaissMemoryBackend, "resident_bytes", counting)
+    for _ in range(5):
+        manager.semantic_search("a", vectors[0], k=1)
+    assert measured == []
+
+    manager.store_many("b", ["b2"], ["B2"], vectors[:1])
+    assert measured == ["b"]
+    assert manager._resident_total == sum(manager.resident().values())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,129 @@
+"""Tests for concurrent Cosmos bulk operations.
+
+This module tests:
+1. Retrying throttled (429) requests
+2. Bounded concurrency
+3. Failure reporting and ignored statuses
+4. Paged bulk deletes
+"""
+
+import threading
+import time
+
+import pytest
+from agentformer.storage.memory.backends.cosmos_bulk import (
+    bulk_delete,
+    bulk_execute,
+    bulk_upsert,
+    retry_delay,
+)
+
+
+class _CosmosError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ThrottlingContainer:
+    """In-memory container that throttles the first request of every item."""
+
+    def __init__(self, throttle=True):
+        self.items = {}
+        self.throttle = throttle
+        self.seen = set()
+        self.active = 0
+        self.max_active = 0
+        self.page_sizes = []
+        self._lock = threading.Lock()
+
+    def _request(self, key):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            first = key not in self.seen
+            self.seen.add(key)
+        try:
+            time.sleep(0.002)
+            if self.throttle and first:
+                raise _CosmosError(429, {"x-ms-retry-after-ms": "1"})
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def upsert_item(self, item):
+        self._request(item["id"])
+        self.items[item["id"]] = item
+
+    def delete_item(self, item, partition_key=None):
+        if item not in self.items:
+            raise _CosmosError(404)
+        self._request(("delete", item))
+        del self.items[item]
+
+    def query_items(
+        self, query, enable_cross_partition_query=None, max_item_count=None
+    ):
+        self.page_sizes.append(max_item_count)
+        return [{"id": key} for key in list(self.items)]
+
+
+def test_bulk_upsert_retries_throttled_requests():
+    """Every 429 is retried and the report counts the retries."""
+    container = ThrottlingContainer()
+    documents = [{"id": f"d{i}"} for i in range(40)]
+
+    report = bulk_upsert(container, documents, max_workers=4)
+
+    assert (report.total, report.succeeded, report.failed) == (40, 40, 0)
+    assert report.retries == 40
+    assert len(container.items) == 40
+    assert 1 < container.max_active <= 4
+    assert report.items_per_second > 0
+    assert "40/40 ok" in report.summary()
+
+
+def test_bulk_execute_reports_failures():
+    """Non-throttling errors fail the item, ignored statuses count as success."""
+
+    def operation(item):
+        if item == 3:
+            raise _CosmosError(400)
+        if item == 5:
+            raise _CosmosError(404)
+
+    report = bulk_execute(operation, range(8), max_workers=2, ignore_status=(404,))
+    assert report.succeeded == 7
+    assert report.failed_keys == {"3"}
+
+    report = bulk_execute(
+        lambda item: (_ for _ in ()).throw(_CosmosError(429)),
+        ["x"],
+        max_retries=2,
+        base_delay=0.001,
+    )
+    assert report.failed == 1 and report.retries == 2
+
+
+def test_bulk_delete_pages_and_ignores_missing():
+    """Resets delete every queried id concurrently."""
+    container = ThrottlingContainer(throttle=False)
+    bulk_upsert(container, [{"id": f"d{i}"} for i in range(25)])
+
+    report = bulk_delete(container, "SELECT c.id FROM c", page_size=10)
+    assert report.succeeded == 25
+    assert container.items == {}
+    assert container.page_sizes == [10]
+
+
+def test_retry_delay_prefers_server_hint():
+    """The x-ms-retry-after-ms header wins over exponential backoff."""
+    assert (
+        retry_delay(_CosmosError(429, {"x-ms-retry-after-ms": "250"}), 0, 1, 5) == 0.25
+    )
+    assert 0 <= retry_delay(_CosmosError(429), 3, 0.1, 0.5) <= 0.5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,175 @@
+"""Tests for the local ANN mirror of a Cosmos container.
+
+This module tests:
+1. Building the mirror on first search
+2. Incremental sync from the _ts cursor
+3. Replacing the vector of an updated document, also within the same second
+4. Dropping documents deleted from Cosmos
+5. Fetching only the top-k documents in one query
+
+Cosmos is replaced by an in-memory container with a manual clock.
+"""
+
+import numpy as np
+import pytest
+from agentformer.storage.memory.backends.cosmos_mirror import CosmosVectorMirror
+
+DIM = 32
+
+
+class ClockedContainer:
+    """Minimal Cosmos container stand-in that stamps upserts with _ts and _etag."""
+
+    def __init__(self):
+        self.items = {}
+        self.queries = []
+        self.now = 1
+        self.writes = 0
+
+    def upsert_item(self, item):
+        self.writes += 1
+        self.items[item["id"]] = dict(item, _ts=self.now, _etag=f'"{self.writes}"')
+
+    def delete_item(self, item, partition_key=None):
+        del self.items[item]
+
+    def query_items(self, query, parameters=None, **kwargs):
+        self.queries.append((query, parameters))
+        value = parameters[0]["value"]
+        if query == CosmosVectorMirror.SYNC_QUERY.format(field="_ts"):
+            matched = [
+                i for i in self.items.values() if i["_ts"] >= value and "embedding" in i
+            ]
+            matched.sort(key=lambda i: i["_ts"])
+            return [
+                {
+                    "id": i["id"],
+                    "embedding": i["embedding"],
+                    "etag": i["_etag"],
+                    "cursor": i["_ts"],
+                }
+                for i in matched
+            ]
+        if query == CosmosVectorMirror.FETCH_QUERY:
+            return [dict(self.items[key]) for key in value if key in self.items]
+        raise NotImplementedError(query)
+
+
+def _store(container, key, vector, text=None):
+    container.upsert_item(
+        {
+            "id": key,
+            "content": text or f"Text {key}",
+            "embedding": vector.tolist(),
+            "metadata": {"filename": f"{key}.txt"},
+        }
+    )
+
+
+@pytest.fixture
+def container(random_vectors):
+    container = ClockedContainer()
+    for i, vector in enumerate(random_vectors(20, DIM)):
+        _store(container, f"doc{i}", vector)
+    container.upsert_item({"id": "file_a.pdf", "type": "file_metadata"})
+    return container
+
+
+@pytest.fixture
+def mirror(container):
+    return CosmosVectorMirror(container, poll_interval=0)
+
+
+def test_first_search_builds_mirror(mirror, container, random_vectors):
+    """The first search syncs every embedded document, then fetches k."""
+    results = mirror.search(random_vectors(20, DIM)[7], k=3)
+
+    assert len(mirror) == 20
+    assert results[0]["content"] == "Text doc7"
+    assert results[0]["meta"] == {"filename": "doc7.txt"}
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+    fetches = [p for q, p in container.queries if q == mirror.FETCH_QUERY]
+    assert len(fetches) == 1
+    assert len(fetches[0][0]["value"]) == 3
+
+
+def test_incremental_sync_reads_only_new_documents(mirror, container, random_vectors):
+    """Later syncs skip documents already seen at the cursor second."""
+    assert mirror.sync() == 20
+    assert mirror.sync() == 0
+
+    container.now = 2
+    _store(container, "new", random_vectors(1, DIM, seed=5)[0])
+    assert mirror.sync() == 1
+    assert len(mirror) == 21
+    assert mirror.cursor == 2
+
+    # Saman sekunnin myöhempi kirjoitus ei katoa
+    _store(container, "late", random_vectors(1, DIM, seed=6)[0])
+    assert mirror.sync() == 1
+    assert len(mirror) == 22
+
+
+def test_updated_document_replaces_vector(mirror, container, random_vectors):
+    mirror.sync()
+    replacement = random_vectors(1, DIM, seed=9)[0]
+    container.now = 3
+    _store(container, "doc0", replacement, text="Updated")
+
+    assert mirror.sync() == 1
+    assert len(mirror) == 20
+    assert mirror.stats["replaced"] == 1
+    results = mirror.search(replacement, k=1)
+    assert results[0]["content"] == "Updated"
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_same_second_update_replaces_vector(mirror, container, random_vectors):
+    """An upsert in the cursor second is re-applied, not skipped as seen."""
+    container.now = 2
+    _store(container, "doc", random_vectors(1, DIM, seed=7)[0])
+    mirror.sync()
+
+    replacement = random_vectors(1, DIM, seed=8)[0]
+    _store(container, "doc", replacement, text="Updated")
+    assert mirror.sync() == 1
+    assert mirror.sync() == 0
+    results = mirror.search(replacement, k=1)
+    assert results[0]["content"] == "Updated"
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_deleted_documents_are_pruned(mirror, container, random_vectors):
+    """Hits missing from Cosmos are dropped and replaced by the next ones."""
+    query = random_vectors(20, DIM)[4]
+    first = mirror.search(query, k=5)
+    for result in first[:2]:
+        container.delete_item(result["meta"]["filename"][: -len(".txt")])
+
+    results = mirror.search(query, k=5)
+    assert len(results) == 5
+    assert {r["content"] for r in results}.isdisjoint(r["content"] for r in first[:2])
+    assert len(mirror) == 18
+    assert mirror.stats["pruned"] == 2
+
+
+def test_matches_exhaustive_cosine_ranking(mirror, container, random_vectors):
+    """Local ranking equals brute-force cosine over the container."""
+    query = random_vectors(1, DIM, seed=3)[0]
+    results = mirror.search(query, k=5)
+
+    vectors = random_vectors(20, DIM)
+    expected = np.argsort(-(vectors @ query))[:5]
+    assert [r["content"] for r in results] == [f"Text doc{i}" for i in expected]
+
+
+def test_clear_resyncs_from_scratch(mirror, container, random_vectors):
+    mirror.sync()
+    mirror.clear()
+    assert len(mirror) == 0
+    assert mirror.search(random_vectors(20, DIM)[1], k=1)[0]["content"] == "Text doc1"
+    assert len(mirror) == 20
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
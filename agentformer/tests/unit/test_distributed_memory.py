@@ -0,0 +1,223 @@
+"""Tests for DistributedMemory and its similarity graph.
+
+This module tests:
+1. Bounded node degree and symmetric links
+2. Graph search recall against brute force
+3. Sublinear insertion cost
+4. Node removal keeping the graph consistent
+5. DistributedMemory linking and state metrics
+6. Top-k spreading-activation retrieval
+7. Cleanup of expired and weakly connected nodes
+8. CSR compaction and renumbering after removals
+"""
+
+import time
+
+import numpy as np
+import pytest
+from agentformer.storage.memory.memory_distributed import DistributedMemory
+from agentformer.storage.memory.memory_graph import SimilarityGraph, hashed_embedding
+
+DIM = 32
+
+
+def _assert_consistent(graph):
+    for node_id in graph:
+        for level in range(graph.level(node_id) + 1):
+            cap = graph.m0 if level == 0 else graph.m
+            neighbors = graph.neighbors(node_id, level)
+            assert len(neighbors) <= cap
+            for neighbor in neighbors:
+                assert node_id in graph.neighbors(neighbor, level)
+
+
+@pytest.fixture(scope="module")
+def graph(random_vectors):
+    graph = SimilarityGraph(m=8, seed=0)
+    for i, vector in enumerate(random_vectors(2000, DIM)):
+        graph.add(i, vector)
+    return graph
+
+
+def test_degree_bounded_and_symmetric(graph):
+    _assert_consistent(graph)
+    degrees = [graph.degree(node_id) for node_id in graph]
+    assert min(degrees) >= 1
+    assert np.mean(degrees) <= graph.m0
+
+
+def test_search_recall(graph, random_vectors):
+    vectors = random_vectors(2000, DIM)
+    queries = random_vectors(50, DIM, seed=1)
+    hits = 0
+    for query in queries:
+        expected = set(np.argsort(-(vectors @ query))[:10].tolist())
+        found = {node_id for _, node_id in graph.search(query, 10, ef=64)}
+        hits += len(expected & found)
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_insertion_cost_is_sublinear(random_vectors):
+    graph = SimilarityGraph(m=8, seed=0)
+    vectors = random_vectors(4000, DIM, seed=2)
+    for i, vector in enumerate(vectors[:3900]):
+        graph.add(i, vector)
+    before = graph.distance_computations
+    for i, vector in enumerate(vectors[3900:], start=3900):
+        graph.add(i, vector)
+    per_insert = (graph.distance_computations - before) / 100
+    assert per_insert < 3900 / 4
+
+
+def test_remove_keeps_graph_consistent(random_vectors):
+    graph = SimilarityGraph(m=4, seed=0)
+    vectors = random_vectors(300, DIM, seed=3)
+    for i, vector in enumerate(vectors):
+        graph.add(i, vector)
+    for i in range(0, 300, 2):
+        graph.remove(i)
+
+    _assert_consistent(graph)
+    assert len(graph) == 150
+    assert graph.entry in graph
+    found = graph.search(vectors[1], 1)
+    assert found[0][1] == 1
+
+
+def test_distributed_memory_links_similar_content():
+    memory = DistributedMemory(max_connections=2)
+    for i in range(30):
+        memory.store(f"satunnainen muistiinpano numero {i}", "episodic")
+    memory.store("Helsinki on Suomen pääkaupunki", "semantic")
+    memory.store("Suomen pääkaupunki on Helsinki", "semantic")
+
+    helsinki = [
+        node_id
+        for node_id, node in memory.nodes.items()
+        if "Helsinki" in node["content"]
+    ]
+    assert helsinki[1] in memory.nodes[helsinki[0]]["connections"]
+
+    state = memory.get_state()
+    assert state["total_nodes"] == 32
+    assert 1 <= state["avg_connections"] <= state["max_connections"] == 4
+    assert memory.retrieve("helsinki") != []
+
+
+def test_store_uses_given_embedding(random_vectors):
+    memory = DistributedMemory()
+    vectors = random_vectors(3, DIM)
+    memory.store("a", embedding=vectors[0])
+    memory.store("b", embedding=vectors[1], source="test")
+    node = list(memory.nodes.values())[1]
+    assert node["metadata"] == {"source": "test"}
+    np.testing.assert_allclose(
+        memory.graph.vector(list(memory.nodes)[1]), vectors[1], rtol=1e-6
+    )
+
+
+def test_hashed_embedding_is_normalized():
+    vector = hashed_embedding("Helsinki Helsinki Turku")
+    assert vector.shape == (256,)
+    assert np.linalg.norm(vector) == pytest.approx(1.0)
+    assert not hashed_embedding("").any()
+
+
+@pytest.fixture
+def notes():
+    memory = DistributedMemory(max_connections=4)
+    topics = ["kahvi", "tee", "juna", "bussi", "sauna", "järvi"]
+    for i in range(120):
+        memory.store(f"{topics[i % 6]} muistiinpano {i}", "episodic")
+    memory.store("sauna ja järvi kesällä", "semantic")
+    return memory
+
+
+def test_activation_ranks_nearest_first(notes):
+    results = notes.activate("sauna järvi kesällä", k=5)
+    assert len(results) == 5
+    assert notes.nodes[results[0][1]]["content"] == "sauna ja järvi kesällä"
+    activations = [a for a, _ in results]
+    assert activations == sorted(activations, reverse=True)
+
+    nodes = notes.retrieve("sauna järvi kesällä", k=3)
+    assert [n["content"] for n in nodes][0] == "sauna ja järvi kesällä"
+
+
+def test_activation_filters_type_and_hops(notes):
+    semantic = notes.retrieve("sauna", memory_type="semantic", k=3)
+    assert [n["type"] for n in semantic] == ["semantic"]
+
+    seeds_only = notes.activate("kahvi", k=4, max_hops=0)
+    seeds = [node_id for _, node_id in notes.graph.search(hashed_embedding("kahvi"), 4)]
+    assert {node_id for _, node_id in seeds_only} <= set(seeds)
+
+
+def test_activation_prefers_recent_nodes(monkeypatch):
+    memory = DistributedMemory()
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now - 14 * 24 * 60 * 60)
+    memory.store("sama sisältö", "episodic")
+    monkeypatch.setattr(time, "time", lambda: now)
+    memory.store("sama sisältö", "episodic")
+    old_id, new_id = list(memory.nodes)
+
+    results = memory.activate("sama sisältö", k=2)
+    assert [node_id for _, node_id in results] == [new_id, old_id]
+    assert results[1][0] == pytest.approx(results[0][0] / 4, rel=1e-3)
+
+
+def test_activation_cost_does_not_grow_with_node_count(random_vectors):
+    costs = []
+    for n in (500, 4000):
+        memory = DistributedMemory(max_connections=4)
+        for i, vector in enumerate(random_vectors(n, DIM, seed=4)):
+            memory.store(f"n{i}", embedding=vector)
+        before = memory.graph.distance_computations
+        memory.activate("", k=5, embedding=random_vectors(1, DIM, seed=5)[0])
+        costs.append(memory.graph.distance_computations - before)
+    assert costs[1] < 2 * costs[0]
+
+
+def test_cleanup_removes_only_expired_and_weak_nodes(monkeypatch):
+    memory = DistributedMemory(max_connections=2, max_age=60)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now - 120)
+    memory.store("muistiinpano 0 aiheesta")
+    monkeypatch.undo()
+    for i in range(1, 20):
+        memory.store(f"muistiinpano {i % 4} aiheesta")
+    old_id = next(iter(memory.nodes))
+
+    memory.cleanup()
+    assert old_id not in memory.nodes
+    assert old_id not in memory.graph
+    assert all(len(n["connections"]) >= 2 for n in memory.nodes.values())
+    _assert_consistent(memory.graph)
+
+    # Muuttumattomia solmuja ei tarkisteta uudelleen
+    remaining = len(memory.nodes)
+    memory.graph.pop_touched()
+    memory.cleanup()
+    assert len(memory.nodes) == remaining
+
+
+def test_compaction_renumbers_rows(random_vectors):
+    graph = SimilarityGraph(m=4, seed=0, compact_threshold=16)
+    vectors = random_vectors(400, DIM, seed=6)
+    for i, vector in enumerate(vectors):
+        graph.add(i, vector)
+    assert len(graph._delta) <= max(16, 400 // 8)
+    for i in range(300):
+        graph.remove(i)
+
+    # Kuolleet rivit on pudotettu ja loput numeroitu uudelleen
+    assert graph.index.row_count < 400
+    _assert_consistent(graph)
+    np.testing.assert_allclose(graph.vector(350), vectors[350], rtol=1e-6)
+    found = graph.search(vectors[350], 1)
+    assert found[0][1] == 350
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,125 @@
+"""Tests for the TextEmbedder worker pool.
+
+This module tests:
+1. Small batches staying in-process
+2. Large batches sharing one lazily started pool
+3. Fallback when the pool cannot start
+4. Shutdown of all pools
+5. The real SentenceTransformer accepting the pool calls made by _encode
+
+PoolModel stands in for the library, so the pool path is never run
+against a real model here; test 5 checks the call signatures instead.
+"""
+
+import inspect
+
+import numpy as np
+import pytest
+from agentformer.tools.memory_tools.config import EmbedderConfig
+from agentformer.tools.memory_tools.processing import embedder as embedder_module
+from agentformer.tools.memory_tools.processing.embedder import (
+    TextEmbedder,
+    shutdown_pools,
+)
+
+DIM = 4
+
+
+class PoolModel:
+    starts = 0
+    stopped = []
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32):
+        self.calls.append(("local", len(texts)))
+        return np.ones((len(texts), DIM), np.float32)
+
+    def start_multi_process_pool(self, target_devices):
+        if self.fail:
+            raise RuntimeError("ei prosesseja")
+        PoolModel.starts += 1
+        return {"devices": target_devices}
+
+    def encode_multi_process(self, texts, pool, batch_size, normalize_embeddings):
+        self.calls.append(("pool", len(texts)))
+        return np.ones((len(texts), DIM), np.float32)
+
+    @staticmethod
+    def stop_multi_process_pool(pool):
+        PoolModel.stopped.append(pool)
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools():
+    shutdown_pools()
+    PoolModel.starts = 0
+    PoolModel.stopped = []
+    yield
+    shutdown_pools()
+
+
+def _embedder(monkeypatch, fail=False, **config):
+    monkeypatch.setattr(TextEmbedder, "_load_model", lambda self: PoolModel(fail))
+    return TextEmbedder(
+        EmbedderConfig(use_cache=False, num_workers=3, pool_min_texts=10, **config)
+    )
+
+
+def test_small_batches_stay_in_process(monkeypatch):
+    embedder = _embedder(monkeypatch)
+    assert embedder.embed_texts(["a"] * 9).shape == (9, DIM)
+    assert embedder.model.calls == [("local", 9)]
+    assert PoolModel.starts == 0
+
+
+def test_large_batches_share_pool(monkeypatch):
+    first = _embedder(monkeypatch)
+    second = _embedder(monkeypatch)
+    first.embed_texts(["a"] * 10)
+    second.embed_texts(["b"] * 50)
+
+    assert first.model.calls == [("pool", 10)]
+    assert second.model.calls == [("pool", 50)]
+    assert PoolModel.starts == 1
+
+    shutdown_pools()
+    assert PoolModel.stopped == [{"devices": ["cpu"] * 3}]
+
+
+def test_pool_disabled_or_unavailable(monkeypatch):
+    gpu = _embedder(monkeypatch, model_device="cuda")
+    gpu.embed_texts(["a"] * 20)
+    assert gpu.model.calls == [("local", 20)]
+
+    failing = _embedder(monkeypatch, fail=True)
+    failing.embed_texts(["a"] * 20)
+    failing.embed_texts(["a"] * 20)
+    assert failing.model.calls == [("local", 20), ("local", 20)]
+    assert embedder_module._pools == {("all-MiniLM-L6-v2", 3): None}
+
+
+@pytest.mark.parametrize(
+    "method, keywords",
+    [
+        ("start_multi_process_pool", ["target_devices"]),
+        ("encode_multi_process", ["pool", "batch_size", "normalize_embeddings"]),
+        ("stop_multi_process_pool", ["pool"]),
+    ],
+)
+def test_real_model_accepts_pool_calls(method, keywords):
+    # normalize_embeddings tuli encode_multi_processiin versiossa 2.3
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    parameters = inspect.signature(
+        getattr(sentence_transformers.SentenceTransformer, method)
+    ).parameters
+    assert set(keywords) <= set(parameters)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
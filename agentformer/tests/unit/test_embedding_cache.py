@@ -0,0 +1,186 @@
+"""Tests for the persistent embedding cache.
+
+This module tests:
+1. Round trip and persistence across reopen
+2. TTL expiry and size-bounded compaction
+3. Recovery from a torn final record
+4. Row key verification and keys ending in NUL bytes
+5. TextEmbedder encoding only cache misses through a shared cache
+6. The same vector for a text whether it was a miss or a hit, exact by default
+"""
+
+import os
+
+import numpy as np
+import pytest
+from agentformer.tools.memory_tools.config import EmbedderConfig
+from agentformer.tools.memory_tools.processing.embedder import TextEmbedder
+from agentformer.tools.memory_tools.processing import (
+    embedding_cache as embedder_cache_module,
+)
+from agentformer.tools.memory_tools.processing.embedding_cache import (
+    EmbeddingCache,
+    cache_key,
+    open_cache,
+)
+
+DIM = 8
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _key(text):
+    return cache_key("malli", True, text)
+
+
+def test_round_trip_and_reopen(tmp_path, random_vectors):
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(path, DIM, dtype="float32")
+    keys = [_key(t) for t in ("a", "b", "c")]
+    vectors = random_vectors(3, DIM)
+    cache.put_many(keys, vectors)
+
+    found, missing = cache.get_many([keys[2], _key("x"), keys[0]])
+    assert missing == [1]
+    np.testing.assert_array_equal(found[0], vectors[2])
+    np.testing.assert_array_equal(found[2], vectors[0])
+    assert not found[1].any()
+
+    reopened = EmbeddingCache(path, DIM, dtype="float32")
+    assert len(reopened) == 3
+    found, missing = reopened.get_many(keys)
+    assert missing == []
+    np.testing.assert_array_equal(found, vectors)
+    assert _key("a") != cache_key("malli", False, "a")
+
+
+def test_float16_slab_is_close(tmp_path, random_vectors):
+    cache = EmbeddingCache(str(tmp_path / "cache.bin"), DIM, dtype="float16")
+    vectors = random_vectors(4, DIM)
+    cache.put_many([_key(str(i)) for i in range(4)], vectors)
+    found, _ = cache.get_many([_key(str(i)) for i in range(4)])
+    np.testing.assert_allclose(found, vectors, rtol=1e-3, atol=1e-3)
+    assert cache.nbytes == 4 * (32 + 8 + 2 * DIM)
+
+
+def test_ttl_and_size_eviction(tmp_path, random_vectors):
+    clock = Clock()
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(path, DIM, ttl=60, max_entries=10, clock=clock)
+    cache.put_many([_key("vanha")], random_vectors(1, DIM))
+    clock.now += 61
+    assert cache.get_many([_key("vanha")])[1] == [0]
+
+    keys = [_key(str(i)) for i in range(11)]
+    cache.put_many(keys, random_vectors(11, DIM))
+    # Ylitys tiivistää 90 %:iin ja säilyttää uusimmat
+    assert len(cache) == 9
+    assert cache.get_many(keys[:2])[1] == [0, 1]
+    assert cache.get_many(keys[2:])[1] == []
+    assert os.path.getsize(path) == cache.nbytes == 9 * cache.record.itemsize
+
+
+def test_torn_record_is_dropped(tmp_path, random_vectors):
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(path, DIM)
+    cache.put_many([_key("a"), _key("b")], random_vectors(2, DIM))
+    with open(path, "ab") as f:
+        f.write(b"\x01" * 10)
+
+    reopened = EmbeddingCache(path, DIM)
+    assert len(reopened) == 2
+    reopened.put_many([_key("c")], random_vectors(1, DIM))
+    assert EmbeddingCache(path, DIM).get_many([_key("c")])[1] == []
+
+
+def test_row_key_mismatch_is_a_miss(tmp_path, random_vectors):
+    cache = EmbeddingCache(str(tmp_path / "cache.bin"), DIM)
+    cache.put_many([_key("a"), _key("b")], random_vectors(2, DIM))
+    # Vanhentunut indeksi osoittaa toisen avaimen riville
+    cache._index[_key("a")] = cache._index[_key("b")]
+    found, missing = cache.get_many([_key("a"), _key("b")])
+    assert missing == [0]
+    assert not found[0].any()
+    assert _key("a") not in cache
+
+
+def test_key_with_trailing_nul_survives_reopen(tmp_path, random_vectors):
+    path = str(tmp_path / "cache.bin")
+    key = b"\x07" * 31 + b"\x00"
+    EmbeddingCache(path, DIM).put_many([key], random_vectors(1, DIM))
+    assert EmbeddingCache(path, DIM).get_many([key])[1] == []
+
+
+def test_open_cache_shares_one_instance(tmp_path):
+    path = str(tmp_path / "jaettu.bin")
+    first = open_cache(path, DIM, max_entries=10)
+    assert open_cache(str(tmp_path / "." / "jaettu.bin"), DIM) is first
+    with pytest.raises(ValueError):
+        open_cache(path, DIM + 1)
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32):
+        self.encoded.extend(texts)
+        return np.array([[len(t)] + [1.0] * (DIM - 1) for t in texts], np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+def test_embedder_encodes_only_misses(tmp_path, monkeypatch):
+    monkeypatch.setattr(TextEmbedder, "_load_model", lambda self: CountingModel())
+    config = EmbedderConfig(cache_dir=str(tmp_path), cache_dtype="float32")
+    embedder = TextEmbedder(config)
+
+    first = embedder.embed_texts(["yksi", "kaksi", "yksi"])
+    assert embedder.model.encoded == ["yksi", "kaksi"]
+
+    assert TextEmbedder(config).cache is embedder.cache
+    # Uudelleenkäynnistys: välimuisti avataan tiedostosta
+    monkeypatch.setattr(embedder_cache_module, "_caches", {})
+    restarted = TextEmbedder(config)
+    assert restarted.cache is not embedder.cache
+    second = restarted.embed_texts(["kolme", "kaksi", "yksi"])
+    assert restarted.model.encoded == ["kolme"]
+    np.testing.assert_array_equal(second[1:], first[[1, 0]])
+    assert second[0][0] == 5
+    assert restarted.cache_stats()["hits"] == 2
+
+
+def test_float16_cache_returns_same_vector_on_miss_and_hit(tmp_path, monkeypatch):
+    """A miss returns the stored float16-rounded row, not the raw encoding."""
+    monkeypatch.setattr(TextEmbedder, "_load_model", lambda self: CountingModel())
+    config = EmbedderConfig(cache_dir=str(tmp_path), cache_dtype="float16")
+    embedder = TextEmbedder(config)
+
+    text = "x" * 2049  # 2049 ei ole tarkka float16-luku
+    first = embedder.embed_texts([text])[0]
+    second = embedder.embed_texts([text])[0]
+    assert embedder.model.encoded == [text]
+    np.testing.assert_array_equal(first, second)
+    assert first.dtype == np.float32
+
+
+def test_default_cache_keeps_exact_encodings(tmp_path, monkeypatch):
+    """The default float32 cache returns the model's vectors unrounded."""
+    monkeypatch.setattr(TextEmbedder, "_load_model", lambda self: CountingModel())
+    embedder = TextEmbedder(EmbedderConfig(cache_dir=str(tmp_path)))
+
+    text = "x" * 2049
+    exact = CountingModel().encode([text])[0]
+    np.testing.assert_array_equal(embedder.embed_texts([text])[0], exact)
+    np.testing.assert_array_equal(embedder.embed_texts([text])[0], exact)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,546 @@
+"""Tests for FaissMemoryBackend.
+
+This module tests:
+1. Single and bulk storage
+2. Batch writer mode, buffered per thread
+3. Persistence between backend instances
+4. Journal replay, torn tails, rejected writes and compaction
+5. Read-mostly startup with lazily loaded chunk records
+6. Quantized storage with exact vectors on disk
+7. Batched multi-query search
+8. Metadata-filtered search
+9. Lock-free searches during ingestion
+"""
+
+import threading
+
+import pytest
+import numpy as np
+from agentformer.storage.memory.backends.faiss_backend import FaissMemoryBackend
+from agentformer.storage.memory.backends.chunk_sidecar import LazyChunkList
+from agentformer.storage.memory.backends.index_factory import (
+    IndexConfig,
+    index_quantization,
+)
+from agentformer.storage.memory.backends.index_snapshot import IndexSnapshot
+from agentformer.storage.memory.backends.metadata_filter import MetadataIndex
+from agentformer.storage.memory.backends.vector_sidecar import (
+    VectorSidecar,
+    write_vectors,
+)
+
+DIM = 384
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """Create a backend with an isolated storage directory."""
+    return FaissMemoryBackend(storage_dir=str(tmp_path))
+
+
+def test_store_many_adds_all_chunks(backend, random_vectors):
+    """Bulk store adds every chunk and keeps metadata aligned."""
+    vectors = random_vectors(20, DIM)
+    ids = [f"chunk{i}" for i in range(20)]
+    texts = [f"Text {i}" for i in range(20)]
+    metas = [{"filename": "manual.pdf", "chunk": i} for i in range(20)]
+
+    assert backend.store_many(ids, texts, vectors, metas) == 20
+    assert backend.count() == 20
+    assert len(backend.metadata) == 20
+
+    results = backend.semantic_search(vectors[7], k=1)
+    assert results[0]["content"] == "Text 7"
+    assert results[0]["meta"]["chunk"] == 7
+
+
+def test_store_many_persists_once(backend, monkeypatch, random_vectors):
+    """Bulk store writes a single journal record."""
+    appends = []
+    append = backend.journal.append
+
+    def count_append(header, vectors=None):
+        appends.append(header["op"])
+        return append(header, vectors)
+
+    monkeypatch.setattr(backend.journal, "append", count_append)
+
+    backend.store_many([str(i) for i in range(50)], ["x"] * 50, random_vectors(50, DIM))
+
+    assert appends == ["store"]
+
+
+def test_store_many_rejects_misaligned_input(backend, random_vectors):
+    """Mismatched ids and texts raise ValueError."""
+    with pytest.raises(ValueError):
+        backend.store_many(["a", "b"], ["only one"], random_vectors(2, DIM))
+
+
+def test_batch_commits_on_exit(backend, random_vectors):
+    """store() calls inside batch() are written on exit."""
+    vectors = random_vectors(5, DIM)
+    with backend.batch():
+        for i, vector in enumerate(vectors):
+            backend.store(f"id{i}", f"Text {i}", vector)
+        assert backend.count() == 0
+
+    assert backend.count() == 5
+    assert [m["content_id"] for m in backend.metadata] == [f"id{i}" for i in range(5)]
+
+
+def test_batch_discards_on_error(backend, random_vectors):
+    """An exception inside batch() leaves the store untouched."""
+    with pytest.raises(RuntimeError):
+        with backend.batch():
+            backend.store("id0", "Text", random_vectors(1, DIM)[0])
+            raise RuntimeError("boom")
+
+    assert backend.index.ntotal == 0
+    assert backend.metadata == []
+
+
+def test_batch_does_not_capture_other_threads(backend, random_vectors):
+    """Writes from another thread during a batch are stored at once."""
+    vectors = random_vectors(3, DIM)
+    entered, stored = threading.Event(), threading.Event()
+
+    def writer():
+        entered.wait()
+        backend.store("other", "Other thread", vectors[2])
+        backend.store_many(["other2"], ["Other bulk"], vectors[1:2])
+        stored.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    with pytest.raises(RuntimeError):
+        with backend.batch():
+            backend.store("mine", "Batched", vectors[0])
+            entered.set()
+            assert stored.wait(5)
+            assert backend.count() == 2
+            raise RuntimeError("boom")
+    thread.join()
+
+    assert [m["content_id"] for m in backend.metadata] == ["other", "other2"]
+
+
+def test_reload_from_disk(tmp_path, random_vectors):
+    """A new backend instance loads what the previous one stored."""
+    first = FaissMemoryBackend(storage_dir=str(tmp_path))
+    vectors = random_vectors(3, DIM)
+    first.store_many(["a", "b", "c"], ["A", "B", "C"], vectors)
+
+    second = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert second.index.ntotal == 3
+    assert second.semantic_search(vectors[2], k=1)[0]["content"] == "C"
+
+
+def test_journal_replay_without_snapshot(tmp_path, random_vectors):
+    """Mutations survive a restart through journal replay alone."""
+    first = FaissMemoryBackend(storage_dir=str(tmp_path))
+    vectors = random_vectors(4, DIM)
+    first.store_many(["a", "b", "c", "d"], ["A", "B", "C", "D"], vectors)
+    first.delete(["b"])
+    first.close()
+
+    assert not (tmp_path / "vector_database" / "faiss_snapshot.json").exists()
+
+    second = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert [m["content_id"] for m in second.metadata] == ["a", "c", "d"]
+    assert second.semantic_search(vectors[3], k=1)[0]["content"] == "D"
+
+
+def test_torn_journal_tail_is_dropped(tmp_path, random_vectors):
+    """A partially written last record is cut off on startup."""
+    first = FaissMemoryBackend(storage_dir=str(tmp_path))
+    first.store("a", "A", random_vectors(1, DIM)[0])
+    first.store("b", "B", random_vectors(1, DIM, seed=1)[0])
+    first.close()
+
+    journal_path = tmp_path / "vector_database" / "faiss_journal.wal"
+    data = journal_path.read_bytes()
+    journal_path.write_bytes(data[:-10])
+
+    second = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert [m["content_id"] for m in second.metadata] == ["a"]
+
+    second.store("c", "C", random_vectors(1, DIM, seed=2)[0])
+    second.close()
+    third = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert [m["content_id"] for m in third.metadata] == ["a", "c"]
+
+
+def test_rejected_store_does_not_break_reopen(tmp_path, random_vectors):
+    """A vector of the wrong dimension never reaches the journal."""
+    first = FaissMemoryBackend(storage_dir=str(tmp_path))
+    first.store("a", "A", random_vectors(1, DIM)[0])
+    with pytest.raises(ValueError):
+        first.store("bad", "X", np.ones(DIM + 1, dtype=np.float32))
+    first.store("b", "B", random_vectors(1, DIM, seed=1)[0])
+    first.close()
+
+    second = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert [m["content_id"] for m in second.metadata] == ["a", "b"]
+
+
+def test_unappliable_journal_record_stops_replay(tmp_path, random_vectors):
+    """Replay stops at a record it cannot apply instead of failing to open."""
+    first = FaissMemoryBackend(storage_dir=str(tmp_path))
+    first.store("a", "A", random_vectors(1, DIM)[0])
+    first.journal.append({"op": "unknown", "seq": 2})
+    first.close()
+
+    second = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert [m["content_id"] for m in second.metadata] == ["a"]
+    second.store("b", "B", random_vectors(1, DIM, seed=1)[0])
+    second.close()
+
+    third = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert [m["content_id"] for m in third.metadata] == ["a", "b"]
+
+
+def test_unreadable_or_misaligned_metadata_refuses_to_open(tmp_path, random_vectors):
+    """The store does not serve vectors whose metadata is lost."""
+    first = FaissMemoryBackend(storage_dir=str(tmp_path))
+    first.store_many(["a", "b"], ["A", "B"], random_vectors(2, DIM))
+    first.compact()
+    first.close()
+
+    db_dir = tmp_path / "vector_database"
+    chunks = next(db_dir.glob("faiss_chunks.*.bin"))
+    original = chunks.read_bytes()
+    chunks.write_bytes(b"rikki")
+    with pytest.raises(ValueError, match="Unreadable"):
+        FaissMemoryBackend(storage_dir=str(tmp_path))
+
+    chunks.write_bytes(original)
+    next(db_dir.glob("faiss_index.*.bin")).unlink()
+    with pytest.raises(ValueError, match="metadata has 2 records"):
+        FaissMemoryBackend(storage_dir=str(tmp_path))
+
+
+def test_compaction_folds_journal_into_snapshot(tmp_path, random_vectors):
+    """compact() writes a snapshot and empties the journal."""
+    backend = FaissMemoryBackend(storage_dir=str(tmp_path))
+    vectors = random_vectors(10, DIM)
+    backend.store_many([str(i) for i in range(10)], ["x"] * 10, vectors)
+
+    assert backend.compact() is True
+    assert backend.journal.size() == 0
+    assert not backend.compact()
+
+    backend.store("late", "Late", random_vectors(1, DIM, seed=3)[0])
+    backend.close()
+
+    reloaded = FaissMemoryBackend(storage_dir=str(tmp_path))
+    assert reloaded.index.ntotal == 11
+    assert reloaded.metadata[-1]["content_id"] == "late"
+
+
+def test_background_compaction(tmp_path, random_vectors):
+    """Crossing compact_threshold compacts in a background thread."""
+    backend = FaissMemoryBackend(storage_dir=str(tmp_path), compact_threshold=1)
+    backend.store_many(["a", "b"], ["A", "B"], random_vectors(2, DIM))
+    backend.close()
+
+    assert backend.journal.size() == 0
+    assert (tmp_path / "vector_database" / "faiss_snapshot.json").exists()
+
+
+def test_reset_index(backend, random_vectors):
+    """reset_index() empties the store durably."""
+    backend.store_many(["a", "b"], ["A", "B"], random_vectors(2, DIM))
+    backend.reset_index()
+
+    assert backend.index.ntotal == 0
+    reloaded = FaissMemoryBackend(storage_dir=backend.storage_dir)
+    assert reloaded.metadata == []
+
+
+@pytest.fixture
+def compacted_dir(tmp_path, random_vectors):
+    """Storage directory holding a compacted snapshot of 100 chunks."""
+    backend = FaissMemoryBackend(storage_dir=str(tmp_path))
+    backend.store_many(
+        [f"id{i}" for i in range(100)],
+        [f"Text {i}" for i in range(100)],
+        random_vectors(100, DIM),
+        [{"chunk": i} for i in range(100)],
+    )
+    backend.compact()
+    backend.close()
+    return tmp_path
+
+
+def test_read_mostly_fetches_only_hits(compacted_dir, monkeypatch, random_vectors):
+    """Read-mostly mode decodes chunk records only for search hits."""
+    backend = FaissMemoryBackend(storage_dir=str(compacted_dir), read_mostly=True)
+    assert isinstance(backend.metadata, LazyChunkList)
+    assert len(backend.metadata) == 100
+
+    reads = []
+    read = backend.metadata.sidecar.read
+
+    def count_read(row):
+        reads.append(row)
+        return read(row)
+
+    monkeypatch.setattr(backend.metadata.sidecar, "read", count_read)
+
+    results = backend.semantic_search(random_vectors(100, DIM)[42], k=3)
+    assert results[0]["content"] == "Text 42"
+    assert results[0]["meta"] == {"chunk": 42}
+    assert len(reads) == 3
+
+
+def test_read_mostly_accepts_writes(compacted_dir, random_vectors):
+    """Writes on top of a mapped snapshot survive compaction and reload."""
+    backend = FaissMemoryBackend(storage_dir=str(compacted_dir), read_mostly=True)
+    backend.store("new", "New text", random_vectors(1, DIM, seed=9)[0])
+    backend.delete(["id0", "id1"])
+
+    assert len(backend.metadata) == 99
+    assert backend.metadata[0]["content_id"] == "id2"
+    assert backend.metadata[-1]["content_id"] == "new"
+
+    backend.compact()
+    backend.close()
+
+    eager = FaissMemoryBackend(storage_dir=str(compacted_dir))
+    assert isinstance(eager.metadata, list)
+    assert [m["content_id"] for m in eager.metadata[:2]] == ["id2", "id3"]
+    assert eager.semantic_search(random_vectors(1, DIM, seed=9)[0], k=1)[0][
+        "content"
+    ] == ("New text")
+
+
+def test_compaction_releases_old_sidecar(compacted_dir, random_vectors):
+    """The replaced sidecar is closed once no generation uses it."""
+    import gc
+
+    backend = FaissMemoryBackend(storage_dir=str(compacted_dir), read_mostly=True)
+    old_finalizer = backend.metadata.sidecar._finalizer
+    backend.store("late", "Late", random_vectors(1, DIM, seed=5)[0])
+    backend.compact()
+    gc.collect()
+
+    assert not old_finalizer.alive
+    assert isinstance(backend.metadata, LazyChunkList)
+    assert backend.metadata[-1]["content_id"] == "late"
+    current = backend.metadata.sidecar
+    backend.close()
+    assert current.closed
+
+
+def test_vector_sidecar_positions(tmp_path, random_vectors):
+    """Sidecar keeps positions aligned across drops, appends and mapping."""
+    vectors = random_vectors(10, DIM)
+    sidecar = VectorSidecar(DIM)
+    sidecar.extend(vectors[:6])
+    path = str(tmp_path / "vectors.npy")
+    write_vectors(path, sidecar)
+    mapped = VectorSidecar(DIM, path)
+    mapped.extend(vectors[6:])
+    frozen = mapped.frozen()
+    mapped.drop([1, 7])
+
+    assert len(frozen) == 10
+    assert len(mapped) == 8
+    assert np.array_equal(mapped.take([0, 1, 6, 7]), vectors[[0, 2, 8, 9]])
+    assert np.array_equal(mapped.range(0, 8), np.delete(vectors, [1, 7], axis=0))
+
+
+def test_quantized_backend_reranks_from_disk(tmp_path, random_vectors):
+    """An SQ8 backend returns exact scores and maps float vectors after compaction."""
+    config = IndexConfig(quantization="sq8")
+    backend = FaissMemoryBackend(storage_dir=str(tmp_path), index_config=config)
+    vectors = random_vectors(1200, DIM)
+    backend.store_many([f"id{i}" for i in range(1200)], ["x"] * 1200, vectors)
+    backend.promoter.wait()
+
+    assert index_quantization(backend.index) == "sq8"
+    result = backend.semantic_search(vectors[5], k=1)
+    assert result[0]["distance"] == pytest.approx(1.0, abs=1e-5)
+
+    backend.delete(["id0"])
+    backend.compact()
+    backend.close()
+    assert backend.vectors.path == backend.vectors_path
+
+    reloaded = FaissMemoryBackend(
+        storage_dir=str(tmp_path), read_mostly=True, index_config=config
+    )
+    assert index_quantization(reloaded.index) == "sq8"
+    assert len(reloaded.vectors) == reloaded.index.ntotal == 1199
+    assert np.array_equal(reloaded.vectors.take([0]), vectors[1:2])
+    result = reloaded.semantic_search(vectors[5], k=1)
+    assert result[0]["distance"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_semantic_search_batch_matches_single_queries(
+    backend, monkeypatch, random_vectors
+):
+    """A batch runs one index search and returns per-query result lists."""
+    vectors = random_vectors(30, DIM)
+    backend.store_many(
+        [str(i) for i in range(30)], [f"T{i}" for i in range(30)], vectors
+    )
+    expected = [backend.semantic_search(vectors[i], k=3) for i in (4, 17, 29)]
+
+    searches = []
+    search = IndexSnapshot.search
+
+    def count_search(snapshot, queries, *args, **kwargs):
+        searches.append(len(queries))
+        return search(snapshot, queries, *args, **kwargs)
+
+    monkeypatch.setattr(IndexSnapshot, "search", count_search)
+    batch = backend.semantic_search_batch(vectors[[4, 17, 29]], k=3)
+
+    assert searches == [3]
+    # Delta-rivit pisteytetään numpyllä, joten erän ja yksittäisen haun
+    # etäisyydet voivat erota pyöristyksen verran
+    assert [[r["content"] for r in results] for results in batch] == [
+        [r["content"] for r in results] for results in expected
+    ]
+    for results, single in zip(batch, expected):
+        assert [r["distance"] for r in results] == pytest.approx(
+            [r["distance"] for r in single], abs=1e-6
+        )
+    assert [results[0]["content"] for results in batch] == ["T4", "T17", "T29"]
+    assert backend.semantic_search_batch(np.empty((0, DIM)), k=3) == []
+
+
+def test_semantic_search_batch_accepts_single_vector(backend, random_vectors):
+    """A 1-D query is one query, and inputs above two dimensions raise."""
+    vectors = random_vectors(5, DIM)
+    backend.store_many([str(i) for i in range(5)], [f"T{i}" for i in range(5)], vectors)
+
+    batch = backend.semantic_search_batch(vectors[2], k=2)
+    assert len(batch) == 1
+    assert batch[0][0]["content"] == "T2"
+    with pytest.raises(ValueError):
+        backend.semantic_search_batch(vectors.reshape(5, 2, -1), k=2)
+
+
+def test_metadata_index_match():
+    """Fields combine with AND, listed values with OR, file_type from suffix."""
+    filters = MetadataIndex()
+    filters.add(0, {"filename": "a.pdf", "doc_id": "1"})
+    filters.add(1, {"filename": "b.txt", "doc_id": "1"})
+    filters.add(2, {"filename": "c.PDF", "doc_id": "2"})
+
+    assert filters.match({"file_type": "pdf"}).tolist() == [0, 2]
+    assert filters.match({"file_type": "pdf", "doc_id": "1"}).tolist() == [0]
+    assert filters.match({"filename": ["a.pdf", "b.txt"]}).tolist() == [0, 1]
+    assert filters.match({"filename": "missing"}).tolist() == []
+
+    filters.remove(0, {"filename": "a.pdf", "doc_id": "1"})
+    assert filters.match({"doc_id": "1"}).tolist() == [1]
+    with pytest.raises(ValueError):
+        filters.match({"author": "x"})
+
+
+def test_metadata_index_adds_in_place():
+    """Adding ids extends a posting without copying it; removal copies."""
+    filters = MetadataIndex()
+    filters.add_many(range(3), [{"doc_id": "1"}] * 3)
+    posting = filters.postings["doc_id"]["1"]
+
+    filters.add_many(range(3, 6), [{"doc_id": "1"}] * 3)
+    assert filters.postings["doc_id"]["1"] is posting
+    assert filters.ids("doc_id", "1") == set(range(6))
+
+    filters.remove(0, {"doc_id": "1"})
+    assert filters.postings["doc_id"]["1"] is not posting
+    assert posting == list(range(6))  # Lukijan näkemä lista ei muutu
+    assert filters.match({"doc_id": "1"}).tolist() == [1, 2, 3, 4, 5]
+
+
+def test_filtered_search_follows_deletes(backend, random_vectors):
+    """Filtered search only returns matching chunks, also after a delete."""
+    vectors = random_vectors(40, DIM)
+    metas = [{"filename": f"doc{i % 4}.pdf"} for i in range(40)]
+    backend.store_many(
+        [str(i) for i in range(40)], [f"T{i}" for i in range(40)], vectors, metas
+    )
+
+    results = backend.semantic_search(vectors[5], k=5, filter={"filename": "doc2.pdf"})
+    assert len(results) == 5
+    assert {r["meta"]["filename"] for r in results} == {"doc2.pdf"}
+
+    backend.delete(["2", "6"])
+    backend.store("new", "New", vectors[5], {"filename": "doc2.pdf"})
+    results = backend.semantic_search(vectors[5], k=3, filter={"filename": "doc2.pdf"})
+    assert results[0]["content"] == "New"
+    assert "T2" not in [r["content"] for r in results]
+    assert backend.semantic_search(vectors[5], filter={"file_type": "txt"}) == []
+    # Indeksoimaton kenttä on kutsujan virhe, ei tyhjä tulos
+    with pytest.raises(ValueError):
+        backend.semantic_search(vectors[5], filter={"author": "x"})
+
+
+def test_searches_run_during_ingestion(tmp_path, random_vectors):
+    """Searches see complete generations while another thread stores chunks."""
+    config = IndexConfig(cow_delta_min=50, cow_delta_fraction=0.5)
+    backend = FaissMemoryBackend(storage_dir=str(tmp_path), index_config=config)
+    vectors = random_vectors(400, DIM)
+    backend.store_many(["c0"], ["Text 0"], vectors[:1], [{"filename": "a.txt"}])
+    errors = []
+    done = threading.Event()
+
+    def search():
+        while not done.is_set():
+            results = backend.semantic_search(vectors[0], k=3)
+            filtered = backend.semantic_search(
+                vectors[0], k=3, filter={"filename": "a.txt"}
+            )
+            if results[0]["content"] != "Text 0" or len(filtered) != 1:
+                errors.append((results, filtered))
+
+    readers = [threading.Thread(target=search) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        for start in range(1, 381, 20):
+            end = start + 20
+            backend.store_many(
+                [f"c{i}" for i in range(start, end)],
+                [f"Text {i}" for i in range(start, end)],
+                vectors[start:end],
+                [{"filename": "b.txt"}] * 20,
+            )
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert backend.semantic_search(vectors[333], k=1)[0]["content"] == "Text 333"
+
+
+def test_delta_rows_survive_delete_and_compaction(tmp_path, random_vectors):
+    """Rows still in the delta are deleted, compacted and reloaded like others."""
+    config = IndexConfig(cow_delta_min=10, cow_delta_fraction=0.5)
+    backend = FaissMemoryBackend(storage_dir=str(tmp_path), index_config=config)
+    vectors = random_vectors(30, DIM)
+    backend.store_many([f"c{i}" for i in range(20)], ["x"] * 20, vectors[:20])
+    backend.store_many([f"c{i}" for i in range(20, 25)], ["y"] * 5, vectors[20:25])
+    assert backend.index.ntotal == 20
+
+    old = backend._current
+    assert backend.delete(["c3", "c22"]) == 2
+    assert old.index.ntotal == 25 and old.count == 25
+    assert backend.semantic_search(vectors[24], k=1)[0]["content"] == "y"
+    assert backend.semantic_search(vectors[22], k=1)[0]["distance"] < 0.9
+
+    backend.store_many([f"c{i}" for i in range(25, 30)], ["z"] * 5, vectors[25:30])
+    backend.compact()
+    backend.close()
+    reopened = FaissMemoryBackend(storage_dir=str(tmp_path), index_config=config)
+    assert reopened.index.ntotal == 28
+    assert reopened.semantic_search(vectors[27], k=1)[0]["content"] == "z"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
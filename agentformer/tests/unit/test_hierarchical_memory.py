@@ -0,0 +1,254 @@
+"""Tests for HierarchicalMemory retrieval.
+
+This module tests:
+1. Index results match the old substring scan
+2. Short queries and removal from the text index
+3. Early stop and term frequency ranking
+4. MemoryManager limits
+5. Bounded layers with LRU, TTL and importance-decay eviction
+6. Searching the on-disk archive of evicted memories
+7. Unbounded layers by default
+8. Archive search reads only n-gram candidates from disk
+9. Incomplete eviction policies are rejected on instantiation
+"""
+
+import random
+
+import pytest
+from agentformer.storage.memory.memory_eviction import EvictionPolicy, LayerLimits
+from agentformer.storage.memory.memory_hierarchical import HierarchicalMemory
+from agentformer.storage.memory.memory_index import TextIndex
+from agentformer.storage.memory.memory_manager import MemoryManager
+
+WORDS = ["Helsinki", "pääkaupunki", "type:document", "filename:a.pdf", "Suomi", "x"]
+
+
+def _scan(memory, query):
+    """Reference implementation: the original substring scan."""
+    results = []
+    for memories in memory.memories.values():
+        for data in memories.values():
+            content = str(data.get("content", "")).lower()
+            response = str(data.get("response", "")).lower()
+            if query.lower() in content or query.lower() in response:
+                results.append(data)
+    return results
+
+
+@pytest.fixture
+def memory():
+    rng = random.Random(0)
+    memory = HierarchicalMemory()
+    layers = list(memory.memory_state)
+    for i in range(300):
+        data = {"content": " ".join(rng.choices(WORDS, k=4)) + f" #{i}"}
+        if i % 3 == 0:
+            data["response"] = rng.choice(WORDS).upper()
+        if i % 7 == 0:
+            data["content"] = {"type": "document", "n": i}
+        memory.store(data, rng.choice(layers))
+    return memory
+
+
+@pytest.mark.parametrize(
+    "query", ["helsinki", "PÄÄKAUPUNKI", "type:doc", "'type': 'document'", "#1", "x"]
+)
+def test_matches_substring_scan(memory, query):
+    assert memory.retrieve(query) == _scan(memory, query)
+
+
+def test_no_match_across_fields():
+    memory = HierarchicalMemory()
+    memory.store({"content": "Hel", "response": "sinki"}, "episodic")
+    assert memory.retrieve("helsinki") == []
+    assert memory.retrieve("sinki") == [{"content": "Hel", "response": "sinki"}]
+
+
+def test_text_index_remove():
+    index = TextIndex()
+    index.add(1, "Helsinki on pääkaupunki")
+    index.add(2, "Turku")
+    index.remove(1)
+    assert list(index.search("helsinki")) == []
+    assert list(index.search("tu")) == [2]
+    assert "hel" not in index.grams and "helsinki" not in index.tokens
+
+
+def test_limit_stops_early(memory):
+    matches = memory.iter_matches("helsinki")
+    first = [next(matches) for _ in range(3)]
+    assert memory.retrieve("helsinki", limit=3) == first
+    assert memory.retrieve("helsinki", memory_type="core") == [
+        m for m in _scan(memory, "helsinki") if m in memory.memories["core"].values()
+    ]
+
+
+def test_rank_by_term_frequency():
+    memory = HierarchicalMemory()
+    memory.store({"content": "Helsinki"}, "core")
+    memory.store({"content": "Helsinki Helsinki Helsinki"}, "episodic")
+    memory.store({"content": "Helsinki Helsinki"}, "semantic")
+    memory.store({"content": "Helsinki, again"}, "working")
+
+    ranked = memory.retrieve("helsinki", rank=True)
+    assert [m["content"] for m in ranked] == [
+        "Helsinki Helsinki Helsinki",
+        "Helsinki Helsinki",
+        "Helsinki",
+        "Helsinki, again",
+    ]
+    assert memory.retrieve("helsinki", rank=True, limit=1) == ranked[:1]
+
+
+def test_manager_limit(memory):
+    manager = MemoryManager()
+    manager.memory = memory
+    assert manager.retrieve_memories("suomi", limit=5) == _scan(memory, "suomi")[:5]
+    assert manager.retrieve_memories("suomi") == _scan(memory, "suomi")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _bounded(policy, capacity=3, **kwargs):
+    clock = Clock()
+    limits = {"episodic": LayerLimits(capacity=capacity, policy=policy, **kwargs)}
+    return HierarchicalMemory(limits=limits, clock=clock), clock
+
+
+def test_lru_evicts_least_recently_retrieved():
+    memory, clock = _bounded("lru")
+    for i in range(3):
+        memory.store({"content": f"muisti {i}"}, "episodic")
+    memory.retrieve("muisti 0")
+    memory.store({"content": "muisti 3"}, "episodic")
+
+    contents = [m["content"] for m in memory.memories["episodic"].values()]
+    assert contents == ["muisti 0", "muisti 2", "muisti 3"]
+    assert memory.retrieve("muisti 1") == []
+    assert memory.get_state()["episodic"]["evicted"] == 1
+    assert memory.get_state()["episodic"]["count"] == 3
+
+
+def test_ttl_expires_in_cleanup():
+    memory, clock = _bounded("ttl", capacity=None, ttl=60)
+    memory.store({"content": "vanha"}, "episodic")
+    clock.now += 30
+    memory.store({"content": "uusi"}, "episodic")
+    clock.now += 40
+
+    memory.cleanup()
+    state = memory.get_state()["episodic"]
+    assert [m["content"] for m in memory.memories["episodic"].values()] == ["uusi"]
+    assert state["evicted"] == 1
+    assert state["oldest"] == 1030.0
+
+
+def test_importance_decay_keeps_important_memories():
+    memory, clock = _bounded("importance", capacity=2, half_life=100)
+    memory.store({"content": "tärkeä", "importance": 8.0}, "episodic")
+    clock.now += 200  # Tärkeys 8 -> 2
+    memory.store({"content": "tavallinen", "importance": 1.0}, "episodic")
+    clock.now += 50
+    memory.store({"content": "uusin", "importance": 1.0}, "episodic")
+
+    # tavallinen: 1 * 0.5 ** 0.5 < tärkeä: 8 * 0.5 ** 2.5
+    contents = {m["content"] for m in memory.memories["episodic"].values()}
+    assert contents == {"tärkeä", "uusin"}
+
+
+def test_resident_bytes_follow_evictions():
+    memory, _ = _bounded("lru", capacity=2)
+    memory.store({"content": "x" * 1000}, "episodic")
+    full = memory.get_state()["episodic"]["resident_bytes"]
+    assert full > 1000
+    memory.store({"content": "a"}, "episodic")
+    memory.store({"content": "b"}, "episodic")
+    assert memory.get_state()["episodic"]["resident_bytes"] < full
+
+
+def test_evicted_memories_stay_searchable(tmp_path):
+    limits = {"working": LayerLimits(capacity=2)}
+    memory = HierarchicalMemory(limits=limits, archive_path=str(tmp_path / "a.jsonl"))
+    for i in range(5):
+        memory.store({"content": f"viesti {i}", "tags": {"t"}}, "working")
+
+    assert memory.retrieve("viesti") == [
+        {"content": "viesti 3", "tags": {"t"}},
+        {"content": "viesti 4", "tags": {"t"}},
+    ]
+    everything = memory.retrieve("viesti", include_archive=True)
+    assert [m["content"] for m in everything] == [
+        "viesti 3",
+        "viesti 4",
+        "viesti 0",
+        "viesti 1",
+        "viesti 2",
+    ]
+    assert list(memory.search_archive("viesti 1", "working")) == [
+        {"content": "viesti 1", "tags": "{'t'}"}
+    ]
+    assert memory.retrieve("viesti", limit=3, include_archive=True)[2] == {
+        "content": "viesti 0",
+        "tags": "{'t'}",
+    }
+
+
+def test_layers_are_unbounded_by_default():
+    clock = Clock()
+    memory = HierarchicalMemory(clock=clock)
+    for i in range(1500):
+        memory.store({"content": f"viesti {i}"}, "working")
+    clock.now += 2 * 60 * 60
+    memory.cleanup()
+    assert len(memory.memories["working"]) == 1500
+    assert memory.get_state()["working"]["evicted"] == 0
+
+
+def test_archive_search_reads_only_candidates(tmp_path):
+    limits = {"episodic": LayerLimits(capacity=1)}
+    path = str(tmp_path / "a.jsonl")
+    memory = HierarchicalMemory(limits=limits, archive_path=path)
+    for i in range(50):
+        memory.store({"content": f"muisti {i:03d}"}, "episodic")
+    memory.store({"content": "Helsinki"}, "episodic")
+    memory.store({"content": "loppu"}, "episodic")
+
+    reads = []
+    get = memory.archive.get
+    memory.archive.get = lambda position: reads.append(position) or get(position)
+    assert list(memory.search_archive("helsinki")) == [{"content": "Helsinki"}]
+    assert reads == [50]
+    assert list(memory.search_archive("helsinki", "working")) == []
+
+    # Myöhemmin arkistoidut indeksoidaan seuraavassa haussa
+    memory.store({"content": "Helsinki 2"}, "episodic")
+    memory.store({"content": "loppu 2"}, "episodic")
+    assert [m["content"] for m in memory.search_archive("helsinki")] == [
+        "Helsinki",
+        "Helsinki 2",
+    ]
+    # Avattaessa indeksi rakennetaan olemassa olevasta arkistosta
+    reopened = HierarchicalMemory(limits=limits, archive_path=path)
+    assert len(list(reopened.search_archive("muisti"))) == 50
+
+
+def test_incomplete_policy_cannot_be_instantiated():
+    class NoVictim(EvictionPolicy):
+        def add(self, entry_id, data, now):
+            pass
+
+        def remove(self, entry_id):
+            pass
+
+    with pytest.raises(TypeError):
+        NoVictim()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,136 @@
+"""Tests for HybridMemoryBackend metadata lookups.
+
+This module tests:
+1. One Cosmos query per search for all hits
+2. Serving hot results from the local metadata cache
+3. Cache invalidation on upsert and delete
+4. Bulk store and reset
+
+Cosmos is replaced by an in-memory container, so azure-cosmos is not needed.
+"""
+
+import pytest
+from agentformer.storage.memory.backends.hybrid_backend import (
+    HybridMemoryBackend,
+    MetadataCache,
+)
+
+DIM = 768
+
+
+class _NotFound(Exception):
+    status_code = 404
+
+
+class InMemoryContainer:
+    """Minimal stand-in for a Cosmos container client."""
+
+    def __init__(self):
+        self.items = {}
+        self.queries = []
+
+    def upsert_item(self, item):
+        self.items[item["id"]] = dict(item)
+
+    def delete_item(self, item, partition_key=None):
+        if item not in self.items:
+            raise _NotFound(item)
+        del self.items[item]
+
+    def query_items(self, query, parameters=None, **kwargs):
+        self.queries.append((query, parameters))
+        if query == HybridMemoryBackend.METADATA_QUERY:
+            wanted = set(parameters[0]["value"])
+            return [dict(i) for i in self.items.values() if i["vector_id"] in wanted]
+        if query == "SELECT c.id FROM c":
+            return [{"id": key} for key in self.items]
+        raise NotImplementedError(query)
+
+
+@pytest.fixture
+def backend(tmp_path, random_vectors):
+    """Backend with an in-memory container and an isolated index file."""
+    backend = HybridMemoryBackend(
+        container=InMemoryContainer(), index_file=str(tmp_path / "faiss_index.bin")
+    )
+    for i, vector in enumerate(random_vectors(10, DIM)):
+        backend.store(f"doc{i}", f"Text {i}", vector, {"n": i})
+    return backend
+
+
+def test_search_fetches_all_hits_in_one_query(backend, random_vectors):
+    """A cold k=5 search costs one round trip, a repeated one none."""
+    container = backend.container
+    backend.metadata_cache.clear()
+
+    results = backend.semantic_search(random_vectors(10, DIM)[3], k=5)
+    assert len(results) == 5
+    assert results[0]["content"] == "Text 3"
+    assert len(container.queries) == 1
+    assert sorted(container.queries[0][1][0]["value"]) == sorted(
+        r["vector_id"] for r in results
+    )
+
+    assert backend.semantic_search(random_vectors(10, DIM)[3], k=5) == results
+    assert len(container.queries) == 1
+
+
+def test_stored_documents_are_cached(backend, random_vectors):
+    """Write-through on store means fresh content needs no query."""
+    results = backend.semantic_search(random_vectors(10, DIM)[7], k=3)
+    assert results[0]["meta"] == {"n": 7}
+    assert backend.container.queries == []
+
+
+def test_upsert_and_delete_invalidate(backend, random_vectors):
+    """Replaced and deleted chunks stop appearing in results."""
+    vectors = random_vectors(10, DIM)
+    backend.store("doc2", "Text 2 v2", vectors[2] * 0.5 + vectors[4] * 0.5)
+    results = backend.semantic_search(vectors[2], k=10)
+    contents = [r["content"] for r in results]
+    assert "Text 2" not in contents and "Text 2 v2" in contents
+
+    assert backend.delete(["doc5", "missing"]) == 1
+    results = backend.semantic_search(vectors[5], k=10)
+    assert "Text 5" not in [r["content"] for r in results]
+
+    backend.metadata_cache.clear()
+    results = backend.semantic_search(vectors[5], k=11)
+    assert "Text 5" not in [r["content"] for r in results]
+    assert len(results) == 9
+
+
+def test_metadata_cache_lru_and_stale_fill():
+    """The cache evicts the coldest entry and ignores fills that raced a write."""
+    cache = MetadataCache(max_size=2)
+    version = cache.version
+    cache.put({"id": "a", "vector_id": 0})
+    cache.fill({1: {"id": "b", "vector_id": 1}}, version)
+    assert cache.get_many([1]) == ({}, [1])
+
+    cache.fill({1: {"id": "b", "vector_id": 1}, 2: None}, cache.version)
+    found, missing = cache.get_many([0, 1, 2])
+    assert list(found) == [1] and missing == [0]
+
+
+def test_store_many_and_reset(tmp_path, random_vectors):
+    """Bulk store adds every chunk with one index save; reset empties both stores."""
+    backend = HybridMemoryBackend(
+        container=InMemoryContainer(), index_file=str(tmp_path / "faiss_index.bin")
+    )
+    vectors = random_vectors(50, DIM)
+    report = backend.store_many(
+        [f"c{i}" for i in range(50)], [f"Text {i}" for i in range(50)], vectors
+    )
+    assert (report.total, report.succeeded, report.failed) == (50, 50, 0)
+    assert backend.index.ntotal == 50
+    assert backend.semantic_search(vectors[42], k=1)[0]["content"] == "Text 42"
+
+    report = backend.reset_index()
+    assert report.succeeded == 50
+    assert backend.container.items == {} and backend.index.ntotal == 0
+    assert backend.semantic_search(vectors[42], k=1) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
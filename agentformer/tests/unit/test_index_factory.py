@@ -0,0 +1,318 @@
+"""Tests for the FAISS index factory.
+
+This module tests:
+1. Index type selection by corpus size
+2. Flat, IVF and HNSW construction and query-time tuning
+3. Background promotion of a store's index
+4. Recall-vs-latency reporting
+5. SQ8 / PQ quantization with exact re-ranking
+6. Id-addressed indexes
+7. Subset (filtered) search
+8. Copy-on-write snapshots with delta rows
+9. Single-vector adds amortize folds instead of cloning per add
+"""
+
+import threading
+
+import faiss
+import numpy as np
+import pytest
+from agentformer.storage.memory.backends.faiss_backend import FaissMemoryBackend
+from agentformer.storage.memory.backends.index_snapshot import (
+    IndexSnapshot,
+    add_to_snapshot,
+    folded,
+)
+from agentformer.storage.memory.backends.index_factory import (
+    IdMapPromoter,
+    IndexConfig,
+    IndexPromoter,
+    build_id_index,
+    build_index,
+    choose_index_type,
+    choose_quantization,
+    index_kind,
+    index_quantization,
+    recall_latency_report,
+    remove_ids,
+    remove_positions,
+    search_index,
+    search_parameters,
+    stored_ids,
+)
+
+DIM = 32
+
+
+def test_choose_index_type_by_threshold():
+    """auto picks the type with the largest crossed threshold."""
+    config = IndexConfig(index_type="auto", promote_at={"hnsw": 100, "ivf": 5000})
+    assert choose_index_type(10, config) == "flat"
+    assert choose_index_type(100, config) == "hnsw"
+    assert choose_index_type(6000, config) == "ivf"
+    assert choose_index_type(10, IndexConfig(index_type="ivf")) == "flat"
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_build_index_finds_exact_match(index_type, random_vectors):
+    """Every index type finds a stored vector as its own nearest hit."""
+    vectors = random_vectors(2000, DIM)
+    index = build_index(DIM, IndexConfig(), index_type, vectors)
+    index.add(vectors)
+
+    params = search_parameters(index, nprobe=16, ef_search=64)
+    _, ids = index.search(vectors[:5], 1, params=params)
+
+    assert index_kind(index) == index_type
+    assert list(ids[:, 0]) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "hnsw"])
+def test_remove_positions_keeps_order(index_type, random_vectors):
+    """Removing rows from ANN indexes keeps remaining rows contiguous."""
+    vectors = random_vectors(1500, DIM)
+    index = build_index(DIM, IndexConfig(), index_type, vectors)
+    index.add(vectors)
+
+    index = remove_positions(index, [0, 1])
+    _, ids = index.search(vectors[2:3], 1, params=search_parameters(index, 32, 128))
+
+    assert index.ntotal == 1498
+    assert ids[0, 0] == 0
+
+
+def test_promoter_adds_rows_written_during_rebuild(random_vectors):
+    """Vectors added while rebuilding are carried over to the new index."""
+    lock = threading.RLock()
+    holder = {"index": build_index(DIM, IndexConfig(), "flat")}
+    holder["index"].add(random_vectors(200, DIM))
+
+    config = IndexConfig(index_type="hnsw")
+    promoter = IndexPromoter(
+        config, lock, lambda: holder["index"], lambda i: holder.update(index=i)
+    )
+
+    original_build = build_index
+
+    def add_during_build(*args, **kwargs):
+        holder["index"].add(random_vectors(10, DIM, seed=1))
+        return original_build(*args, **kwargs)
+
+    import agentformer.storage.memory.backends.index_factory as factory
+
+    factory.build_index = add_during_build
+    try:
+        assert promoter.maybe_promote(background=False) == ("hnsw", "none")
+    finally:
+        factory.build_index = original_build
+
+    assert index_kind(holder["index"]) == "hnsw"
+    assert holder["index"].ntotal == 210
+
+
+def test_backend_promotes_in_background(tmp_path, random_vectors):
+    """A backend in auto mode rebuilds into HNSW after the threshold."""
+    config = IndexConfig(index_type="auto", promote_at={"hnsw": 50})
+    backend = FaissMemoryBackend(storage_dir=str(tmp_path), index_config=config)
+    backend.dimension = DIM
+    backend.reset_index()
+
+    vectors = random_vectors(60, DIM)
+    backend.store_many([str(i) for i in range(60)], ["x"] * 60, vectors)
+    backend.promoter.wait()
+
+    assert index_kind(backend.index) == "hnsw"
+    result = backend.semantic_search(vectors[10], k=1, ef_search=32)
+    assert result[0]["distance"] == pytest.approx(1.0, abs=1e-4)
+
+    backend.delete(["10"])
+    assert backend.index.ntotal == 59
+    backend.compact()
+    backend.close()
+
+    reloaded = FaissMemoryBackend(storage_dir=str(tmp_path), index_config=config)
+    assert index_kind(reloaded.index) == "hnsw"
+    assert reloaded.index.ntotal == 59
+
+
+def test_recall_latency_report(random_vectors):
+    """The report lists exact, IVF and HNSW settings with recall."""
+    vectors = random_vectors(2000, DIM)
+    report = recall_latency_report(
+        vectors, vectors[:20], k=5, nprobe_values=(1, 64), ef_search_values=(64,)
+    )
+
+    assert report[0]["index"] == "flat" and report[0]["recall"] == 1.0
+    assert {row["index"] for row in report} == {"flat", "ivf", "hnsw", "sq8"}
+    ivf_rows = [row for row in report if row["index"] == "ivf"]
+    assert ivf_rows[-1]["recall"] >= ivf_rows[0]["recall"]
+    assert all(row["latency_ms"] >= 0 for row in report)
+
+    sq8_rows = [row for row in report if row["index"] == "sq8"]
+    assert sq8_rows[0]["bytes_per_vector"] < report[0]["bytes_per_vector"] / 3
+    assert sq8_rows[1]["recall"] >= sq8_rows[0]["recall"]
+
+
+def test_choose_quantization_waits_for_training_sample():
+    """Quantization starts once enough vectors exist to train it."""
+    config = IndexConfig(quantization="pq")
+    assert choose_quantization(500, config) == "none"
+    assert choose_quantization(10_000, config) == "pq"
+    assert choose_quantization(10_000, IndexConfig()) == "none"
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+@pytest.mark.parametrize("quantization", ["sq8", "pq"])
+def test_build_quantized_index(index_type, quantization, random_vectors):
+    """Quantized indexes report their encoding and kind."""
+    vectors = random_vectors(10_000, DIM)
+    index = build_index(DIM, IndexConfig(), index_type, vectors, quantization)
+    index.add(vectors[:100])
+
+    assert index_kind(index) == index_type
+    assert index_quantization(index) == quantization
+
+
+def test_rerank_restores_exact_order(random_vectors):
+    """Re-ranking PQ candidates with float vectors finds the exact match."""
+    vectors = random_vectors(10_000, DIM)
+    config = IndexConfig(pq_m=8, rerank_factor=20)
+    index = build_index(DIM, config, "flat", vectors, "pq")
+    index.add(vectors)
+    queries = vectors[:50]
+
+    plain_scores, _ = search_index(index, queries, 1, config)
+    scores, reranked = search_index(
+        index, queries, 1, config, fetch=vectors.__getitem__
+    )
+
+    assert (reranked[:, 0] == np.arange(50)).all()
+    assert scores[:, 0] == pytest.approx(np.ones(50), abs=1e-5)
+    assert not np.allclose(plain_scores[:, 0], 1.0, atol=1e-5)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_remove_ids_keeps_other_ids(index_type, random_vectors):
+    """Removing ids leaves the remaining ids searchable under the same id."""
+    vectors = random_vectors(1500, DIM)
+    ids = np.arange(1500, dtype=np.int64) * 3
+    index = build_id_index(DIM, IndexConfig(), index_type, vectors)
+    index.add_with_ids(vectors, ids)
+
+    index = remove_ids(index, ids[:10])
+    _, found = index.search(vectors[20:21], 1, params=search_parameters(index, 32, 128))
+
+    assert index.ntotal == 1490
+    assert found[0, 0] == ids[20]
+    assert set(stored_ids(index)) == set(ids[10:])
+
+
+def test_id_promoter_keeps_ids(random_vectors):
+    """Promotion of an id-addressed index keeps every id."""
+    lock = threading.RLock()
+    holder = {"index": build_id_index(DIM, IndexConfig(), "flat")}
+    vectors = random_vectors(300, DIM)
+    holder["index"].add_with_ids(vectors, np.arange(300, dtype=np.int64) + 1000)
+
+    promoter = IdMapPromoter(
+        IndexConfig(index_type="hnsw"),
+        lock,
+        lambda: holder["index"],
+        lambda i: holder.update(index=i),
+    )
+    assert promoter.maybe_promote(background=False) == ("hnsw", "none")
+
+    _, found = holder["index"].search(vectors[7:8], 1)
+    assert index_kind(holder["index"]) == "hnsw"
+    assert found[0, 0] == 1007
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+@pytest.mark.parametrize("limit", [0, 10_000])
+def test_search_index_subset(index_type, limit, random_vectors):
+    """Subset search returns only selected ids, via IDSelector or directly."""
+    vectors = random_vectors(2000, DIM)
+    config = IndexConfig(exact_filter_limit=limit, nprobe=64)
+    index = build_id_index(DIM, config, index_type, vectors)
+    index.add_with_ids(vectors, np.arange(2000, dtype=np.int64))
+    subset = np.arange(0, 2000, 3, dtype=np.int64)
+
+    scores, ids = search_index(index, vectors[[9, 10]], 5, config, subset=subset)
+
+    assert set(ids.ravel().tolist()) <= set(subset.tolist())
+    assert ids[0, 0] == 9
+    assert ids[1, 0] != 10
+
+
+def test_search_index_subset_pads_small_sets(random_vectors):
+    """A subset smaller than k is padded with -1 like FAISS does."""
+    vectors = random_vectors(100, DIM)
+    config = IndexConfig()
+    index = build_index(DIM, config, "flat")
+    index.add(vectors)
+
+    _, ids = search_index(index, vectors[:1], 4, config, subset=np.array([3, 0]))
+    assert ids.tolist() == [[0, 3, -1, -1]]
+    _, ids = search_index(index, vectors[:1], 4, config, subset=np.array([]))
+    assert ids.tolist() == [[-1, -1, -1, -1]]
+
+
+def test_snapshot_delta_matches_folded_index(random_vectors):
+    """Delta rows are searched next to the base and never touch old generations."""
+    config = IndexConfig(index_type="flat", cow_delta_min=100, cow_delta_fraction=0.5)
+    vectors = random_vectors(260, DIM)
+    base = build_id_index(DIM, config)
+    base.add_with_ids(vectors[:200], np.arange(200))
+    first = IndexSnapshot.of(base, with_ids=True)
+
+    second = add_to_snapshot(first, vectors[200:260], np.arange(200, 260), config)
+    assert second.index is base and len(second.delta_ids) == 60
+    assert first.ntotal == base.ntotal == 200
+
+    queries = vectors[[5, 230]]
+    expected = folded(second).index.search(queries, 5)
+    D, I = second.search(queries, 5, config)
+    np.testing.assert_array_equal(I, expected[1])
+    np.testing.assert_allclose(D, expected[0], rtol=1e-5)
+
+    subset = np.array([5, 7, 230, 240])
+    _, I = second.search(queries, 2, config, subset=subset)
+    assert I[:, 0].tolist() == [5, 230]
+    assert set(I.ravel()) <= set(subset)
+
+    # Deltan kasvaessa yli osuuden pohjasta se yhdistetään pohjan kopioon
+    third = add_to_snapshot(
+        second, random_vectors(50, DIM, 1), np.arange(260, 310), config
+    )
+    assert len(third.delta_ids) == 0 and third.index is not base
+    assert third.ntotal == 310 and base.ntotal == 200
+
+
+def test_single_adds_fold_rarely(random_vectors, monkeypatch):
+    """Per-item adds go to shared delta chunks; the base is cloned only on folds."""
+    clones = []
+    clone_index = faiss.clone_index
+    monkeypatch.setattr(
+        faiss, "clone_index", lambda index: clones.append(1) or clone_index(index)
+    )
+    config = IndexConfig(index_type="flat", cow_delta_min=100, cow_delta_fraction=0.05)
+    vectors = random_vectors(1000, DIM)
+    snapshot = IndexSnapshot.of(build_index(DIM, config, "flat"))
+    generations = []
+    for i in range(1000):
+        snapshot = add_to_snapshot(snapshot, vectors[i : i + 1], [i], config)
+        generations.append(snapshot)
+
+    # Yhdistys noin 100 lisäyksen välein, ei jokaisella lisäyksellä
+    assert len(clones) == 9
+    assert snapshot.ntotal == 1000
+    assert snapshot.delta_count == len(snapshot.delta_ids) == 1000 - 909
+    # Sukupolvet jakavat lohkot, vanhat eivät näe uusia rivejä
+    assert generations[950].delta_chunks[0] is snapshot.delta_chunks[0]
+    assert generations[950].ntotal == 951
+    _, I = snapshot.search(vectors[[3, 990]], 1, config)
+    assert I.ravel().tolist() == [3, 990]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,135 @@
+"""Tests for LocalJsonMemoryBackend storage formats.
+
+This module tests:
+1. Appending and streaming records in JSONL format
+2. Random access through the offset index
+3. Migration from the JSON array format
+4. Concurrent writers and torn trailing lines
+5. Writers waiting on the lock while the data file is replaced
+"""
+
+import json
+import threading
+import time
+import types
+
+import pytest
+from agentformer.storage.memory.backends.local_json_store import (
+    LocalJsonMemoryBackend,
+    _file_lock,
+    migrate_to_jsonl,
+)
+
+
+def test_jsonl_append_and_stream(tmp_path):
+    backend = LocalJsonMemoryBackend(str(tmp_path / "memory.jsonl"))
+    assert backend.storage_format == "jsonl"
+    for i in range(5):
+        backend.store({"role": "user", "content": f"viesti {i} äöå"})
+
+    records = backend.retrieve_all()
+    assert isinstance(records, types.GeneratorType)
+    assert [r["content"] for r in records] == [f"viesti {i} äöå" for i in range(5)]
+    assert len(backend) == 5
+    assert backend.get(2)["content"] == "viesti 2 äöå"
+    assert backend.get(-1)["content"] == "viesti 4 äöå"
+
+    backend.clear()
+    assert len(backend) == 0
+    assert list(backend.retrieve_all()) == []
+
+
+def test_json_array_format_unchanged(tmp_path):
+    path = tmp_path / "memory.json"
+    backend = LocalJsonMemoryBackend(str(path))
+    backend.store({"a": 1})
+    backend.store({"a": 2})
+
+    assert backend.retrieve_all() == [{"a": 1}, {"a": 2}]
+    assert json.loads(path.read_text(encoding="utf-8")) == [{"a": 1}, {"a": 2}]
+
+
+def test_array_file_is_migrated_once(tmp_path):
+    path = tmp_path / "history.json"
+    path.write_text(json.dumps([{"n": 0}, {"n": 1}]), encoding="utf-8")
+
+    backend = LocalJsonMemoryBackend(str(path), storage_format="jsonl")
+    backend.store({"n": 2})
+    assert [r["n"] for r in backend.retrieve_all()] == [0, 1, 2]
+    assert path.read_text(encoding="utf-8").splitlines()[0] == '{"n": 0}'
+
+    # Uudelleen avaaminen ei muunna enää mitään
+    reopened = LocalJsonMemoryBackend(str(path), storage_format="jsonl")
+    assert len(reopened) == 3
+
+
+def test_migrate_to_separate_file(tmp_path):
+    source = tmp_path / "old.json"
+    source.write_text(json.dumps([{"n": i} for i in range(3)]), encoding="utf-8")
+
+    assert migrate_to_jsonl(str(source), str(tmp_path / "new.jsonl")) == 3
+    assert json.loads(source.read_text(encoding="utf-8")) == [
+        {"n": i} for i in range(3)
+    ]
+    assert len(LocalJsonMemoryBackend(str(tmp_path / "new.jsonl"))) == 3
+
+
+def test_concurrent_writers_lose_nothing(tmp_path):
+    """Separate instances (own offset indexes) share one file safely."""
+    path = str(tmp_path / "shared.jsonl")
+    writers, per_writer = 4, 50
+
+    def write(w):
+        backend = LocalJsonMemoryBackend(path)
+        for i in range(per_writer):
+            backend.store({"writer": w, "i": i})
+
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reader = LocalJsonMemoryBackend(path)
+    records = list(reader.retrieve_all())
+    assert len(records) == writers * per_writer
+    assert len(reader) == writers * per_writer
+    for w in range(writers):
+        assert [r["i"] for r in records if r["writer"] == w] == list(range(per_writer))
+
+
+def test_torn_line_is_skipped_and_truncated(tmp_path):
+    path = tmp_path / "memory.jsonl"
+    backend = LocalJsonMemoryBackend(str(path))
+    backend.store({"n": 0})
+    with open(path, "ab") as f:
+        f.write(b'{"n": ')
+
+    assert len(LocalJsonMemoryBackend(str(path))) == 1
+    backend.store({"n": 1})
+    assert [r["n"] for r in backend.retrieve_all()] == [0, 1]
+
+
+def test_waiting_writer_appends_to_replaced_file(tmp_path):
+    path = str(tmp_path / "memory.jsonl")
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text(json.dumps([{"i": 0}, {"i": 1}]), encoding="utf-8")
+    backend = LocalJsonMemoryBackend(path)
+
+    with _file_lock(path):
+        writer = threading.Thread(target=backend.store, args=({"i": 2},))
+        writer.start()
+        time.sleep(0.2)
+        # Kirjoittaja odottaa lukkoa, kun datatiedosto korvataan
+        migrate_to_jsonl(str(legacy), path)
+    writer.join()
+
+    assert list(LocalJsonMemoryBackend(path).retrieve_all()) == [
+        {"i": 0},
+        {"i": 1},
+        {"i": 2},
+    ]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
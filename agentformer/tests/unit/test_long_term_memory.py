@@ -0,0 +1,119 @@
+"""Tests for LongTermMemory cleanup.
+
+This module tests:
+1. Age-based expiry of archived conversations
+2. Count-based trimming of the oldest conversations
+3. Long-term cleanup on every MemoryChain interaction
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+from agentformer.tools.memory_tools.config import ArchiveConfig, ConversationWindow
+from agentformer.tools.memory_tools.conversation.long_term import LongTermMemory
+from agentformer.tools.memory_tools.conversation.memory_chain import MemoryChain
+
+DAY = 24 * 3600
+
+
+class _HashEmbedder:
+    """Deterministic offline embedder"""
+
+    def get_dimension(self):
+        return 16
+
+    def embed_texts(self, texts):
+        return [
+            np.random.default_rng(abs(hash(t)) % 2**32)
+            .standard_normal(16)
+            .astype(np.float32)
+            for t in texts
+        ]
+
+
+def _memory(tmp_path, **options):
+    config = ArchiveConfig(
+        storage_path=str(tmp_path / "archives"),
+        index_path=str(tmp_path / "indices"),
+        **options,
+    )
+    return LongTermMemory(config, embedder=_HashEmbedder())
+
+
+def _archive(memory, summary, last_updated):
+    window = ConversationWindow()
+    window.interactions = [{"role": "user", "content": summary}]
+    window.summary = summary
+    window.created_at = last_updated
+    window.last_updated = last_updated
+    return memory.archive_conversation(window)
+
+
+def _exists(memory, archive_id):
+    path = os.path.join(memory.config.storage_path, f"{archive_id}.json")
+    return os.path.exists(path)
+
+
+def test_cleanup_removes_conversations_older_than_max_age(tmp_path):
+    memory = _memory(tmp_path, max_age_days=30)
+    now = time.time()
+    old = _archive(memory, "vanha keskustelu", now - 40 * DAY)
+    recent = _archive(memory, "uusi keskustelu", now - DAY)
+
+    memory.cleanup()
+
+    assert set(memory.archive_index) == {recent}
+    assert not _exists(memory, old) and _exists(memory, recent)
+    assert memory.vector_store.get_ids(old) == []
+    assert memory.find_relevant("uusi keskustelu", limit=5) == [recent]
+    assert memory.get_conversation(recent).interactions == [
+        {"role": "user", "content": "uusi keskustelu"}
+    ]
+    # Siivous tallentaa indeksin, joten uudelleen avattu muisti on ajan tasalla
+    assert set(_memory(tmp_path).archive_index) == {recent}
+
+
+def test_cleanup_trims_oldest_over_threshold(tmp_path):
+    memory = _memory(tmp_path, cleanup_threshold=3)
+    now = time.time()
+    ids = [_archive(memory, f"keskustelu {i}", now - (5 - i) * 60) for i in range(5)]
+
+    memory.cleanup()
+
+    assert set(memory.archive_index) == set(ids[2:])
+    assert [_exists(memory, i) for i in ids] == [False, False, True, True, True]
+    assert memory.vector_store.count() == 3
+    assert len(memory.expiry) == 3
+
+
+class _Recorder:
+    def __init__(self):
+        self.calls = 0
+
+    def cleanup(self):
+        self.calls += 1
+
+    def _cleanup_window(self):
+        self.calls += 1
+
+
+def test_chain_runs_long_term_cleanup_once_per_interaction():
+    chain = MemoryChain.__new__(MemoryChain)
+    chain.config = type("Config", (), {"cleanup_interval": 3600})()
+    chain.long_term = _Recorder()
+    chain.short_term = _Recorder()
+    chain.last_cleanup = time.time()
+
+    chain._check_cleanup()
+    assert (chain.long_term.calls, chain.short_term.calls) == (1, 0)
+
+    # Välin umpeuduttua lyhytkestoinen siivotaan, pitkäkestoista ei toiseen kertaan
+    chain.last_cleanup -= 7200
+    chain._check_cleanup()
+    assert (chain.long_term.calls, chain.short_term.calls) == (2, 1)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
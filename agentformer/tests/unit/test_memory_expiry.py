@@ -0,0 +1,62 @@
+"""Tests for the expiry scheduler used by memory cleanup.
+
+This module tests:
+1. Due keys popped in time order
+2. Rescheduling and discarding with lazy deletion
+3. Popping the oldest keys without sorting
+4. Heap compaction under repeated rescheduling
+"""
+
+import pytest
+from agentformer.storage.memory.memory_expiry import ExpiryScheduler
+
+
+def test_pop_due_returns_only_expired_in_order():
+    expiry = ExpiryScheduler()
+    for key, at in [("c", 30.0), ("a", 10.0), ("b", 20.0), ("d", 40.0)]:
+        expiry.schedule(key, at)
+
+    assert expiry.pop_due(25.0) == ["a", "b"]
+    assert expiry.pop_due(25.0) == []
+    assert len(expiry) == 2
+    assert expiry.peek() == (30.0, "c")
+
+
+def test_reschedule_and_discard():
+    expiry = ExpiryScheduler()
+    expiry.schedule("a", 10.0)
+    expiry.schedule("b", 20.0)
+    expiry.schedule("a", 50.0)  # Vanha aika jää kekoon ohitettavaksi
+    expiry.discard("b")
+    expiry.discard("puuttuva")
+
+    assert "b" not in expiry
+    assert expiry.time_of("a") == 50.0
+    assert expiry.pop_due(40.0) == []
+    assert expiry.pop() == (50.0, "a")
+    assert expiry.pop() is None
+
+
+def test_pop_oldest():
+    expiry = ExpiryScheduler()
+    for i in range(10):
+        expiry.schedule(i, float(10 - i))
+
+    assert expiry.pop_oldest(3) == [9, 8, 7]
+    assert len(expiry) == 7
+    assert expiry.pop_oldest(100) == [6, 5, 4, 3, 2, 1, 0]
+    assert expiry.pop_oldest(1) == []
+
+
+def test_heap_is_compacted():
+    expiry = ExpiryScheduler()
+    for step in range(1000):
+        expiry.schedule(step % 5, float(step))
+
+    assert len(expiry) == 5
+    assert len(expiry._heap) <= 2 * 5 + 64
+    assert expiry.pop_oldest(5) == [0, 1, 2, 3, 4]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
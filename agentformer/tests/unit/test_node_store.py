@@ -0,0 +1,149 @@
+"""Tests for the compact DistributedMemory node store.
+
+This module tests:
+1. Round trip from DistributedMemory node dicts
+2. Symmetric links through the delta buffer and CSR compaction
+3. Removal, out-of-order ids and non-string content
+4. Export of a DistributedMemory with its vectors
+5. The live memory against the former dict layout in bytes per node
+6. Expiry in row order, including out-of-order timestamps
+7. Renumbering after removals and the graph-backed mode
+"""
+
+import numpy as np
+import pytest
+from agentformer.storage.memory.memory_distributed import DistributedMemory
+from agentformer.storage.memory.memory_node_store import (
+    CompactNodeStore,
+    memory_report,
+)
+
+
+def test_round_trip_from_distributed_memory():
+    memory = DistributedMemory(max_connections=2)
+    for i in range(40):
+        memory.store(f"muistiinpano {i} äö", "episodic" if i % 3 else "semantic", n=i)
+
+    store = CompactNodeStore.from_nodes(memory.nodes)
+    assert len(store) == 40
+    assert list(store) == sorted(memory.nodes)
+    for node_id, node in memory.nodes.items():
+        compact = store[node_id]
+        assert compact["content"] == node["content"]
+        assert compact["type"] == node["type"]
+        assert compact["timestamp"] == node["timestamp"]
+        assert compact["metadata"] == node["metadata"]
+        assert compact["connections"] == set(node["connections"])
+
+
+def test_links_survive_compaction():
+    store = CompactNodeStore(compact_threshold=0)
+    store.add(10, "a")
+    store.add(20, "b", connections=[10])
+    store.add(30, "c", connections=[10, 20])
+    store.link(10, 30)  # Jo olemassa
+    store.unlink(20, 30)
+
+    for _ in range(2):
+        assert sorted(store.neighbors(10)) == [20, 30]
+        assert store.neighbors(20) == [10]
+        assert store.neighbors(30) == [10]
+        store.compact()
+    assert not store._delta
+
+
+def test_remove_and_out_of_order_ids():
+    store = CompactNodeStore()
+    store.add(100, "a")
+    store.add(200, {"rakenne": [1, 2]}, "semantic", metadata={"k": "v"})
+    store.add(150, "c", connections=[100, 200])
+
+    assert store[150]["connections"] == {100, 200}
+    assert store[200]["content"] == {"rakenne": [1, 2]}
+    assert list(store) == [100, 200, 150]
+
+    store.remove(200)
+    assert 200 not in store
+    assert len(store) == 2
+    assert store.neighbors(150) == [100]
+    with pytest.raises(KeyError):
+        store[200]
+
+    store.add(200, "uudelleen")
+    assert store[200]["content"] == "uudelleen"
+    assert store[200]["connections"] == set()
+    with pytest.raises(KeyError):
+        store.add(100, "kaksoiskappale")
+
+
+def test_export_from_memory_keeps_vectors_and_links():
+    memory = DistributedMemory(max_connections=2)
+    for i in range(30):
+        memory.store(f"muistiinpano {i % 5} aiheesta {i}")
+
+    store = CompactNodeStore.from_memory(memory)
+    assert store.vectors.dtype == np.float32
+    assert store.vectors.flags["C_CONTIGUOUS"]
+    for node_id, node in memory.nodes.items():
+        np.testing.assert_array_equal(
+            store.vector(node_id), memory.graph.vector(node_id)
+        )
+        assert store[node_id]["connections"] == set(node["connections"])
+    with pytest.raises(ValueError):
+        store.add(1, "uusi")
+
+
+def test_live_memory_is_smaller_than_dict_layout():
+    report = memory_report(300, max_connections=4, dimension=64)
+    assert report["memory_bytes_per_node"] < report["dict_bytes_per_node"]
+
+
+def test_pop_older_follows_row_order():
+    store = CompactNodeStore()
+    for node_id, timestamp in ((1, 10.0), (2, 20.0), (3, 30.0), (4, 15.0)):
+        store.add(node_id, f"solmu {node_id}", timestamp=timestamp)
+
+    # Solmu 4 lisättiin myöhemmin vanhemmalla aikaleimalla
+    assert store.pop_older(16.0) == [1, 4]
+    assert store.pop_older(16.0) == []
+    assert list(store) == [2, 3]
+    assert store.pop_older(30.0) == [2, 3]
+    assert len(store) == 0
+
+
+def test_removed_rows_are_renumbered():
+    store = CompactNodeStore(compact_threshold=2)
+    for i in range(10):
+        store.add(i, f"solmu {i}", "semantic" if i % 2 else "episodic")
+    for i in range(8):
+        store.link(i, i + 2)
+    for i in range(6):
+        store.remove(i)
+
+    assert store.index.row_count < 10
+    assert list(store) == [6, 7, 8, 9]
+    assert store[8] == {
+        "content": "solmu 8",
+        "type": "episodic",
+        "timestamp": store.timestamp(8),
+        "metadata": {},
+        "connections": {6},
+    }
+    assert store.type_counts() == {"episodic": 2, "semantic": 2}
+    assert store.pop_older(store.timestamp(7)) == [6, 7]
+
+
+def test_graph_backed_store_reads_links_from_graph():
+    memory = DistributedMemory(max_connections=2)
+    for i in range(10):
+        memory.store(f"muistiinpano {i}")
+    node_id = next(iter(memory.nodes))
+
+    assert memory.nodes[node_id]["connections"] == set(memory.graph.neighbors(node_id))
+    assert memory.nodes.indices == memory.nodes.indices[:0]
+    with pytest.raises(ValueError):
+        memory.nodes.link(node_id, list(memory.nodes)[1])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
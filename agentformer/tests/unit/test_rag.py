@@ -1,6 +1,15 @@
-import pytest
+import os
+import threading
 import logging
+import numpy as np
 from agentformer.tools.memory_tools.rag_tool import RAGTool
+from agentformer.tools.memory_tools.config import EmbedderConfig
+from agentformer.tools.memory_tools.processing.indexer import DocumentIndexer
+from agentformer.tools.memory_tools.processing.reindex_planner import (
+    file_info,
+    plan_reindex,
+)
+from agentformer.tools.memory_tools.storage.vector_store import VectorStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -48,5 +57,136 @@ def test_rag_functionality():
         )  # Näytä alku vastauksesta
 
 
+class _RecordingEmbedder:
+    """Deterministic offline embedder that records what it embedded."""
+
+    def __init__(self):
+        self.config = EmbedderConfig()
+        self.embedded = []
+
+    def get_dimension(self):
+        return 16
+
+    def embed_texts(self, texts):
+        self.embedded.extend(texts)
+        return [
+            np.random.default_rng(abs(hash(t)) % 2**32)
+            .standard_normal(16)
+            .astype(np.float32)
+            for t in texts
+        ]
+
+
+def _offline_rag_tool(storage_dir):
+    """Build a RAGTool on a temporary directory without loading models."""
+    rag = RAGTool.__new__(RAGTool)
+    rag.storage_dir = str(storage_dir)
+    rag.saved_files_dir = str(storage_dir / "saved_files")
+    rag.index_dir = str(storage_dir / "rag_index")
+    rag.indexer = DocumentIndexer()
+    rag.embedder = _RecordingEmbedder()
+    rag.vector_store = VectorStore(embedder=rag.embedder)
+    rag._load_index()
+    return rag
+
+
+def test_startup_embeds_only_changed_files(tmp_path):
+    """A restart embeds new and changed files and drops deleted ones."""
+    saved = tmp_path / "saved_files"
+    saved.mkdir()
+    (saved / "a.txt").write_text("alpha document", encoding="utf-8")
+    (saved / "b.txt").write_text("beta document", encoding="utf-8")
+
+    first = _offline_rag_tool(tmp_path)
+    assert sorted(first.embedder.embedded) == ["alpha document", "beta document"]
+
+    (saved / "a.txt").unlink()
+    (saved / "b.txt").write_text("beta changed", encoding="utf-8")
+    (saved / "c.txt").write_text("gamma document", encoding="utf-8")
+
+    second = _offline_rag_tool(tmp_path)
+    assert sorted(second.embedder.embedded) == ["beta changed", "gamma document"]
+    assert set(second.vector_store.documents) == {"b.txt", "c.txt"}
+    assert second.vector_store.count() == 2
+
+    third = _offline_rag_tool(tmp_path)
+    assert third.embedder.embedded == []
+    assert third.vector_store.count() == 2
+
+
+def test_plan_reindex_compares_size_mtime_and_hash(tmp_path, monkeypatch):
+    """Only new, edited and removed files end up in the plan."""
+    for name in ["same.txt", "touched.txt", "edited.txt", "gone.txt"]:
+        (tmp_path / name).write_text(f"{name} content", encoding="utf-8")
+    manifest = {
+        name: file_info(str(tmp_path / name))
+        for name in ["same.txt", "touched.txt", "edited.txt", "gone.txt"]
+    }
+    (tmp_path / "gone.txt").unlink()
+    (tmp_path / "new.txt").write_text("new", encoding="utf-8")
+    (tmp_path / "edited.txt").write_text("edited.txt new content", encoding="utf-8")
+    os.utime(tmp_path / "touched.txt", (0, 12345))
+
+    hashed = []
+    monkeypatch.setattr(
+        "agentformer.tools.memory_tools.processing.reindex_planner.file_info",
+        lambda path: hashed.append(os.path.basename(path)) or file_info(path),
+    )
+    plan = plan_reindex(str(tmp_path), os.listdir(tmp_path), manifest)
+
+    assert plan.add == ["new.txt"]
+    assert plan.update == ["edited.txt"]
+    assert plan.delete == ["gone.txt"]
+    assert plan.unchanged == ["same.txt", "touched.txt"]
+    assert plan.info["touched.txt"]["mtime"] == 12345
+    assert sorted(hashed) == ["edited.txt", "new.txt", "touched.txt"]
+
+
+def test_reindex_reports_skipped_and_embedded_chunks(tmp_path):
+    """reindex() applies only the delta and counts chunks on both sides."""
+    saved = tmp_path / "saved_files"
+    saved.mkdir()
+    (saved / "a.txt").write_text("alpha document", encoding="utf-8")
+    (saved / "b.txt").write_text("beta document", encoding="utf-8")
+    rag = _offline_rag_tool(tmp_path)
+
+    result = rag.reindex()
+    assert result["status"] == "success"
+    assert (result["added"], result["updated"], result["deleted"]) == (0, 0, 0)
+    assert result["chunks_skipped"] == 2
+    assert result["chunks_embedded"] == 0
+
+    (saved / "b.txt").write_text("beta changed text", encoding="utf-8")
+    rag.embedder.embedded.clear()
+    result = rag.reindex()
+    assert result["updated"] == 1
+    assert result["chunks_embedded"] == 1
+    assert result["chunks_skipped"] == 1
+    assert rag.embedder.embedded == ["beta changed text"]
+    assert rag.vector_store.count() == 2
+
+
+def test_concurrent_reindex_embeds_each_file_once(tmp_path):
+    """Concurrent reindex calls are serialized by the store's writer lock."""
+    saved = tmp_path / "saved_files"
+    saved.mkdir()
+    rag = _offline_rag_tool(tmp_path)
+    for i in range(20):
+        (saved / f"f{i}.txt").write_text(f"document {i}", encoding="utf-8")
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(rag.reindex())) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(r["added"] for r in results) == [0, 0, 0, 20]
+    assert len(rag.embedder.embedded) == 20
+    assert rag.vector_store.count() == 20
+
+
 if __name__ == "__main__":
     test_rag_functionality()
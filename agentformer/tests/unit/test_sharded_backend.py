@@ -0,0 +1,92 @@
+"""Tests for the sharded memory backend.
+
+This module tests:
+1. Routing chunks to shards by content id
+2. Scatter-gather search matching a single backend, also for a 1-D query
+3. Deletes and persistence across restarts
+4. Merging per-shard top-k lists
+"""
+
+import pytest
+from agentformer.storage.memory.backends.faiss_backend import FaissMemoryBackend
+from agentformer.storage.memory.backends.sharded_backend import (
+    ShardedMemoryBackend,
+    merge_top_k,
+    shard_of,
+)
+
+DIM = 384
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    """Three shards in an isolated storage directory."""
+    backend = ShardedMemoryBackend(
+        name="corpus", num_shards=3, storage_dir=str(tmp_path)
+    )
+    yield backend
+    backend.close()
+
+
+def test_merge_top_k_orders_by_metric():
+    """Per-shard lists are merged best first for both metrics."""
+    a = [{"distance": 0.9}, {"distance": 0.5}]
+    b = [{"distance": 0.7}, {"distance": 0.1}]
+    assert [r["distance"] for r in merge_top_k([a, b], 3, True)] == [0.9, 0.7, 0.5]
+    a, b = a[::-1], b[::-1]
+    assert [r["distance"] for r in merge_top_k([a, b], 2, False)] == [0.1, 0.5]
+
+
+def test_sharded_search_matches_single_backend(sharded, tmp_path, random_vectors):
+    """Scatter-gather returns the same top-k as one unsharded backend."""
+    vectors = random_vectors(90, DIM)
+    ids = [f"chunk{i}" for i in range(90)]
+    texts = [f"Text {i}" for i in range(90)]
+    metas = [{"filename": f"doc{i % 4}.txt"} for i in range(90)]
+    assert sharded.store_many(ids, texts, vectors, metas) == 90
+
+    counts = sharded.shard_counts()
+    assert sum(counts) == 90 and all(counts)
+    assert counts[shard_of("chunk7", 3)] >= 1
+
+    single = FaissMemoryBackend(storage_dir=str(tmp_path / "single"))
+    single.store_many(ids, texts, vectors, metas)
+    queries = random_vectors(4, DIM, seed=1)
+    expected = single.semantic_search_batch(queries, k=5)
+    batch = sharded.semantic_search_batch(queries, k=5)
+    assert [[r["content"] for r in rs] for rs in batch] == [
+        [r["content"] for r in rs] for rs in expected
+    ]
+
+    results = sharded.semantic_search(vectors[10], k=3, filter={"filename": "doc2.txt"})
+    assert results[0]["content"] == "Text 10"
+    assert {r["meta"]["filename"] for r in results} == {"doc2.txt"}
+
+    # Yksittäinen 1-D-vektori on yksi kysely
+    single_query = sharded.semantic_search_batch(vectors[10], k=1)
+    assert [[r["content"] for r in rs] for rs in single_query] == [["Text 10"]]
+
+
+def test_delete_and_reopen(sharded, tmp_path, random_vectors):
+    """Deletes reach the owning shard and the collection survives a restart."""
+    vectors = random_vectors(20, DIM)
+    sharded.store_many([f"c{i}" for i in range(20)], ["x"] * 20, vectors)
+    assert sharded.delete(["c3", "c4", "missing"]) == 2
+    sharded.compact()
+    sharded.close()
+
+    with pytest.raises(ValueError):
+        ShardedMemoryBackend(name="corpus", num_shards=2, storage_dir=str(tmp_path))
+
+    reopened = ShardedMemoryBackend(name="corpus", storage_dir=str(tmp_path))
+    try:
+        assert reopened.num_shards == 3
+        assert reopened.count() == 18
+        assert reopened.semantic_search(vectors[3], k=1)[0]["distance"] < 0.9
+        assert reopened.semantic_search(vectors[5], k=1)[0]["distance"] > 0.99
+    finally:
+        reopened.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
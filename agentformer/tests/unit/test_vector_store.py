@@ -5,11 +5,19 @@ This module tests:
 2. Similarity search
 3. Metadata management
 4. Index optimization
+5. Stable ids and per-document deletion
+6. Saving and loading
+7. Batched multi-query search
+8. Metadata-filtered search
+9. Searches during concurrent ingestion
 """
 
+import threading
+
 import pytest
 import numpy as np
 from agentformer.tools.memory_tools import VectorStore
+from agentformer.storage.memory.backends.index_factory import IndexConfig
 
 
 @pytest.fixture
@@ -118,5 +126,196 @@ def test_metadata_update(vector_store):
     assert stored.metadata == new_metadata
 
 
+class _HashEmbedder:
+    """Deterministic embedder: every distinct text gets its own random vector."""
+
+    def __init__(self, dimension=16):
+        self.dimension = dimension
+        self.calls = 0
+
+    def get_dimension(self):
+        return self.dimension
+
+    def embed_texts(self, texts):
+        self.calls += 1
+        return [
+            np.random.default_rng(abs(hash(t)) % 2**32)
+            .standard_normal(self.dimension)
+            .astype(np.float32)
+            for t in texts
+        ]
+
+
+@pytest.fixture
+def store():
+    """Create a vector store with a deterministic embedder."""
+    return VectorStore(embedder=_HashEmbedder())
+
+
+def test_ids_are_stable_across_deletes(store):
+    """Ids do not shift when other documents are removed."""
+    first = store.add_texts(["a1", "a2"], ["a.txt", "a.txt"])
+    second = store.add_texts(["b1"], ["b.txt"])
+
+    assert store.remove_document("a.txt") == 2
+    assert store.count() == 1
+    assert store.get_ids("b.txt") == second
+    assert store.get_ids("a.txt") == []
+    assert second[0] not in first
+
+    results = store.semantic_search("b1", k=3)
+    assert [r["content"] for r in results] == ["b1"]
+    assert results[0]["filename"] == "b.txt"
+
+
+def test_remove_by_metadata_uses_filename_index(store):
+    """Filename filters only touch that document's vectors."""
+    store.add_texts(["a1", "a2"], ["a.txt", "a.txt"], [{"page": 1}, {"page": 2}])
+    store.add_texts(["b1"], ["b.txt"])
+
+    assert store.remove_vectors_by_metadata({"filename": "a.txt", "page": 2})
+    assert store.count() == 2
+    assert [store.texts[i] for i in store.get_ids("a.txt")] == ["a1"]
+
+
+def test_replace_document(store):
+    """Replacing a document swaps its vectors and keeps the others."""
+    store.add_texts(["old"], ["a.txt"])
+    store.add_texts(["other"], ["b.txt"])
+
+    new_ids = store.replace_document("a.txt", ["new1", "new2"])
+
+    assert store.get_ids("a.txt") == new_ids
+    assert store.count() == 3
+    assert store.semantic_search("old", k=1)[0]["content"] != "old"
+
+
+def test_delete_on_hnsw_index():
+    """HNSW stores keep ids when a document is removed."""
+    store = VectorStore(_HashEmbedder(), IndexConfig(metric="l2", index_type="hnsw"))
+    store.add_texts([f"t{i}" for i in range(50)], ["a.txt"] * 25 + ["b.txt"] * 25)
+
+    store.remove_document("a.txt")
+
+    assert store.count() == 25
+    assert store.semantic_search("t30", k=1)[0]["content"] == "t30"
+
+
+def test_save_and_load(tmp_path, store):
+    """A loaded store answers like the saved one and keeps its ids."""
+    ids = store.add_texts(["a1", "a2"], ["a.txt", "a.txt"])
+    store.documents["a.txt"] = {"hash": "abc"}
+    store.save(str(tmp_path), {"model": "m"})
+
+    loaded = VectorStore(embedder=_HashEmbedder())
+    assert loaded.load(str(tmp_path), {"model": "m"})
+    assert loaded.get_ids("a.txt") == ids
+    assert loaded.documents == {"a.txt": {"hash": "abc"}}
+    assert loaded.semantic_search("a2", k=1)[0]["content"] == "a2"
+
+    new_ids = loaded.add_texts(["b1"], ["b.txt"])
+    assert new_ids[0] > max(ids)
+    loaded.save(str(tmp_path), {"model": "m"})
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "vector_store.2.bin",
+        "vector_store.2.idx",
+        "vector_store.2.index",
+        "vector_store.json",
+    ]
+
+
+def test_load_rejects_other_signature(tmp_path, store):
+    """A store built with other settings is not loaded."""
+    store.add_texts(["a1"], ["a.txt"])
+    store.save(str(tmp_path), {"model": "m", "chunk_size": 1000})
+
+    other = VectorStore(embedder=_HashEmbedder())
+    assert not other.load(str(tmp_path), {"model": "m", "chunk_size": 500})
+    assert other.count() == 0
+    assert not other.load(str(tmp_path / "missing"))
+
+
+def test_quantized_store_maps_exact_vectors(tmp_path):
+    """Exact re-ranking vectors are saved and memory-mapped on load."""
+    config = IndexConfig(metric="l2", quantization="sq8")
+    store = VectorStore(_HashEmbedder(), config)
+    store.add_texts([f"t{i}" for i in range(1100)], ["a.txt"] * 1100)
+    store.promoter.wait()
+    store.save(str(tmp_path))
+
+    loaded = VectorStore(_HashEmbedder(), config)
+    assert loaded.load(str(tmp_path))
+    assert loaded.vectors.path == str(tmp_path / "vector_store.1.npy")
+    assert loaded.semantic_search("t42", k=1)[0]["score"] == pytest.approx(0.0)
+
+
+def test_semantic_search_batch_embeds_once(store, monkeypatch):
+    """All queries are embedded in a single embed_texts call."""
+    store.add_texts([f"t{i}" for i in range(10)], ["a.txt"] * 10)
+    calls = []
+    embed = store.embedder.embed_texts
+
+    def count_embed(texts):
+        calls.append(list(texts))
+        return embed(texts)
+
+    monkeypatch.setattr(store.embedder, "embed_texts", count_embed)
+    batch = store.semantic_search_batch(["t3", "t7", "t9"], k=2)
+
+    assert calls == [["t3", "t7", "t9"]]
+    assert [results[0]["content"] for results in batch] == ["t3", "t7", "t9"]
+    assert all(len(results) == 2 for results in batch)
+    assert store.semantic_search_batch([]) == []
+
+
+def test_filtered_search(store):
+    """filter= restricts results to the matching documents."""
+    store.add_texts([f"a{i}" for i in range(5)], ["a.pdf"] * 5)
+    store.add_texts([f"b{i}" for i in range(5)], ["b.txt"] * 5)
+
+    results = store.semantic_search("a3", k=10, filter={"file_type": "txt"})
+    assert len(results) == 5
+    assert {r["filename"] for r in results} == {"b.txt"}
+    assert (
+        store.semantic_search("a3", k=1, filter={"filename": "a.pdf"})[0]["content"]
+        == "a3"
+    )
+
+    store.remove_document("b.txt")
+    assert store.semantic_search("a3", filter={"filename": "b.txt"}) == []
+
+
+def test_search_during_add_texts():
+    """Searches keep answering from a complete generation while texts are added."""
+    store = VectorStore(
+        embedder=_HashEmbedder(),
+        index_config=IndexConfig(metric="l2", cow_delta_min=20, cow_delta_fraction=0.5),
+    )
+    store.add_texts(["anchor"], ["a.txt"])
+    errors = []
+    done = threading.Event()
+
+    def search():
+        while not done.is_set():
+            results = store.semantic_search("anchor", k=2, filter={"filename": "a.txt"})
+            if [r["content"] for r in results] != ["anchor"]:
+                errors.append(results)
+
+    readers = [threading.Thread(target=search) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        for batch in range(30):
+            store.add_texts([f"t{batch}-{i}" for i in range(10)], ["b.txt"] * 10)
+        store.remove_document("b.txt")
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert store.count() == 1
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
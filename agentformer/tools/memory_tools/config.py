@@ -33,6 +33,10 @@ class ArchiveConfig:
     archive_batch_size: int = 50  # Montako keskustelua arkistoidaan kerralla
     min_messages_to_archive: int = 5  # Minimikeskustelun pituus arkistointiin
     include_metadata: bool = True  # Tallennetaanko metatiedot
+    max_age_days: int = 30  # Vanhemmat arkistoidut keskustelut poistetaan
+    cleanup_threshold: int = 1000  # Yli menevät vanhimmat poistetaan siivouksessa
+    storage_path: str = "memory/archives"  # Arkistoitujen keskustelujen hakemisto
+    index_path: str = "memory/indices"  # Arkistoindeksin hakemisto
 
 
 @dataclass
@@ -84,11 +88,14 @@ class EmbedderConfig:
     use_cache: bool = True  # Käytetäänkö välimuistia
     cache_dir: str = "memory/cache/embeddings"  # Välimuistin sijainti
     cache_ttl: int = 604800  # Välimuistin elinaika sekunteina (7 päivää)
+    cache_max_entries: int = 200000  # Välimuistin enimmäiskoko vektoreina
+    cache_dtype: str = "float32"  # float16 puolittaa koon, mutta pyöristää vektorit
 
     # Suoritusasetukset
     use_gpu: bool = False  # Käytetäänkö GPU:ta
     show_progress: bool = True  # Näytetäänkö edistymispalkki
     num_workers: int = 4  # Rinnakkaisten prosessien määrä
+    pool_min_texts: int = 256  # Pienemmät erät upotetaan samassa prosessissa
 
     # Virhetilanteiden käsittely
     max_retries: int = 3  # Uudelleenyrityskerrat virhetilanteissa
@@ -110,6 +117,9 @@ class MemoryChainConfig:
     enable_auto_summarization: bool = True
     enable_auto_archival: bool = True
 
+    # Siivousasetukset
+    cleanup_interval: int = 3600  # Lyhytkestoisen muistin siivousväli sekunteina
+
     # Hakuasetukset
     max_search_results: int = 5
     similarity_threshold: float = 0.7
@@ -135,6 +145,7 @@ class MemoryChainConfig:
             "use_long_term": self.use_long_term,
             "enable_auto_summarization": self.enable_auto_summarization,
             "enable_auto_archival": self.enable_auto_archival,
+            "cleanup_interval": self.cleanup_interval,
             "max_search_results": self.max_search_results,
             "similarity_threshold": self.similarity_threshold,
             "context_window_size": self.context_window_size,
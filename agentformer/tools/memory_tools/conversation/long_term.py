@@ -5,6 +5,9 @@ This module handles:
 2. Semantic search for relevant history
 3. Automatic cleanup of old conversations
 4. Memory optimization
+
+Cleanup uses an expiry heap keyed by last update time, so it only touches
+conversations that are due and is cheap enough to run on every interaction.
 """
 
 import os
@@ -12,9 +15,11 @@ import time
 import json
 import uuid
 from typing import List, Optional, Dict
-from dataclasses import asdict
+from dataclasses import asdict, is_dataclass
+
+from agentformer.storage.memory.memory_expiry import ExpiryScheduler
 
-from ..config import ArchiveConfig, ConversationWindow
+from ..config import ArchiveConfig, ConversationWindow, EmbedderConfig
 from ..storage.vector_store import VectorStore
 from ..processing.embedder import TextEmbedder
 
@@ -22,17 +27,23 @@ from ..processing.embedder import TextEmbedder
 class LongTermMemory:
     """Manages long-term memory for archived conversations."""
 
-    def __init__(self, config: ArchiveConfig):
+    def __init__(self, config: ArchiveConfig, embedder: Optional[TextEmbedder] = None):
         """Initialize long-term memory manager.
 
         Args:
             config: Archive configuration
+            embedder: Shared TextEmbedder instance, created from the default
+                EmbedderConfig when omitted
         """
         self.config = config
         self._ensure_directories()
-        self.vector_store = VectorStore()
-        self.embedder = TextEmbedder()
+        self.embedder = embedder or TextEmbedder(config=EmbedderConfig())
+        self.vector_store = VectorStore(embedder=self.embedder)
         self.archive_index: Dict[str, dict] = self._load_index()
+        # Arkistotunnisteet viimeisimmän päivityksen mukaan järjestyksessä
+        self.expiry: ExpiryScheduler[str] = ExpiryScheduler()
+        for archive_id, metadata in self.archive_index.items():
+            self.expiry.schedule(archive_id, metadata["last_updated"])
 
     def archive_conversation(self, conversation: ConversationWindow) -> str:
         """Archive a conversation for long-term storage.
@@ -59,12 +70,12 @@ class LongTermMemory:
 
         # Update index
         self.archive_index[archive_id] = metadata
+        self.expiry.schedule(archive_id, metadata["last_updated"])
         self._save_index()
 
         # Add to vector store for semantic search
         if conversation.summary:
-            embedding = self.embedder.embed_text(conversation.summary)
-            self.vector_store.add_vector(archive_id, embedding, metadata)
+            self.vector_store.add_texts([conversation.summary], [archive_id])
 
         return archive_id
 
@@ -103,29 +114,28 @@ class LongTermMemory:
         Returns:
             List of archive IDs
         """
-        query_embedding = self.embedder.embed_text(query)
-        results = self.vector_store.search(query_embedding, limit)
-        return [result.id for result in results]
+        results = self.vector_store.semantic_search(query, k=limit)
+        return [result["filename"] for result in results]
 
     def cleanup(self) -> None:
         """Clean up old conversations based on age and threshold."""
         current_time = time.time()
         max_age = self.config.max_age_days * 24 * 3600
 
-        # Find old conversations
-        old_ids = []
-        for archive_id, metadata in self.archive_index.items():
-            age = current_time - metadata["last_updated"]
-            if age > max_age:
-                old_ids.append(archive_id)
+        # Find old conversations (only the due ones are touched)
+        old_ids = self.expiry.pop_due(current_time - max_age)
 
         # Remove old conversations
         for archive_id in old_ids:
             self._remove_conversation(archive_id)
 
         # Check total count
+        removed = len(old_ids)
         if len(self.archive_index) > self.config.cleanup_threshold:
-            self._cleanup_by_count()
+            removed += self._cleanup_by_count()
+
+        if removed:
+            self._save_index()
 
     def _ensure_directories(self) -> None:
         """Ensure required directories exist."""
@@ -151,32 +161,43 @@ class LongTermMemory:
     ) -> None:
         """Save a conversation to disk."""
         archive_path = os.path.join(self.config.storage_path, f"{archive_id}.json")
+        # Samat kentät, jotka get_conversation lukee
+        data = {
+            "interactions": [
+                asdict(item) if is_dataclass(item) else item
+                for item in getattr(conversation, "interactions", [])
+            ],
+            "summary": conversation.summary,
+            "created_at": conversation.created_at,
+            "last_updated": conversation.last_updated,
+        }
         with open(archive_path, "w") as f:
-            json.dump(asdict(conversation), f)
+            json.dump(data, f)
 
     def _remove_conversation(self, archive_id: str) -> None:
         """Remove a conversation from storage."""
         # Remove from index
         if archive_id in self.archive_index:
             del self.archive_index[archive_id]
+        self.expiry.discard(archive_id)
 
         # Remove from vector store
-        self.vector_store.remove_vector(archive_id)
+        self.vector_store.remove_document(archive_id)
 
         # Remove file
         archive_path = os.path.join(self.config.storage_path, f"{archive_id}.json")
         if os.path.exists(archive_path):
             os.remove(archive_path)
 
-    def _cleanup_by_count(self) -> None:
-        """Clean up conversations when total count exceeds threshold."""
-        # Sort by last updated time
-        sorted_ids = sorted(
-            self.archive_index.keys(),
-            key=lambda x: self.archive_index[x]["last_updated"],
-        )
-
-        # Remove oldest conversations
-        remove_count = len(sorted_ids) - self.config.cleanup_threshold
-        for archive_id in sorted_ids[:remove_count]:
+    def _cleanup_by_count(self) -> int:
+        """Clean up conversations when total count exceeds threshold.
+
+        Returns:
+            Number of removed conversations
+        """
+        # Remove oldest conversations: O(k log n) from the expiry heap
+        remove_count = len(self.archive_index) - self.config.cleanup_threshold
+        oldest = self.expiry.pop_oldest(remove_count)
+        for archive_id in oldest:
             self._remove_conversation(archive_id)
+        return len(oldest)
@@ -88,9 +88,14 @@ class MemoryChain:
 
     def _check_cleanup(self) -> None:
         """Check if cleanup is needed."""
+        # Pitkäkestoisen muistin siivous koskee vain erääntyneitä
+        # keskusteluja, joten se ajetaan jokaisella vuorovaikutuksella
+        self.long_term.cleanup()
         current_time = time.time()
         if current_time - self.last_cleanup > self.config.cleanup_interval:
-            self.cleanup()
+            # Pitkäkestoinen muisti siivottiin jo yllä
+            self.short_term._cleanup_window()
+            self.last_cleanup = current_time
 
     def _check_archival(self) -> None:
         """Check if conversation should be archived."""
@@ -34,5 +34,7 @@ class DocumentChunker:
                 end = len(text)
             chunk = text[start:end]
             chunks.append(chunk)
-            start = end - self.overlap
+            if end == len(text):
+                break
+            start = max(end - self.overlap, start + 1)
         return chunks
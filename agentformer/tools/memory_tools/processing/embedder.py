@@ -1,13 +1,62 @@
-"""Text embedding generation and caching."""
+"""Text embedding generation and caching.
 
+Large batches are encoded in a process pool of EmbedderConfig.num_workers
+CPU workers (SentenceTransformer.start_multi_process_pool). The pool is
+started on first use, shared by all embedders of the same model in the
+process and stopped at exit or by shutdown_pools(). Batches smaller than
+pool_min_texts, such as interactive queries, are encoded in-process.
+"""
+
+import atexit
 import logging
-from typing import List, Dict, Any
+import os
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from ..config import EmbedderConfig
+from .embedding_cache import EmbeddingCache, cache_key, open_cache
 
 logger = logging.getLogger(__name__)
 
+# (malli, työntekijöiden määrä) -> (pooliin käynnistetty malli, pooli);
+# None, jos käynnistys epäonnistui, jolloin sitä ei yritetä uudelleen
+_pools: Dict[Tuple[str, int], Optional[Tuple[Any, Dict[str, Any]]]] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(model: SentenceTransformer, model_name: str, num_workers: int):
+    """Get or start the shared worker pool of a model."""
+    key = (model_name, num_workers)
+    with _pools_lock:
+        if key not in _pools:
+            try:
+                pool = model.start_multi_process_pool(["cpu"] * num_workers)
+                _pools[key] = (model, pool)
+                logger.info(
+                    f"Started embedding pool for {model_name}: {num_workers} workers"
+                )
+            except Exception as e:
+                logger.warning(f"Embedding pool unavailable, encoding in-process: {e}")
+                _pools[key] = None
+        entry = _pools[key]
+    return entry[1] if entry else None
+
+
+def shutdown_pools() -> None:
+    """Stop all embedding worker pools of this process."""
+    with _pools_lock:
+        entries = [entry for entry in _pools.values() if entry]
+        _pools.clear()
+    for model, pool in entries:
+        try:
+            model.stop_multi_process_pool(pool)
+        except Exception as e:
+            logger.warning(f"Error stopping embedding pool: {e}")
+
+
+atexit.register(shutdown_pools)
+
 
 class TextEmbedder:
     """Handles text embedding generation and caching."""
@@ -20,6 +69,7 @@ class TextEmbedder:
         """
         self.config = config
         self.model = self._load_model()
+        self.cache = self._open_cache()
         logger.info(f"Initialized TextEmbedder with model: {config.model_name}")
 
     def _load_model(self) -> SentenceTransformer:
@@ -28,14 +78,89 @@ class TextEmbedder:
             self.config.model_name, device=self.config.model_device
         )
 
-    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
-        """Generate embeddings for multiple texts."""
+    def _open_cache(self) -> Optional[EmbeddingCache]:
+        """Open the persistent embedding cache if enabled."""
+        dimension = self.get_dimension()
+        if not self.config.use_cache or not dimension:
+            return None
+        # Tietueen koko riippuu dimensiosta ja tyypistä, joten ne ovat
+        # tiedostonimessä; mallin nimi on mukana avaimessa
+        path = os.path.join(
+            self.config.cache_dir,
+            f"embeddings-{dimension}-{self.config.cache_dtype}.bin",
+        )
         try:
-            embeddings = self.model.encode(
-                texts,
-                normalize_embeddings=self.config.normalize_embeddings,
-                batch_size=self.config.batch_size,
+            # Samaa tiedostoa käyttävät embedderit jakavat yhden välimuistin
+            return open_cache(
+                path,
+                dimension,
+                ttl=self.config.cache_ttl,
+                max_entries=self.config.cache_max_entries,
+                dtype=self.config.cache_dtype,
             )
+        except (OSError, ValueError) as e:
+            logger.warning(f"Embedding cache disabled: {str(e)}")
+            return None
+
+    def _use_pool(self, texts: List[str]) -> bool:
+        """Whether to encode texts in the worker pool."""
+        return (
+            self.config.num_workers > 1
+            and self.config.model_device == "cpu"
+            and len(texts) >= self.config.pool_min_texts
+        )
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts with the model, in the worker pool if large."""
+        if self._use_pool(texts):
+            pool = _get_pool(
+                self.model, self.config.model_name, self.config.num_workers
+            )
+            if pool is not None:
+                return self.model.encode_multi_process(
+                    texts,
+                    pool,
+                    batch_size=self.config.batch_size,
+                    normalize_embeddings=self.config.normalize_embeddings,
+                )
+        return self.model.encode(
+            texts,
+            normalize_embeddings=self.config.normalize_embeddings,
+            batch_size=self.config.batch_size,
+        )
+
+    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """Generate embeddings for multiple texts.
+
+        With the cache enabled only texts missing from the cache are
+        encoded; their embeddings are stored and spliced back in order as
+        the cache holds them, so a text gets the same vector on every call.
+        """
+        try:
+            if self.cache is None or not texts:
+                return self._encode(texts)
+
+            keys = [
+                cache_key(
+                    self.config.model_name, self.config.normalize_embeddings, text
+                )
+                for text in texts
+            ]
+            embeddings, missing = self.cache.get_many(keys)
+            if missing:
+                # Sama teksti upotetaan vain kerran erän sisällä
+                unique: Dict[bytes, int] = {}
+                for i in missing:
+                    unique.setdefault(keys[i], i)
+                encoded = np.asarray(
+                    self._encode([texts[i] for i in unique.values()]),
+                    dtype=np.float32,
+                )
+                # Palautetaan tallennetut arvot (float16-välimuistissa pyöristetyt)
+                encoded = self.cache.put_many(list(unique), encoded)
+                rows = {key: row for row, key in enumerate(unique)}
+                for i in missing:
+                    embeddings[i] = encoded[rows[keys[i]]]
             return embeddings
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
@@ -48,3 +173,11 @@ class TextEmbedder:
             int: Dimension of embeddings
         """
         return self.model.get_sentence_embedding_dimension()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get embedding cache statistics.
+
+        Returns:
+            Dict[str, Any]: Entry, byte and hit counts, empty if disabled
+        """
+        return self.cache.stats() if self.cache is not None else {}
@@ -0,0 +1,313 @@
+"""Persistent content-addressed embedding cache.
+
+Tallentaa TextEmbedderin laskemat vektorit levylle, jotta samoja
+tekstejä (esim. muuttumattomia chunkkeja uudelleenindeksoinnissa tai
+uudelleenkäynnistyksen jälkeen) ei tarvitse upottaa uudelleen.
+
+Avain on SHA-256 mallin nimestä, normalisointiasetuksesta ja tekstistä.
+Tallennusmuoto on yksi lisäyspohjainen tiedosto ("slab") kiinteän
+kokoisia tietueita:
+
+    avain (32 tavua) | tallennusaika (float64) | vektori (float16/float32)
+
+Tiedosto luetaan numpy.memmapin kautta, joten haku ei lataa koko
+välimuistia muistiin. Muistissa pidetään vain indeksi avain -> rivi,
+joka rakennetaan avattaessa tiedoston avainsarakkeesta. Koska jokainen
+tietue sisältää oman avaimensa, erillistä indeksitiedostoa ei tarvita
+eikä se voi joutua ristiriitaan slabin kanssa.
+
+Vanhentuminen ja koko:
+- cache_ttl: vanhempi tietue tulkitaan hudiksi ja poistetaan tiivistyksessä
+- max_entries: ylityksen jälkeen tiivistys säilyttää uusimmat tietueet
+- tiivistys kirjoittaa elävät rivit uuteen tiedostoon ja vaihtaa sen
+  paikalleen os.replace():lla; kesken jäänyt viimeinen tietue (kaatunut
+  kirjoittaja) jätetään lukematta ja leikataan pois
+
+Välimuisti on tarkoitettu yhdelle kirjoittavalle prosessille. Prosessin
+sisällä samaa tiedostoa käyttää yksi jaettu olio (open_cache), koska
+toisen olion tiivistys siirtäisi rivejä sen indeksin alta. Lisäksi haku
+vertaa rivin avainta pyydettyyn ja tulkitsee eron hudiksi.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 32
+# Tiivistys jättää tilaa, ettei jokainen lisäys käynnistä uutta tiivistystä
+COMPACT_FILL = 0.9
+COMPACT_CHUNK = 65536
+
+# Tiedostopolku -> jaettu välimuisti
+_caches: Dict[str, "EmbeddingCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def _raw_keys(keys: np.ndarray) -> List[bytes]:
+    """Full 32-byte keys of a key column (tolist() strips trailing NULs)"""
+    raw = keys.tobytes()
+    return [raw[i : i + KEY_BYTES] for i in range(0, len(raw), KEY_BYTES)]
+
+
+def open_cache(path: str, dimension: int, **options) -> "EmbeddingCache":
+    """Get the process-wide cache of a slab file, opening it on first use.
+
+    Args:
+        path: Slab file path
+        dimension: Embedding dimension
+        **options: EmbeddingCache options, used when the file is first opened
+
+    Returns:
+        EmbeddingCache: Cache shared by all callers using the same file
+    """
+    key = os.path.realpath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = EmbeddingCache(path, dimension, **options)
+        elif cache.dimension != dimension:
+            raise ValueError(
+                f"Embedding cache {path} has dimension {cache.dimension}, "
+                f"not {dimension}"
+            )
+        return cache
+
+
+def cache_key(model_name: str, normalize: bool, text: str) -> bytes:
+    """Content address of an embedding"""
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\x00" + (b"1" if normalize else b"0") + b"\x00")
+    digest.update(text.encode("utf-8", "surrogatepass"))
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """Disk-backed embedding cache in an append-only memory-mapped slab"""
+
+    def __init__(
+        self,
+        path: str,
+        dimension: int,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        dtype: str = "float32",
+        clock=time.time,
+    ):
+        """Open or create a cache file.
+
+        Args:
+            path: Slab file path
+            dimension: Embedding dimension
+            ttl: Seconds an entry stays valid, None = forever
+            max_entries: Maximum number of live entries, None = unbounded
+            dtype: Stored vector type, float16 or float32
+            clock: Time source (for tests)
+        """
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"Unsupported cache dtype: {dtype}")
+        self.path = path
+        self.dimension = dimension
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.record = np.dtype(
+            [
+                ("key", f"S{KEY_BYTES}"),
+                ("stored", "<f8"),
+                ("vector", f"<{dtype[0]}{np.dtype(dtype).itemsize}", (dimension,)),
+            ]
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}  # avain -> rivi, tallennusjärjestyksessä
+        self._rows = 0
+        self._map: Optional[np.memmap] = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._index
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the slab file in bytes"""
+        return self._rows * self.record.itemsize
+
+    def _load(self) -> None:
+        """Build the key index from the slab, dropping a torn tail"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        rows, torn = divmod(size, self.record.itemsize)
+        if torn:
+            logger.warning(f"Dropping torn record at the end of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(rows * self.record.itemsize)
+        self._rows = rows
+        self._index = {}
+        if not rows:
+            return
+
+        records = self._records()
+        deadline = self._deadline()
+        for start in range(0, rows, COMPACT_CHUNK):
+            block = records[start : start + COMPACT_CHUNK]
+            keys = _raw_keys(block["key"])
+            stored = block["stored"].tolist()
+            for offset, (key, at) in enumerate(zip(keys, stored)):
+                # Myöhempi rivi korvaa aiemman (uudelleen tallennettu avain)
+                self._index.pop(key, None)
+                if at >= deadline:
+                    self._index[key] = start + offset
+
+    def _records(self) -> np.memmap:
+        """Read-only memory map of the slab, remapped after appends"""
+        if self._map is None or len(self._map) != self._rows:
+            self._map = np.memmap(
+                self.path, dtype=self.record, mode="r", shape=(self._rows,)
+            )
+        return self._map
+
+    def _deadline(self) -> float:
+        """Oldest store time that is still valid"""
+        return -np.inf if self.ttl is None else self.clock() - self.ttl
+
+    def get_many(self, keys: Sequence[bytes]) -> Tuple[np.ndarray, List[int]]:
+        """Look up embeddings.
+
+        Args:
+            keys: Cache keys (see cache_key)
+
+        Returns:
+            Tuple[np.ndarray, List[int]]: float32 array with a row per key
+                (zeros for misses) and the positions of the misses
+        """
+        vectors = np.zeros((len(keys), self.dimension), dtype=np.float32)
+        with self._lock:
+            positions, rows, missing = [], [], []
+            for i, key in enumerate(keys):
+                row = self._index.get(key)
+                if row is None or row >= self._rows:
+                    missing.append(i)
+                else:
+                    positions.append(i)
+                    rows.append(row)
+
+            if rows:
+                found = self._records()[np.asarray(rows)]
+                # Vanhentuneet ovat huteja; rivi jää tiivistyksen poistettavaksi.
+                # Väärä avain rivillä (vanhentunut indeksi) on myös huti
+                matches = [
+                    stored == keys[i]
+                    for i, stored in zip(positions, _raw_keys(found["key"]))
+                ]
+                valid = (found["stored"] >= self._deadline()) & np.asarray(matches)
+                for i, row, ok in zip(positions, rows, valid.tolist()):
+                    if not ok:
+                        missing.append(i)
+                        if self._index.get(keys[i]) == row:
+                            del self._index[keys[i]]
+                positions = np.asarray(positions)[valid]
+                vectors[positions] = found["vector"][valid]
+                missing.sort()
+
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return vectors, missing
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> np.ndarray:
+        """Append embeddings to the slab.
+
+        Args:
+            keys: Cache keys
+            vectors: Embeddings, one row per key
+
+        Returns:
+            np.ndarray: The stored embeddings as float32, i.e. the values a
+                later get_many returns (rounded when the slab is float16)
+        """
+        if not len(keys):
+            return np.empty((0, self.dimension), dtype=np.float32)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(
+            len(keys), self.dimension
+        )
+        block = np.zeros(len(keys), dtype=self.record)
+        block["key"] = keys
+        block["stored"] = self.clock()
+        block["vector"] = vectors
+
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(block.tobytes())
+            for offset, key in enumerate(keys):
+                self._index.pop(key, None)
+                self._index[key] = self._rows + offset
+            self._rows += len(keys)
+
+            dead = self._rows - len(self._index)
+            over = self.max_entries is not None and len(self) > self.max_entries
+            if over or dead > max(len(self._index), COMPACT_CHUNK):
+                self._compact()
+        return block["vector"].astype(np.float32)
+
+    def compact(self) -> None:
+        """Drop expired, overwritten and over-capacity rows from the slab"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        deadline = self._deadline()
+        live = list(self._index.values())  # Vanhimmasta uusimpaan
+        if live:
+            stored = self._records()["stored"][np.asarray(live)]
+            live = [row for row, at in zip(live, stored.tolist()) if at >= deadline]
+        if self.max_entries is not None and len(live) > self.max_entries:
+            keep = int(self.max_entries * COMPACT_FILL)
+            live = live[len(live) - keep :] if keep else []
+
+        temp_path = f"{self.path}.tmp"
+        records = self._records() if self._rows else None
+        with open(temp_path, "wb") as f:
+            for start in range(0, len(live), COMPACT_CHUNK):
+                rows = np.asarray(live[start : start + COMPACT_CHUNK])
+                f.write(records[rows].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Windowsissa muistikartoitettua tiedostoa ei voi korvata
+        self._map = records = None
+        os.replace(temp_path, self.path)
+        removed = self._rows - len(live)
+        self._load()
+        logger.debug(f"Compacted embedding cache {self.path}: -{removed} rows")
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._map = None
+            open(self.path, "wb").close()
+            self._index = {}
+            self._rows = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Entry, row, byte and hit counts"""
+        return {
+            "entries": len(self),
+            "rows": self._rows,
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -35,7 +35,7 @@ class DocumentIndexer:
         """
         try:
             # Split into chunks
-            chunks = self.chunker.split_text(content)
+            chunks = self.chunker.chunk_text(content)
 
             # Add metadata to each chunk
             processed_chunks = []
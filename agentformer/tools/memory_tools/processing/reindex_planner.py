@@ -0,0 +1,114 @@
+"""Reindex planner for the RAG file library.
+
+Vertaa saved_files-hakemiston tiedostoja indeksin manifestiin
+(VectorStore.documents) ja muodostaa suunnitelman, jossa on vain
+lisättävät, päivitettävät ja poistettavat tiedostot.
+
+Vertailu tehdään halvimmasta kalleimpaan:
+1. Sama koko ja mtime kuin manifestissa -> muuttumaton, tiedostoa ei lueta
+2. Koko sama mutta mtime eri -> sisällön hash ratkaisee
+   (esim. kopioitu tai "touchattu" tiedosto pysyy muuttumattomana)
+3. Koko eri tai hash eri -> tiedosto upotetaan uudelleen
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List
+
+
+def file_info(file_path: str) -> Dict[str, Any]:
+    """Content hash, size and modification time of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    stat = os.stat(file_path)
+    return {
+        "hash": digest.hexdigest(),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+
+
+@dataclass
+class ReindexPlan:
+    """Files to add, update and delete, plus refreshed file info"""
+
+    add: List[str] = field(default_factory=list)
+    update: List[str] = field(default_factory=list)
+    delete: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # Uudet tiedot lisätyille/päivitetyille sekä tiedostoille,
+    # joiden mtime muuttui mutta sisältö ei
+    info: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    def is_empty(self) -> bool:
+        """Whether applying the plan would change nothing"""
+        return not (self.add or self.update or self.delete or self.info)
+
+    def summary(self) -> Dict[str, int]:
+        """File counts of the plan"""
+        return {
+            "added": len(self.add),
+            "updated": len(self.update),
+            "deleted": len(self.delete),
+            "unchanged": len(self.unchanged),
+        }
+
+
+def plan_reindex(
+    directory: str,
+    filenames: Iterable[str],
+    manifest: Dict[str, Dict[str, Any]],
+    verify: bool = False,
+) -> ReindexPlan:
+    """Compare files on disk against the index manifest.
+
+    Args:
+        directory: Directory holding the files
+        filenames: Files currently in the directory
+        manifest: Indexed files mapped to their stored file info
+        verify: Hash every file even if size and mtime match
+
+    Returns:
+        ReindexPlan: Delta needed to bring the index up to date
+    """
+    plan = ReindexPlan()
+    present = set()
+
+    for filename in sorted(filenames):
+        present.add(filename)
+        known = manifest.get(filename)
+        file_path = os.path.join(directory, filename)
+        try:
+            stat = os.stat(file_path)
+            if (
+                known
+                and not verify
+                and known.get("size") == stat.st_size
+                and known.get("mtime") == stat.st_mtime
+            ):
+                plan.unchanged.append(filename)
+                continue
+
+            # Koon muuttuessa sisältö on varmasti muuttunut, mutta
+            # hash tarvitaan silti manifestiin
+            info = file_info(file_path)
+        except OSError as e:
+            plan.errors[filename] = str(e)
+            continue
+
+        if known is None:
+            plan.add.append(filename)
+        elif known.get("hash") != info["hash"]:
+            plan.update.append(filename)
+        else:
+            plan.unchanged.append(filename)
+            if known.get("mtime") == info["mtime"]:
+                continue
+        plan.info[filename] = info
+
+    plan.delete = sorted(set(manifest) - present)
+    return plan
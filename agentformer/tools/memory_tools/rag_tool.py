@@ -1,9 +1,18 @@
-"""RAG Tool - Retrieval Augmented Generation implementation"""
+"""RAG Tool - Retrieval Augmented Generation implementation
+
+Vektori-indeksi tallennetaan storage/memory/rag_index-hakemistoon.
+Käynnistyksessä tallennettu indeksi ladataan ja vain uudet tai
+muuttuneet tiedostot (koko, mtime ja sisällön hash, ks. reindex_planner)
+luetaan ja upotetaan uudelleen; poistettujen tiedostojen vektorit
+pudotetaan. Jos upotusmalli tai
+pilkkomisasetukset ovat muuttuneet, indeksi rakennetaan alusta.
+"""
 
 import logging
 from typing import Dict, Any, Optional, List
 from .rag_base import RAGToolBase
 from .processing.indexer import DocumentIndexer
+from .processing.reindex_planner import plan_reindex
 from .storage.vector_store import VectorStore
 from .processing.embedder import TextEmbedder
 from .processing.embedder import EmbedderConfig
@@ -31,6 +40,9 @@ class RAGTool(RAGToolBase):
         if not os.path.exists(self.saved_files_dir):
             os.makedirs(self.saved_files_dir)
 
+        # Persisted vector index
+        self.index_dir = os.path.join(self.storage_dir, "rag_index")
+
         # Initialize components
         self.indexer = DocumentIndexer()
         self.embedder = TextEmbedder(config=EmbedderConfig())
@@ -40,36 +52,146 @@ class RAGTool(RAGToolBase):
         self._load_index()
 
     def _load_index(self):
-        """Load existing index from files"""
+        """Load the persisted index and embed only new or changed files"""
         try:
-            # Read each file and add to vector store
-            for filename in self.list_saved_files():
-                try:
-                    file_path = os.path.join(self.saved_files_dir, filename)
+            signature = self.index_signature()
+            if not self.vector_store.load(self.index_dir, signature):
+                logger.info("No usable saved index, indexing all files")
 
-                    # Handle PDF files
-                    if filename.lower().endswith(".pdf"):
-                        from pypdf import PdfReader
+            result = self.reindex()
+            logger.info(f"Index ready: {result['message']}")
 
-                        reader = PdfReader(file_path)
-                        content = ""
-                        for page in reader.pages:
-                            content += page.extract_text()
-                    else:
-                        # Handle text files
-                        with open(file_path, "r", encoding="utf-8") as f:
-                            content = f.read()
+        except Exception as e:
+            logger.error(f"Error loading index: {str(e)}")
+
+    def reindex(self, verify: bool = False) -> Dict[str, Any]:
+        """Bring the index up to date with the saved files.
 
-                    # Add to vector store
-                    self.vector_store.add_texts([content], [filename])
-                    logger.info(f"Indexed file: {filename}")
+        Only files whose size, mtime or content hash differ from the
+        index manifest are read and embedded again. The plan is made and
+        applied under the vector store's writer lock, so concurrent calls
+        run one after another.
+
+        Args:
+            verify: Hash every file even if size and mtime are unchanged
 
+        Returns:
+            Dict containing:
+                status: success, or partial if some files failed
+                message: Human readable summary
+                added/updated/deleted/unchanged: File counts
+                chunks_embedded: Number of chunks embedded
+                chunks_skipped: Number of chunks kept from unchanged files
+                failed: Files that could not be indexed
+        """
+        # Suunnitelma ja sen toteutus samassa kirjoituslukossa: rinnakkainen
+        # reindex tai tiedoston lisäys ei voi muuttaa documents-taulua välissä
+        with self.vector_store.write_lock() as store:
+            plan = plan_reindex(
+                self.saved_files_dir, self.list_saved_files(), store.documents, verify
+            )
+            failed = dict(plan.errors)
+
+            for filename in plan.delete:
+                store.remove_document(filename)
+                logger.info(f"Dropped stale file from index: {filename}")
+
+            chunks_embedded = 0
+            for filename in plan.add + plan.update:
+                try:
+                    file_path = os.path.join(self.saved_files_dir, filename)
+                    content = self._read_file(file_path)
+                    ids = self.index_document(filename, content, plan.info[filename])
+                    chunks_embedded += len(ids)
+                    logger.info(f"Indexed file: {filename} ({len(ids)} chunks)")
                 except Exception as e:
+                    failed[filename] = str(e)
                     logger.error(f"Error indexing file {filename}: {str(e)}")
-                    continue
 
+            chunks_skipped = 0
+            for filename in plan.unchanged:
+                # Sisältö ennallaan, päivitetään vain mtime manifestiin
+                if filename in plan.info:
+                    store.update_document_info(filename, plan.info[filename])
+                chunks_skipped += len(store.get_ids(filename))
+
+            if not plan.is_empty():
+                self.save_index()
+
+        counts = plan.summary()
+        counts["added"] -= len([f for f in plan.add if f in failed])
+        counts["updated"] -= len([f for f in plan.update if f in failed])
+        message = (
+            f"{counts['added']} added, {counts['updated']} updated, "
+            f"{counts['deleted']} deleted, {counts['unchanged']} unchanged; "
+            f"{chunks_embedded} chunks embedded, {chunks_skipped} skipped"
+        )
+        if failed:
+            message += f"; {len(failed)} failed"
+
+        return {
+            "status": "partial" if failed else "success",
+            "message": message,
+            **counts,
+            "chunks_embedded": chunks_embedded,
+            "chunks_skipped": chunks_skipped,
+            "failed": failed,
+        }
+
+    def index_signature(self) -> Dict[str, Any]:
+        """Settings the stored vectors depend on"""
+        chunk_config = self.indexer.config
+        return {
+            "model": self.embedder.config.model_name,
+            "normalize": self.embedder.config.normalize_embeddings,
+            "chunk_size": chunk_config.chunk_size,
+            "overlap": chunk_config.overlap,
+            "min_chunk_size": chunk_config.min_chunk_size,
+        }
+
+    def index_document(
+        self, filename: str, content: str, info: Optional[Dict] = None
+    ) -> List[int]:
+        """Chunk and embed a document, replacing its previous vectors.
+
+        Args:
+            filename: Source filename
+            content: Document text
+            info: File info for the manifest (hash, size, mtime)
+
+        Returns:
+            List[int]: Vector ids of the new chunks
+        """
+        chunks = self.indexer.process_document(content)
+        texts = [chunk["content"] for chunk in chunks]
+        metadata = [
+            {"chunk_index": c["chunk_index"], "total_chunks": c["total_chunks"]}
+            for c in chunks
+        ]
+        return self.vector_store.replace_document(filename, texts, metadata, info)
+
+    def save_index(self):
+        """Persist the vector index"""
+        try:
+            self.vector_store.save(self.index_dir, self.index_signature())
         except Exception as e:
-            logger.error(f"Error loading index: {str(e)}")
+            logger.error(f"Error saving index: {str(e)}")
+
+    def _read_file(self, file_path: str) -> str:
+        """Read text content of a saved file"""
+        # Handle PDF files
+        if file_path.lower().endswith(".pdf"):
+            from pypdf import PdfReader
+
+            reader = PdfReader(file_path)
+            content = ""
+            for page in reader.pages:
+                content += page.extract_text()
+            return content
+
+        # Handle text files
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
 
     def query(self, query: str) -> Dict[str, Any]:
         """Process a query using RAG.
@@ -1,22 +1,86 @@
 """Vector store implementation using FAISS."""
 
+import json
 import logging
-import numpy as np
+import os
+import threading
+from contextlib import contextmanager
 import faiss
-from typing import List, Dict, Optional, Any
+import numpy as np
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
 from ..processing.embedder import TextEmbedder
+from agentformer.storage.memory.backends.index_factory import (
+    IndexConfig,
+    IdMapPromoter,
+    build_id_index,
+    choose_index_type,
+    index_kind,
+    reconstruct_ids,
+    remove_ids as remove_index_ids,
+)
+from agentformer.storage.memory.backends.index_snapshot import (
+    IndexSnapshot,
+    add_to_snapshot,
+    folded,
+    writable_index,
+)
+from agentformer.storage.memory.backends.vector_sidecar import (
+    VectorSidecar,
+    write_vectors,
+)
+from agentformer.storage.memory.backends.chunk_sidecar import (
+    ChunkSidecar,
+    encode_record,
+    write_sidecar,
+)
+from agentformer.storage.memory.backends.faiss_journal import atomic_write
+from agentformer.storage.memory.backends.metadata_filter import MetadataIndex
 
 logger = logging.getLogger(__name__)
 
 
+class _Generation(NamedTuple):
+    """Index state published to lock-free searches"""
+
+    index: IndexSnapshot
+    vectors: Optional[VectorSidecar]
+    # Sukupolveen kuuluvat tunnisteet ovat tätä pienempiä
+    next_id: int
+
+
 class VectorStore:
-    """Manages vector database and semantic search."""
+    """Manages vector database and semantic search.
+
+    Every vector gets a stable int64 id. The FAISS index is addressed by these
+    ids, texts and metadata are keyed by them, and an inverted index of
+    metadata fields (filename, doc_id, file_type) -> ids lets a document be
+    removed, or a search be filtered, without scanning the store.
+
+    save() and load() persist the store as one generation of files
+    (index, records and optional exact vectors) named in a manifest,
+    vector_store.json. The manifest also holds the documents table
+    (filename -> content hash and other file info) and the signature
+    (embedding model, chunk config) the vectors were built with.
 
-    def __init__(self, embedder: Optional[TextEmbedder] = None):
+    Searches do not take the lock. Every write publishes a new index
+    generation (copy-on-write, see index_snapshot.py), so a search started
+    during add_texts() sees either the old or the new generation.
+    """
+
+    MANIFEST = "vector_store.json"
+
+    def __init__(
+        self,
+        embedder: Optional[TextEmbedder] = None,
+        index_config: Optional[IndexConfig] = None,
+    ):
         """Initialize vector store.
 
         Args:
             embedder: Shared TextEmbedder instance
+            index_config: Index type and tuning (default: exact L2 search).
+                With quantization="sq8"/"pq" the exact vectors are kept in a
+                VectorSidecar for re-ranking; spill_vectors() moves them to disk.
 
         Raises:
             ValueError: If embedder is not provided
@@ -26,68 +90,264 @@ class VectorStore:
 
         self.embedder = embedder
         self.dimension = embedder.get_dimension()
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.texts = []
-        self.metadata = []
+        self.index_config = index_config or IndexConfig(metric="l2")
+        self._lock = threading.RLock()
+        self._index_snapshot: Optional[IndexSnapshot] = None
+        self.index = self._new_index()
+        self.texts: Dict[int, str] = {}
+        self.metadata: Dict[int, Dict] = {}
+        self.filters = MetadataIndex()
+        # Indeksoitujen tiedostojen tiedot (hash, koko, mtime) manifestia varten
+        self.documents: Dict[str, Dict] = {}
+        self._next_id = 0
+        self._generation = 0
+        # Sivutiedoston rivi on sama kuin vektorin tunniste
+        self.vectors = self._new_vectors()
+        self.promoter = IdMapPromoter(
+            self.index_config,
+            self._lock,
+            lambda: self.index,
+            self._install_index,
+            self._exact_vectors,
+            lambda: self._index_snapshot.ntotal,
+            self._fold_delta,
+        )
+        self._publish()
+
+    @property
+    def index(self) -> faiss.Index:
+        """Writer's base index (delta rows not folded in yet are excluded)"""
+        return self._index_snapshot.index
+
+    @index.setter
+    def index(self, index: faiss.Index) -> None:
+        self._index_snapshot = IndexSnapshot.of(index, with_ids=True)
+
+    def _publish(self) -> None:
+        """Make the current index and vectors visible to searches (lock held)"""
+        self._current = _Generation(self._index_snapshot, self.vectors, self._next_id)
+
+    def _new_index(self):
+        """Create an empty index of the configured starting type"""
+        return build_id_index(
+            self.dimension, self.index_config, choose_index_type(0, self.index_config)
+        )
+
+    def _fold_delta(self) -> None:
+        """Move pending delta rows into the base index (called under the lock)"""
+        self._index_snapshot = folded(self._index_snapshot)
+        self._publish()
+
+    def _install_index(self, index) -> None:
+        """Swap in a promoted index (called under the lock)"""
+        # Ylennys rakennetaan pohjaindeksistä, delta-rivit säilyvät ennallaan
+        self._index_snapshot = self._index_snapshot.with_index(index)
+        self._publish()
+
+    def _new_vectors(self) -> Optional[VectorSidecar]:
+        """Exact vector store for re-ranking, only needed with quantization"""
+        if self.index_config.quantization == "none":
+            return None
+        return VectorSidecar(self.dimension)
+
+    def _exact_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """Exact vectors for an array of ids"""
+        if self.vectors is not None:
+            return self.vectors.take(ids)
+        return reconstruct_ids(self.index, ids)
+
+    def spill_vectors(self, path: str) -> None:
+        """Move exact re-ranking vectors to a memory-mapped file.
+
+        Args:
+            path: Target .npy file
+        """
+        with self._lock:
+            if self.vectors is None:
+                return
+            write_vectors(path, self.vectors)
+            self.vectors = VectorSidecar(self.dimension, path)
+            self._publish()
 
     def add_vectors(
         self,
         vectors: List[np.ndarray],
         metadata: Optional[List[Dict]] = None,
         texts: Optional[List[str]] = None,
-    ) -> None:
+    ) -> List[int]:
         """Add vectors to the database.
 
         Args:
             vectors: List of vectors as numpy arrays
             metadata: Optional metadata for each vector
             texts: Optional original texts
+
+        Returns:
+            List[int]: Ids assigned to the vectors
         """
-        if not vectors:
-            return
+        if vectors is None or len(vectors) == 0:
+            return []
+
+        vectors_array = np.asarray(vectors, dtype=np.float32).reshape(
+            -1, self.dimension
+        )
+        with self._lock:
+            ids = np.arange(
+                self._next_id, self._next_id + len(vectors_array), dtype=np.int64
+            )
+            self._next_id += len(ids)
+            self._index_snapshot = add_to_snapshot(
+                self._index_snapshot, vectors_array, ids, self.index_config
+            )
+            if self.vectors is not None:
+                # Julkaistu sivutiedosto jää haun käyttöön ennallaan
+                self.vectors = self.vectors.frozen()
+                self.vectors.extend(vectors_array)
 
-        vectors_array = np.array(vectors)
-        self.index.add(vectors_array)
+            indexed = []
+            for i, vector_id in enumerate(ids.tolist()):
+                if texts and i < len(texts):
+                    self.texts[vector_id] = texts[i]
+                if metadata and i < len(metadata):
+                    self.metadata[vector_id] = metadata[i]
+                    indexed.append(vector_id)
+            self.filters.add_many(indexed, (self.metadata[i] for i in indexed))
+            self._publish()
 
-        if texts:
-            self.texts.extend(texts)
-        if metadata:
-            self.metadata.extend(metadata)
+        self.promoter.maybe_promote()
+        return ids.tolist()
 
-    def semantic_search(self, query: str, k: int = 5) -> List[Dict]:
+    def add_texts(
+        self,
+        texts: List[str],
+        filenames: List[str],
+        metadata: Optional[List[Dict]] = None,
+    ) -> List[int]:
+        """Embed texts and add them under their source filenames.
+
+        Args:
+            texts: Texts to embed
+            filenames: Source filename of each text
+            metadata: Optional extra metadata for each text
+
+        Returns:
+            List[int]: Ids assigned to the texts
+        """
+        if not texts:
+            return []
+        metas = [
+            {**(metadata[i] if metadata else {}), "filename": filenames[i]}
+            for i in range(len(texts))
+        ]
+        vectors = self.embedder.embed_texts(texts)
+        with self._lock:
+            for filename in filenames:
+                self.documents.setdefault(filename, {})
+            return self.add_vectors(vectors, metas, texts)
+
+    def semantic_search(
+        self,
+        query: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict]:
         """Search for most similar vectors.
 
         Args:
             query: Search query
             k: Number of results to return
+            nprobe: IVF lists to visit (default from index_config)
+            ef_search: HNSW search breadth (default from index_config)
+            filter: Only search vectors whose metadata matches, e.g.
+                {"filename": "doc.pdf"} or {"file_type": ["pdf", "txt"]}.
+                Fields must be indexed (filename, doc_id, file_type).
+
+        Quantized indexes return k * rerank_factor candidates that are
+        re-scored against the exact vectors.
 
         Returns:
             List of dicts containing results with scores and metadata
         """
-        # Get query embedding
-        query_vector = self.embedder.embed_texts([query])[0]
+        return self.semantic_search_batch([query], k, nprobe, ef_search, filter)[0]
+
+    def semantic_search_batch(
+        self,
+        queries: List[str],
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict]]:
+        """Search for many queries with one embedding call and one index search.
+
+        Args:
+            queries: Search queries
+            k: Number of results per query
+            nprobe: IVF lists to visit (default from index_config)
+            ef_search: HNSW search breadth (default from index_config)
+            filter: Only search vectors whose metadata matches (see semantic_search)
+
+        Returns:
+            List of result lists, one per query in query order
+        """
+        if not queries:
+            return []
+
+        # Koko haku käyttää samaa sukupolvea, lukkoa ei tarvita
+        current = self._current
+        subset = None
+        if filter:
+            subset = self.filters.match(filter)
+            # Julkaisun jälkeen lisätyt tunnisteet eivät kuulu sukupolveen
+            subset = subset[: np.searchsorted(subset, current.next_id)]
+            if not len(subset):
+                return [[] for _ in queries]
+
+        # Get query embeddings
+        query_vectors = self.embedder.embed_texts(list(queries))
 
         # Search index
-        scores, indices = self.index.search(np.array([query_vector]), k)
+        vectors = current.vectors
+        scores, indices = current.index.search(
+            np.asarray(query_vectors, dtype=np.float32).reshape(len(queries), -1),
+            k,
+            self.index_config,
+            nprobe,
+            ef_search,
+            vectors.take if vectors is not None else None,
+            subset,
+        )
 
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.texts):
-                result = {
-                    "score": float(score),
-                    "content": self.texts[idx],
-                }
-                if idx < len(self.metadata):
-                    result.update(self.metadata[idx])
-                results.append(result)
+        batch = []
+        for row_scores, row_ids in zip(scores, indices):
+            results = []
+            for score, vector_id in zip(row_scores, row_ids):
+                text = self.texts.get(int(vector_id))
+                if text is not None:
+                    result = {
+                        "score": float(score),
+                        "content": text,
+                    }
+                    result.update(self.metadata.get(int(vector_id), {}))
+                    results.append(result)
+            batch.append(results)
 
-        return results
+        return batch
 
     def reset(self) -> None:
         """Reset the vector store."""
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.texts = []
-        self.metadata = []
+        with self._lock:
+            self.index = self._new_index()
+            self.texts = {}
+            self.metadata = {}
+            self.filters.clear()
+            self.documents = {}
+            self._next_id = 0
+            self.vectors = self._new_vectors()
+            self.promoter.invalidate()
+            self._publish()
 
     def count(self) -> int:
         """Get total number of vectors.
@@ -95,7 +355,111 @@ class VectorStore:
         Returns:
             int: Number of vectors in store
         """
-        return self.index.ntotal
+        return self._current.index.ntotal
+
+    def get_ids(self, filename: str) -> List[int]:
+        """Get ids of the vectors stored for a file.
+
+        Args:
+            filename: Source filename
+
+        Returns:
+            List[int]: Vector ids (empty if the file is not indexed)
+        """
+        return sorted(self.filters.ids("filename", filename))
+
+    def remove_ids(self, ids: List[int]) -> int:
+        """Remove vectors by id.
+
+        Args:
+            ids: Vector ids to remove
+
+        Returns:
+            int: Number of removed vectors
+        """
+        with self._lock:
+            ids = [i for i in set(ids) if i in self.texts or i in self.metadata]
+            if not ids:
+                return 0
+
+            # Flat ja IVF poistavat paikallaan, joten julkaistusta indeksistä
+            # tehdään kopio; HNSW rakennetaan joka tapauksessa uudelleen
+            generation = self._index_snapshot
+            copy = index_kind(generation.index) != "hnsw" or generation.delta_count > 0
+            kept_vectors = self._exact_vectors if self.vectors is not None else None
+            self.index = remove_index_ids(
+                writable_index(generation, in_place=not copy), ids, kept_vectors
+            )
+            for vector_id in ids:
+                self.texts.pop(vector_id, None)
+            self.filters.remove_many(ids, [self.metadata.pop(i, None) for i in ids])
+            self.promoter.invalidate()
+            self._publish()
+            return len(ids)
+
+    def remove_document(self, filename: str) -> int:
+        """Remove all vectors of a file.
+
+        Args:
+            filename: Source filename
+
+        Returns:
+            int: Number of removed vectors
+        """
+        with self._lock:
+            self.documents.pop(filename, None)
+            return self.remove_ids(self.get_ids(filename))
+
+    def update_document_info(self, filename: str, info: Dict) -> None:
+        """Merge file info (e.g. a new mtime) into the documents table.
+
+        Args:
+            filename: Source filename
+            info: Fields to update
+        """
+        with self._lock:
+            self.documents[filename] = {**self.documents.get(filename, {}), **info}
+
+    @contextmanager
+    def write_lock(self) -> Iterator["VectorStore"]:
+        """Hold the writer lock across several writes.
+
+        Other writers wait until the block exits; searches are not blocked.
+
+        Yields:
+            VectorStore: This store
+        """
+        with self._lock:
+            yield self
+
+    def replace_document(
+        self,
+        filename: str,
+        texts: List[str],
+        metadata: Optional[List[Dict]] = None,
+        info: Optional[Dict] = None,
+    ) -> List[int]:
+        """Replace the vectors of a file with new texts.
+
+        Args:
+            filename: Source filename
+            texts: New texts of the file
+            metadata: Optional extra metadata for each text
+            info: File info stored in the documents table (e.g. content hash)
+
+        Returns:
+            List[int]: Ids assigned to the new texts
+        """
+        # Upotetaan ennen poistoa, jotta haku ei näe tiedostoa tyhjänä
+        vectors = self.embedder.embed_texts(texts) if texts else []
+        metas = [
+            {**(metadata[i] if metadata else {}), "filename": filename}
+            for i in range(len(texts))
+        ]
+        with self._lock:
+            self.remove_document(filename)
+            self.documents[filename] = dict(info or {})
+            return self.add_vectors(vectors, metas, texts)
 
     def remove_vectors_by_metadata(self, metadata_filter: Dict[str, Any]) -> bool:
         """Remove vectors matching metadata filter.
@@ -107,34 +471,159 @@ class VectorStore:
             bool: True if removal succeeded
         """
         try:
-            # Find indices to remove
-            indices_to_remove = []
-            for i, meta in enumerate(self.metadata):
-                if all(meta.get(k) == v for k, v in metadata_filter.items()):
-                    indices_to_remove.append(i)
-
-            if not indices_to_remove:
-                return True  # Nothing to remove
-
-            # Create new index and copy vectors to keep
-            new_index = faiss.IndexFlatL2(self.dimension)
-            new_metadata = []
-            new_texts = []
-
-            for i in range(len(self.metadata)):
-                if i not in indices_to_remove:
-                    vector = faiss.vector_to_array(self.index.reconstruct(i))
-                    new_index.add(np.array([vector]))
-                    new_metadata.append(self.metadata[i])
-                    new_texts.append(self.texts[i])
-
-            # Update data structures
-            self.index = new_index
-            self.metadata = new_metadata
-            self.texts = new_texts
+            # Indeksoiduilla kentillä ehdokkaat saadaan käänteisestä indeksistä
+            indexed = {
+                k: v for k, v in metadata_filter.items() if k in self.filters.fields
+            }
+            if indexed:
+                candidates = self.filters.match(indexed).tolist()
+            else:
+                candidates = list(self.metadata)
 
+            ids_to_remove = [
+                i
+                for i in candidates
+                if all(
+                    self.metadata.get(i, {}).get(k) == v
+                    for k, v in metadata_filter.items()
+                )
+            ]
+
+            if ids_to_remove:
+                self.remove_ids(ids_to_remove)
             return True
 
         except Exception as e:
             logger.error(f"Error removing vectors: {str(e)}")
             return False
+
+    def save(self, directory: str, signature: Optional[Dict] = None) -> None:
+        """Persist the store into a directory.
+
+        Uusi sukupolvi kirjoitetaan omiin tiedostoihinsa ja otetaan käyttöön
+        manifestin atomisella vaihdolla; edellisen sukupolven tiedostot
+        poistetaan vasta sen jälkeen.
+
+        Args:
+            directory: Target directory
+            signature: What the vectors were built with (model, chunk config)
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            generation = self._generation + 1
+            prefix = f"vector_store.{generation}"
+            index_name = f"{prefix}.index"
+            records_name = f"{prefix}.bin"
+            offsets_name = f"{prefix}.idx"
+
+            index = folded(self._index_snapshot).index
+            faiss.write_index(index, os.path.join(directory, index_name))
+            raw_records = (
+                encode_record(
+                    {
+                        "id": vector_id,
+                        "text": self.texts.get(vector_id),
+                        "metadata": self.metadata.get(vector_id),
+                    }
+                )
+                for vector_id in sorted(set(self.texts) | set(self.metadata))
+            )
+            write_sidecar(
+                os.path.join(directory, records_name),
+                os.path.join(directory, offsets_name),
+                raw_records,
+            )
+            manifest = {
+                "generation": generation,
+                "dimension": self.dimension,
+                "next_id": self._next_id,
+                "index": index_name,
+                "records": records_name,
+                "offsets": offsets_name,
+                "signature": signature or {},
+                "documents": self.documents,
+            }
+            if self.vectors is not None:
+                manifest["vectors"] = f"{prefix}.npy"
+                vectors_path = os.path.join(directory, manifest["vectors"])
+                write_vectors(vectors_path, self.vectors)
+
+            atomic_write(
+                os.path.join(directory, self.MANIFEST),
+                json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+            )
+            self._generation = generation
+            if self.vectors is not None:
+                self.vectors = VectorSidecar(self.dimension, vectors_path)
+                self._publish()
+
+        current = {index_name, records_name, offsets_name, manifest.get("vectors")}
+        for name in os.listdir(directory):
+            if name.startswith("vector_store.") and name != self.MANIFEST:
+                if name not in current:
+                    os.remove(os.path.join(directory, name))
+        logger.info(f"Saved vector store generation {generation} to {directory}")
+
+    def load(self, directory: str, signature: Optional[Dict] = None) -> bool:
+        """Load a store saved with save().
+
+        Args:
+            directory: Directory passed to save()
+            signature: Expected signature; a saved store built with a
+                different model or chunk config is not loaded
+
+        Returns:
+            bool: True if the store was loaded
+        """
+        manifest_path = os.path.join(directory, self.MANIFEST)
+        if not os.path.isfile(manifest_path):
+            return False
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["dimension"] != self.dimension:
+                logger.info("Saved vector store has a different dimension")
+                return False
+            if signature is not None and manifest.get("signature") != signature:
+                logger.info("Saved vector store was built with other settings")
+                return False
+
+            index = faiss.read_index(os.path.join(directory, manifest["index"]))
+            sidecar = ChunkSidecar(
+                os.path.join(directory, manifest["records"]),
+                os.path.join(directory, manifest["offsets"]),
+            )
+            records = sidecar.read_all()
+            sidecar.close()
+            vectors = None
+            if manifest.get("vectors"):
+                vectors = VectorSidecar(
+                    self.dimension, os.path.join(directory, manifest["vectors"])
+                )
+            elif self.index_config.quantization != "none":
+                logger.info("Saved vector store has no exact vectors, rebuilding")
+                return False
+        except Exception as e:
+            logger.error(f"Error loading vector store: {str(e)}")
+            return False
+
+        with self._lock:
+            self.reset()
+            self.index = index
+            self.vectors = vectors if self._new_vectors() is not None else None
+            for record in records:
+                vector_id = record["id"]
+                if record["text"] is not None:
+                    self.texts[vector_id] = record["text"]
+                if record["metadata"] is not None:
+                    self.metadata[vector_id] = record["metadata"]
+            self.filters.add_many(self.metadata.keys(), self.metadata.values())
+            self.documents = manifest.get("documents", {})
+            self._next_id = manifest["next_id"]
+            self._generation = manifest["generation"]
+            self._publish()
+
+        self.promoter.maybe_promote()
+        logger.info(f"Loaded {self.count()} vectors from {directory}")
+        return True
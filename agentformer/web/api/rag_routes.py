@@ -15,17 +15,11 @@ import os
 import logging
 from flask import request, jsonify
 from agentformer.web.web_gui import app, socketio, orchestrator
-from agentformer.tools.memory_tools.rag_tool import RAGTool
+from agentformer.tools.memory_tools.processing.reindex_planner import file_info
 
 # Määritä logger
 logger = logging.getLogger(__name__)
 
-# Määritä polut
-STORAGE_DIR = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "memory/storage"
-)
-SAVED_FILES_DIR = os.path.join(STORAGE_DIR, "saved_files")
-
 
 def emit_progress(value: float, message: str):
     """Lähetä edistymispäivitys WebSocket-yhteyden kautta.
@@ -73,24 +67,32 @@ def reindex_file():
         if not filename:
             return jsonify({"status": "error", "message": "Filename not provided"})
 
-        rag_tool = RAGTool()
-        file_path = os.path.join(SAVED_FILES_DIR, filename)
+        # Käytetään jaettua RAG-instanssia, jotta muutos näkyy heti hauissa
+        rag_tool = orchestrator.rag_tool
+        file_path = os.path.join(rag_tool.saved_files_dir, filename)
 
         # Tarkista että tiedosto on olemassa
         if not os.path.exists(file_path):
             return jsonify({"status": "error", "message": "File not found"})
 
-        # Lue ja indeksoi tiedosto
+        # Lue ja indeksoi tiedosto; vain tämän tiedoston vektorit korvataan
         with open(file_path, "r", encoding="utf-8") as f:
             content = f.read()
 
-        metadata = {"filename": filename, "path": file_path, "type": "file"}
-        if rag_tool.add_document(content, metadata):
-            return jsonify(
-                {"status": "success", "message": f"Successfully reindexed {filename}"}
-            )
-        else:
-            return jsonify({"status": "error", "message": "Failed to reindex file"})
+        # index_document nostaa poikkeuksen epäonnistuessaan; tyhjä tiedosto
+        # antaa 0 chunkia ja on onnistunut uudelleenindeksointi. Vanhat
+        # vektorit on jo voitu poistaa, joten indeksi tallennetaan aina.
+        try:
+            ids = rag_tool.index_document(filename, content, file_info(file_path))
+        finally:
+            rag_tool.save_index()
+
+        return jsonify(
+            {
+                "status": "success",
+                "message": f"Successfully reindexed {filename} ({len(ids)} chunks)",
+            }
+        )
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
@@ -114,26 +116,24 @@ def delete_file():
         if not filename:
             return jsonify({"status": "error", "message": "Filename not provided"})
 
-        rag_tool = RAGTool()
+        # Käytetään jaettua RAG-instanssia, jotta poisto näkyy heti hauissa
+        rag_tool = orchestrator.rag_tool
 
         # Poista tiedosto saved_files-hakemistosta
-        saved_file_path = os.path.join(SAVED_FILES_DIR, filename)
+        saved_file_path = os.path.join(rag_tool.saved_files_dir, filename)
         if os.path.exists(saved_file_path):
             os.remove(saved_file_path)
 
-        # Poista dokumentti document_storesta
-        rag_tool.document_store.remove_document(filename)
-
-        # Poista vektorit vector_storesta
-        rag_tool.vector_store.remove_vectors_by_metadata({"filename": filename})
+        # Poista vain tämän tiedoston vektorit vector_storesta
+        removed = rag_tool.vector_store.remove_document(filename)
+        rag_tool.save_index()
+        logger.info(f"Removed {removed} vectors of {filename}")
 
         return jsonify(
             {
                 "status": "success",
                 "message": f"Successfully deleted {filename}",
-                "indexed_files": list(
-                    rag_tool.document_store.get_all_documents().keys()
-                ),  # Palauta päivitetty tiedostolista
+                "indexed_files": rag_tool.list_saved_files(),  # Palauta päivitetty tiedostolista
             }
         )
     except Exception as e:
@@ -367,7 +367,7 @@ def handle_reindex():
             "reindex_progress", {"value": 0.0, "message": "Aloitetaan reindeksointi..."}
         )
 
-        result = rag_tool.check_and_reindex_files()
+        result = rag_tool.reindex()
 
         # Lähetä valmistumisviesti
         socketio.emit(
@@ -582,53 +582,23 @@ def update_response_length():
 
 @app.route("/api/rag/reindex", methods=["POST"])
 def reindex_files():
-    """Reindex all files"""
+    """Reindex changed files
+
+    Vertaa tiedostoja indeksin manifestiin (koko, mtime, hash) ja
+    upottaa vain lisätyt ja muuttuneet tiedostot; poistettujen
+    tiedostojen vektorit pudotetaan. {"verify": true} laskee hashin
+    kaikille tiedostoille.
+    """
     try:
         logger.info("Starting reindexing...")
+        verify = bool((request.get_json(silent=True) or {}).get("verify", False))
 
-        # Get list of files
-        files = rag_tool.list_saved_files()
-        if not files:
+        if not rag_tool.list_saved_files() and not rag_tool.vector_store.documents:
             return jsonify({"status": "error", "message": "No files found to reindex"})
 
-        # Track successfully indexed files
-        indexed = []
-
-        # Reindex each file
-        for filename in files:
-            try:
-                # Read file content
-                file_path = os.path.join(rag_tool.saved_files_dir, filename)
-
-                # Handle PDF files
-                if filename.lower().endswith(".pdf"):
-                    from pypdf import PdfReader
-
-                    reader = PdfReader(file_path)
-                    content = ""
-                    for page in reader.pages:
-                        content += page.extract_text()
-                else:
-                    # Handle text files
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-
-                # Add to vector store
-                rag_tool.vector_store.add_texts([content], [filename])
-                indexed.append(filename)
-                logger.info(f"Reindexed: {filename}")
-
-            except Exception as e:
-                logger.error(f"Error indexing {filename}: {str(e)}")
-                continue
-
-        return jsonify(
-            {
-                "status": "success",
-                "message": f"Reindexed {len(indexed)} files",
-                "indexed": indexed,
-            }
-        )
+        result = rag_tool.reindex(verify=verify)
+        logger.info(f"Reindex done: {result['message']}")
+        return jsonify({**result, "indexed": rag_tool.list_saved_files()})
 
     except Exception as e:
         logger.error(f"Error reindexing files: {str(e)}")
@@ -637,33 +607,24 @@ def reindex_files():
 
 @app.route("/api/rag/update_index", methods=["POST"])
 def update_index():
-    """Indeksoi vain indeksoimattomat tiedostot"""
+    """Indeksoi vain uudet ja muuttuneet tiedostot"""
     try:
-        # Tarkista mitkä tiedostot puuttuvat indeksistä
-        paths = PathManager.get_storage_paths()
-        save_dir = paths["saved_files"]
-
-        disk_files = set(f for f in os.listdir(save_dir) if not f.startswith("."))
-        indexed_files = set(rag_tool.list_saved_files())
-
-        missing_files = disk_files - indexed_files
-
-        if not missing_files:
-            return jsonify(
-                {"status": "info", "message": "Kaikki tiedostot on jo indeksoitu"}
-            )
+        result = rag_tool.reindex()
 
-        # Indeksoi puuttuvat tiedostot
-        indexed = []
-        for filename in missing_files:
-            file_path = os.path.join(save_dir, filename)
-            if rag_tool.index_file(filename, file_path):
-                indexed.append(filename)
+        if not (result["added"] or result["updated"] or result["deleted"]):
+            if not result["failed"]:
+                return jsonify(
+                    {"status": "info", "message": "Kaikki tiedostot on jo indeksoitu"}
+                )
 
         return jsonify(
             {
-                "status": "success",
-                "message": f"Indeksoitu {len(indexed)} uutta tiedostoa",
+                **result,
+                "message": (
+                    f"Indeksoitu {result['added']} uutta ja "
+                    f"{result['updated']} muuttunutta tiedostoa"
+                ),
+                "summary": result["message"],
                 "indexed_files": rag_tool.list_saved_files(),
             }
         )
@@ -799,7 +760,7 @@ def reindex():
         )
 
         # Suorita reindeksointi ilman progress_callback-parametria
-        result = rag_tool.check_and_reindex_files()
+        result = rag_tool.reindex()
 
         # Lähetä valmistumisviesti
         socketio.emit(
@@ -807,7 +768,7 @@ def reindex():
         )
 
         # Päivitä tiedostolista reindeksoinnin jälkeen
-        indexed_files = rag_tool.document_store.get_all_documents().keys()
+        indexed_files = rag_tool.vector_store.documents.keys()
 
         return jsonify(
             {